@@ -0,0 +1,141 @@
+# api/action_queue.py
+"""
+Per-device delivery queue for remediation actions. Every enqueued action gets an id from
+one monotonically increasing sequence and stays pending until the device acks it; agents
+long-poll for the pending actions of their own device only and are woken the moment one
+is enqueued.
+
+Delivery is at-least-once (an unacked action is handed out again); agents make it
+exactly-once by applying only ids above the last one they recorded as applied, then
+acking cumulatively up to that id.
+"""
+import json, threading, time, traceback
+from datetime import datetime, timezone
+
+class ActionQueue:
+    def __init__(self, con):
+        self.con = con
+        self._lock = threading.Lock()
+        self._waiters = {}          # device_id -> set of (loop, asyncio.Event)
+        self._listeners = []
+        self._ack_listeners = []
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS action_queue (
+            id BIGINT PRIMARY KEY,
+            device_id VARCHAR,
+            action VARCHAR,
+            params VARCHAR,
+            created_at TIMESTAMP,
+            delivered_at TIMESTAMP,
+            acked_at TIMESTAMP
+        )
+        """)
+        self._next = int(con.execute("SELECT coalesce(max(id), 0) FROM action_queue").fetchall()[0][0]) + 1
+        self.enqueued = 0
+        self.acked = 0
+
+    # ---------- Producer side ----------
+    def enqueue(self, device_id, action, params=None, record=None):
+        """
+        Queue an action for one device; returns it as delivered to agents. record(cur, action),
+        if given, runs in the same transaction (e.g. to log it elsewhere): if either write
+        fails, neither is kept.
+        """
+        with self._lock:
+            action_id = self._next
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            queued = {"id": action_id, "device_id": device_id, "action": action, "params": params or {},
+                      "created_at": now.isoformat() + "Z"}
+            cur = self.con.cursor()
+            cur.execute("BEGIN TRANSACTION")
+            try:
+                cur.execute(
+                    "INSERT INTO action_queue (id, device_id, action, params, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [action_id, device_id, action, json.dumps(params or {}), now])
+                if record is not None:
+                    record(cur, queued)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            self._next += 1
+            self.enqueued += 1
+            waiters = list(self._waiters.get(device_id, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+        for fn in self._listeners:
+            try:
+                fn(queued)
+            except Exception:
+                traceback.print_exc()
+        return queued
+
+    def subscribe(self, fn):
+        """Register fn(action) to be called for every enqueued action (e.g. to push it over MQTT)."""
+        self._listeners.append(fn)
+
+    def subscribe_acks(self, fn):
+        """Register fn(device_id, upto, acked_at epoch s) to be called for every ack that applied actions."""
+        self._ack_listeners.append(fn)
+
+    # ---------- Agent side ----------
+    def pending(self, device_id, after=0, limit=100):
+        """Unacked actions of one device with id > after, oldest first."""
+        cur = self.con.cursor()
+        rows = cur.execute(
+            """
+            SELECT id, action, params, created_at
+            FROM action_queue
+            WHERE device_id = ? AND acked_at IS NULL AND id > ?
+            ORDER BY id ASC
+            LIMIT ?
+            """,
+            [device_id, int(after), int(limit)],
+        ).fetchall()
+        if rows:
+            cur.execute("UPDATE action_queue SET delivered_at = ? "
+                        "WHERE delivered_at IS NULL AND device_id = ? AND id BETWEEN ? AND ?",
+                        [datetime.now(timezone.utc).replace(tzinfo=None), device_id, rows[0][0], rows[-1][0]])
+        return [{"id": int(r[0]), "device_id": device_id, "action": r[1],
+                 "params": json.loads(r[2]) if r[2] else {}, "created_at": r[3].isoformat() + "Z"}
+                for r in rows]
+
+    def ack(self, device_id, upto):
+        """Mark every action of the device with id <= upto as applied; returns how many were pending."""
+        now = time.time()
+        n = self.con.cursor().execute(
+            "UPDATE action_queue SET acked_at = ? "
+            "WHERE device_id = ? AND acked_at IS NULL AND id <= ?",
+            [datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None), device_id, int(upto)],
+        ).fetchone()[0]
+        self.acked += int(n)
+        if n:
+            for fn in self._ack_listeners:
+                try:
+                    fn(device_id, int(upto), now)
+                except Exception:
+                    traceback.print_exc()
+        return int(n)
+
+    # ---------- Long-poll wake-ups ----------
+    def watch(self, device_id, loop, event):
+        with self._lock:
+            self._waiters.setdefault(device_id, set()).add((loop, event))
+
+    def unwatch(self, device_id, loop, event):
+        with self._lock:
+            ws = self._waiters.get(device_id)
+            if ws is not None:
+                ws.discard((loop, event))
+                if not ws:
+                    del self._waiters[device_id]
+
+    def stats(self):
+        pending, devices, oldest = self.con.cursor().execute(
+            "SELECT count(*), count(DISTINCT device_id), min(created_at) FROM action_queue WHERE acked_at IS NULL"
+        ).fetchone()
+        with self._lock:
+            pollers = sum(len(w) for w in self._waiters.values())
+        return {"next_id": self._next, "pending": int(pending), "pending_devices": int(devices),
+                "oldest_pending": oldest.isoformat() + "Z" if oldest is not None else None,
+                "pollers": pollers, "enqueued": self.enqueued, "acked": self.acked}
@@ -1,23 +1,66 @@
 import pandas as pd, numpy as np
-from sklearn.ensemble import IsolationForest
+from metrics import registry
+registry.histogram("anomaly_stage_seconds","Time in anomaly detection and RCA stages",("stage",),subsystem="anomaly")
 METRICS = ["cpu_pct","mem_pct","temp_c","fan_rpm","disk_errors","nic_drops","latency_ms"]
+Z_THRESHOLD = 2.5
 def _rolling_z(x,w=60):
     s=pd.Series(x).astype(float); mu=s.rolling(w,min_periods=10).mean(); sd=s.rolling(w,min_periods=10).std().replace(0,np.nan)
     return ((s-mu)/sd).fillna(0.0).values
-def find_anomalies(df: pd.DataFrame):
+def _rolling_z_matrix(V,w=60):
+    """_rolling_z for every column of an n x m matrix in one pass (bit-identical per column)."""
+    f=pd.DataFrame(V,copy=False).rolling(w,min_periods=10); sd=f.std().to_numpy(); sd[sd==0]=np.nan
+    with np.errstate(invalid="ignore"): z=(V-f.mean().to_numpy())/sd
+    z[np.isnan(z)]=0.0; return z
+def _iso(ts: pd.Series, idx):
+    """ts.iloc[i].isoformat() for each i in idx, converted in bulk."""
+    if len(idx)==0: return np.array([],dtype=object)
+    if not (pd.api.types.is_datetime64_dtype(ts.dtype) and ts.dt.tz is None): return np.array([ts.iloc[i].isoformat() for i in idx],dtype=object)
+    v=ts.values[idx].astype("datetime64[ns]"); frac=v.astype(np.int64)%1_000_000_000
+    # Timestamp.isoformat() drops a zero fraction and prints nanoseconds only when present
+    return np.where(frac==0,np.datetime_as_string(v,unit="s"),np.where(frac%1000==0,np.datetime_as_string(v,unit="us"),np.datetime_as_string(v,unit="ns"))).astype(object)
+def _zscore_arrays(df: pd.DataFrame, threshold=None):
+    """(idx, metric_code, score) arrays of z-score hits (|z| > threshold, default Z_THRESHOLD), ordered by metric then row."""
+    codes=[j for j,m in enumerate(METRICS) if m in df.columns]
+    if not codes: return np.array([],dtype=np.int64),np.array([],dtype=np.int64),np.array([])
+    V=df[[METRICS[j] for j in codes]].astype(float).to_numpy()
+    Z=np.abs(_rolling_z_matrix(V,w=min(60,max(10,len(df)//5))))
+    c,i=np.nonzero((Z>(Z_THRESHOLD if threshold is None else threshold)).T)
+    return i.astype(np.int64),np.asarray(codes,dtype=np.int64)[c],Z[i,c]
+def _records(df,idx,codes,scores,kinds):
+    names=np.array(METRICS+["multivariate"],dtype=object); uniq,inv=np.unique(idx,return_inverse=True); ts=_iso(df["ts"],uniq)[inv]
+    return [{"idx":i,"ts":t,"metric":m,"score":s,"type":k} for i,t,m,s,k in zip(idx.tolist(),ts.tolist(),names[codes].tolist(),scores.tolist(),kinds)]
+def zscore_anomalies(df: pd.DataFrame):
+    idx,codes,scores=_zscore_arrays(df)
+    return _records(df,idx,codes,scores,["zscore"]*len(idx))
+@registry.timed("anomaly_stage_seconds",("find_anomalies",))
+def find_anomalies(df: pd.DataFrame, zscore=None, model=None, z_threshold=None, contamination=0.05):
+    """
+    zscore: precomputed zscore_anomalies(df) result (e.g. from the streaming detector).
+    model: pre-fitted IsolationForest (or registry entry); scores only instead of fitting on df.
+    z_threshold / contamination: detector settings (defaults Z_THRESHOLD / 0.05), for backtests;
+    contamination only applies when the IsolationForest is fitted here, and model=False skips it.
+    """
     if df.empty: return []
-    out=[]
-    for m in METRICS:
-        if m in df.columns:
-            z=_rolling_z(df[m].values,w=min(60,max(10,len(df)//5)))
-            for i in np.where(np.abs(z)>2.5)[0]: out.append({"idx":int(i),"ts":df.iloc[i]["ts"].isoformat(),"metric":m,"score":float(abs(z[i])),"type":"zscore"})
+    if zscore is None:
+        with registry.timer("anomaly_stage_seconds",("zscore",)): idx,codes,scores=_zscore_arrays(df,z_threshold)
+    else:
+        pos={m:j for j,m in enumerate(METRICS+["multivariate"])}
+        idx=np.array([a["idx"] for a in zscore],dtype=np.int64); codes=np.array([pos[a["metric"]] for a in zscore],dtype=np.int64); scores=np.array([a["score"] for a in zscore],dtype=float)
+    kinds=["zscore"]*len(idx)
     X=df[METRICS].astype(float).fillna(0.0)
-    if len(X)>=40:
-        iso=IsolationForest(n_estimators=100,contamination=0.05,random_state=42); pred=iso.fit_predict(X); scores=-iso.score_samples(X)
-        for i,p in enumerate(pred):
-            if p==-1: out.append({"idx":int(i),"ts":df.iloc[i]["ts"].isoformat(),"metric":"multivariate","score":float(scores[i]),"type":"iforest"})
-    keyed={}
-    for a in out:
-        k=(a["idx"],a["metric"])
-        if k not in keyed or a["score"]>keyed[k]["score"]: keyed[k]=a
-    return list(keyed.values())
+    if len(X)>=40 and model is not False:
+        if model is None:
+            from sklearn.ensemble import IsolationForest   # ~1.5 s to import: first use, or app warm-up
+            # fit + one scoring pass (fit_predict followed by score_samples scored twice)
+            model=IsolationForest(n_estimators=100,contamination=contamination,random_state=42)
+            with registry.timer("anomaly_stage_seconds",("iforest_fit",)): model.fit(X)
+        with registry.timer("anomaly_stage_seconds",("iforest_score",)): raw=model.score_samples(X)
+        pred=np.where(raw<model.offset_,-1,1); s=-raw
+        hit=np.nonzero(pred==-1)[0]
+        idx=np.concatenate([idx,hit]); codes=np.concatenate([codes,np.full(len(hit),len(METRICS))]); scores=np.concatenate([scores,s[hit]]); kinds+=["iforest"]*len(hit)
+    if not len(idx): return []
+    # Dedupe on (idx, metric): keep the highest score (first on ties), in first-seen key order
+    key=codes*(int(idx.max())+1)+idx; pos=np.arange(len(key))
+    best=np.lexsort((pos,-scores,key)); first=np.r_[True,key[best][1:]!=key[best][:-1]]; keep=best[first]
+    _,first_seen=np.unique(key,return_index=True); keep=keep[np.argsort(first_seen,kind="stable")]
+    return _records(df,idx[keep],codes[keep],scores[keep],[kinds[k] for k in keep])
@@ -1,105 +1,726 @@
 # api/app.py
 from fastapi import FastAPI, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
 from typing import Dict, Any
-import duckdb, os, json, datetime, traceback
+from contextlib import asynccontextmanager
+import duckdb, os, json, datetime, traceback, asyncio, tempfile, gzip, importlib
 import pandas as pd
 from datetime import datetime as dt, timedelta, timezone
 
 # Local modules
 from anomaly import find_anomalies
-from rca import rank_root_causes
+from rca import rank_root_causes, _get_graph
 from remediation import apply_remediation
+from ingest_queue import IngestQueue, QueueFull, Duplicate, Pending
+import bulk_ingest
+from hotcache import HotCache, to_ns, _ts_ns
+from streaming import StreamingDetector
+from models import ModelRegistry
+from fleet import FleetSweeper
+from tiering import TierManager
+from clustering import Clusterer
+from rollups import Rollups, LEVELS, GAUGES, pick_level
+import encoding
+from feed import Feed, make_cursor, parse_cursor
+from action_queue import ActionQueue
+from device_registry import DeviceRegistry
+from metrics import registry, MetricsMiddleware
+from snapshots import Snapshotter, SnapshotReader
+from forward import Forwarder
+from checkpoints import Checkpointer
+from startup import Startup
+from policy import PolicyEngine, load_rules
+import downsample
+from overview import FleetOverview
+
+startup = Startup()
+startup.mark("imported")
 
 DB_PATH = os.getenv("RCA_DB", "rca.duckdb")
 print("DB path:", os.path.abspath(DB_PATH))
 
+# /metrics subsystems: all, 0, or a list of http,ingest,db,anomaly,storage
+registry.configure(os.getenv("METRICS", "all"))
+
+# Write-behind ingest tuning (rows / milliseconds)
+INGEST_MAX_ROWS = int(os.getenv("INGEST_MAX_ROWS", "50000"))
+INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "5000"))
+INGEST_MAX_AGE_MS = float(os.getenv("INGEST_MAX_AGE_MS", "250"))
+INGEST_WAIT_TIMEOUT_S = float(os.getenv("INGEST_WAIT_TIMEOUT_S", "10"))
+# Commit failures caused by the events themselves; resending them cannot succeed
+INGEST_REJECTED = (duckdb.DataError, ValueError, TypeError)
+
+# Hot-data cache: rows kept per device (0 disables) and max devices held (LRU)
+HOTCACHE_ROWS = int(os.getenv("HOTCACHE_ROWS", "2048"))
+HOTCACHE_DEVICES = int(os.getenv("HOTCACHE_DEVICES", "1024"))
+
+# Streaming z-score detector: flagged samples kept per device
+STREAM_ANOMALIES_PER_DEVICE = int(os.getenv("STREAM_ANOMALIES_PER_DEVICE", "4096"))
+
+# IsolationForest model registry (MODEL_REGISTRY=0 restores fit-per-request)
+MODEL_REGISTRY = os.getenv("MODEL_REGISTRY", "1") == "1"
+MODEL_DIR = os.getenv("MODEL_DIR") or None
+MODEL_MAX = int(os.getenv("MODEL_MAX", "1000"))
+MODEL_TTL_S = float(os.getenv("MODEL_TTL_S", str(6 * 3600)))
+MODEL_REFRESH_S = float(os.getenv("MODEL_REFRESH_S", "900"))
+MODEL_BASELINE_ROWS = int(os.getenv("MODEL_BASELINE_ROWS", "3600"))
+
+# Fleet sweep worker processes kept warm between sweeps (0 = one per core); concurrent
+# sweeps each get their own workers
+FLEET_WORKERS = int(os.getenv("FLEET_WORKERS", "0"))
+
+# Storage tiering: hot rows older than TIER_HOT_HOURS move to Parquet under TIER_DIR;
+# cold partitions are dropped after TIER_COLD_DAYS (0 = keep). TIERING=0 keeps one table.
+TIERING = os.getenv("TIERING", "1") == "1"
+TIER_DIR = os.getenv("TIER_DIR") or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "cold")
+TIER_HOT_HOURS = float(os.getenv("TIER_HOT_HOURS", "24"))
+TIER_COLD_DAYS = float(os.getenv("TIER_COLD_DAYS", "0"))
+TIER_COMPACT_FILES = int(os.getenv("TIER_COMPACT_FILES", "8"))
+TIER_INTERVAL_S = float(os.getenv("TIER_INTERVAL_S", "300"))
+
+# Sorted rewrites of settled CLUSTER_SLICE_S slices of the hot table by (device_id, ts), once
+# they are CLUSTER_SETTLE_S old, checked every CLUSTER_INTERVAL_S (CLUSTER=0 disables)
+CLUSTER = os.getenv("CLUSTER", "1") == "1"
+CLUSTER_SLICE_S = float(os.getenv("CLUSTER_SLICE_S", "3600"))
+CLUSTER_SETTLE_S = float(os.getenv("CLUSTER_SETTLE_S", "600"))
+CLUSTER_INTERVAL_S = float(os.getenv("CLUSTER_INTERVAL_S", "300"))
+
+# Continuous 1m/1h rollups, folded in at most ROLLUP_FLUSH_S after commit (ROLLUPS=0 disables)
+ROLLUPS = os.getenv("ROLLUPS", "1") == "1"
+ROLLUP_FLUSH_S = float(os.getenv("ROLLUP_FLUSH_S", "1"))
+
+# Charts: /downsample reduces from the 1m/1h rollups once a window would hold more than
+# DOWNSAMPLE_RAW_MAX raw rows; /fleet/summary builds are shared for FLEET_SUMMARY_TTL_S
+DOWNSAMPLE_RAW_MAX = int(os.getenv("DOWNSAMPLE_RAW_MAX", "200000"))
+FLEET_SUMMARY_TTL_S = float(os.getenv("FLEET_SUMMARY_TTL_S", "2"))
+
+# Incremental feed behind ?since= cursors and /stream: rows kept per device, devices held (LRU),
+# and the idle interval after which /stream sends a keep-alive comment
+FEED_ROWS = int(os.getenv("FEED_ROWS", "4096"))
+FEED_DEVICES = int(os.getenv("FEED_DEVICES", "4096"))
+STREAM_KEEPALIVE_S = float(os.getenv("STREAM_KEEPALIVE_S", "15"))
+
+# MQTT ingest bridge (off unless MQTT_HOST is set): telemetry topics in, per-device action topics out
+MQTT_HOST = os.getenv("MQTT_HOST")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "telemetry/#")
+MQTT_ACTION_PREFIX = os.getenv("MQTT_ACTION_PREFIX", "actions")
+MQTT_BATCH_ROWS = int(os.getenv("MQTT_BATCH_ROWS", "20000"))
+MQTT_FLUSH_MS = float(os.getenv("MQTT_FLUSH_MS", "250"))
+
+# Longest an agent's /actions/poll request is held open waiting for a new action
+ACTION_POLL_MAX_S = float(os.getenv("ACTION_POLL_MAX_S", "30"))
+
+# Closed-loop remediation (policy.py): POLICY=on dispatches the actions its rules pick as soon as
+# the detector flags a device, dry_run only records the decisions, off disables it. Rules, trigger
+# and rate limits are in POLICY_RULES; a triggered device's last POLICY_WINDOW_MIN minutes are analysed.
+POLICY = os.getenv("POLICY", "dry_run")
+if POLICY not in ("on", "dry_run", "off"):
+    raise SystemExit(f"POLICY must be on, dry_run or off, not {POLICY!r}")
+POLICY_RULES = os.getenv("POLICY_RULES", os.path.join(os.path.dirname(__file__), "policies.yaml"))
+POLICY_WINDOW_MIN = float(os.getenv("POLICY_WINDOW_MIN", "10"))
+
+# Process role (see serve.py): "all" serves everything from one process; "writer" owns the
+# database and publishes a read snapshot every SNAPSHOT_INTERVAL_S; "reader" serves reads
+# from the newest snapshot and forwards writes and live routes to WRITER_URL, as well as
+# every read once its snapshot is older than SNAPSHOT_MAX_AGE_S
+ROLE = os.getenv("ROLE", "all")
+if ROLE not in ("all", "writer", "reader"):
+    raise SystemExit(f"ROLE must be all, writer or reader, not {ROLE!r}")
+READER = ROLE == "reader"
+WRITER_URL = os.getenv("WRITER_URL", "http://127.0.0.1:8001")
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR") or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "snapshots")
+SNAPSHOT_INTERVAL_S = float(os.getenv("SNAPSHOT_INTERVAL_S", "5"))
+# Longest share of the writer's time spent copying: a copy slower than the interval allows
+# stretches the interval instead (see snapshots.py and /snapshot/stats)
+SNAPSHOT_MAX_DUTY = float(os.getenv("SNAPSHOT_MAX_DUTY", "0.25"))
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))
+SNAPSHOT_POLL_S = float(os.getenv("SNAPSHOT_POLL_S", "1"))
+SNAPSHOT_MAX_AGE_S = float(os.getenv("SNAPSHOT_MAX_AGE_S", "60"))
+SNAPSHOT_WAIT_S = float(os.getenv("SNAPSHOT_WAIT_S", "300"))
+READER_MEMORY_LIMIT = os.getenv("READER_MEMORY_LIMIT")     # DuckDB memory_limit per reader, e.g. 1GB
+
+# WAL replay on restart is bounded by CHECKPOINT_WAL_MAX (DuckDB checkpoints at that WAL size)
+# and by a CHECKPOINT every CHECKPOINT_INTERVAL_S (0 = only the size bound) and on shutdown
+CHECKPOINT_INTERVAL_S = float(os.getenv("CHECKPOINT_INTERVAL_S", "60"))
+CHECKPOINT_WAL_MAX = os.getenv("CHECKPOINT_WAL_MAX", "16MB")
+CHECKPOINT_SHUTDOWN_WAIT_S = float(os.getenv("CHECKPOINT_SHUTDOWN_WAIT_S", "10"))
+
+# Background warm-up once the server listens: sklearn, the RCA DAG, the window query path and
+# the models of the WARMUP_MODELS most recently seen devices (WARMUP=0 leaves it all to first
+# use). /health/ready reports 503 until it is done unless READY_AFTER_WARMUP=0.
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_MODELS = int(os.getenv("WARMUP_MODELS", "16"))
+READY_AFTER_WARMUP = os.getenv("READY_AFTER_WARMUP", "1") == "1"
+
 # ---------- DB setup ----------
-con = duckdb.connect(DB_PATH)
-
-# Canonical 11-column schema (includes inlet_temp_c, vcore_v)
-con.execute("""
-CREATE TABLE IF NOT EXISTS telemetry (
-    ts TIMESTAMP,
-    device_id VARCHAR,
-    inlet_temp_c DOUBLE,
-    fan_rpm INTEGER,
-    temp_c DOUBLE,
-    vcore_v DOUBLE,
-    cpu_pct DOUBLE,
-    mem_pct DOUBLE,
-    disk_errors INTEGER,
-    nic_drops INTEGER,
-    latency_ms DOUBLE
-)
-""")
-
-con.execute("""
-CREATE TABLE IF NOT EXISTS actions (
-    ts TIMESTAMP,
-    device_id VARCHAR,
-    action VARCHAR,
-    params VARCHAR
-)
-""")
+if READER:
+    con = SnapshotReader(SNAPSHOT_DIR, poll_s=SNAPSHOT_POLL_S,
+                         config={"memory_limit": READER_MEMORY_LIMIT} if READER_MEMORY_LIMIT else None)
+    con.wait(SNAPSHOT_WAIT_S)
+else:
+    con = duckdb.connect(DB_PATH, config={"checkpoint_threshold": CHECKPOINT_WAL_MAX})
+
+    # Canonical 11-column schema (includes inlet_temp_c, vcore_v)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS telemetry (
+        ts TIMESTAMP,
+        device_id VARCHAR,
+        inlet_temp_c DOUBLE,
+        fan_rpm INTEGER,
+        temp_c DOUBLE,
+        vcore_v DOUBLE,
+        cpu_pct DOUBLE,
+        mem_pct DOUBLE,
+        disk_errors INTEGER,
+        nic_drops INTEGER,
+        latency_ms DOUBLE
+    )
+    """)
+
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS actions (
+        ts TIMESTAMP,
+        device_id VARCHAR,
+        action VARCHAR,
+        params VARCHAR
+    )
+    """)
+startup.mark("db_open")
+
+# Readers keep no hot cache (latest/last are served by the writer) and own no queues
+device_reg = DeviceRegistry(con, read_only=READER)
+hot = HotCache(capacity=0 if READER else HOTCACHE_ROWS, max_devices=HOTCACHE_DEVICES)
+detector = StreamingDetector(max_anomalies=STREAM_ANOMALIES_PER_DEVICE)
+rollups = Rollups(con, flush_s=ROLLUP_FLUSH_S, read_only=READER) if ROLLUPS else None
+feed = Feed(capacity=FEED_ROWS, max_devices=FEED_DEVICES)
+action_q = ingest_q = None
+if not READER:
+    action_q = ActionQueue(con)
+    ingest_q = IngestQueue(con, max_rows=INGEST_MAX_ROWS, batch_rows=INGEST_BATCH_ROWS,
+                           max_age_s=INGEST_MAX_AGE_MS / 1000.0)
+    ingest_q.in_transaction(device_reg.fold)
+    ingest_q.subscribe(hot.append)
+    ingest_q.subscribe(detector.append)
+    if rollups is not None:
+        ingest_q.subscribe(rollups.append)
+    # Last, so a woken /stream subscriber already finds the batch's anomalies in the detector
+    ingest_q.subscribe(feed.append)
+
+checkpoints = Checkpointer(con, DB_PATH + ".wal", interval_s=CHECKPOINT_INTERVAL_S) if not READER else None
+
+mqtt = None
+if MQTT_HOST and not READER:
+    from mqtt_bridge import MqttBridge
+    mqtt = MqttBridge(ingest_q, MQTT_HOST, MQTT_PORT, topic=MQTT_TOPIC, action_prefix=MQTT_ACTION_PREFIX,
+                      batch_rows=MQTT_BATCH_ROWS, flush_s=MQTT_FLUSH_MS / 1000.0,
+                      username=os.getenv("MQTT_USERNAME"), password=os.getenv("MQTT_PASSWORD"))
+    action_q.subscribe(mqtt.publish_action)
+
+# ---------- Instrumentation ----------
+registry.histogram("db_query_seconds", "DuckDB query execution time by call site", ("site",), subsystem="db")
+
+def query(site, sql, params=None):
+    """Execute sql on its own cursor, timed into db_query_seconds{site}; returns the cursor."""
+    cur = con.cursor()
+    with registry.timer("db_query_seconds", (site,)):
+        cur.execute(sql, params)
+    return cur
+
+def _file_bytes(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+registry.collect("db_file_bytes", "Size of the DuckDB database file", lambda: _file_bytes(DB_PATH))
+registry.collect("db_wal_bytes", "Size of the DuckDB write-ahead log", lambda: _file_bytes(DB_PATH + ".wal") or 0)
+if checkpoints is not None:
+    registry.collect("db_checkpoints_total", "Scheduled and shutdown CHECKPOINTs run",
+                     lambda: checkpoints.checkpoints, kind="counter", subsystem="db")
+    registry.collect("db_checkpoints_skipped_total", "CHECKPOINT rounds skipped (results streaming or a write open)",
+                     lambda: checkpoints.skipped, kind="counter", subsystem="db")
+registry.collect("startup_seconds", "Seconds from process start to each startup phase",
+                 lambda: {(phase,): s for phase, s in startup.phases.items()}, labelnames=("phase",), subsystem="http")
+if ingest_q is not None:
+    registry.collect("ingest_queue_rows", "Rows accepted but not yet committed", lambda: ingest_q.depth(), subsystem="ingest")
+    registry.collect("ingest_rejected_rows_total", "Rows refused with 429 (queue full)",
+                     lambda: ingest_q.rejected_rows, kind="counter", subsystem="ingest")
+    registry.collect("ingest_duplicate_rows_total", "Rows of replayed batches acknowledged without insert",
+                     lambda: ingest_q.duplicate_rows, kind="counter", subsystem="ingest")
+    registry.collect("ingest_failed_rows_total", "Rows dropped by a failed commit",
+                     lambda: ingest_q.failed_rows, kind="counter", subsystem="ingest")
+
+def load_baseline(device_id):
+    """Trailing baseline the device's IsolationForest is fitted on."""
+    return query(
+        "baseline",
+        "SELECT * FROM telemetry WHERE device_id = ? ORDER BY ts DESC LIMIT ?",
+        [device_id, MODEL_BASELINE_ROWS],
+    ).df()
+
+models = ModelRegistry(load_baseline, max_models=MODEL_MAX, ttl_s=MODEL_TTL_S,
+                       refresh_s=MODEL_REFRESH_S, model_dir=MODEL_DIR)
+
+fleet = FleetSweeper(workers=FLEET_WORKERS or None)
+overview = FleetOverview(query, detector.flagged_counts, rollups=rollups is not None, ttl_s=FLEET_SUMMARY_TTL_S)
+
+tiers = TierManager(con, TIER_DIR, hot_hours=TIER_HOT_HOURS, cold_days=TIER_COLD_DAYS,
+                    compact_files=TIER_COMPACT_FILES, read_only=READER,
+                    multiprocess=ROLE == "writer") if TIERING else None
+
+# Slices past the tiering horizon are about to move to Parquet: not worth sorting
+clusterer = Clusterer(con, slice_s=CLUSTER_SLICE_S, settle_s=CLUSTER_SETTLE_S,
+                      floor=(lambda: dt.utcnow() - timedelta(hours=TIER_HOT_HOURS)) if tiers is not None else None
+                      ) if CLUSTER and not READER else None
+
+snapshots = None
+if ROLE == "writer":
+    snapshots = Snapshotter(con, SNAPSHOT_DIR, interval_s=SNAPSHOT_INTERVAL_S, keep=SNAPSHOT_KEEP,
+                            guard=tiers.stable if tiers is not None else None, max_duty=SNAPSHOT_MAX_DUTY)
+elif READER and tiers is not None:
+    con.on_refresh(tiers.reload)
+if snapshots is not None or READER:
+    registry.collect("snapshot_age_seconds", "Age of the newest published (writer) or opened (reader) snapshot",
+                     lambda: (snapshots or con).stats()["age_s"])
+startup.mark("components")
+
+WINDOW_SQL = """
+    SELECT *
+    FROM telemetry
+    WHERE device_id = ?
+      AND ts BETWEEN CAST(? AS TIMESTAMP) AND CAST(? AS TIMESTAMP)
+    ORDER BY ts ASC
+"""
+
+def read_window(device_id, start, end):
+    """One device's rows in [start, end] (ascending), from the hot table and cold Parquet."""
+    if tiers is not None:
+        with registry.timer("db_query_seconds", ("window",)):
+            return tiers.window(device_id, start, end)
+    return query("window", WINDOW_SQL, [device_id, start, end]).df()
+
+def read_last(device_id, limit):
+    """
+    One device's newest `limit` rows (ascending) from both tiers: a device silent for longer
+    than TIER_HOT_HOURS still gets its newest rows, from cold Parquet.
+    """
+    with registry.timer("db_query_seconds", ("last",)):
+        return tiers.last(device_id, limit)
+
+def response_format(request, format):
+    try:
+        return encoding.negotiate(request.headers.get("accept"), format)
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+def pin_result():
+    """Hold scheduled checkpoints off while a result is streamed; returns the release function."""
+    return checkpoints.pin() if checkpoints is not None else (lambda: None)
+
+def stream_query(fmt, sql, params, cursor=None, site="stream"):
+    """Run sql on its own cursor and stream the result in `fmt` without materialising it."""
+    unpin = pin_result()
+    cur = con.cursor()
+    try:
+        with registry.timer("db_query_seconds", (site,)):
+            cur.execute(sql, params)
+    except Exception:
+        cur.close()
+        unpin()
+        raise
+    if cursor is None:
+        return encoding.stream(cur, fmt, on_close=unpin)
+    return encoding.stream(cur, fmt, on_close=unpin, extra={"cursor": cursor}, headers={CURSOR_HEADER: cursor})
+
+def stream_window(fmt, device_id, start, end):
+    """read_window, streamed: both tiers stay readable until the last batch is sent."""
+    if tiers is None:
+        return stream_query(fmt, WINDOW_SQL, [device_id, start, end], site="window")
+    unpin = pin_result()
+    cur = con.cursor()
+    try:
+        with registry.timer("db_query_seconds", ("window",)):
+            release = tiers.execute(cur, device_id, start, end)
+    except Exception:
+        cur.close()
+        unpin()
+        raise
+
+    def close():
+        release()
+        unpin()
+    return encoding.stream(cur, fmt, on_close=close)
+
+CURSOR_HEADER = "X-Telemetry-Cursor"
+
+def newest_us(df):
+    """Newest ts of a result in µs since epoch (0 when there is none)."""
+    ts = df["ts"].dropna() if df is not None and not df.empty else ()
+    return to_ns(ts.max()) // 1000 if len(ts) else 0
+
+def respond_with_cursor(df, cursor, fmt):
+    """The rows plus the cursor to pass back as ?since= (JSON member and response header)."""
+    return encoding.respond(df, fmt, extra={"cursor": cursor}, headers={CURSOR_HEADER: cursor})
+
+def read_since(device_id, since, limit):
+    """
+    (rows of the device committed after cursor `since`, next cursor). Served from the feed;
+    after a restart or once the client fell behind the feed, rows newer than the cursor's
+    ts watermark are read from DuckDB instead (late rows below the watermark are missed then).
+    """
+    try:
+        ts_us = parse_cursor(since)[2]
+        got = feed.since(device_id, since, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"malformed since cursor {since!r}")
+    if got is not None:
+        return got
+    head = feed.seq    # taken before the read: rows committed meanwhile repeat, never go missing
+    df = query(
+        "since",
+        """
+        SELECT *
+        FROM (
+            SELECT *
+            FROM telemetry
+            WHERE device_id = ?
+              AND ts > make_timestamp(?::BIGINT)
+            ORDER BY ts DESC
+            LIMIT ?
+        )
+        ORDER BY ts ASC
+        """,
+        [device_id, ts_us, limit],
+    ).df()
+    return df, make_cursor(feed.epoch, head, max(ts_us, newest_us(df)))
+
+def detect(device_id, df):
+    """find_anomalies with precomputed z-scores and the device's cached model when available."""
+    model = models.get(device_id) if (MODEL_REGISTRY and not df.empty) else None
+    return find_anomalies(df, zscore=detector.zscore_anomalies(device_id, df), model=model)
+
+def hot_read(device_id, read):
+    """
+    Serve a read from the device's ring buffer, seeding it from DuckDB on first use.
+    Returns None when the cache is disabled or the request reaches past the buffer.
+    """
+    if not hot.enabled:
+        return None
+    if not hot.seeded(device_id):
+        # Seed under the write lock so no batch is committed between the query and the seed
+        with ingest_q.write_lock:
+            if not hot.seeded(device_id):
+                seed = query(
+                    "hot_seed",
+                    "SELECT * FROM telemetry WHERE device_id = ? ORDER BY ts DESC LIMIT ?",
+                    [device_id, hot.capacity],
+                ).df()
+                hot.seed(device_id, seed, floor=tiers.hot_floor() if tiers is not None else None)
+    return read()
+
+# ---------- Closed-loop remediation ----------
+def policy_evaluate(device_id):
+    """/detect_latest's analysis of a device the detector just flagged: (anomalies, rca)."""
+    now = dt.utcnow()
+    start = (now - timedelta(minutes=POLICY_WINDOW_MIN)).isoformat() + "Z"
+    df = hot_read(device_id, lambda: hot.window(device_id, start, now))
+    if df is None:
+        df = read_window(device_id, start, now.isoformat() + "Z")
+    anomalies = detect(device_id, df)
+    return anomalies, rank_root_causes(df, anomalies)
+
+policy = None
+if POLICY != "off" and not READER:
+    policy = PolicyEngine(con, load_rules(POLICY_RULES), policy_evaluate, action_q.enqueue,
+                          dry_run=POLICY == "dry_run")
+    detector.subscribe(policy.on_anomalies)
+    action_q.subscribe_acks(policy.on_ack)
+
+# ---------- Warm-up ----------
+def warm_models():
+    """Load (MODEL_DIR) or schedule fits of the models of the most recently seen devices."""
+    recent = query("warmup", "SELECT device_id FROM devices ORDER BY last_seen DESC LIMIT ?",
+                   [WARMUP_MODELS]).fetchall()
+    for (device_id,) in recent:
+        models.get(device_id)
+
+def warmup_steps():
+    """What the first /rca, /anomaly/window or /window would otherwise load, in that order."""
+    steps = [
+        ("sklearn", lambda: importlib.import_module("sklearn.ensemble")),
+        ("rca_dag", _get_graph),
+        ("window_query", lambda: read_window("", "1970-01-01", "1970-01-01")),
+    ]
+    if MODEL_REGISTRY and WARMUP_MODELS > 0:
+        steps.append(("models", warm_models))
+    return steps
 
 # ---------- FastAPI ----------
-app = FastAPI(title="Exotic Telemetry Agent API")
+@asynccontextmanager
+async def lifespan(app):
+    if READER:
+        con.start()
+    else:
+        ingest_q.start()
+    if snapshots is not None:
+        snapshots.start()
+    if MODEL_REGISTRY:
+        models.start()
+    if tiers is not None and not READER:
+        tiers.start(TIER_INTERVAL_S)
+    if clusterer is not None:
+        clusterer.start(CLUSTER_INTERVAL_S)
+    if rollups is not None and not READER:
+        rollups.start()
+    if mqtt is not None:
+        mqtt.start()
+    if policy is not None:
+        policy.start()
+    if checkpoints is not None and CHECKPOINT_INTERVAL_S > 0:
+        checkpoints.start()
+    startup.mark("serving")
+    startup.warm_up(warmup_steps() if WARMUP else [])
+    yield
+    if mqtt is not None:
+        mqtt.stop()
+    if policy is not None:
+        policy.stop()
+    if clusterer is not None:
+        clusterer.stop()
+    if tiers is not None:
+        tiers.stop()
+    fleet.shutdown()
+    models.stop()
+    if snapshots is not None:
+        snapshots.stop()
+    if READER:
+        con.stop()
+    else:
+        ingest_q.stop()
+    if rollups is not None:
+        rollups.stop()
+    # Last, once nothing writes any more: the next start has no WAL to replay
+    if checkpoints is not None:
+        checkpoints.stop(CHECKPOINT_SHUTDOWN_WAIT_S)
+
+# Reader role: served by the writer (writes, in-memory state: hot cache, feed, action queue)
+WRITER_ROUTES = ("/ingest", "/remediate", "/actions/", "/policy/", "/fleet/", "/stream", "/latest", "/last",
+                 "/cache/stats", "/tiering/stats", "/cluster/stats", "/rollup/stats", "/checkpoint/stats")
+LOCAL_ROUTES = ("/health", "/health/live", "/health/ready", "/startup/stats", "/metrics", "/snapshot/stats")
+
+def forward_to_writer(scope):
+    path = scope["path"]
+    if path in LOCAL_ROUTES:
+        return False
+    if path.startswith(WRITER_ROUTES):
+        return True
+    age = con.age_s()
+    return age is None or age > SNAPSHOT_MAX_AGE_S
+
+def snapshot_age_header():
+    return [(b"x-snapshot-age", b"%.3f" % (con.age_s() or 0.0))]
+
+app = FastAPI(title="Exotic Telemetry Agent API", lifespan=lifespan)
+if READER:
+    app.add_middleware(Forwarder, target=WRITER_URL, match=forward_to_writer, headers=snapshot_age_header)
+app.add_middleware(MetricsMiddleware, registry=registry)
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "role": ROLE}
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness: the event loop answers. No dependency checks, so a slow query never gets the pod restarted."""
+    return {"status": "ok", "role": ROLE}
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: serving and (READY_AFTER_WARMUP) warmed up; 503 with the warm-up steps until then."""
+    ready = "serving" in startup.phases and (startup.warm() or not READY_AFTER_WARMUP)
+    body = {"status": "ready" if ready else "starting", "role": ROLE, "warm": startup.warm(),
+            "steps": startup.steps}
+    if not ready:
+        return JSONResponse(body, status_code=503)
+    return body
+
+@app.get("/startup/stats")
+def startup_stats():
+    """Seconds from process start to imported, db_open, components, serving and warm; warm-up steps."""
+    return dict(startup.stats(), role=ROLE)
 
-# ---------- Ingest (hardened: guarantees non-null UTC timestamps) ----------
+@app.get("/checkpoint/stats")
+def checkpoint_stats():
+    """Scheduled checkpoints: WAL size now, runs, skipped rounds and the last one's duration."""
+    return checkpoints.stats() if checkpoints is not None else {"enabled": False}
+
+@app.get("/snapshot/stats")
+def snapshot_stats():
+    """
+    Writer: snapshots published, copy time and size, and the interval in effect (stretched
+    when copies take longer than SNAPSHOT_MAX_DUTY allows). Reader: open snapshot and its age.
+    """
+    if READER:
+        return dict(con.stats(), writer=WRITER_URL, max_age_s=SNAPSHOT_MAX_AGE_S)
+    return snapshots.stats() if snapshots is not None else {"enabled": False}
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of the enabled subsystems (METRICS)."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+# ---------- Ingest (write-behind; writer guarantees non-null UTC timestamps) ----------
 @app.post("/ingest")
-async def ingest(request: Request):
+async def ingest(request: Request, wait: bool = False, source: str = None, batch: int = None):
     """
-    Accept single event or list of events; insert by named columns.
-    If timestamp is missing/invalid, set to current UTC so time windows work.
+    Accept single event or list of events and enqueue them for the background writer.
+    Returns as soon as the events are queued; with ?wait=true returns only after the
+    batch holding them is committed. Responds 429 when the queue is full.
+
+    A commit that fails on the events themselves (a value that does not convert) is a 400;
+    any other commit failure is a 503 and the same request can be retried.
+
+    Bodies may be gzip-compressed (Content-Encoding: gzip). Retrying producers pass
+    ?source=&batch= (batch numbers increasing per source): a batch already committed is
+    acknowledged with "duplicate": true and not inserted again; a resend of one still queued
+    gets a 409 to retry later, since its commit may yet fail. X-Spool-Depth and
+    X-Upload-Lag headers are kept per source for /ingest/sources.
     """
-    payload = await request.json()
+    body = await request.body()
+    if "gzip" in request.headers.get("content-encoding", "").lower():
+        try:
+            body = gzip.decompress(body)
+        except (OSError, EOFError) as e:
+            raise HTTPException(status_code=400, detail=f"bad gzip body: {e}")
+    try:
+        payload = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"invalid JSON: {e}")
     events = payload if isinstance(payload, list) else [payload]
+    if not all(isinstance(e, dict) for e in events):
+        raise HTTPException(status_code=400, detail="events must be JSON objects")
+    if (source is None) != (batch is None):
+        raise HTTPException(status_code=400, detail="source and batch go together")
+    if source is not None and "x-spool-depth" in request.headers:
+        try:
+            ingest_q.report(source, spool_rows=int(request.headers["x-spool-depth"]),
+                            upload_lag_s=float(request.headers.get("x-upload-lag", "0")))
+        except ValueError:
+            pass
 
-    df = pd.DataFrame(events)
+    # Stamp missing timestamps with receipt time (invalid ones are coerced at flush)
+    now_iso = dt.utcnow().isoformat() + "Z"
+    for e in events:
+        if e.get("ts") is None:
+            e["ts"] = now_iso
 
-    # Parse/normalize timestamp; coerce invalid to NaT
-    if "ts" in df.columns:
-        df["ts"] = pd.to_datetime(df["ts"], errors="coerce", utc=True)
-    else:
-        df["ts"] = pd.NaT
+    try:
+        fut = ingest_q.submit(events, durable=wait, mark=(source, batch) if source is not None else None)
+    except Duplicate:
+        return {"ingested": 0, "duplicate": True}
+    except Pending as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
 
-    # Fill NaT timestamps with current UTC
-    now_utc = pd.Timestamp.utcnow()
-    df["ts"] = df["ts"].fillna(now_utc)
+    if fut is None:
+        return {"ingested": len(events), "committed": False}
+    try:
+        await asyncio.wait_for(asyncio.wrap_future(fut), timeout=INGEST_WAIT_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="ingest queued but not committed in time")
+    except INGEST_REJECTED as e:
+        raise HTTPException(status_code=400, detail=f"ingest rejected: {e}")
+    except Exception as e:
+        # Transient (IO, transaction conflict, ...): the producer should resend the batch
+        raise HTTPException(status_code=503, detail=f"ingest failed: {e}", headers={"Retry-After": "1"})
+    return {"ingested": len(events), "committed": True}
 
-    # Ensure required columns exist (backfill missing ones with None)
-    required = [
-        "ts","device_id","inlet_temp_c","fan_rpm","temp_c","vcore_v",
-        "cpu_pct","mem_pct","disk_errors","nic_drops","latency_ms"
-    ]
-    for col in required:
-        if col not in df.columns:
-            df[col] = None
+@app.post("/ingest/bulk")
+async def ingest_bulk(request: Request, format: str = None, chunk_rows: int = bulk_ingest.DEFAULT_CHUNK_ROWS,
+                      source: str = None, batch: int = None):
+    """
+    Columnar bulk ingest of an Arrow IPC stream, NDJSON or Parquet body (Content-Type or
+    ?format=arrow|ndjson|parquet). The body is spooled to disk and committed in chunks of
+    chunk_rows, bypassing the queue; same timestamp/missing-column rules as /ingest, and
+    the same ?source=&batch= acknowledgement of an upload already accepted.
+    """
+    try:
+        fmt = bulk_ingest.detect_format(request.headers.get("content-type"), format)
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    if (source is None) != (batch is None):
+        raise HTTPException(status_code=400, detail="source and batch go together")
+    suffix = {"arrow": ".arrows", "ndjson": ".ndjson", "parquet": ".parquet"}[fmt]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        async for part in request.stream():
+            tmp.write(part)
+        tmp.flush()
+        try:
+            rows = await run_in_threadpool(bulk_ingest.load, con, ingest_q, tmp.name, fmt, max(1, chunk_rows),
+                                           (source, batch) if source is not None else None)
+        except Duplicate:
+            return {"ingested": 0, "duplicate": True, "format": fmt}
+        except Pending as e:
+            raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+        except Exception as e:
+            raise HTTPException(status_code=400, detail={
+                "error": f"bulk ingest failed: {e}", "ingested": getattr(e, "committed", 0)})
+    return {"ingested": rows, "format": fmt, "committed": True}
 
-    before = con.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0]
-    con.execute("""
-        INSERT INTO telemetry
-        (ts, device_id, inlet_temp_c, fan_rpm, temp_c, vcore_v,
-         cpu_pct, mem_pct, disk_errors, nic_drops, latency_ms)
-        SELECT ts, device_id, inlet_temp_c, fan_rpm, temp_c, vcore_v,
-               cpu_pct, mem_pct, disk_errors, nic_drops, latency_ms
-        FROM df
-    """)
-    after = con.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0]
-    print(f"[INGEST] inserted={after - before}  total={after}")
+@app.get("/ingest/sources")
+def ingest_sources():
+    """Retrying producers: last committed batch and self-reported spool depth / upload lag."""
+    return {"sources": ingest_q.sources}
+
+@app.get("/ingest/mqtt")
+def ingest_mqtt():
+    """MQTT bridge: connection, messages, committed/invalid rows and batch commit latency."""
+    return mqtt.stats() if mqtt is not None else {"enabled": False}
+
+@app.get("/ingest/stats")
+def ingest_stats():
+    """Queue depth, throughput counters and recent flush latency of the ingest writer."""
+    return ingest_q.stats()
+
+@app.get("/anomaly/stats")
+def anomaly_stats():
+    """Streaming detector counters: samples scored, anomalies stored, served vs recomputed."""
+    return detector.stats()
+
+@app.get("/models/stats")
+def models_stats():
+    """IsolationForest registry: cached models, hits/misses, fits and evictions."""
+    return models.stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hot-data cache size and hit/miss counters."""
+    return hot.stats()
 
-    return {"ingested": len(df)}
+@app.get("/tiering/stats")
+def tiering_stats():
+    """Hot/cold tiering: current cutoff, cold partitions, moved rows, compactions."""
+    return tiers.stats() if tiers is not None else {"enabled": False}
+
+@app.get("/cluster/stats")
+def cluster_stats():
+    """Clustering of the hot table: watermark, slices and rows rewritten, conflicts."""
+    return clusterer.stats() if clusterer is not None else {"enabled": False}
 
 # ---------- Basic queries ----------
 @app.get("/devices")
-def devices():
-    rows = con.execute("SELECT DISTINCT device_id FROM telemetry ORDER BY device_id").fetchall()
-    return {"devices": [r[0] for r in rows]}
+def devices(detail: bool = False):
+    """Known devices from the registry (plus cold-only ones); ?detail=true adds first/last seen, rows, source."""
+    if detail:
+        df = device_reg.list()
+        return {"devices": json.loads(df.to_json(orient="records", date_format="iso"))}
+    rows = query("devices", "SELECT device_id FROM devices ORDER BY device_id").fetchall()
+    names = {r[0] for r in rows} | (tiers.devices() if tiers is not None else set())
+    return {"devices": sorted(names, key=lambda d: (d is None, d))}
 
 class WindowReq(BaseModel):
     device_id: str
@@ -107,24 +728,85 @@ class WindowReq(BaseModel):
     end: str     # ISO string
 
 @app.post("/window")
-def window(req: WindowReq):
-    df = con.execute(
-        """
-        SELECT *
-        FROM telemetry
-        WHERE device_id = ?
-          AND ts BETWEEN CAST(? AS TIMESTAMP) AND CAST(? AS TIMESTAMP)
-        ORDER BY ts ASC
-        """,
-        [req.device_id, req.start, req.end],
-    ).df()
-    return {"rows": json.loads(df.to_json(orient="records", date_format="iso"))}
+def window(req: WindowReq, request: Request, format: str = None):
+    """
+    Rows of one device in [start, end], streamed straight from DuckDB in the negotiated
+    format (?format=json|columnar|arrow|csv or Accept); memory stays flat for any size.
+    """
+    return stream_window(response_format(request, format), req.device_id, req.start, req.end)
+
+@app.get("/rollup")
+def rollup(device_id: str, start: str, end: str, points: int = 1000, resolution: str = None):
+    """
+    Downsampled buckets (min/max/mean/count/last per gauge, counter sums) for one device.
+    Picks the finest of 1s/1m/1h that fits in `points` buckets unless `resolution` is given;
+    1s buckets are aggregated from raw rows, 1m/1h come from the maintained rollups.
+    """
+    if rollups is None:
+        raise HTTPException(status_code=404, detail="rollups are disabled (ROLLUPS=0)")
+    level = resolution or pick_level(start, end, max(1, points))
+    if level not in dict(LEVELS):
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {[n for n, _ in LEVELS]}")
+    raw = read_window(device_id, start, end) if level == LEVELS[0][0] else None
+    df = rollups.query(device_id, start, end, level, raw=raw)
+    return {"device_id": device_id, "resolution": level,
+            "rows": json.loads(df.to_json(orient="records", date_format="iso"))}
+
+@app.get("/downsample")
+def downsample_window(request: Request, device_id: str, start: str = None, end: str = None, minutes: int = 10,
+                      points: int = 1000, method: str = "lttb", metrics: str = None, format: str = None):
+    """
+    One device's series over [start, end] (default: the last `minutes`) reduced to about
+    `points` points per metric for a chart: method=lttb keeps the line's shape, minmax each
+    bucket's extremes. Returns real samples (rows picked for any of `metrics`, comma-separated);
+    windows beyond DOWNSAMPLE_RAW_MAX raw rows are reduced from the rollup means instead.
+    """
+    fmt = response_format(request, format)
+    if method not in downsample.METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {list(downsample.METHODS)}")
+    names = [m.strip() for m in metrics.split(",") if m.strip()] if metrics else downsample.CHART_METRICS
+    unknown = sorted(set(names) - set(GAUGES))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown metrics {unknown}; choose from {GAUGES}")
+    points = min(max(int(points), 3), 100000)
+    try:
+        start, end = downsample.window_bounds(start, end, minutes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"bad start/end: {e}")
+    level = pick_level(start, end, DOWNSAMPLE_RAW_MAX) if rollups is not None else LEVELS[0][0]
+    if level == LEVELS[0][0]:
+        df = read_window(device_id, start, end)
+    else:
+        df = downsample.from_rollup(rollups.query(device_id, start, end, level), names)
+    out, rows_in = downsample.downsample(df, points, method, names)
+    return encoding.respond(out, fmt, extra={"device_id": device_id, "method": method,
+                                             "source": "raw" if level == LEVELS[0][0] else level,
+                                             "rows_in": rows_in, "points": points})
+
+@app.get("/rollup/stats")
+def rollup_stats():
+    """Rows held per rollup level, pending (unfolded) rows and fold latency."""
+    return rollups.stats() if rollups is not None else {"enabled": False}
 
 # ---------- Time-based latest window (server clock) ----------
 @app.get("/latest")
-def latest(device_id: str, minutes: int = 10, limit: int = 5000):
-    start = (dt.utcnow() - timedelta(minutes=int(minutes))).isoformat() + "Z"
-    df = con.execute(
+def latest(request: Request, device_id: str, minutes: int = 10, limit: int = 5000, format: str = None,
+           since: str = None):
+    """
+    Rows of the last `minutes` (server clock). Every response carries a cursor; pass it back
+    as ?since= to get only the rows committed after it.
+    """
+    fmt = response_format(request, format)
+    if since:
+        return respond_with_cursor(*read_since(device_id, since, limit), fmt)
+    head = feed.seq
+    now = dt.utcnow()
+    start = (now - timedelta(minutes=int(minutes))).isoformat() + "Z"
+    df = hot_read(device_id, lambda: hot.window(device_id, start, now, limit=limit))
+    if df is not None:
+        return respond_with_cursor(df, make_cursor(feed.epoch, head, newest_us(df)), fmt)
+    return stream_query(
+        fmt,
         """
         SELECT *
         FROM telemetry
@@ -134,56 +816,148 @@ def latest(device_id: str, minutes: int = 10, limit: int = 5000):
         LIMIT ?
         """,
         [device_id, start, limit],
-    ).df()
-    return {"rows": json.loads(df.to_json(orient="records", date_format="iso"))}
+        cursor=make_cursor(feed.epoch, head, 0),
+        site="latest",
+    )
 
 # ---------- Time-agnostic recent rows (ignores clock; great for charts) ----------
 @app.get("/latest_recent")
-def latest_recent(device_id: str, limit: int = 1000):
-    df = con.execute(
+def latest_recent(request: Request, device_id: str, limit: int = 1000, format: str = None, since: str = None):
+    """The device's newest `limit` rows; with ?since=<cursor> only the ones committed after it."""
+    fmt = response_format(request, format)
+    if since:
+        return respond_with_cursor(*read_since(device_id, since, limit), fmt)
+    head = feed.seq
+    df = hot_read(device_id, lambda: hot.last(device_id, limit))
+    if df is None and tiers is not None:
+        df = read_last(device_id, limit)
+    if df is not None:
+        return respond_with_cursor(df, make_cursor(feed.epoch, head, newest_us(df)), fmt)
+    return stream_query(
+        fmt,
         """
         SELECT *
-        FROM telemetry
-        WHERE device_id = ?
-        ORDER BY ts DESC
-        LIMIT ?
+        FROM (
+            SELECT *
+            FROM telemetry
+            WHERE device_id = ?
+            ORDER BY ts DESC
+            LIMIT ?
+        )
+        ORDER BY ts ASC
         """,
         [device_id, limit],
-    ).df()
-    df = df.sort_values("ts")
-    return {"rows": json.loads(df.to_json(orient="records", date_format="iso"))}
+        cursor=make_cursor(feed.epoch, head, 0),
+        site="latest_recent",
+    )
+
+# ---------- Push stream (server-sent events) ----------
+def sse(event, data, id=None):
+    head = f"id: {id}\n" if id is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n".encode()
+
+@app.get("/stream")
+async def stream_device(request: Request, device_id: str, since: str = None):
+    """
+    Server-sent events for one device, pushed as soon as a batch is committed:
+    "telemetry" (the new rows and the cursor after them, which is also the event id) and
+    "anomaly" (z-score anomalies flagged among those rows). Starts at ?since= or the
+    Last-Event-ID header, else at the current position.
+    """
+    since = since or request.headers.get("last-event-id") or feed.position()
+    try:
+        parse_cursor(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"malformed since cursor {since!r}")
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+
+    async def events():
+        cursor = since
+        feed.watch(device_id, loop, wake)
+        try:
+            while True:
+                wake.clear()
+                df, cursor = await run_in_threadpool(read_since, device_id, cursor, FEED_ROWS)
+                if not df.empty:
+                    rows = b"".join(encoding.encode(df, "json", extra={"cursor": cursor})).decode()
+                    yield sse("telemetry", rows, id=cursor)
+                    flagged = detector.flagged_at(device_id, _ts_ns(df["ts"]))
+                    if flagged:
+                        yield sse("anomaly", json.dumps({"device_id": device_id, "anomalies": [
+                            {"ts": pd.Timestamp(t).isoformat(), "metric": m, "score": score, "type": "zscore"}
+                            for t, m, score in flagged]}))
+                try:
+                    await asyncio.wait_for(wake.wait(), STREAM_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            feed.unwatch(device_id, loop, wake)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/stream/stats")
+def stream_stats():
+    """Feed position, retained devices, open /stream subscribers and since= hit/fallback counts."""
+    return feed.stats()
 
 # ---------- Quick debug helpers ----------
 @app.get("/rowcount")
 def rowcount():
-    total = con.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0]
+    total = query("rowcount", "SELECT COUNT(*) FROM telemetry").fetchone()[0]
     return {"rows": int(total)}
 
 @app.get("/stats")
 def stats(minutes: int = 60):
+    """
+    Rows per device over the last N minutes, for devices the registry saw in that window.
+    With rollups, whole minutes come from rollup_1m (lagging ingest by about ROLLUP_FLUSH_S)
+    and only the partial first minute is counted from raw rows.
+    """
     start = (dt.utcnow() - timedelta(minutes=int(minutes))).isoformat() + "Z"
-    df = con.execute(
+    if rollups is not None:
+        counts = """
+            SELECT device_id, rows FROM rollup_1m
+            WHERE bucket >= date_trunc('minute', CAST($1 AS TIMESTAMP)) + INTERVAL 1 MINUTE
+              AND bucket <= CURRENT_TIMESTAMP
+            UNION ALL
+            SELECT device_id, 1 FROM telemetry
+            WHERE ts >= CAST($1 AS TIMESTAMP)
+              AND ts < date_trunc('minute', CAST($1 AS TIMESTAMP)) + INTERVAL 1 MINUTE
         """
-        SELECT device_id, COUNT(*) AS rows
-        FROM telemetry
-        WHERE ts BETWEEN CAST(? AS TIMESTAMP) AND CURRENT_TIMESTAMP
+    else:
+        counts = "SELECT device_id, 1 AS rows FROM telemetry WHERE ts BETWEEN CAST($1 AS TIMESTAMP) AND CURRENT_TIMESTAMP"
+    df = query(
+        "stats",
+        f"""
+        SELECT c.device_id, sum(c.rows)::BIGINT AS rows, any_value(d.last_seen) AS last_seen,
+               any_value(d.source) AS source
+        FROM ({counts}) c
+        JOIN devices d ON d.device_id = c.device_id AND d.last_seen >= CAST($1 AS TIMESTAMP)
         GROUP BY 1
         ORDER BY 2 DESC
         """,
         [start],
     ).df()
-    return {"minutes": minutes, "devices": json.loads(df.to_json(orient="records"))}
+    return {"minutes": minutes, "devices": json.loads(df.to_json(orient="records", date_format="iso"))}
 
 @app.get("/stats_null")
 def stats_null():
     """Counts of NULL/non-NULL ts rows."""
-    nulls = con.execute("SELECT COUNT(*) FROM telemetry WHERE ts IS NULL").fetchone()[0]
-    not_nulls = con.execute("SELECT COUNT(*) FROM telemetry WHERE ts IS NOT NULL").fetchone()[0]
+    nulls, not_nulls = query("stats_null", "SELECT COUNT(*) - COUNT(ts), COUNT(ts) FROM telemetry").fetchone()
     return {"ts_null": int(nulls), "ts_not_null": int(not_nulls)}
 
 @app.get("/last")
-def last(device_id: str, limit: int = 10):
-    df = con.execute(
+def last(request: Request, device_id: str, limit: int = 10, format: str = None):
+    fmt = response_format(request, format)
+    df = hot_read(device_id, lambda: hot.last(device_id, limit))
+    if df is None and tiers is not None:
+        df = read_last(device_id, limit)
+    if df is not None:
+        return encoding.respond(df.iloc[::-1], fmt)
+    return stream_query(
+        fmt,
         """
         SELECT *
         FROM telemetry
@@ -192,38 +966,20 @@ def last(device_id: str, limit: int = 10):
         LIMIT ?
         """,
         [device_id, limit],
-    ).df()
-    return {"rows": json.loads(df.to_json(orient="records", date_format="iso"))}
+        site="last",
+    )
 
 # ---------- Anomaly + RCA ----------
 @app.post("/anomaly/window")
 def anomaly_window(req: WindowReq):
-    df = con.execute(
-        """
-        SELECT *
-        FROM telemetry
-        WHERE device_id = ?
-          AND ts BETWEEN CAST(? AS TIMESTAMP) AND CAST(? AS TIMESTAMP)
-        ORDER BY ts ASC
-        """,
-        [req.device_id, req.start, req.end],
-    ).df()
-    anomalies = find_anomalies(df)
+    df = read_window(req.device_id, req.start, req.end)
+    anomalies = detect(req.device_id, df)
     return {"anomalies": anomalies}
 
 @app.post("/rca")
 def rca(req: WindowReq):
-    df = con.execute(
-        """
-        SELECT *
-        FROM telemetry
-        WHERE device_id = ?
-          AND ts BETWEEN CAST(? AS TIMESTAMP) AND CAST(? AS TIMESTAMP)
-        ORDER BY ts ASC
-        """,
-        [req.device_id, req.start, req.end],
-    ).df()
-    anomalies = find_anomalies(df)
+    df = read_window(req.device_id, req.start, req.end)
+    anomalies = detect(req.device_id, df)
     result = rank_root_causes(df, anomalies)
     return result
 
@@ -233,18 +989,22 @@ def detect_latest(device_id: str, minutes: int = 10):
     Run anomaly + RCA over the last N minutes (server clock).
     """
     try:
-        start = (dt.utcnow() - timedelta(minutes=int(minutes))).isoformat() + "Z"
-        df = con.execute(
-            """
-            SELECT *
-            FROM telemetry
-            WHERE device_id = ?
-              AND ts BETWEEN CAST(? AS TIMESTAMP) AND CURRENT_TIMESTAMP
-            ORDER BY ts ASC
-            """,
-            [device_id, start],
-        ).df()
-        anomalies = find_anomalies(df)
+        now = dt.utcnow()
+        start = (now - timedelta(minutes=int(minutes))).isoformat() + "Z"
+        df = hot_read(device_id, lambda: hot.window(device_id, start, now))
+        if df is None:
+            df = query(
+                "detect_latest",
+                """
+                SELECT *
+                FROM telemetry
+                WHERE device_id = ?
+                  AND ts BETWEEN CAST(? AS TIMESTAMP) AND CURRENT_TIMESTAMP
+                ORDER BY ts ASC
+                """,
+                [device_id, start],
+            ).df()
+        anomalies = detect(device_id, df)
         result = rank_root_causes(df, anomalies)
         return {"anomalies": anomalies, "rca": result}
     except Exception as e:
@@ -252,6 +1012,59 @@ def detect_latest(device_id: str, minutes: int = 10):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"detect_latest failed: {e}")
 
+@app.get("/detect_fleet")
+def detect_fleet(minutes: int = 10, limit: int = 50, concurrency: int = 0,
+                 device_timeout_s: float = 10.0, timeout_s: float = 60.0):
+    """
+    Anomaly + RCA for every device over the last N minutes, ranked by severity (share of
+    samples flagged). One query pulls all devices; per-device work runs on worker processes.
+    Devices that time out or error are listed in "errors"; the rest are still returned.
+    """
+    start = (dt.utcnow() - timedelta(minutes=int(minutes))).isoformat() + "Z"
+    df = query(
+        "detect_fleet",
+        """
+        SELECT *
+        FROM telemetry
+        WHERE ts BETWEEN CAST(? AS TIMESTAMP) AND CURRENT_TIMESTAMP
+        ORDER BY device_id, ts ASC
+        """,
+        [start],
+    ).df()
+    jobs = []
+    for device_id, g in df.groupby("device_id", sort=False):
+        g = g.reset_index(drop=True)
+        entry = models.get(device_id) if MODEL_REGISTRY else None
+        jobs.append((device_id, g, detector.zscore_anomalies(device_id, g),
+                     entry.model if entry is not None else None))
+    results, errors = fleet.sweep(jobs, concurrency=concurrency or None,
+                                  device_timeout_s=device_timeout_s, timeout_s=timeout_s)
+    return {"minutes": minutes, "devices": len(jobs), "completed": len(results),
+            "ranked": results[:max(0, limit)], "errors": errors}
+
+@app.get("/fleet/summary")
+def fleet_summary(minutes: float = 10, points: int = 60, metrics: str = "temp_c,fan_rpm,cpu_pct",
+                  limit: int = 200, offset: int = 0, match: str = None):
+    """
+    Every device in one response: latest values, a `points`-step sparkline per metric (step
+    means over the last `minutes`) and the samples the detector flagged, anomalous devices
+    first. One aggregation query per FLEET_SUMMARY_TTL_S serves all callers; page with
+    limit/offset, filter device ids with `match` (substring).
+    """
+    names = [m.strip() for m in metrics.split(",") if m.strip()]
+    unknown = sorted(set(names) - set(GAUGES))
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"unknown metrics {unknown}; choose from {GAUGES}")
+    if minutes <= 0:
+        raise HTTPException(status_code=400, detail="minutes must be positive")
+    summary, cached = overview.summary(minutes, min(max(int(points), 2), 1000), names)
+    devices = summary["devices"]
+    if match:
+        devices = [d for d in devices if match in d["device_id"]]
+    page = devices[max(0, offset):max(0, offset) + max(0, limit)]
+    return dict(summary, devices=page, total=len(devices),
+                anomalous=sum(1 for d in devices if d["anomalies"]), cached=cached)
+
 # ---------- Remediation ----------
 class RemediationReq(BaseModel):
     device_id: str
@@ -265,25 +1078,24 @@ def remediate(req: RemediationReq):
     """
     try:
         params_json = json.dumps(req.params) if req.params is not None else "{}"
-        con.execute(
-            """
-            INSERT INTO actions (ts, device_id, action, params)
-            VALUES (CURRENT_TIMESTAMP, ?, ?, ?)
-            """,
-            [req.device_id, req.action, params_json],
-        )
-        row = con.execute(
-            """
-            SELECT ts, device_id, action, params
-            FROM actions
-            WHERE device_id = ?
-            ORDER BY ts DESC
-            LIMIT 1
-            """,
-            [req.device_id],
-        ).fetchone()
+        recorded = []
+
+        def record(cur, queued):
+            # Same transaction as the queue insert: an action is logged only if it is queued
+            recorded.append(cur.execute(
+                """
+                INSERT INTO actions (ts, device_id, action, params)
+                VALUES (CURRENT_TIMESTAMP, ?, ?, ?)
+                RETURNING ts, device_id, action, params
+                """,
+                [req.device_id, req.action, params_json],
+            ).fetchone())
+
+        with registry.timer("db_query_seconds", ("remediate",)):
+            queued = action_q.enqueue(req.device_id, req.action, req.params, record=record)
+        row = recorded[0]
         ts_iso = row[0].isoformat() + "Z" if hasattr(row[0], "isoformat") else str(row[0])
-        return {"ok": True, "ts": ts_iso, "device_id": row[1], "action": row[2],
+        return {"ok": True, "id": queued["id"], "ts": ts_iso, "device_id": row[1], "action": row[2],
                 "params": json.loads(row[3]) if row[3] else {}}
     except Exception as e:
         print("[/remediate ERROR]", e)
@@ -292,7 +1104,8 @@ def remediate(req: RemediationReq):
 
 @app.get("/actions")
 def list_actions():
-    rows = con.execute(
+    rows = query(
+        "actions",
         "SELECT ts, device_id, action, params FROM actions ORDER BY ts DESC LIMIT 100"
     ).fetchall()
     out = []
@@ -305,6 +1118,76 @@ def list_actions():
         out.append({"ts": ts_iso, "device_id": r[1], "action": r[2], "params": pj})
     return {"actions": out}
 
+# ---------- Per-device action delivery (agents) ----------
+@app.get("/actions/poll")
+async def poll_actions(device_id: str, after: int = 0, timeout: float = 25.0, limit: int = 100):
+    """
+    Long-poll: the device's unacked actions with id > after, returned as soon as there are
+    any or after `timeout` seconds with an empty list. Apply each id once, then /actions/ack.
+    """
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    action_q.watch(device_id, loop, wake)
+    try:
+        deadline = loop.time() + max(0.0, min(timeout, ACTION_POLL_MAX_S))
+        while True:
+            wake.clear()
+            actions = await run_in_threadpool(action_q.pending, device_id, after, limit)
+            remaining = deadline - loop.time()
+            if actions or remaining <= 0:
+                return {"device_id": device_id, "actions": actions}
+            try:
+                await asyncio.wait_for(wake.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        action_q.unwatch(device_id, loop, wake)
+
+class ActionAck(BaseModel):
+    device_id: str
+    upto: int    # every action of the device with id <= upto has been applied
+
+@app.post("/actions/ack")
+def ack_actions(req: ActionAck):
+    return {"ok": True, "acked": action_q.ack(req.device_id, req.upto)}
+
+@app.get("/actions/stats")
+def actions_stats():
+    """Pending (unacked) actions, open long-polls and enqueue/ack counters."""
+    return action_q.stats()
+
+# ---------- Closed-loop remediation (policy engine) ----------
+@app.get("/policy/stats")
+def policy_stats():
+    """Mode, triggers, outcomes (dispatched, dry_run, cooldown, ...) and recent latency per stage."""
+    return dict(policy.stats(), mode=POLICY) if policy is not None else {"enabled": False}
+
+@app.get("/policy/decisions")
+def policy_decisions(device_id: str = None, limit: int = 100):
+    """Recent decisions with their detect -> decide -> dispatch -> delivered -> applied timestamps."""
+    if policy is None:
+        return {"enabled": False, "decisions": []}
+    return {"decisions": policy.decisions(device_id, max(1, min(limit, 1000)))}
+
+@app.get("/policy/rules")
+def policy_rules():
+    if policy is None:
+        return {"enabled": False}
+    s = policy.stats()
+    return {"path": POLICY_RULES, "trigger": s["trigger"], "eval_interval_s": s["eval_interval_s"],
+            "limits": s["limits"], "rules": policy.rules}
+
+@app.post("/policy/reload")
+def policy_reload():
+    """Re-read POLICY_RULES; a file that does not parse leaves the current rules in place."""
+    if policy is None:
+        raise HTTPException(status_code=409, detail="POLICY is off")
+    try:
+        policy.configure(load_rules(POLICY_RULES))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"rules not loaded: {e}")
+    return {"ok": True, "rules": len(policy.rules)}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=False)
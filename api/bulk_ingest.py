@@ -0,0 +1,135 @@
+# api/bulk_ingest.py
+"""
+Columnar bulk ingest: Arrow IPC streams, newline-delimited JSON and Parquet uploads are
+read as a stream of Arrow record batches, normalized inside DuckDB (no per-row Python)
+and committed chunk by chunk, so a large backfill never has to fit in memory at once.
+"""
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from schema import COLUMNS
+
+# DuckDB types of the canonical columns (ts is normalized separately)
+COLUMN_TYPES = {
+    "device_id": "VARCHAR", "inlet_temp_c": "DOUBLE", "fan_rpm": "INTEGER", "temp_c": "DOUBLE",
+    "vcore_v": "DOUBLE", "cpu_pct": "DOUBLE", "mem_pct": "DOUBLE", "disk_errors": "INTEGER",
+    "nic_drops": "INTEGER", "latency_ms": "DOUBLE",
+}
+
+FORMATS = {
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.arrow.file": "arrow",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+}
+
+DEFAULT_CHUNK_ROWS = 65536
+
+def detect_format(content_type, fmt=None):
+    """Resolve the upload format from an explicit ?format= or the Content-Type header."""
+    if fmt:
+        fmt = fmt.lower()
+        if fmt not in ("arrow", "ndjson", "parquet"):
+            raise ValueError(f"unsupported format: {fmt}")
+        return fmt
+    ctype = (content_type or "").split(";")[0].strip().lower()
+    if ctype not in FORMATS:
+        raise ValueError(f"unsupported content type: {ctype or '<none>'}")
+    return FORMATS[ctype]
+
+def read_batches(con, path, fmt, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield Arrow record batches of at most ~chunk_rows rows from an uploaded file."""
+    if fmt == "arrow":
+        with pa.memory_map(path) as src:
+            try:
+                reader = ipc.open_stream(src)
+            except pa.ArrowInvalid:
+                reader = ipc.open_file(src)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i)
+                return
+            yield from reader
+    elif fmt == "parquet":
+        yield from pq.ParquetFile(path).iter_batches(batch_size=chunk_rows)
+    elif fmt == "ndjson":
+        # DuckDB's JSON reader streams the file; explicit columns make missing keys NULL
+        cols = {"ts": "VARCHAR", **COLUMN_TYPES}
+        spec = "{" + ", ".join(f"'{c}': '{t}'" for c, t in cols.items()) + "}"
+        cur = con.cursor()
+        rel = cur.execute(
+            f"SELECT * FROM read_json(?, format='newline_delimited', columns={spec})", [path]
+        )
+        yield from rel.fetch_record_batch(chunk_rows)
+    else:
+        raise ValueError(f"unsupported format: {fmt}")
+
+def normalize_sql(schema):
+    """
+    SELECT list applying the same rules as /ingest: timestamps parsed as UTC with invalid or
+    missing values set to current UTC, and missing canonical columns backfilled with NULL.
+    """
+    names = set(schema.names)
+    if "ts" not in names:
+        ts = "NULL::TIMESTAMP"
+    elif pa.types.is_timestamp(schema.field("ts").type) or pa.types.is_date(schema.field("ts").type):
+        ts = "CAST(ts AS TIMESTAMPTZ)::TIMESTAMP"
+    else:
+        ts = "TRY_CAST(CAST(ts AS VARCHAR) AS TIMESTAMPTZ)::TIMESTAMP"
+    cols = [f"COALESCE({ts}, CURRENT_TIMESTAMP::TIMESTAMP) AS ts"]
+    for c in COLUMNS[1:]:
+        cols.append(f"CAST({c} AS {COLUMN_TYPES[c]}) AS {c}" if c in names
+                    else f"NULL::{COLUMN_TYPES[c]} AS {c}")
+    return "SELECT " + ", ".join(cols) + " FROM chunk"
+
+def load(con, ingest_q, path, fmt, chunk_rows=DEFAULT_CHUNK_ROWS, mark=None):
+    """
+    Stream an uploaded file into telemetry. Each chunk is normalized by DuckDB directly
+    over the Arrow buffers and committed in its own transaction. Returns rows committed;
+    on error, raises with the already-committed count attached as .committed.
+
+    `mark` (source, batch) makes a retried upload idempotent like /ingest: Duplicate is
+    raised when the batch was already committed (Pending while another upload of it is
+    still in flight), and the mark is committed with the last
+    chunk. An upload that failed part-way is not marked, so resending it repeats the
+    chunks committed before the failure.
+    """
+    cur = con.cursor()
+    cur.execute("SET TimeZone='UTC'")
+    committed = 0; pending = []; pending_rows = 0
+    if mark is not None:
+        ingest_q.reserve(*mark)
+
+    def flush(marks=None):
+        nonlocal committed, pending, pending_rows
+        chunk = pa.Table.from_batches(pending)
+        cur.register("chunk", chunk)
+        try:
+            normalized = cur.execute(normalize_sql(chunk.schema)).arrow()
+        finally:
+            cur.unregister("chunk")
+        committed += ingest_q.commit(normalized, marks=marks, source=mark[0] if mark else "bulk")
+        pending = []; pending_rows = 0
+
+    try:
+        for batch in read_batches(con, path, fmt, chunk_rows):
+            if batch.num_rows == 0:
+                continue
+            if pending and batch.schema != pending[0].schema:
+                flush()
+            if pending_rows >= chunk_rows:
+                flush()
+            pending.append(batch); pending_rows += batch.num_rows
+        # The last chunk is held back to here so the mark commits with it
+        if pending:
+            flush(marks={mark[0]: mark[1]} if mark is not None else None)
+        elif mark is not None:
+            ingest_q.release(*mark)
+    except Exception as e:
+        if mark is not None:
+            ingest_q.release(*mark)
+        e.committed = committed
+        raise
+    return committed
@@ -0,0 +1,124 @@
+# api/checkpoints.py
+"""
+Scheduled DuckDB checkpoints, so the write-ahead log a restart has to replay stays small.
+DuckDB checkpoints on its own only once the WAL reaches checkpoint_threshold (the hard
+bound); a trickle of ingest can leave a WAL just below it for hours. The Checkpointer folds
+the WAL into the database file every interval_s, and once more on shutdown.
+
+A checkpoint waits for every half-read result on the database, and every other query waits
+behind it. Streaming responses therefore pin() the checkpointer for as long as they hold a
+result open: a round that finds pins (or a concurrent write transaction) is skipped, and
+new pins wait for a running checkpoint to finish.
+"""
+import os, threading, time, traceback
+import duckdb
+
+from metrics import registry
+
+registry.histogram("db_checkpoint_seconds", "Duration of scheduled and shutdown CHECKPOINTs", subsystem="db")
+
+class Checkpointer:
+    def __init__(self, con, wal_path, interval_s=60.0, min_wal_bytes=0):
+        self.con = con
+        self.wal_path = wal_path
+        self.interval_s = float(interval_s)
+        self.min_wal_bytes = int(min_wal_bytes)
+        self._cond = threading.Condition()
+        self._pins = 0
+        self._running = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.checkpoints = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_ms = None
+        self.last_wal_bytes = None
+
+    def wal_bytes(self):
+        try:
+            return os.path.getsize(self.wal_path)
+        except OSError:
+            return 0
+
+    # ---------- Request path ----------
+    def pin(self):
+        """Hold checkpoints off while a result is streamed; returns the release function."""
+        with self._cond:
+            while self._running:
+                self._cond.wait()
+            self._pins += 1
+        released = []
+
+        def release():
+            if released:
+                return
+            released.append(True)
+            with self._cond:
+                self._pins -= 1
+        return release
+
+    # ---------- Checkpoint ----------
+    def checkpoint(self, wait_s=0.0):
+        """
+        CHECKPOINT unless results are pinned (waiting up to wait_s for them to close) or
+        another write transaction is open; True when it ran.
+        """
+        deadline = time.monotonic() + wait_s
+        with self._cond:
+            while self._pins and time.monotonic() < deadline:
+                self._cond.wait(0.1)
+            if self._pins:
+                self.skipped += 1
+                return False
+            self._running = True
+        wal = self.wal_bytes()
+        cur = self.con.cursor()
+        t0 = time.perf_counter()
+        try:
+            cur.execute("CHECKPOINT")
+        except duckdb.TransactionException:
+            self.skipped += 1              # an ingest commit or tier move is open: next round
+            return False
+        finally:
+            cur.close()
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+        seconds = time.perf_counter() - t0
+        registry.observe("db_checkpoint_seconds", (), seconds)
+        self.checkpoints += 1
+        self.last_ms = seconds * 1000.0
+        self.last_wal_bytes = wal
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="checkpoints", daemon=True)
+            self._thread.start()
+
+    def stop(self, wait_s=10.0):
+        """Stop the schedule and checkpoint once more (after the writers have been stopped)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+        try:
+            if not self.checkpoint(wait_s=wait_s):
+                print(f"[checkpoints] shutdown checkpoint skipped; {self.wal_bytes()} WAL bytes left", flush=True)
+        except Exception:
+            self.failures += 1
+            traceback.print_exc()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            if self.wal_bytes() <= self.min_wal_bytes:
+                continue
+            try:
+                self.checkpoint()
+            except Exception:
+                self.failures += 1
+                traceback.print_exc()
+
+    def stats(self):
+        return {"interval_s": self.interval_s, "wal_bytes": self.wal_bytes(), "checkpoints": self.checkpoints,
+                "skipped": self.skipped, "failures": self.failures, "pinned": self._pins,
+                "last_ms": self.last_ms, "last_wal_bytes": self.last_wal_bytes}
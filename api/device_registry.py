@@ -0,0 +1,77 @@
+# api/device_registry.py
+"""
+Device registry: one row per device (first/last seen, rows ingested, last producer),
+maintained by ingest inside the same transaction as the telemetry rows, so /devices and
+/stats read a table the size of the fleet instead of scanning the history.
+
+`source` is the producer that last sent the device's rows: the ?source= of a retrying
+/ingest producer, "mqtt", "bulk" or "http". `rows` counts rows ingested (rows later moved
+to cold storage still count).
+"""
+import pandas as pd
+
+DDL = """
+CREATE TABLE IF NOT EXISTS devices (
+    device_id VARCHAR PRIMARY KEY,
+    first_seen TIMESTAMP,
+    last_seen TIMESTAMP,
+    rows BIGINT,
+    source VARCHAR,
+    updated_at TIMESTAMP
+)
+"""
+
+UPSERT_SQL = """
+INSERT INTO devices
+SELECT b.device_id, min(CAST(b.ts AS TIMESTAMP)), max(CAST(b.ts AS TIMESTAMP)), count(*),
+       {source}, CURRENT_TIMESTAMP
+FROM batch b {join}
+WHERE b.device_id IS NOT NULL
+GROUP BY b.device_id
+ON CONFLICT (device_id) DO UPDATE SET
+    first_seen = least(first_seen, EXCLUDED.first_seen),
+    last_seen = greatest(last_seen, EXCLUDED.last_seen),
+    rows = rows + EXCLUDED.rows,
+    source = EXCLUDED.source,
+    updated_at = EXCLUDED.updated_at
+"""
+
+class DeviceRegistry:
+    def __init__(self, con, read_only=False):
+        self.con = con
+        if read_only:
+            return
+        fresh = not con.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = 'devices'").fetchall()[0][0]
+        con.execute(DDL)
+        if fresh:
+            # Backfill once from the history the hot table already holds
+            con.execute("""
+            INSERT INTO devices
+            SELECT device_id, min(ts), max(ts), count(*), 'backfill', CURRENT_TIMESTAMP
+            FROM telemetry WHERE device_id IS NOT NULL GROUP BY device_id
+            """)
+
+    def fold(self, cur, source=None):
+        """
+        IngestQueue transaction hook: fold the registered `batch` into the registry on the
+        writer's cursor. `source` is a name for the whole batch or {device_id: name}.
+        """
+        if not isinstance(source, dict):
+            cur.execute(UPSERT_SQL.format(source="?", join=""), [source or "http"])
+            return
+        sources = pd.DataFrame({"device_id": list(source), "source": list(source.values())})
+        cur.register("batch_sources", sources)
+        try:
+            cur.execute(UPSERT_SQL.format(source="coalesce(any_value(s.source), ?)",
+                                          join="LEFT JOIN batch_sources s ON s.device_id = b.device_id"), ["http"])
+        finally:
+            cur.unregister("batch_sources")
+
+    def list(self, active_since=None):
+        """Registry rows (ordered by device_id), optionally only devices seen since a timestamp."""
+        sql = "SELECT device_id, first_seen, last_seen, rows, source FROM devices"
+        params = []
+        if active_since is not None:
+            sql += " WHERE last_seen >= CAST(? AS TIMESTAMP)"
+            params.append(active_since)
+        return self.con.cursor().execute(sql + " ORDER BY device_id", params).df()
@@ -0,0 +1,107 @@
+# api/downsample.py
+"""
+Shape-preserving downsampling of a window to a pixel budget, for charts.
+
+- lttb: Largest-Triangle-Three-Buckets. First and last points are kept; the rows between
+  are split into points-2 equal-count buckets and each keeps the point forming the largest
+  triangle with the previously kept point and the next bucket's average. Keeps the visual
+  shape (peaks, slopes) of a line with `points` points.
+- minmax: first and last points are kept and the time range is split into (points-2)/2
+  equal-width buckets that each keep their lowest and highest sample, so no spike or dip
+  is lost (an envelope).
+
+Selection runs per metric on that metric's non-null samples. downsample() returns the rows
+picked for any of the metrics, so every series keeps its exact timestamps and values and
+the result is at most points x metrics rows.
+"""
+import numpy as np
+import pandas as pd
+
+from hotcache import _ts_ns
+
+METHODS = ("lttb", "minmax")
+CHART_METRICS = ["inlet_temp_c", "fan_rpm", "temp_c", "cpu_pct", "latency_ms"]
+
+def lttb(x, y, n):
+    """Indices of the n points LTTB keeps of (x, y), x ascending and no NaN."""
+    m = len(x)
+    if n >= m:
+        return np.arange(m)
+    if n < 3:
+        return np.array([0, m - 1][:max(n, 1)])
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, m - 1, n - 1).astype(np.int64)      # n-2 buckets over rows 1..m-2
+    # Average of each bucket (the last one's "next" is the last point)
+    cx, cy = np.r_[0.0, np.cumsum(x)], np.r_[0.0, np.cumsum(y)]
+    cnt = np.maximum(edges[1:] - edges[:-1], 1)
+    avg_x = np.r_[(cx[edges[1:]] - cx[edges[:-1]]) / cnt, x[-1]]
+    avg_y = np.r_[(cy[edges[1:]] - cy[edges[:-1]]) / cnt, y[-1]]
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, m - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - avg_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+def minmax(x, y, n):
+    """Indices of the first and last sample and of the lowest and highest of each of (n-2)/2 equal-width time buckets."""
+    m = len(x)
+    if n >= m:
+        return np.arange(m)
+    buckets = max(1, (n - 2) // 2)
+    x = np.asarray(x, dtype=np.int64); y = np.asarray(y, dtype=float)
+    bid = (x - x[0]) * buckets // max(int(x[-1] - x[0]) + 1, 1)
+    order = np.lexsort((y, bid))                  # by bucket, then value
+    first = np.flatnonzero(np.r_[True, np.diff(bid[order]) != 0])
+    last = np.r_[first[1:] - 1, m - 1]
+    return np.unique(np.r_[0, order[first], order[last], m - 1])
+
+def downsample(df, points, method="lttb", metrics=None):
+    """
+    Rows of df (one device, ts ascending) picked so each metric keeps its shape in `points`
+    points; ts, device_id and the metrics columns. Returns (rows, rows_in).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {list(METHODS)}")
+    metrics = [m for m in (metrics or CHART_METRICS) if m in df.columns]
+    cols = [c for c in ("ts", "device_id") if c in df.columns] + metrics
+    if len(df) <= points:
+        return df[cols].reset_index(drop=True), len(df)
+    x = _ts_ns(df["ts"])
+    keep = np.zeros(len(df), dtype=bool)
+    pick = lttb if method == "lttb" else minmax
+    for m in metrics:
+        y = df[m].to_numpy(dtype=float, na_value=np.nan)
+        idx = np.flatnonzero(~np.isnan(y))
+        if len(idx):
+            keep[idx[pick(x[idx], y[idx], points)]] = True
+    return df.loc[keep, cols].reset_index(drop=True), len(df)
+
+def from_rollup(df, metrics=None):
+    """A rollup query result (bucket ts, <metric>_mean, ...) shaped like raw rows: one row per bucket."""
+    metrics = [m for m in (metrics or CHART_METRICS) if f"{m}_mean" in df.columns]
+    out = pd.DataFrame({"ts": df["ts"], "device_id": df["device_id"]})
+    for m in metrics:
+        out[m] = df[f"{m}_mean"]
+    return out
+
+def window_bounds(start=None, end=None, minutes=10, now=None):
+    """
+    [start, end] as naive UTC ISO strings: the last `minutes` when start is missing, up to
+    now when only end is. Bounds may mix offsets and naive (UTC) times; raises ValueError
+    for one that does not parse.
+    """
+    now = pd.Timestamp(now if now is not None else pd.Timestamp.now("UTC"))
+    if start is None:
+        start, end = now - pd.Timedelta(minutes=int(minutes)), now
+    elif end is None:
+        end = now
+    out = []
+    for t in (start, end):
+        t = pd.Timestamp(t)
+        out.append((t.tz_convert("UTC").tz_localize(None) if t.tz is not None else t).isoformat())
+    return tuple(out)
@@ -0,0 +1,140 @@
+# api/encoding.py
+"""
+Response encoding straight from query results: a DuckDB result is pulled as Arrow record
+batches and each batch is written once in the negotiated format, so rows never become
+Python dicts and a streamed window holds one batch in memory at a time.
+
+Formats (?format= or Accept):
+- json      {"rows": [{...}, ...]}            application/json (default, same shape as before)
+- columnar  {"columns": {"ts": [...], ...}}   application/json; collected as Arrow, then
+                                              rendered one column at a time
+- arrow     Arrow IPC stream                  application/vnd.apache.arrow.stream
+- csv       header + rows                     text/csv
+"""
+import io, json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.ipc as ipc
+from starlette.responses import Response, StreamingResponse
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "columnar": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "csv": "text/csv",
+}
+_ACCEPT = {"application/vnd.apache.arrow.stream": "arrow", "application/vnd.apache.arrow.file": "arrow",
+           "text/csv": "csv", "application/json": "json"}
+BATCH_ROWS = 65536          # rows pulled from DuckDB per Arrow batch
+TEXT_ROWS = 8192            # rows rendered per JSON/CSV chunk (bounds the text buffers)
+
+def negotiate(accept=None, fmt=None):
+    """Pick a format from ?format= (wins) or the Accept header; json when neither says."""
+    if fmt:
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"unsupported format {fmt!r}; use one of {sorted(MEDIA_TYPES)}")
+        return fmt
+    for part in (accept or "").split(","):
+        media = part.split(";")[0].strip().lower()
+        if media in _ACCEPT:
+            return _ACCEPT[media]
+    return "json"
+
+def _batches(data):
+    """Arrow record batches from a DataFrame, an Arrow table or a RecordBatchReader."""
+    if isinstance(data, pd.DataFrame):
+        data = pa.Table.from_pandas(data, preserve_index=False)
+    if isinstance(data, pa.Table):
+        return data.to_batches(max_chunksize=BATCH_ROWS), data.schema
+    return data, data.schema
+
+def _json_rows(batch):
+    """One batch as the inside of a JSON array, in the exact form df.to_json(records, iso) gives."""
+    return batch.to_pandas().to_json(orient="records", date_format="iso")[1:-1]
+
+def _fields(extra):
+    """Extra top-level JSON members (e.g. a cursor) appended after the rows."""
+    return "".join(f",{json.dumps(k)}:{json.dumps(v)}" for k, v in (extra or {}).items()).encode()
+
+def encode(data, fmt, key="rows", extra=None):
+    """Yield the encoded response body chunk by chunk; `extra` only applies to the JSON formats."""
+    batches, schema = _batches(data)
+    if fmt == "json":
+        yield f'{{"{key}":['.encode()
+        first = True
+        for batch in batches:
+            for off in range(0, batch.num_rows, TEXT_ROWS):
+                yield (b"" if first else b",") + _json_rows(batch.slice(off, TEXT_ROWS)).encode()
+                first = False
+        yield b"]" + _fields(extra) + b"}"
+    elif fmt == "columnar":
+        # Needs every row of a column before the next one: collect as Arrow, render per column
+        table = pa.Table.from_batches(list(batches), schema=schema)
+        yield b'{"columns":{'
+        for i, name in enumerate(table.column_names):
+            values = table.column(i).to_pandas().to_json(orient="values", date_format="iso")
+            yield (b"," if i else b"") + f"{json.dumps(name)}:{values}".encode()
+        yield f'}},"{key}":{table.num_rows}'.encode() + _fields(extra) + b"}"
+    elif fmt == "arrow":
+        sink = io.BytesIO()
+        with ipc.new_stream(sink, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                yield sink.getvalue()
+                sink.seek(0); sink.truncate()
+        yield sink.getvalue()
+    elif fmt == "csv":
+        sink = io.BytesIO()
+        with pacsv.CSVWriter(sink, schema) as writer:
+            for batch in batches:
+                for off in range(0, batch.num_rows, TEXT_ROWS):
+                    writer.write_batch(batch.slice(off, TEXT_ROWS))
+                    yield sink.getvalue()
+                    sink.seek(0); sink.truncate()
+        yield sink.getvalue()
+    else:
+        raise ValueError(f"unsupported format {fmt!r}")
+
+def respond(data, fmt, key="rows", extra=None, headers=None):
+    """Encode an in-memory result (DataFrame / Arrow table) into one Response."""
+    return Response(b"".join(encode(data, fmt, key, extra)), media_type=MEDIA_TYPES[fmt], headers=headers)
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that runs `on_close` once the response is over, however it ends. The
+    body generator's own finally is not enough: a client that disconnects before the first
+    chunk leaves the generator unstarted, and closing an unstarted generator runs nothing.
+    """
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self._content = content
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._content.close()
+            self._on_close()
+
+def stream(cur, fmt, key="rows", on_close=None, extra=None, headers=None):
+    """
+    Stream the pending result of `cur` batch by batch. The cursor is closed (and on_close
+    called) exactly once when the body is done or the client goes away, even before the
+    first chunk.
+    """
+    reader = cur.fetch_record_batch(BATCH_ROWS)
+    closed = []
+    def close():
+        if not closed:
+            closed.append(True)
+            cur.close()
+            if on_close is not None:
+                on_close()
+    def body():
+        try:
+            yield from encode(reader, fmt, key, extra)
+        finally:
+            close()
+    return ClosingStreamingResponse(body(), close, media_type=MEDIA_TYPES[fmt], headers=headers)
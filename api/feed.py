@@ -0,0 +1,126 @@
+# api/feed.py
+"""
+Incremental per-device feed. Every committed row gets a sequence number (commit order)
+and recent rows are kept per device, so a reader holding a cursor receives only the rows
+committed after it, late or out-of-order ones included, and push subscribers are woken as
+soon as a batch lands.
+
+A cursor is "<epoch>.<seq>.<ts_us>": the process epoch, the last sequence number the
+reader has seen and the newest ts it holds. The seq part is only meaningful within the
+epoch that issued it and while the device's rows after it are still retained; otherwise
+since() returns None and callers fall back to ts > watermark.
+"""
+import threading, time
+from collections import OrderedDict, deque
+import numpy as np
+
+from hotcache import HotCache, VALUE_COLUMNS, _ts_ns, _values
+
+def make_cursor(epoch, seq, ts_us):
+    return f"{epoch}.{int(seq)}.{int(ts_us)}"
+
+def parse_cursor(cursor):
+    """(epoch, seq, ts_us); raises ValueError for a malformed cursor."""
+    epoch, seq, ts_us = str(cursor).split(".")
+    return epoch, int(seq), int(ts_us)
+
+class _DeviceFeed:
+    def __init__(self):
+        self.chunks = deque()      # (seq, ts_ns, vals) per committed batch, oldest first
+        self.rows = 0
+        self.floor = 0             # rows with seq <= floor may have been evicted
+
+class Feed:
+    def __init__(self, capacity=4096, max_devices=4096):
+        self.capacity = int(capacity)
+        self.max_devices = int(max_devices)
+        self.epoch = f"{time.time_ns() // 1000:x}"
+        self.seq = 0
+        self._devices = OrderedDict()
+        self._evicted_upto = 0      # highest seq held by a device dropped from the LRU
+        self._waiters = {}          # device_id -> set of (loop, asyncio.Event)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.fallbacks = 0
+
+    # ---------- Write side ----------
+    def append(self, df):
+        """Ingest listener: number the committed rows and wake the device's subscribers."""
+        if df.empty:
+            return
+        ts = _ts_ns(df["ts"]); vals = _values(df)
+        groups = df.groupby("device_id", sort=False).indices
+        with self._lock:
+            seqs = np.arange(self.seq + 1, self.seq + len(df) + 1, dtype=np.int64)
+            self.seq += len(df)
+            for device_id, idx in groups.items():
+                dev = self._devices.get(device_id)
+                if dev is None:
+                    dev = self._devices[device_id] = _DeviceFeed()
+                    dev.floor = self._evicted_upto
+                self._devices.move_to_end(device_id)
+                dev.chunks.append((seqs[idx], ts[idx], vals[idx]))
+                dev.rows += len(idx)
+                while dev.rows - len(dev.chunks[0][0]) >= self.capacity:
+                    old = dev.chunks.popleft()
+                    dev.rows -= len(old[0])
+                    dev.floor = int(old[0][-1])
+            while len(self._devices) > self.max_devices:
+                _, dev = self._devices.popitem(last=False)
+                if dev.chunks:
+                    self._evicted_upto = max(self._evicted_upto, int(dev.chunks[-1][0][-1]))
+            waiters = [w for d in groups for w in self._waiters.get(d, ())]
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    # ---------- Read side ----------
+    def position(self, ts_us=0):
+        """Cursor for "everything committed so far"; deltas after it are new rows."""
+        with self._lock:
+            return make_cursor(self.epoch, self.seq, ts_us)
+
+    def since(self, device_id, cursor, limit=None):
+        """
+        (frame, next_cursor) with the device's rows committed after `cursor`, sorted by ts
+        (the newest `limit` of them if there are more), or None when the feed cannot tell.
+        """
+        epoch, seq, ts_us = parse_cursor(cursor)
+        with self._lock:
+            dev = self._devices.get(device_id)
+            floor = dev.floor if dev is not None else self._evicted_upto
+            if epoch != self.epoch or seq < floor or seq > self.seq:
+                self.fallbacks += 1
+                return None
+            head = self.seq
+            parts = [c for c in (dev.chunks if dev is not None else ()) if c[0][-1] > seq]
+            self.served += 1
+        if not parts:
+            empty = HotCache.frame(device_id, np.empty(0, np.int64), np.empty((0, len(VALUE_COLUMNS))))
+            return empty, make_cursor(epoch, head, ts_us)
+        seqs = np.concatenate([p[0] for p in parts]); ts = np.concatenate([p[1] for p in parts])
+        vals = np.concatenate([p[2] for p in parts])
+        keep = np.nonzero(seqs > seq)[0]
+        order = keep[np.argsort(ts[keep], kind="stable")]
+        if limit is not None:
+            order = order[len(order) - min(len(order), max(0, int(limit))):]
+        newest = max(ts_us, int(ts[keep].max()) // 1000)
+        return HotCache.frame(device_id, ts[order], vals[order]), make_cursor(epoch, head, newest)
+
+    # ---------- Push ----------
+    def watch(self, device_id, loop, event):
+        with self._lock:
+            self._waiters.setdefault(device_id, set()).add((loop, event))
+
+    def unwatch(self, device_id, loop, event):
+        with self._lock:
+            ws = self._waiters.get(device_id)
+            if ws is not None:
+                ws.discard((loop, event))
+                if not ws:
+                    del self._waiters[device_id]
+
+    def stats(self):
+        with self._lock:
+            return {"epoch": self.epoch, "seq": self.seq, "devices": len(self._devices),
+                    "rows_per_device": self.capacity, "subscribers": sum(len(w) for w in self._waiters.values()),
+                    "served": self.served, "fallbacks": self.fallbacks}
@@ -0,0 +1,193 @@
+# api/fleet.py
+"""
+Fleet-wide anomaly + RCA sweep. The caller pulls every device's window in one query;
+per-device find_anomalies + rank_root_causes runs on worker processes with a concurrency
+limit and a per-device timeout, and whatever finished is returned ranked by severity.
+
+Each worker process sits in its own single-process executor, so a device that times out
+gets its worker killed and replaced on the spot without breaking the others, and its
+timeout runs from when the worker picked it up rather than from when it was queued.
+"""
+import itertools, multiprocessing, os, queue as queue_mod, signal, threading, time, traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from anomaly import find_anomalies
+from rca import rank_root_causes
+
+def analyze_device(device_id, df, zscore=None, model=None):
+    """Worker: anomalies + RCA for one device, reduced to a compact severity summary."""
+    anomalies = find_anomalies(df, zscore=zscore, model=model)
+    rca = rank_root_causes(df, anomalies)
+    rows = len(df)
+    flagged_rows = len({a["idx"] for a in anomalies})
+    zmax = max((a["score"] for a in anomalies if a["type"] == "zscore"), default=0.0)
+    ranked = rca.get("ranked", [])
+    return {
+        "device_id": device_id,
+        "rows": rows,
+        "anomalies": len(anomalies),
+        "anomalous_rows": flagged_rows,
+        "max_zscore": float(zmax),
+        # Share of samples flagged by any detector, in percent
+        "severity": 100.0 * flagged_rows / rows if rows else 0.0,
+        "top_cause": ranked[0] if ranked else None,
+        "rca": ranked,
+    }
+
+_started = None
+
+def _init_worker(started):
+    """Worker initializer: the queue _run reports job starts on."""
+    global _started
+    _started = started
+
+def _run(token, device_id, df, zscore, model):
+    """Worker: report (token, pid, wall-clock start) so the parent starts the timeout now."""
+    _started.put((token, os.getpid(), time.time()))
+    return analyze_device(device_id, df, zscore, model)
+
+class _Worker:
+    """One worker process in its own executor, so it can be killed without breaking others."""
+
+    def __init__(self, ctx):
+        self.started = ctx.Queue()
+        self.pid = None
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=ctx,
+                                            initializer=_init_worker, initargs=(self.started,))
+
+    def submit(self, token, job):
+        return self.executor.submit(_run, token, *job)
+
+    def poll(self, token):
+        """Wall-clock time the job `token` started, or None if the worker hasn't reported it."""
+        while True:
+            try:
+                got, self.pid, t0 = self.started.get_nowait()
+            except queue_mod.Empty:
+                return None
+            if got == token:
+                return t0                # else a late report from an earlier job
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.started.close()
+
+    def kill(self):
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except OSError:
+                pass                     # already gone
+        self.close()
+
+class FleetSweeper:
+    # How often to look for start reports while some submitted device hasn't reported one
+    POLL_S = 0.05
+
+    def __init__(self, workers=None):
+        self.workers = int(workers or os.cpu_count() or 1)
+        # spawn: forking a process that holds DuckDB and server threads is unsafe
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = []                  # healthy workers kept between sweeps
+        self._lock = threading.Lock()
+        self._tokens = itertools.count()
+
+    def _checkout(self):
+        """A worker for this sweep alone: concurrent sweeps never share (or kill) one."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _Worker(self._ctx)
+
+    def _checkin(self, workers):
+        with self._lock:
+            keep = max(0, self.workers - len(self._idle))
+            self._idle.extend(workers[:keep])
+        for w in workers[keep:]:
+            w.close()
+
+    def worker_pids(self):
+        """PIDs of the idle workers that have run a device."""
+        with self._lock:
+            return {w.pid for w in self._idle if w.pid is not None}
+
+    def sweep(self, jobs, concurrency=None, device_timeout_s=10.0, timeout_s=60.0):
+        """
+        jobs: iterable of (device_id, df, zscore, model). Returns (results, errors) where
+        errors maps device_id -> "timeout" / "skipped" / error message.
+        """
+        jobs = list(jobs)
+        limit = max(1, min(int(concurrency or self.workers), self.workers))
+        deadline = time.monotonic() + timeout_s
+        results, errors = [], {}
+        free = []                        # this sweep's workers with nothing to do
+        running = {}                     # future -> [device_id, worker, token, started_at]
+        queue = iter(jobs)
+
+        def submit_next():
+            job = next(queue, None)
+            if job is None:
+                return False
+            w, token = free.pop() if free else self._checkout(), next(self._tokens)
+            try:
+                fut = w.submit(token, job)
+            except BrokenProcessPool:
+                # An idle worker died since its last device; replace it
+                w.kill(); w = _Worker(self._ctx)
+                fut = w.submit(token, job)
+            running[fut] = [job[0], w, token, None]
+            return True
+
+        while len(running) < limit and submit_next():
+            pass
+        while running:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            for entry in running.values():
+                if entry[3] is None:
+                    entry[3] = entry[1].poll(entry[2])
+            starts = [entry[3] for entry in running.values() if entry[3] is not None]
+            wake = deadline - now
+            if starts:
+                wake = min(wake, min(starts) + device_timeout_s - time.time())
+            if len(starts) < len(running):
+                wake = min(wake, self.POLL_S)
+            done, _ = wait(list(running), timeout=max(0.0, wake), return_when=FIRST_COMPLETED)
+            for fut in done:
+                device_id, w, token, t0 = running.pop(fut)
+                if t0 is None:
+                    w.poll(token)        # consume the start report (and learn the pid)
+                try:
+                    results.append(fut.result())
+                    free.append(w)
+                except BrokenProcessPool:
+                    errors[device_id] = "error: worker process died"
+                    w.kill()
+                except Exception as e:
+                    traceback.print_exc()
+                    errors[device_id] = f"error: {e}"
+                    free.append(w)
+            wall = time.time()
+            for fut, (device_id, w, _, t0) in list(running.items()):
+                if t0 is not None and wall - t0 >= device_timeout_s and not fut.done():
+                    # Kill only this worker; the next device gets a fresh one
+                    running.pop(fut); w.kill()
+                    errors[device_id] = "timeout"
+            while len(running) < limit and time.monotonic() < deadline and submit_next():
+                pass
+
+        for device_id, w, _, _ in running.values():
+            w.kill(); errors[device_id] = "timeout"
+        for job in queue:
+            errors[job[0]] = "skipped"
+        self._checkin(free)
+        results.sort(key=lambda r: (r["severity"], r["max_zscore"]), reverse=True)
+        return results, errors
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for w in idle:
+            w.close()
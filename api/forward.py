@@ -0,0 +1,92 @@
+# api/forward.py
+"""
+ASGI middleware of the reader processes: requests for which match(scope) is true are
+proxied to the writer process (method, path, query, headers and body), and its response
+is streamed back as it arrives, so /stream and long-polls work through it. Everything
+else is served locally, with headers() added to the response.
+"""
+import asyncio
+import httpx
+
+# Hop-by-hop headers are not forwarded
+_HOP = {b"connection", b"keep-alive", b"transfer-encoding", b"te", b"upgrade",
+        b"proxy-authorization", b"proxy-authenticate", b"trailer"}
+
+class Forwarder:
+    def __init__(self, app, target, match, headers=None, client=None):
+        self.app = app
+        self.target = target.rstrip("/")
+        self.match = match
+        self.headers = headers
+        self._client = client
+
+    def client(self):
+        # Created on first use, inside the worker's event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.target, timeout=httpx.Timeout(10.0, read=None, write=60.0, pool=None),
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=64))
+        return self._client
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if not self.match(scope):
+            if self.headers is None:
+                return await self.app(scope, receive, send)
+
+            async def send_with_headers(message):
+                if message["type"] == "http.response.start":
+                    message = dict(message, headers=list(message.get("headers", [])) + self.headers())
+                await send(message)
+
+            return await self.app(scope, receive, send_with_headers)
+        await self.forward(scope, receive, send)
+
+    async def forward(self, scope, receive, send):
+        body_done = asyncio.Event()
+
+        async def body():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+                yield message.get("body", b"")
+                if not message.get("more_body"):
+                    break
+            body_done.set()
+
+        headers = [(k, v) for k, v in scope["headers"] if k.lower() not in _HOP and k.lower() != b"host"]
+        url = scope["path"] + ("?" + scope["query_string"].decode("latin-1") if scope["query_string"] else "")
+        client = self.client()
+        req = client.build_request(scope["method"], url, headers=headers, content=body())
+        try:
+            resp = await client.send(req, stream=True)
+        except httpx.HTTPError as e:
+            await send({"type": "http.response.start", "status": 502,
+                        "headers": [(b"content-type", b"text/plain")]})
+            await send({"type": "http.response.body", "body": f"writer unavailable: {e}".encode()})
+            return
+
+        async def pump():
+            await send({"type": "http.response.start", "status": resp.status_code,
+                        "headers": [(k, v) for k, v in resp.headers.raw if k.lower() not in _HOP]})
+            async for chunk in resp.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def disconnected():
+            await body_done.wait()
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        # A client that goes away mid-stream (SSE, long-poll) closes the upstream request too
+        tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                t.result()
+        finally:
+            for t in tasks:
+                t.cancel()
+            await resp.aclose()
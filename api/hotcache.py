@@ -0,0 +1,218 @@
+# api/hotcache.py
+"""
+Hot-data cache: one fixed-size, array-backed ring buffer per device holding the most
+recently ingested rows of the canonical columns. Fed by the ingest writer after each
+commit, so it never shows rows that are not in DuckDB yet.
+
+Each ring tracks a floor timestamp: every row of the device with ts > floor is in the
+buffer. Rows at or below the floor may have been evicted (or never loaded), so a read is
+a hit only if everything it needs lies strictly above the floor.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from schema import COLUMNS
+
+VALUE_COLUMNS = COLUMNS[2:]
+INT_COLUMNS = {"fan_rpm", "disk_errors", "nic_drops"}
+UNSEEDED = np.iinfo(np.int64).max   # floor of a ring that knows nothing yet
+COMPLETE = np.iinfo(np.int64).min   # floor of a ring holding the device's full history
+
+def _ts_ns(values):
+    """Timestamps (naive UTC or tz-aware) -> int64 ns since epoch, truncated to DuckDB's µs."""
+    ts = pd.to_datetime(pd.Series(values), utc=True).dt.tz_localize(None)
+    return (ts.values.astype("datetime64[us]").astype("datetime64[ns]").astype(np.int64))
+
+def _values(df):
+    """Canonical value columns as a float matrix (NULL -> NaN)."""
+    return df.reindex(columns=VALUE_COLUMNS).to_numpy(dtype=float, na_value=np.nan)
+
+def to_ns(t):
+    """A single timestamp/ISO string -> int64 ns (UTC)."""
+    t = pd.Timestamp(t)
+    if t.tzinfo is not None:
+        t = t.tz_convert("UTC").tz_localize(None)
+    return int(t.value)
+
+class DeviceRing:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.vals = np.full((capacity, len(VALUE_COLUMNS)), np.nan)
+        self.head = 0          # next slot to write
+        self.size = 0
+        self.floor = UNSEEDED
+
+    def append(self, ts, vals):
+        cap = self.capacity; k = len(ts)
+        if k == 0:
+            return
+        if k >= cap:
+            dropped = [ts[:k - cap].max()] if k > cap else []
+            if self.size:
+                dropped.append(self._ordered()[0].max())
+            if dropped:
+                self.floor = max(self.floor, int(max(dropped)))
+            self.ts[:] = ts[k - cap:]; self.vals[:] = vals[k - cap:]
+            self.head = 0; self.size = cap
+            return
+        over = self.size + k - cap
+        if over > 0:
+            oldest = (self.head - self.size) % cap
+            evicted = (oldest + np.arange(over)) % cap
+            self.floor = max(self.floor, int(self.ts[evicted].max()))
+            self.size -= over
+        pos = (self.head + np.arange(k)) % cap
+        self.ts[pos] = ts; self.vals[pos] = vals
+        self.head = (self.head + k) % cap
+        self.size += k
+
+    def _ordered(self):
+        """Copies of the buffered rows sorted by ts (arrival order breaks ties)."""
+        idx = (self.head - self.size + np.arange(self.size)) % self.capacity
+        ts = self.ts[idx]; vals = self.vals[idx]
+        if ts.size > 1 and (np.diff(ts) < 0).any():
+            order = np.argsort(ts, kind="stable")
+            ts = ts[order]; vals = vals[order]
+        return ts, vals
+
+    def nbytes(self):
+        return self.ts.nbytes + self.vals.nbytes
+
+class HotCache:
+    def __init__(self, capacity=2048, max_devices=1024):
+        self.capacity = int(capacity)
+        self.max_devices = int(max_devices)
+        self._rings = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seeds = 0
+        self.evicted_devices = 0
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    # ---------- Write side ----------
+    def append(self, df):
+        """Ingest listener: append a committed batch to the rings of already-seeded devices."""
+        if not self.enabled or df.empty:
+            return
+        ts = _ts_ns(df["ts"])
+        vals = _values(df)
+        groups = df.groupby("device_id", sort=False).indices
+        with self._lock:
+            for device_id, idx in groups.items():
+                ring = self._rings.get(device_id)
+                # Unseeded devices are skipped: seeding reads these rows from DuckDB anyway
+                if ring is not None and ring.floor != UNSEEDED:
+                    ring.append(ts[idx], vals[idx])
+
+    def seeded(self, device_id):
+        ring = self._rings.get(device_id)
+        return ring is not None and ring.floor != UNSEEDED
+
+    def seed(self, device_id, df, floor=None):
+        """
+        Load a device's most recent rows (as returned by ORDER BY ts DESC LIMIT capacity).
+        Must run under the ingest write lock so no committed batch is missed or doubled.
+        floor: when the source holds only rows with ts >= floor (older ones were tiered
+        out), a short seed is complete down to there rather than for the whole history.
+        """
+        if not self.enabled:
+            return
+        ring = DeviceRing(self.capacity)
+        if not df.empty:
+            df = df.iloc[::-1]
+            ring.append(_ts_ns(df["ts"]), _values(df))
+        if len(df) < self.capacity:
+            ring.floor = COMPLETE if floor is None else to_ns(floor) - 1
+        else:
+            # Rows sharing the oldest loaded ts may be only partly loaded
+            ring.floor = int(ring.ts[:ring.size].min())
+        with self._lock:
+            self._rings[device_id] = ring
+            self._rings.move_to_end(device_id)
+            self.seeds += 1
+            while len(self._rings) > self.max_devices:
+                self._rings.popitem(last=False)
+                self.evicted_devices += 1
+
+    # ---------- Read side ----------
+    def last(self, device_id, n):
+        """The n most recent rows (ascending), or None if the buffer cannot answer."""
+        snap = self._snapshot(device_id)
+        if snap is None:
+            return None
+        ts, vals, floor = snap
+        if n <= 0:
+            return self._hit(device_id, ts[:0], vals[:0])
+        if len(ts) >= n and ts[-n] > floor:
+            return self._hit(device_id, ts[-n:], vals[-n:])
+        if floor == COMPLETE:
+            return self._hit(device_id, ts, vals)
+        return self._miss()
+
+    def window(self, device_id, start, end=None, limit=None):
+        """Rows with start <= ts <= end (ascending, first `limit`), or None on a miss."""
+        snap = self._snapshot(device_id)
+        if snap is None:
+            return None
+        ts, vals, floor = snap
+        start_ns = to_ns(start)
+        if start_ns <= floor:
+            return self._miss()
+        lo = np.searchsorted(ts, start_ns, side="left")
+        hi = len(ts) if end is None else np.searchsorted(ts, to_ns(end), side="right")
+        if limit is not None:
+            hi = min(hi, lo + max(0, int(limit)))
+        return self._hit(device_id, ts[lo:hi], vals[lo:hi])
+
+    def _snapshot(self, device_id):
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None or ring.floor == UNSEEDED:
+                self.misses += 1
+                return None
+            self._rings.move_to_end(device_id)
+            ts, vals = ring._ordered()
+            return ts, vals, ring.floor
+
+    def _hit(self, device_id, ts, vals):
+        self.hits += 1
+        return self.frame(device_id, ts, vals)
+
+    def _miss(self):
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def frame(device_id, ts, vals):
+        """Build the same DataFrame shape/dtypes DuckDB's .df() returns for SELECT *."""
+        data = {"ts": ts.astype("datetime64[ns]").astype("datetime64[us]"),
+                "device_id": np.full(len(ts), device_id, dtype=object)}
+        for j, col in enumerate(VALUE_COLUMNS):
+            v = vals[:, j]
+            data[col] = v.astype(np.int32) if col in INT_COLUMNS and not np.isnan(v).any() else v
+        return pd.DataFrame(data, columns=COLUMNS)
+
+    def stats(self):
+        with self._lock:
+            devices = len(self._rings)
+            nbytes = sum(r.nbytes() for r in self._rings.values())
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "rows_per_device": self.capacity,
+            "max_devices": self.max_devices,
+            "devices": devices,
+            "bytes": nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+            "seeds": self.seeds,
+            "evicted_devices": self.evicted_devices,
+        }
@@ -0,0 +1,291 @@
+# api/ingest_queue.py
+"""
+Write-behind ingest: requests enqueue events into a bounded in-memory queue and return
+immediately; one background writer drains the queue and group-commits micro-batches
+(by size or age) to DuckDB in a single transaction.
+
+Producers that retry (edge spools) tag each request with (source, batch): batch numbers
+of a source only grow, the highest committed one is written in the same transaction as
+the rows, and a batch at or below what the source already has committed is acknowledged
+without inserting it again. A resend of a batch that is still queued raises Pending
+instead: it is not safe to acknowledge until its commit succeeds.
+"""
+import threading, time, traceback
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+
+from metrics import registry, SIZE_BUCKETS
+from schema import COLUMNS, normalize_events
+
+registry.histogram("ingest_commit_seconds", "Telemetry commit time (insert + listeners)", subsystem="ingest")
+registry.histogram("ingest_batch_rows", "Rows per committed batch", buckets=SIZE_BUCKETS, subsystem="ingest")
+registry.counter("ingest_rows_total", "Rows committed to telemetry", subsystem="ingest")
+
+INSERT_SQL = f"""
+    INSERT INTO telemetry ({", ".join(COLUMNS)})
+    SELECT {", ".join(COLUMNS)} FROM batch
+"""
+
+MARKS_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_marks (
+    source VARCHAR PRIMARY KEY,
+    batch BIGINT,
+    updated_at TIMESTAMP
+)
+"""
+
+class QueueFull(Exception):
+    """Raised by submit() when accepting the events would exceed max_rows."""
+
+class Duplicate(Exception):
+    """Raised by submit() for a (source, batch) that is already committed."""
+
+class Pending(Exception):
+    """Raised by submit() for a (source, batch) that is queued but not committed yet."""
+
+class IngestQueue:
+    def __init__(self, con, max_rows=50000, batch_rows=5000, max_age_s=0.25):
+        self.max_rows = int(max_rows)
+        self.batch_rows = int(batch_rows)
+        self.max_age_s = float(max_age_s)
+        self._con = con.cursor()          # writer-owned connection to the same database
+        self._con.execute(MARKS_DDL)
+        self._marks = dict(self._con.execute("SELECT source, batch FROM ingest_marks").fetchall())
+        self._queued_marks = {}           # source -> highest batch accepted but not yet committed
+        self.sources = {}                 # source -> last reported producer stats
+        self._cond = threading.Condition()
+        self._pending = deque()           # (enqueued_at, events, future-or-None, mark-or-None)
+        self._pending_rows = 0
+        self._listeners = []
+        self._tx_hooks = []
+        self._thread = None
+        self._stopping = False
+        # Held around every commit + listener fan-out so readers can get a consistent view
+        self.write_lock = threading.Lock()
+        # Stats
+        self.accepted_rows = 0
+        self.rejected_rows = 0
+        self.duplicate_rows = 0
+        self.committed_rows = 0
+        self.failed_rows = 0
+        self.flushes = 0
+        self._flush_ms = deque(maxlen=512)
+        self._last_flush_rows = 0
+
+    # ---------- Producer side ----------
+    def submit(self, events, durable=False, mark=None):
+        """
+        Enqueue a list of event dicts. Returns a Future resolved on commit when durable=True,
+        otherwise None. Raises QueueFull when the queue cannot take the events, Duplicate
+        when `mark` (source, batch) is already committed and Pending while it is still queued.
+        """
+        n = len(events)
+        if n == 0:
+            return None
+        fut = Future() if durable else None
+        with self._cond:
+            if self._stopping:
+                raise QueueFull("ingest queue is shutting down")
+            if mark is not None:
+                source, batch = mark
+                self._check_mark(source, batch, n)
+            if self._pending_rows + n > self.max_rows:
+                self.rejected_rows += n
+                raise QueueFull(f"ingest queue full ({self._pending_rows}/{self.max_rows} rows)")
+            if mark is not None:
+                self._queued_marks[source] = batch
+            was_empty = not self._pending
+            self._pending.append((time.monotonic(), events, fut, mark))
+            self._pending_rows += n
+            self.accepted_rows += n
+            # Wake the writer to arm its age deadline, or to flush a full batch now
+            if was_empty or self._pending_rows >= self.batch_rows:
+                self._cond.notify()
+        return fut
+
+    def reserve(self, source, batch):
+        """
+        Claim (source, batch) for a caller that commits the rows itself (bulk ingest) and
+        passes the mark to commit(); raises Duplicate / Pending like submit(). release() it
+        when the commit fails so the batch can be resent.
+        """
+        with self._cond:
+            self._check_mark(source, batch)
+            self._queued_marks[source] = batch
+
+    def _check_mark(self, source, batch, n=0):
+        # Caller holds _cond
+        if batch <= self._marks.get(source, -1):
+            self.duplicate_rows += n
+            raise Duplicate(f"batch {batch} of {source!r} already committed")
+        if batch <= self._queued_marks.get(source, -1):
+            raise Pending(f"batch {batch} of {source!r} is queued but not committed yet")
+
+    def release(self, source, batch):
+        """Give up a reserve()d batch that was not committed."""
+        self._settle({source: batch})
+
+    def subscribe(self, fn):
+        """Register fn(df) to be called (under write_lock) after every committed batch."""
+        self._listeners.append(fn)
+
+    def in_transaction(self, fn):
+        """
+        Register fn(cur, source) to run inside every commit's transaction, after the rows
+        are inserted, with the batch registered on `cur` as "batch".
+        """
+        self._tx_hooks.append(fn)
+
+    # ---------- Writer side ----------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop accepting events, flush whatever is queued and join the writer."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending_rows >= self.batch_rows or self._stopping:
+                        break
+                    if self._pending:
+                        wait = self._pending[0][0] + self.max_age_s - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if not self._pending and self._stopping:
+                    return
+                items = []; rows = 0
+                while self._pending and (rows < self.batch_rows or self._stopping):
+                    item = self._pending.popleft()
+                    items.append(item); rows += len(item[1])
+                self._pending_rows -= rows
+            try:
+                self._flush(items)
+            except Exception:
+                traceback.print_exc()
+
+    def _flush(self, items):
+        events = [e for _, evts, _, _ in items for e in evts]
+        marks = {}
+        sources = {}                      # device -> named producer, for the device registry
+        for _, evts, _, mark in items:
+            if mark is not None:
+                marks[mark[0]] = max(mark[1], marks.get(mark[0], -1))
+                if self._tx_hooks:
+                    for e in evts:
+                        sources[e.get("device_id")] = mark[0]
+        try:
+            self.commit(normalize_events(events), marks=marks, source=sources or None)
+        except Exception as e:
+            if len(items) > 1:
+                # One malformed request must not sink the whole group: retry per request
+                for item in items:
+                    self._flush([item])
+                return
+            self.failed_rows += len(events)
+            print("[INGEST ERROR]", e)
+            self._settle(marks)
+            fut = items[0][2]
+            if fut is not None and not fut.done():
+                fut.set_exception(e)
+            return
+        for _, evts, fut, _ in items:
+            # A durable caller that timed out cancels its future; the rows are still committed
+            if fut is not None and not fut.done():
+                fut.set_result(len(evts))
+
+    def _settle(self, marks, committed=False):
+        """A marked batch left the queue: record it as committed, or allow it to be resent."""
+        with self._cond:
+            for source, batch in marks.items():
+                if committed:
+                    self._marks[source] = max(batch, self._marks.get(source, -1))
+                if self._queued_marks.get(source) == batch:
+                    del self._queued_marks[source]
+
+    def commit(self, batch, marks=None, source=None):
+        """
+        Insert a normalized frame (pandas DataFrame or Arrow table) in one transaction and
+        notify listeners; `marks` ({source: batch}) are recorded in the same transaction.
+        `source` (a name, or {device_id: name}) is passed to the transaction hooks.
+        Thread-safe.
+        """
+        t0 = time.perf_counter()
+        with self.write_lock:
+            self._con.register("batch", batch)
+            self._con.execute("BEGIN TRANSACTION")
+            try:
+                self._con.execute(INSERT_SQL)
+                for name, b in (marks or {}).items():
+                    self._con.execute(
+                        "INSERT INTO ingest_marks VALUES (?, ?, CURRENT_TIMESTAMP) ON CONFLICT (source) "
+                        "DO UPDATE SET batch = greatest(batch, EXCLUDED.batch), updated_at = EXCLUDED.updated_at",
+                        [name, b])
+                for fn in self._tx_hooks:
+                    fn(self._con, source)
+                self._con.execute("COMMIT")
+            except Exception:
+                self._con.execute("ROLLBACK")
+                raise
+            finally:
+                self._con.unregister("batch")
+            if marks:
+                self._settle(marks, committed=True)
+            self.committed_rows += len(batch)
+            self.flushes += 1
+            self._last_flush_rows = len(batch)
+            self._flush_ms.append((time.perf_counter() - t0) * 1000.0)
+            frame = batch
+            if self._listeners and not isinstance(frame, pd.DataFrame):
+                frame = frame.to_pandas()
+            for fn in self._listeners:
+                try:
+                    fn(frame)
+                except Exception:
+                    traceback.print_exc()
+        registry.observe("ingest_commit_seconds", (), time.perf_counter() - t0)
+        registry.observe("ingest_batch_rows", (), len(batch))
+        registry.inc("ingest_rows_total", (), len(batch))
+        return len(batch)
+
+    # ---------- Introspection ----------
+    def report(self, source, **stats):
+        """Keep the latest self-reported stats of a producer (spool depth, upload lag)."""
+        self.sources[source] = dict(stats, batch=self._marks.get(source), seen=time.time())
+
+    def depth(self):
+        return self._pending_rows
+
+    def stats(self):
+        lat = np.array(self._flush_ms) if self._flush_ms else np.zeros(1)
+        return {
+            "queue_rows": self._pending_rows,
+            "queue_requests": len(self._pending),
+            "max_rows": self.max_rows,
+            "batch_rows": self.batch_rows,
+            "max_age_ms": self.max_age_s * 1000.0,
+            "accepted_rows": self.accepted_rows,
+            "rejected_rows": self.rejected_rows,
+            "duplicate_rows": self.duplicate_rows,
+            "committed_rows": self.committed_rows,
+            "failed_rows": self.failed_rows,
+            "flushes": self.flushes,
+            "last_flush_rows": self._last_flush_rows,
+            "flush_ms_p50": float(np.percentile(lat, 50)),
+            "flush_ms_p99": float(np.percentile(lat, 99)),
+            "flush_ms_max": float(lat.max()),
+        }
@@ -0,0 +1,237 @@
+# api/metrics.py
+"""
+Prometheus-style instrumentation. Histograms and counters are recorded into per-thread
+shards (each thread only ever writes its own dict), so the hot path takes no lock;
+GET /metrics merges the shards and renders the text exposition format.
+
+Every metric belongs to a subsystem, switched on with METRICS (default "all"):
+    METRICS=http,ingest,db,anomaly,storage    METRICS=0 records nothing
+Recording into a disabled subsystem is one set lookup.
+
+    registry.histogram("db_query_seconds", "DuckDB query time", ("site",), subsystem="db")
+    with registry.timer("db_query_seconds", ("window",)):
+        ...
+"""
+import bisect, threading, time
+from functools import wraps
+
+SUBSYSTEMS = ("http", "ingest", "db", "anomaly", "storage")
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 10, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000)
+
+class _Def:
+    __slots__ = ("kind", "help", "labelnames", "buckets", "subsystem", "fn")
+
+    def __init__(self, kind, help, labelnames, buckets, subsystem, fn=None):
+        self.kind, self.help, self.labelnames = kind, help, tuple(labelnames)
+        self.buckets, self.subsystem, self.fn = buckets, subsystem, fn
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "t0")
+
+    def __init__(self, registry, name, labels):
+        self.registry, self.name, self.labels = registry, name, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, self.labels, time.perf_counter() - self.t0)
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+_NULL = _NullTimer()
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Registry:
+    def __init__(self, enabled="all"):
+        self._defs = {}
+        self._live = frozenset()          # names of the metrics whose subsystem is on
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()     # taken once per thread (new shard) and at scrape
+        self.configure(enabled)
+
+    def configure(self, spec):
+        """Enable subsystems from a spec: "all", "0"/"none"/"", or a comma-separated list."""
+        spec = (spec or "").strip().lower()
+        if spec in ("all", "1", "true"):
+            self.enabled = frozenset(SUBSYSTEMS)
+        elif spec in ("", "0", "none", "false"):
+            self.enabled = frozenset()
+        else:
+            self.enabled = frozenset(s.strip() for s in spec.split(",") if s.strip())
+        self._refresh()
+
+    def on(self, subsystem):
+        return subsystem in self.enabled
+
+    def _refresh(self):
+        self._live = frozenset(n for n, d in self._defs.items() if d.subsystem in self.enabled)
+
+    # ---------- Definitions (idempotent, so modules can declare what they record) ----------
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, subsystem="http"):
+        self._defs.setdefault(name, _Def("histogram", help, labelnames, tuple(buckets), subsystem))
+        self._refresh()
+
+    def counter(self, name, help, labelnames=(), subsystem="http"):
+        self._defs.setdefault(name, _Def("counter", help, labelnames, None, subsystem))
+        self._refresh()
+
+    def collect(self, name, help, fn, kind="gauge", labelnames=(), subsystem="storage"):
+        """A value read at scrape time: fn() returns a number, or {label values tuple: number}."""
+        self._defs[name] = _Def(kind, help, labelnames, None, subsystem, fn)
+        self._refresh()
+
+    # ---------- Hot path ----------
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def observe(self, name, labels, value):
+        if name not in self._live:
+            return
+        shard = self._shard()
+        cell = shard.get((name, labels))
+        buckets = self._defs[name].buckets
+        if cell is None:
+            cell = shard[(name, labels)] = [0] * (len(buckets) + 1) + [0.0, 0]
+        cell[bisect.bisect_left(buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def inc(self, name, labels=(), n=1):
+        if name not in self._live:
+            return
+        shard = self._shard()
+        cell = shard.get((name, labels))
+        if cell is None:
+            cell = shard[(name, labels)] = [0]
+        cell[0] += n
+
+    def timer(self, name, labels=()):
+        return _Timer(self, name, labels) if name in self._live else _NULL
+
+    def timed(self, name, labels=()):
+        """Decorator: observe the duration of every call."""
+        def wrap(fn):
+            @wraps(fn)
+            def inner(*a, **kw):
+                if name not in self._live:
+                    return fn(*a, **kw)
+                t0 = time.perf_counter()
+                try:
+                    return fn(*a, **kw)
+                finally:
+                    self.observe(name, labels, time.perf_counter() - t0)
+            return inner
+        return wrap
+
+    # ---------- Scrape ----------
+    def snapshot(self):
+        """{name: {labels: merged cell}} over every thread's shard."""
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            for (name, labels), cell in list(shard.items()):
+                into = merged.setdefault(name, {})
+                have = into.get(labels)
+                into[labels] = list(cell) if have is None else [a + b for a, b in zip(have, cell)]
+        return merged
+
+    def render(self):
+        merged = self.snapshot()
+        out = []
+        for name in sorted(self._live):
+            d = self._defs[name]
+            out.append(f"# HELP {name} {d.help}")
+            out.append(f"# TYPE {name} {d.kind}")
+            if d.fn is not None:
+                try:
+                    value = d.fn()
+                except Exception:
+                    continue
+                items = value.items() if isinstance(value, dict) else [((), value)]
+                for labels, v in items:
+                    if v is not None:
+                        out.append(f"{name}{_labels(d.labelnames, labels)} {_num(v)}")
+                continue
+            for labels, cell in sorted(merged.get(name, {}).items()):
+                if d.kind == "counter":
+                    out.append(f"{name}{_labels(d.labelnames, labels)} {_num(cell[0])}")
+                    continue
+                cum = 0
+                for le, n in zip(d.buckets + ("+Inf",), cell):
+                    cum += n
+                    le = 'le="%s"' % le
+                    out.append(f"{name}_bucket{_labels(d.labelnames, labels, le)} {cum}")
+                out.append(f"{name}_sum{_labels(d.labelnames, labels)} {_num(cell[-2])}")
+                out.append(f"{name}_count{_labels(d.labelnames, labels)} {cell[-1]}")
+        return "\n".join(out) + "\n"
+
+registry = Registry()
+
+class MetricsMiddleware:
+    """ASGI middleware: http_request_duration_seconds per method, route template and status."""
+    def __init__(self, app, registry=registry):
+        self.app = app
+        self.registry = registry
+        self._routes = {}
+        registry.histogram("http_request_duration_seconds", "HTTP request latency until the response is sent",
+                           ("method", "route", "status"), subsystem="http")
+
+    def _route(self, scope):
+        path = scope["path"]
+        route = self._routes.get(path)
+        if route is None:
+            from starlette.routing import Match
+            route = "unmatched"
+            for r in scope["app"].router.routes:
+                if r.matches(scope)[0] == Match.FULL:
+                    route = r.path
+                    break
+            if route != "unmatched":
+                self._routes[path] = route      # only known routes, so arbitrary paths cannot grow the map
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.on("http"):
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            self.registry.observe("http_request_duration_seconds",
+                                  (scope["method"], self._route(scope), str(status[0])), time.perf_counter() - t0)
@@ -0,0 +1,210 @@
+# api/models.py
+"""
+IsolationForest model registry. One model per key (device id by default) is fitted on a
+trailing baseline in the background and cached; request paths only call score_samples.
+
+- Refresh: models older than refresh_s are refitted in the background; a model whose
+  window scores drift away from its baseline is refitted early (at most every min_refit_s).
+- Eviction: LRU bounded by max_models; entries idle for longer than ttl_s are dropped.
+- Persistence: with model_dir set, fitted models are written with joblib and reloaded on
+  first use after a restart instead of being refitted.
+"""
+import os, re, threading, time, traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from anomaly import METRICS
+from metrics import registry
+
+IFOREST_PARAMS = dict(n_estimators=100, contamination=0.05, random_state=42)
+
+class _Entry:
+    """A fitted model plus its baseline score distribution; scores like the model itself."""
+    def __init__(self, model, fitted_at, rows, score_mean, score_std):
+        self.model = model
+        self.fitted_at = fitted_at
+        self.rows = rows
+        self.score_mean = score_mean
+        self.score_std = score_std
+        self.last_used = time.time()
+        self.on_scores = None
+
+    @property
+    def offset_(self):
+        return self.model.offset_
+
+    def score_samples(self, X):
+        s = self.model.score_samples(X)
+        if self.on_scores is not None:
+            self.on_scores(self, s)
+        return s
+
+def fit_model(df, params=None):
+    """Fit an IsolationForest (IFOREST_PARAMS unless given) on a baseline frame; returns an _Entry or None if too short."""
+    from sklearn.ensemble import IsolationForest
+    X = df[METRICS].astype(float).fillna(0.0)
+    if len(X) < 40:
+        return None
+    with registry.timer("anomaly_stage_seconds", ("registry_fit",)):
+        model = IsolationForest(**(params or IFOREST_PARAMS)).fit(X)
+    s = model.score_samples(X)
+    return _Entry(model, time.time(), len(X), float(s.mean()), float(s.std()))
+
+class ModelRegistry:
+    def __init__(self, baseline_loader, key_fn=None, max_models=1000, ttl_s=6 * 3600,
+                 refresh_s=900, min_refit_s=60, drift_sigma=4.0, model_dir=None, workers=1):
+        self.baseline_loader = baseline_loader      # key -> baseline DataFrame
+        self.key_fn = key_fn or (lambda device_id: device_id)
+        self.max_models = int(max_models)
+        self.ttl_s = float(ttl_s)
+        self.refresh_s = float(refresh_s)
+        self.min_refit_s = float(min_refit_s)
+        self.drift_sigma = float(drift_sigma)
+        self.model_dir = model_dir
+        self._models = OrderedDict()
+        self._inflight = set()
+        self._retry_at = {}          # key -> earliest time to retry a fit that had no baseline
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model-fit")
+        self._stop = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.fits = 0
+        self.loads = 0
+        self.drift_refits = 0
+        self.evictions = 0
+        if model_dir:
+            os.makedirs(model_dir, exist_ok=True)
+
+    # ---------- Request path ----------
+    def get(self, device_id):
+        """
+        Cached model for the device's key, or None (a background fit is scheduled). The
+        returned entry is used like the estimator: score_samples() and offset_.
+        """
+        key = self.key_fn(device_id)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                entry.last_used = time.time()
+                self.hits += 1
+                return entry
+        entry = self._load(key)
+        if entry is not None:
+            self._put(key, entry)
+            if time.time() - entry.fitted_at > self.refresh_s:
+                self.schedule(key)
+            with self._lock:
+                self.hits += 1
+            return entry
+        with self._lock:
+            self.misses += 1
+        self.schedule(key)
+        return None
+
+    def _observe(self, key, entry, raw_scores):
+        """Window scores fed back by _Entry.score_samples; a drifted mean triggers an early refit."""
+        if len(raw_scores) < 40 or entry.score_std <= 0:
+            return
+        shift = abs(float(np.mean(raw_scores)) - entry.score_mean) / entry.score_std
+        if shift > self.drift_sigma and time.time() - entry.fitted_at > self.min_refit_s:
+            self.schedule(key, drift=True)
+
+    # ---------- Background fitting ----------
+    def schedule(self, key, drift=False):
+        """Fit the key's model in the background unless a fit is in flight or backing off."""
+        with self._lock:
+            if key in self._inflight or time.time() < self._retry_at.get(key, 0.0):
+                return
+            self._inflight.add(key)
+            if drift:
+                self.drift_refits += 1
+        self._pool.submit(self._fit, key)
+
+    def _fit(self, key):
+        try:
+            entry = fit_model(self.baseline_loader(key))
+            if entry is None:
+                with self._lock:
+                    self._retry_at[key] = time.time() + self.min_refit_s
+                return
+            self._put(key, entry)
+            self._save(key, entry)
+            with self._lock:
+                self._retry_at.pop(key, None)
+                self.fits += 1
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def _put(self, key, entry):
+        entry.on_scores = lambda e, scores: self._observe(key, e, scores)
+        with self._lock:
+            self._models[key] = entry
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+                self.evictions += 1
+
+    def start(self, interval_s=30.0):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._maintain, args=(interval_s,),
+                                            name="model-registry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _maintain(self, interval_s):
+        while not self._stop.wait(interval_s):
+            self.expire()
+
+    def expire(self, now=None):
+        """Drop entries idle for over ttl_s and schedule refits of those older than refresh_s."""
+        now = time.time() if now is None else now
+        with self._lock:
+            idle = [k for k, e in self._models.items() if now - e.last_used > self.ttl_s]
+            for k in idle:
+                del self._models[k]
+            self.evictions += len(idle)
+            stale = [k for k, e in self._models.items() if now - e.fitted_at > self.refresh_s]
+        for k in stale:
+            self.schedule(k)
+
+    # ---------- Persistence ----------
+    def _path(self, key):
+        return os.path.join(self.model_dir, re.sub(r"[^A-Za-z0-9._-]", "_", str(key)) + ".joblib")
+
+    def _save(self, key, entry):
+        if not self.model_dir:
+            return
+        import joblib
+        tmp = f"{self._path(key)}.{os.getpid()}.tmp"     # processes may share model_dir
+        joblib.dump({"model": entry.model, "fitted_at": entry.fitted_at, "rows": entry.rows,
+                     "score_mean": entry.score_mean, "score_std": entry.score_std}, tmp)
+        os.replace(tmp, self._path(key))
+
+    def _load(self, key):
+        if not self.model_dir or not os.path.exists(self._path(key)):
+            return None
+        try:
+            import joblib
+            d = joblib.load(self._path(key))
+        except Exception:
+            traceback.print_exc()
+            return None
+        self.loads += 1
+        return _Entry(d["model"], d["fitted_at"], d["rows"], d["score_mean"], d["score_std"])
+
+    def stats(self):
+        with self._lock:
+            return {"models": len(self._models), "max_models": self.max_models,
+                    "inflight": len(self._inflight), "hits": self.hits, "misses": self.misses,
+                    "fits": self.fits, "loads": self.loads, "drift_refits": self.drift_refits,
+                    "evictions": self.evictions, "persisted": bool(self.model_dir)}
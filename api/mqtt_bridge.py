@@ -0,0 +1,160 @@
+# api/mqtt_bridge.py
+"""
+MQTT ingest bridge. Subscribes to telemetry topics (telemetry/<device_id>, payload one
+event or a JSON array of events), validates each event against the canonical schema and
+commits them to the telemetry table in large batches (batch_rows or flush_s, whichever
+comes first) through IngestQueue.commit, so listeners (hot cache, detector, feed,
+rollups) see them like any other ingest.
+
+Messages are received with manual acknowledgement: a QoS 1 message is acked only after
+the batch holding it is committed, so the broker redelivers whatever was not committed
+when the process died. When commits fall behind, the network thread blocks once
+max_pending_rows are waiting, pushing back on the broker.
+
+Remediation actions are published to <action_prefix>/<device_id> (QoS 1) as they are
+enqueued.
+"""
+import json, threading, time, traceback
+from collections import deque
+import numpy as np
+
+from schema import normalize_events, validate_event
+
+class MqttBridge:
+    def __init__(self, ingest_q, host, port=1883, topic="telemetry/#", action_prefix="actions", qos=1,
+                 batch_rows=20000, flush_s=0.25, max_pending_rows=200000, client_id="eta-api-bridge",
+                 username=None, password=None):
+        import paho.mqtt.client as mqtt
+        self.ingest_q = ingest_q
+        self.host, self.port = host, int(port)
+        self.topic = topic
+        self.action_prefix = action_prefix
+        self.qos = int(qos)
+        self.batch_rows = int(batch_rows)
+        self.flush_s = float(flush_s)
+        self.max_pending_rows = int(max_pending_rows)
+        self._cond = threading.Condition()
+        self._events = []
+        self._acks = []                      # (mid, qos) of the messages in _events
+        self._oldest = None
+        self._stopping = False
+        self._thread = None
+        self.connected = False
+        self.messages = 0
+        self.committed_rows = 0
+        self.invalid_events = 0
+        self.invalid_messages = 0
+        self.last_invalid = None
+        self.published_actions = 0
+        self._flush_ms = deque(maxlen=256)
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id,
+                                  clean_session=False, manual_ack=True)
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.reconnect_delay_set(1, 30)
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mqtt-bridge", daemon=True)
+        self._thread.start()
+        self.client.connect_async(self.host, self.port, keepalive=30)
+        self.client.loop_start()
+
+    def stop(self, timeout=10.0):
+        """Stop receiving, commit what is pending and disconnect."""
+        self.client.unsubscribe(self.topic)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    # ---------- MQTT callbacks (network thread) ----------
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if not reason_code.is_failure:
+            self.connected = True
+            client.subscribe(self.topic, qos=self.qos)
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.connected = False
+
+    def _on_message(self, client, userdata, msg):
+        self.messages += 1
+        parts = msg.topic.split("/", 1)
+        device_id = parts[1] if len(parts) == 2 and parts[1] and "/" not in parts[1] else None
+        try:
+            payload = json.loads(msg.payload)
+        except ValueError as e:
+            self.invalid_messages += 1; self.last_invalid = f"{msg.topic}: {e}"
+            client.ack(msg.mid, msg.qos)
+            return
+        events = []
+        for e in payload if isinstance(payload, list) else [payload]:
+            try:
+                events.append(validate_event(e, device_id))
+            except ValueError as err:
+                self.invalid_events += 1; self.last_invalid = f"{msg.topic}: {err}"
+        with self._cond:
+            while len(self._events) >= self.max_pending_rows and not self._stopping:
+                self._cond.wait(0.5)
+            if not self._acks:
+                self._oldest = time.monotonic()
+                self._cond.notify_all()
+            self._events.extend(events)
+            self._acks.append((msg.mid, msg.qos))
+            if len(self._events) >= self.batch_rows:
+                self._cond.notify_all()
+
+    # ---------- Batch writer ----------
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and len(self._events) < self.batch_rows:
+                    if self._acks:
+                        wait = self._oldest + self.flush_s - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                events, acks = self._events, self._acks
+                self._events, self._acks = [], []
+                stopping = self._stopping
+                self._cond.notify_all()
+            if events:
+                t0 = time.perf_counter()
+                try:
+                    self.ingest_q.commit(normalize_events(events), source="mqtt")
+                except Exception:
+                    # Not acked: the broker redelivers these messages after a reconnect
+                    traceback.print_exc()
+                    acks = []
+                else:
+                    self.committed_rows += len(events)
+                    self._flush_ms.append((time.perf_counter() - t0) * 1000.0)
+            for mid, qos in acks:
+                self.client.ack(mid, qos)
+            if stopping:
+                return
+
+    # ---------- Actions ----------
+    def publish_action(self, action):
+        """ActionQueue listener: push a newly enqueued action to its device's topic."""
+        self.client.publish(f"{self.action_prefix}/{action['device_id']}", json.dumps(action), qos=1)
+        self.published_actions += 1
+
+    def stats(self):
+        lat = np.array(self._flush_ms) if self._flush_ms else np.zeros(1)
+        with self._cond:
+            pending = len(self._events)
+        return {"enabled": True, "connected": self.connected, "broker": f"{self.host}:{self.port}",
+                "topic": self.topic, "messages": self.messages, "pending_rows": pending,
+                "committed_rows": self.committed_rows, "invalid_messages": self.invalid_messages,
+                "invalid_events": self.invalid_events, "last_invalid": self.last_invalid,
+                "published_actions": self.published_actions,
+                "flush_ms_p50": float(np.percentile(lat, 50)), "flush_ms_p99": float(np.percentile(lat, 99))}
@@ -0,0 +1,129 @@
+# api/overview.py
+"""
+Batched fleet overview: one compact summary per device (latest values, a sparkline per
+metric, flagged-sample count) for the dashboard's fleet page, built from a single
+aggregation query instead of one request per device.
+
+The window [end - points*step, end) is aligned to whole steps, so repeated calls within a
+step see the same buckets and sparklines do not jitter. Each sparkline value is the
+metric's mean over its step; steps of whole minutes read the 1m rollup table (when
+rollups are on), shorter ones the raw hot table. Anomaly counts are the samples the
+streaming detector flagged in the window (kept in memory, per device).
+
+Results are cached for ttl_s per (minutes, points, metrics): any number of open dashboards
+cost at most one build per ttl_s, and concurrent callers of a cold key share one build.
+"""
+import math, threading, time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+def _jsonable(values):
+    """Float array -> (nested) list with NaN as None (JSON has no NaN)."""
+    out = np.round(values, 3).astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+class FleetOverview:
+    def __init__(self, query, flagged_counts, rollups=False, ttl_s=2.0):
+        self.query = query                   # app.query(site, sql, params) -> cursor
+        self.flagged_counts = flagged_counts # since_ns -> {device_id: flagged samples}
+        self.rollups = bool(rollups)
+        self.ttl_s = float(ttl_s)
+        self._cache = {}                     # key -> (monotonic built, summary)
+        self._building = {}                  # key -> lock held while that key is built
+        self._lock = threading.Lock()        # guards _cache and _building only
+
+    def summary(self, minutes, points, metrics):
+        """The summary of every device, anomalous first; returns (summary, cached)."""
+        key = (float(minutes), int(points), tuple(metrics))
+        with self._lock:
+            hit = self._fresh(key)
+            if hit is not None:
+                return hit, True
+            building = self._building.setdefault(key, threading.Lock())
+        # Only callers of this key wait on its build; other keys are served meanwhile
+        with building:
+            with self._lock:
+                hit = self._fresh(key)       # built while we waited
+            if hit is not None:
+                return hit, True
+            try:
+                out = self._build(*key)
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+            with self._lock:
+                now = time.monotonic()
+                self._cache = {k: v for k, v in self._cache.items() if now - v[0] < self.ttl_s}
+                self._cache[key] = (now, out)
+        return out, False
+
+    def _fresh(self, key):
+        """The cached summary of key if still within ttl_s (caller holds _lock)."""
+        hit = self._cache.get(key)
+        return hit[1] if hit is not None and time.monotonic() - hit[0] < self.ttl_s else None
+
+    def _build(self, minutes, points, metrics):
+        step_s = max(1, math.ceil(minutes * 60 / points))
+        step_ms = step_s * 1000
+        end_ms = math.ceil(time.time() * 1000 / step_ms) * step_ms
+        start_ms = end_ms - points * step_ms
+        start = datetime.utcfromtimestamp(start_ms / 1000)
+        source = "1m" if self.rollups and step_s % 60 == 0 else "raw"
+        if source == "raw":
+            cols = ", ".join(f"avg({m}) AS {m}, arg_max({m}, ts) FILTER (WHERE {m} IS NOT NULL) AS {m}_last, "
+                             f"max(ts) FILTER (WHERE {m} IS NOT NULL) AS {m}_last_ts"
+                             for m in metrics)
+            buckets = f"""
+                SELECT device_id, least((epoch_ms(ts) - ?) // ?, ?) AS b, count(*) AS n, max(ts) AS last_ts, {cols}
+                FROM telemetry
+                WHERE ts >= ?
+                GROUP BY ALL
+            """
+        else:
+            cols = ", ".join(f"sum({m}_sum) / nullif(sum({m}_count), 0) AS {m}, "
+                             f"arg_max({m}_last, {m}_last_ts) FILTER (WHERE {m}_last IS NOT NULL) AS {m}_last, "
+                             f"max({m}_last_ts) FILTER (WHERE {m}_last IS NOT NULL) AS {m}_last_ts"
+                             for m in metrics)
+            buckets = f"""
+                SELECT device_id, least((epoch_ms(bucket) - ?) // ?, ?) AS b, sum(rows) AS n, max(last_ts) AS last_ts, {cols}
+                FROM rollup_1m
+                WHERE bucket >= ?
+                GROUP BY ALL
+            """
+        # A metric's latest value is its newest non-null one in any bucket, not just the newest bucket
+        latest_cols = ", ".join(f"arg_max({m}_last, {m}_last_ts) OVER (PARTITION BY device_id) AS {m}_latest"
+                                for m in metrics)
+        sql = f"SELECT *, {latest_cols} FROM ({buckets})"
+        df = self.query("fleet_summary", sql, [start_ms, step_ms, points - 1, start]).df()
+        flagged = self.flagged_counts(start_ms * 1_000_000)
+
+        devices = []
+        if not df.empty:
+            df = df[df["device_id"].notna()].sort_values(["device_id", "b"], kind="stable")
+            codes, names = pd.factorize(df["device_id"])
+            b = df["b"].to_numpy(dtype=np.int64)
+            newest = np.r_[codes[1:] != codes[:-1], True]           # one row per device
+            rows = np.bincount(codes, weights=df["n"].to_numpy(dtype=float), minlength=len(names))
+            last_ts = df.groupby(codes)["last_ts"].max().to_numpy()
+            spark, latest = {}, {}
+            for m in metrics:
+                grid = np.full((len(names), points), np.nan)
+                grid[codes, b] = df[m].to_numpy(dtype=float, na_value=np.nan)
+                spark[m] = grid
+                latest[m] = _jsonable(df[f"{m}_latest"].to_numpy(dtype=float, na_value=np.nan)[newest])
+            spark = {m: _jsonable(grid) for m, grid in spark.items()}
+            for i, device_id in enumerate(names):
+                devices.append({
+                    "device_id": device_id,
+                    "last_ts": pd.Timestamp(last_ts[i]).isoformat(),
+                    "rows": int(rows[i]),
+                    "anomalies": int(flagged.get(device_id, 0)),
+                    "latest": {m: latest[m][i] for m in metrics},
+                    "spark": {m: spark[m][i] for m in metrics},
+                })
+            devices.sort(key=lambda d: (-d["anomalies"], d["device_id"]))
+        return {"minutes": minutes, "points": points, "step_s": step_s, "source": source,
+                "start": start.isoformat() + "Z", "end": datetime.utcfromtimestamp(end_ms / 1000).isoformat() + "Z",
+                "metrics": list(metrics), "devices": devices}
@@ -0,0 +1,327 @@
+# api/policy.py
+"""
+Closed-loop auto-remediation. The streaming detector reports the samples it flags as each
+ingest batch commits; a device with trigger.min_anomalies flagged samples within
+trigger.window_s is queued, and a worker thread runs the full detection + RCA over its
+recent window (`evaluate`), takes the top-ranked cause and picks the first rule for that
+cause whose min_score it reaches (POLICY_RULES, policies.yaml). A device is evaluated at
+most every eval_interval_s, so a burst of flags costs one RCA.
+
+A matching decision then has to pass, in order: the rule's cooldown_s on that device,
+device_max_per_hour actions per device and fleet_max_per_minute across the fleet. One that
+passes is dispatched at once through the action queue (which wakes the device's long-poll
+and publishes it over MQTT), or, when the engine or the rule is in dry-run, only recorded;
+limits count dry-run decisions too, so a dry run shows what would really have been sent.
+Cooldowns survive restarts (seeded from the decisions of the last hour).
+
+Every decision is a policy_decisions row with its closed-loop timestamps:
+
+    sample_ts      newest flagged sample of the trigger (device clock)
+    detected_at    its batch committed and was scored
+    decided_at     RCA done, rule matched, limits passed
+    dispatched_at  enqueued for the device (null in dry-run)
+
+joined with action_queue's delivered_at (handed to the agent) and acked_at (applied) by
+decisions(); remediation_latency_seconds{stage} observes detect, decide, dispatch, apply
+(dispatch to ack) and total (sample to ack) for graphing.
+"""
+import json, threading, time, traceback
+from collections import deque
+from datetime import datetime, timezone
+import numpy as np
+import yaml
+
+from metrics import registry
+
+registry.histogram("remediation_latency_seconds", "Closed-loop remediation latency by stage", ("stage",),
+                   buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+                   subsystem="anomaly")
+registry.counter("remediation_decisions_total", "Policy evaluations by outcome", ("outcome",), subsystem="anomaly")
+
+DDL = """
+CREATE TABLE IF NOT EXISTS policy_decisions (
+    id BIGINT PRIMARY KEY,
+    device_id VARCHAR,
+    rule VARCHAR,
+    cause VARCHAR,
+    score DOUBLE,
+    action VARCHAR,
+    params VARCHAR,
+    dry_run BOOLEAN,
+    action_id BIGINT,
+    sample_ts TIMESTAMP,
+    detected_at TIMESTAMP,
+    decided_at TIMESTAMP,
+    dispatched_at TIMESTAMP
+)
+"""
+
+SETTINGS = {"trigger": {"min_anomalies": 3, "window_s": 60.0}, "eval_interval_s": 10.0,
+            "limits": {"device_max_per_hour": 6, "fleet_max_per_minute": 30},
+            "defaults": {"min_score": 0.3, "cooldown_s": 300.0, "dry_run": False, "params": {}}}
+
+def load_rules(path):
+    """Parse and check a rules file; returns the settings with every rule's defaults filled in."""
+    with open(path, "r") as f:
+        doc = yaml.safe_load(f) or {}
+    cfg = {k: dict(v, **(doc.get(k) or {})) if isinstance(v, dict) else doc.get(k, v) for k, v in SETTINGS.items()}
+    rules = []
+    for i, r in enumerate(doc.get("rules") or []):
+        missing = [k for k in ("name", "cause", "action") if not r.get(k)]
+        if missing:
+            raise ValueError(f"rule {i} ({r.get('name', '?')}) lacks {', '.join(missing)}")
+        rules.append(dict(cfg["defaults"], **r))
+    cfg["rules"] = rules
+    return cfg
+
+def _utc(t):
+    return datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None) if t is not None else None
+
+def _iso(d):
+    return d.isoformat() + "Z" if d is not None else None
+
+class PolicyEngine:
+    def __init__(self, con, rules, evaluate, dispatch, dry_run=False, history=512):
+        """
+        rules: load_rules() result. evaluate(device_id) -> (anomalies, rca) over the device's
+        recent window. dispatch(device_id, action, params) -> queued action with its "id".
+        """
+        self.con = con
+        self.evaluate = evaluate
+        self.dispatch = dispatch
+        self.dry_run = bool(dry_run)
+        self.configure(rules)
+        con.execute(DDL)
+        self._next_id = int(con.execute("SELECT coalesce(max(id), 0) FROM policy_decisions").fetchall()[0][0]) + 1
+        self._cond = threading.Condition()
+        self._flags = {}                 # device_id -> deque of flagged sample ts (ns) in the trigger window
+        self._pending = {}               # device_id -> (sample_ts, detected_at), oldest trigger first
+        self._next_eval = {}             # device_id -> monotonic time it may be evaluated again
+        self._fired = {}                 # (device_id, rule) -> time of its last decision
+        self._device_sent = {}           # device_id -> deque of decision times (last hour)
+        self._fleet_sent = deque()       # decision times (last minute)
+        self._inflight = {}              # device_id -> [(action_id, sample_ts, dispatched_at)]
+        self._latency = {s: deque(maxlen=history) for s in ("detect", "decide", "dispatch", "apply", "total")}
+        self._thread = None
+        self._stopping = False
+        self.triggers = 0
+        self.outcomes = {}
+        self._seed()
+
+    def configure(self, rules):
+        self.rules = rules["rules"]
+        self.min_anomalies = int(rules["trigger"]["min_anomalies"])
+        self.window_ns = int(float(rules["trigger"]["window_s"]) * 1e9)
+        self.eval_interval_s = float(rules["eval_interval_s"])
+        self.device_max = int(rules["limits"]["device_max_per_hour"])
+        self.fleet_max = int(rules["limits"]["fleet_max_per_minute"])
+
+    def _seed(self):
+        now = time.time()
+        rows = self.con.cursor().execute(
+            "SELECT device_id, rule, decided_at FROM policy_decisions WHERE decided_at >= ? ORDER BY decided_at",
+            [_utc(now - 3600)]).fetchall()
+        for device_id, rule, decided in rows:
+            t = decided.replace(tzinfo=timezone.utc).timestamp()
+            self._fired[(device_id, rule)] = t
+            self._device_sent.setdefault(device_id, deque()).append(t)
+            if t >= now - 60:
+                self._fleet_sent.append(t)
+
+    # ---------- Trigger (detector listener, under the ingest write lock: no I/O) ----------
+    def on_anomalies(self, flags):
+        """StreamingDetector listener: {device_id: [(ts_ns, metric, score), ...]} flagged in a batch."""
+        detected = time.time()
+        with self._cond:
+            woke = False
+            for device_id, hits in flags.items():
+                q = self._flags.setdefault(device_id, deque())
+                q.extend(sorted({h[0] for h in hits}))
+                newest = q[-1]
+                while q and q[0] < newest - self.window_ns:
+                    q.popleft()
+                if len(q) < self.min_anomalies:
+                    continue
+                q.clear()
+                self.triggers += 1
+                if device_id not in self._pending:
+                    self._pending[device_id] = (newest / 1e9, detected)
+                    woke = True
+            if woke:
+                self._cond.notify()
+
+    # ---------- Decide + dispatch (worker) ----------
+    def _take(self):
+        with self._cond:
+            while not self._stopping:
+                now = time.monotonic()
+                ready = next((d for d in self._pending if self._next_eval.get(d, 0.0) <= now), None)
+                if ready is not None:
+                    self._next_eval[ready] = now + self.eval_interval_s
+                    return ready, self._pending.pop(ready)
+                wait = min((self._next_eval[d] - now for d in self._pending), default=None)
+                self._cond.wait(wait)
+        return None
+
+    def _count(self, outcome):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        registry.inc("remediation_decisions_total", (outcome,))
+
+    def _admit(self, device_id, rule, now):
+        """None if the decision may go out, else the limit hit; _charge() it once it has gone out."""
+        last = self._fired.get((device_id, rule["name"]))
+        if last is not None and now - last < float(rule["cooldown_s"]):
+            return "cooldown"
+        sent = self._device_sent.setdefault(device_id, deque())
+        while sent and sent[0] < now - 3600:
+            sent.popleft()
+        if len(sent) >= self.device_max:
+            return "device_limit"
+        while self._fleet_sent and self._fleet_sent[0] < now - 60:
+            self._fleet_sent.popleft()
+        if len(self._fleet_sent) >= self.fleet_max:
+            return "fleet_limit"
+        return None
+
+    def _charge(self, device_id, rule, now):
+        """Start the rule's cooldown and count the decision against the device/fleet limits."""
+        self._fired[(device_id, rule["name"])] = now
+        self._device_sent.setdefault(device_id, deque()).append(now)
+        self._fleet_sent.append(now)
+
+    def _observe(self, stage, seconds):
+        registry.observe("remediation_latency_seconds", (stage,), max(0.0, seconds))
+        self._latency[stage].append(max(0.0, seconds) * 1000.0)
+
+    def step(self, device_id, sample_ts, detected_at):
+        """Evaluate one triggered device: RCA, rule match, limits, dispatch; returns the outcome."""
+        try:
+            _, rca = self.evaluate(device_id)
+        except Exception:
+            traceback.print_exc()
+            self._count("error")
+            return "error"
+        ranked = rca.get("ranked") or []
+        top = ranked[0] if ranked else None
+        rules = [r for r in self.rules if top is not None and r["cause"] == top["metric"]]
+        rule = next((r for r in rules if top["score"] >= float(r["min_score"])), None)
+        if rule is None:
+            outcome = "no_cause" if top is None else "low_score" if rules else "no_rule"
+            self._count(outcome)
+            return outcome
+        decided = time.time()
+        limited = self._admit(device_id, rule, decided)
+        if limited:
+            self._count(limited)
+            return limited
+        dry = self.dry_run or bool(rule["dry_run"])
+        action_id = dispatched = None
+        if not dry:
+            queued = self.dispatch(device_id, rule["action"], rule["params"])
+            action_id = int(queued["id"])
+            # When it became visible to agents: a woken long-poll may deliver it before dispatch returns
+            dispatched = datetime.fromisoformat(queued["created_at"].rstrip("Z")).replace(tzinfo=timezone.utc).timestamp()
+            with self._cond:
+                self._inflight.setdefault(device_id, []).append((action_id, sample_ts, dispatched))
+        # Only now: a dispatch that raised leaves no cooldown and no limit charged
+        self._charge(device_id, rule, decided)
+        decision_id = self._next_id
+        self._next_id += 1
+        self.con.cursor().execute(
+            "INSERT INTO policy_decisions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [decision_id, device_id, rule["name"], top["metric"], float(top["score"]), rule["action"],
+             json.dumps(rule["params"]), dry, action_id, _utc(sample_ts), _utc(detected_at), _utc(decided),
+             _utc(dispatched)])
+        self._observe("detect", detected_at - sample_ts)
+        self._observe("decide", decided - detected_at)
+        if dispatched is not None:
+            self._observe("dispatch", dispatched - decided)
+        outcome = "dry_run" if dry else "dispatched"
+        self._count(outcome)
+        return outcome
+
+    def _loop(self):
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            device_id, (sample_ts, detected_at) = job
+            try:
+                self.step(device_id, sample_ts, detected_at)
+            except Exception:
+                traceback.print_exc()
+                self._count("error")
+
+    # ---------- Applied (action queue ack listener) ----------
+    def on_ack(self, device_id, upto, acked_at):
+        """ActionQueue ack listener: closes the loop of this device's dispatched actions with id <= upto."""
+        with self._cond:
+            items = self._inflight.get(device_id)
+            if not items:
+                return
+            done = [i for i in items if i[0] <= upto]
+            # Actions never acked are dropped after an hour
+            keep = [i for i in items if i[0] > upto and i[2] >= acked_at - 3600]
+            if keep:
+                self._inflight[device_id] = keep
+            else:
+                del self._inflight[device_id]
+        for _, sample_ts, dispatched in done:
+            self._observe("apply", acked_at - dispatched)
+            self._observe("total", acked_at - sample_ts)
+
+    # ---------- Lifecycle / reads ----------
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._loop, name="policy", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(10)
+            self._thread = None
+
+    def decisions(self, device_id=None, limit=100):
+        """Newest decisions first, with delivery/ack times and per-stage latencies (ms)."""
+        rows = self.con.cursor().execute(
+            """
+            SELECT d.id, d.device_id, d.rule, d.cause, d.score, d.action, d.params, d.dry_run, d.action_id,
+                   d.sample_ts, d.detected_at, d.decided_at, d.dispatched_at, q.delivered_at, q.acked_at
+            FROM policy_decisions d LEFT JOIN action_queue q ON q.id = d.action_id
+            WHERE ? IS NULL OR d.device_id = ?
+            ORDER BY d.id DESC
+            LIMIT ?
+            """,
+            [device_id, device_id, int(limit)],
+        ).fetchall()
+
+        def ms(a, b):
+            return round((b - a).total_seconds() * 1000.0, 3) if a is not None and b is not None else None
+        out = []
+        for (i, dev, rule, cause, score, action, params, dry, action_id,
+             sample, detected, decided, dispatched, delivered, acked) in rows:
+            out.append({"id": int(i), "device_id": dev, "rule": rule, "cause": cause, "score": score,
+                        "action": action, "params": json.loads(params) if params else {}, "dry_run": bool(dry),
+                        "action_id": action_id, "sample_ts": _iso(sample), "detected_at": _iso(detected),
+                        "decided_at": _iso(decided), "dispatched_at": _iso(dispatched),
+                        "delivered_at": _iso(delivered), "acked_at": _iso(acked),
+                        "latency_ms": {"detect": ms(sample, detected), "decide": ms(detected, decided),
+                                       "dispatch": ms(decided, dispatched), "deliver": ms(dispatched, delivered),
+                                       "apply": ms(dispatched, acked), "total": ms(sample, acked)}})
+        return out
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+            inflight = sum(len(v) for v in self._inflight.values())
+            latency = {s: {"n": len(v), "p50_ms": float(np.percentile(v, 50)), "p95_ms": float(np.percentile(v, 95))}
+                       for s, v in self._latency.items() if v}
+        return {"dry_run": self.dry_run, "rules": len(self.rules), "triggers": self.triggers, "pending": pending,
+                "inflight": inflight, "outcomes": dict(self.outcomes), "latency": latency,
+                "trigger": {"min_anomalies": self.min_anomalies, "window_s": self.window_ns / 1e9},
+                "eval_interval_s": self.eval_interval_s,
+                "limits": {"device_max_per_hour": self.device_max, "fleet_max_per_minute": self.fleet_max}}
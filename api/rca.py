@@ -1,39 +1,91 @@
-import pandas as pd, yaml, os
+import numpy as np, yaml, os, threading
+from metrics import registry
+registry.histogram("anomaly_stage_seconds","Time in anomaly detection and RCA stages",("stage",),subsystem="anomaly")
 DAG_PATH=os.getenv("RCA_DAG", os.path.join(os.path.dirname(__file__),"dag.yaml"))
+MAX_LAG=int(os.getenv("RCA_MAX_LAG","10"))            # lags (samples) checked for "X leads symptom"
+XCORR_ROWS=int(os.getenv("RCA_XCORR_ROWS","4096"))    # lag analysis uses at most the newest N rows
+WEIGHTS=(0.5,0.3,0.2)                                  # score = w0*|corr| + w1*precedence + w2*upstream in DAG
+_graph={"key":None}; _graph_lock=threading.Lock()
 def _load_dag():
     with open(DAG_PATH,"r") as f: return yaml.safe_load(f)
-def _pearson(a,b):
-    a=pd.Series(a).astype(float); b=pd.Series(b).astype(float)
-    if a.std()==0 or b.std()==0: return 0.0
-    c=a.corr(b); return float(c) if not pd.isna(c) else 0.0
-def _is_upstream(u,v,parents):
-    seen=set(); stack=[v]
-    while stack:
-        cur=stack.pop()
-        for p in parents.get(cur,[]):
-            if p==u: return True
-            if p not in seen: seen.add(p); stack.append(p)
-    return False
-def rank_root_causes(df, anomalies):
+def _compile(dag):
+    """Nodes, symptom and an ancestor bitset per node (bit i set = nodes[i] is upstream)."""
+    nodes=dag.get("nodes",[]); idx={n:i for i,n in enumerate(nodes)}; parents={n:[] for n in nodes}
+    for src,dst in dag.get("edges",[]): parents[dst].append(src)
+    anc={}
+    def walk(v,path=()):
+        if v in anc: return anc[v]
+        bits=0
+        for p in parents.get(v,[]):
+            if p in path: continue   # tolerate cycles in a hand-edited DAG
+            bits|=(1<<idx[p])|walk(p,path+(v,))
+        anc[v]=bits; return bits
+    for n in nodes: walk(n)
+    return {"nodes":nodes,"index":idx,"ancestors":anc,"symptom":"latency_ms" if "latency_ms" in nodes else nodes[-1]}
+def _get_graph():
+    """Compiled DAG, re-read only when dag.yaml's mtime (or path) changes."""
+    st=os.stat(DAG_PATH); key=(DAG_PATH,st.st_mtime_ns,st.st_size)
+    with _graph_lock:
+        if _graph["key"]!=key: _graph.update(key=key,graph=_compile(_load_dag()))
+        return _graph["graph"]
+def _is_upstream(u,v,graph):
+    return bool((graph["ancestors"].get(v,0)>>graph["index"][u])&1) if u in graph["index"] else False
+def _corr_cols(X,y):
+    """Pearson corr of every column of X with y in one pass (pairwise-complete, 0 if constant)."""
+    mask=~np.isnan(X)&~np.isnan(y)[:,None]; cnt=mask.sum(axis=0)
+    Y=np.broadcast_to(y[:,None],X.shape)
+    with np.errstate(invalid="ignore",divide="ignore"):
+        dx=np.where(mask,X-np.where(mask,X,0).sum(axis=0)/cnt,0.0); dy=np.where(mask,Y-np.where(mask,Y,0).sum(axis=0)/cnt,0.0)
+        r=(dx*dy).sum(axis=0)/np.sqrt((dx*dx).sum(axis=0)*(dy*dy).sum(axis=0))
+    r[~np.isfinite(r)]=0.0; return r
+def _lead_corr(X,y,max_lag):
+    """
+    Per column of X: strongest |corr(X[t-k], y[t])| over k in 1..max_lag and its lag, via one
+    FFT cross-correlation over all columns. Returns (lead_r, lead_lag, r0).
+    """
+    n,m=X.shape
+    if n<3 or max_lag<1: return np.zeros(m),np.zeros(m,dtype=int),np.zeros(m)
+    Xs=X-np.nanmean(X,axis=0); sx=np.sqrt(np.nansum(Xs**2,axis=0)/n); Xs=np.nan_to_num(Xs)
+    ys=y-np.nanmean(y); sy=np.sqrt(np.nansum(ys**2)/n); ys=np.nan_to_num(ys)
+    nfft=1<<int(np.ceil(np.log2(2*n)))
+    cc=np.fft.irfft(np.conj(np.fft.rfft(Xs,nfft,axis=0))*np.fft.rfft(ys,nfft)[:,None],nfft,axis=0)
+    K=min(max_lag,n-2); lags=np.arange(K+1)
+    with np.errstate(invalid="ignore",divide="ignore"):
+        r=cc[:K+1]/((n-lags)[:,None]*sx*sy)
+    r[~np.isfinite(r)]=0.0; r=np.clip(r,-1.0,1.0)
+    best=1+np.argmax(np.abs(r[1:]),axis=0)
+    return r[best,np.arange(m)],best,r[0]
+@registry.timed("anomaly_stage_seconds",("rank_root_causes",))
+def rank_root_causes(df, anomalies, weights=WEIGHTS):
     if df.empty: return {"ranked":[], "explanations":[]}
-    dag=_load_dag(); nodes=dag.get("nodes",[]); edges=dag.get("edges",[])
-    parents={n:[] for n in nodes}
-    for src,dst in edges: parents[dst].append(src)
-    symptom="latency_ms" if "latency_ms" in nodes else nodes[-1]
+    graph=_get_graph(); nodes=graph["nodes"]; symptom=graph["symptom"]
     anomaly_by_metric={}
     for a in anomalies: anomaly_by_metric.setdefault(a["metric"],[]).append(a["idx"])
-    ranked=[]; symptom_idxs=sorted(anomaly_by_metric.get(symptom,[]))
-    for m in nodes:
-        if m==symptom: continue
-        m_idxs=anomaly_by_metric.get(m,[])
-        if not m_idxs: continue
-        precedence=1.0 if (symptom_idxs and m_idxs and min(m_idxs)<min(symptom_idxs)) else 0.0
-        corr=_pearson(df[m].values, df[symptom].values) if (m in df.columns and symptom in df.columns) else 0.0
-        topo=1.0 if _is_upstream(m, symptom, parents) else 0.0
-        score=0.5*abs(corr)+0.3*precedence+0.2*topo
-        expl=[]; 
-        if precedence: expl.append("upstream anomalies occur earlier than symptom")
-        expl.append(f"corr({m}, {symptom})≈{corr:.2f}")
+    symptom_idxs=sorted(anomaly_by_metric.get(symptom,[]))
+    cands=[m for m in nodes if m!=symptom and anomaly_by_metric.get(m)]
+    if not cands: return {"ranked":[], "explanations":[]}
+    # One correlation pass over every candidate instead of a fresh Series pair per metric
+    have=[m for m in cands if m in df.columns] if symptom in df.columns else []
+    corr=dict.fromkeys(cands,0.0); lead=dict.fromkeys(cands,0.0); lag=dict.fromkeys(cands,0)
+    if have:
+        X=df[have].to_numpy(dtype=float,na_value=np.nan); y=df[symptom].to_numpy(dtype=float,na_value=np.nan)
+        corr.update(zip(have,_corr_cols(X,y).tolist()))
+        X=X[-XCORR_ROWS:]; y=y[-XCORR_ROWS:]
+        r_lead,k_lead,r0=_lead_corr(X,y,MAX_LAG)
+        # A lag counts as leading only if it beats the same-time correlation and the noise floor
+        stronger=(np.abs(r_lead)>np.abs(r0))&(np.abs(r_lead)>3.0/np.sqrt(len(y)))
+        lead.update(zip(have,np.where(stronger,np.abs(r_lead),0.0).tolist())); lag.update(zip(have,np.where(stronger,k_lead,0).tolist()))
+    ranked=[]
+    for m in cands:
+        m_idxs=anomaly_by_metric[m]
+        first=1.0 if (symptom_idxs and min(m_idxs)<min(symptom_idxs)) else 0.0
+        precedence=max(first,lead[m])
+        c=corr[m]; topo=1.0 if _is_upstream(m,symptom,graph) else 0.0
+        score=weights[0]*abs(c)+weights[1]*precedence+weights[2]*topo
+        expl=[]
+        if first: expl.append("upstream anomalies occur earlier than symptom")
+        if lead[m]>0: expl.append(f"{m} leads {symptom} by {lag[m]} samples (r≈{lead[m]:.2f})")
+        expl.append(f"corr({m}, {symptom})≈{c:.2f}")
         if topo: expl.append("upstream in dependency DAG")
         ranked.append({"metric":m,"score":float(score),"explanation":expl})
     ranked.sort(key=lambda x:x["score"], reverse=True)
@@ -0,0 +1,299 @@
+# api/replay.py
+"""
+Replay / backtest: stored telemetry is streamed back through the detection + RCA pipeline
+the way the API would have seen it, and the alerts it would have raised are scored
+against labelled fault windows (e.g. simulator/loadgen.py --fault-log).
+
+- Sources: DuckDB files (attached read-only, so a snapshot from SNAPSHOT_DIR rather than
+  the live file, which the API holds open) and/or Parquet (a file, glob or directory, such
+  as the cold tier). Several are unioned.
+- Streaming: each device's rows are read in time order, chunk_s of data at a time, and only
+  the trailing history a detector needs is kept, so memory is bounded by
+  chunk_s + max(window_s, baseline) per device.
+- Detection: every step_s of data time a device's trailing window_s is run through
+  find_anomalies (with an IsolationForest refitted every refit_s on the trailing
+  baseline_rows, like the model registry, or fitted per window, or off); anomalies in the
+  newest step raise an alert, which gets rank_root_causes' top cause.
+- Pace: speedup=N releases each step's data N times faster than it was recorded; 0 replays
+  as fast as possible.
+- Parallelism: devices are split across `workers` spawned processes, each reading its own
+  devices from the sources.
+
+score() reports recall (faults with an alert between their start and end + grace_s),
+precision (alerts inside some fault window of their device), detection delay (first
+alert minus fault start; alerts fire at step boundaries, so it includes up to step_s), and
+how often the first alert's top cause is the metric the fault acts on.
+
+    python api/replay.py --source snapshots/snap-*.duckdb cold/ --labels faults.jsonl --workers 4 \\
+        --z-threshold 3 --contamination 0.02 --rca-weights 0.4 0.4 0.2 --out report.json
+"""
+import argparse, glob, json, multiprocessing, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from anomaly import find_anomalies, Z_THRESHOLD
+from models import fit_model, IFOREST_PARAMS
+from rca import rank_root_causes, WEIGHTS
+from schema import COLUMNS
+
+DEFAULTS = {
+    "window_s": 600.0,          # detection window, as /detect_latest?minutes=10
+    "step_s": 60.0,             # evaluation interval (data time)
+    "chunk_s": 3600.0,          # data read per query, per device
+    "z_threshold": Z_THRESHOLD,
+    "contamination": IFOREST_PARAMS["contamination"],
+    "iforest": "registry",      # registry (refit every refit_s) | window (fit per window) | off
+    "refit_s": 900.0,
+    "baseline_rows": 3600,
+    "rca_weights": WEIGHTS,
+    "min_anomalies": 1,         # anomalies in a step that raise an alert
+    "speedup": 0.0,
+}
+# The metric a fault acts on first: the expected top cause
+EXPECTED_CAUSE = {"fan_drop": "fan_rpm", "workload_spike": "cpu_pct"}
+
+def _sql_str(s):
+    return "'" + str(s).replace("'", "''") + "'"
+
+def _ts(v):
+    """Naive UTC pandas Timestamp from an ISO string (with or without Z) or timestamp."""
+    t = pd.Timestamp(v)
+    return t.tz_convert("UTC").tz_localize(None) if t.tzinfo is not None else t
+
+def open_source(paths):
+    """In-memory DuckDB connection with a `telemetry` view over every source in paths."""
+    import duckdb
+    con = duckdb.connect()
+    parts = []
+    for i, path in enumerate(paths):
+        if path.endswith(".duckdb"):
+            con.execute(f"ATTACH {_sql_str(path)} AS src{i} (READ_ONLY)")
+            parts.append(f"SELECT {', '.join(COLUMNS)} FROM src{i}.telemetry")
+            continue
+        if os.path.isdir(path):
+            path = os.path.join(glob.escape(path), "**", "*.parquet")
+            if not glob.glob(path, recursive=True):
+                continue          # e.g. a cold tier nothing has been moved to yet
+        parts.append(f"SELECT {', '.join(COLUMNS)} FROM read_parquet({_sql_str(path)}, "
+                     f"hive_partitioning = false, union_by_name = true)")
+    if not parts:
+        raise ValueError(f"no telemetry in {paths}")
+    con.execute("CREATE VIEW telemetry AS " + " UNION ALL ".join(parts))
+    return con
+
+class DeviceReplay:
+    """One device's trailing history, model and evaluation clock; feed() returns new alerts."""
+    def __init__(self, device_id, cfg, start):
+        self.device_id = device_id
+        self.cfg = cfg
+        self.window = pd.Timedelta(seconds=cfg["window_s"])
+        self.step = pd.Timedelta(seconds=cfg["step_s"])
+        self.refit = pd.Timedelta(seconds=cfg["refit_s"])
+        self.next_eval = start + self.step
+        self.hist = None
+        self.model = None
+        self.fitted_at = None
+        self.evaluations = 0
+        self.rows = 0
+
+    def _model(self, now, hist):
+        mode = self.cfg["iforest"]
+        if mode == "off":
+            return False
+        if mode == "window":
+            return None
+        if self.fitted_at is None or now - self.fitted_at >= self.refit:
+            params = dict(IFOREST_PARAMS, contamination=self.cfg["contamination"])
+            self.model = fit_model(hist.tail(int(self.cfg["baseline_rows"])), params) or None
+            self.fitted_at = now
+        return self.model if self.model is not None else False
+
+    def feed(self, df, until):
+        """Add the device's rows up to `until` (ts ascending) and evaluate every step boundary passed."""
+        self.rows += len(df)
+        self.hist = df if self.hist is None else pd.concat([self.hist, df], ignore_index=True)
+        alerts = []
+        while self.next_eval <= until:
+            t = self.next_eval
+            self.next_eval += self.step
+            upto = self.hist["ts"].searchsorted(t, side="right")
+            past = self.hist.iloc[:upto]
+            win = past[past["ts"] > t - self.window].reset_index(drop=True)
+            if win.empty:
+                continue
+            self.evaluations += 1
+            anomalies = find_anomalies(win, model=self._model(t, past), z_threshold=self.cfg["z_threshold"],
+                                       contamination=self.cfg["contamination"])
+            first_new = win["ts"].searchsorted(t - self.step, side="right")
+            new = [a for a in anomalies if a["idx"] >= first_new]
+            if len(new) >= self.cfg["min_anomalies"]:
+                ranked = rank_root_causes(win, anomalies, weights=self.cfg["rca_weights"])["ranked"]
+                alerts.append({"device_id": self.device_id, "at": t.isoformat(), "anomalies": len(new),
+                               "metrics": sorted({a["metric"] for a in new}),
+                               "types": sorted({a["type"] for a in new}),
+                               "top_cause": ranked[0]["metric"] if ranked else None})
+        # Keep only what later windows and refits read
+        keep = max(self.window, pd.Timedelta(0))
+        cut = self.hist["ts"].searchsorted(self.next_eval - self.step - keep, side="left")
+        cut = min(cut, max(0, len(self.hist) - int(self.cfg["baseline_rows"])))
+        if cut:
+            self.hist = self.hist.iloc[cut:].reset_index(drop=True)
+        return alerts
+
+def replay_devices(sources, devices, cfg, start, end, wall_start=None):
+    """Worker: replay `devices` over [start, end) chunk by chunk; returns (alerts, stats)."""
+    cfg = dict(DEFAULTS, **cfg)
+    start, end = _ts(start), _ts(end)
+    con = open_source(sources)
+    states = {d: DeviceReplay(d, cfg, start) for d in devices}
+    paced = bool(cfg["speedup"] and cfg["speedup"] > 0)
+    wall_start = wall_start or time.time()
+    # Paced, a chunk is one step: its data is released when the wall clock reaches its end
+    chunk = pd.Timedelta(seconds=cfg["step_s"] if paced else cfg["chunk_s"])
+    alerts = []
+    t = start
+    while t < end:
+        until = min(t + chunk, end)
+        if paced:
+            delay = wall_start + (until - start).total_seconds() / cfg["speedup"] - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        df = con.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM telemetry WHERE device_id IN (SELECT unnest(?)) "
+            "AND ts >= ? AND ts < ? ORDER BY ts",
+            [list(devices), t.to_pydatetime(), until.to_pydatetime()]).df()
+        groups = dict(tuple(df.groupby("device_id", sort=False))) if len(df) else {}
+        for d, st in states.items():
+            alerts += st.feed(groups.get(d, df.iloc[:0]), until - pd.Timedelta(microseconds=1)
+                              if until < end else until)
+        t = until
+    con.close()
+    return alerts, {"rows": sum(s.rows for s in states.values()),
+                    "evaluations": sum(s.evaluations for s in states.values())}
+
+def replay(sources, cfg=None, workers=1, devices=None, start=None, end=None):
+    """
+    Replay every device (or `devices`) between start and end (default: the data's range) on
+    `workers` processes. Returns (alerts sorted by time, stats).
+    """
+    cfg = dict(DEFAULTS, **(cfg or {}))
+    con = open_source(sources)
+    lo, hi = con.execute("SELECT min(ts), max(ts) FROM telemetry").fetchall()[0]
+    if devices is None:
+        devices = [r[0] for r in con.execute("SELECT DISTINCT device_id FROM telemetry ORDER BY 1").fetchall()]
+    con.close()
+    if lo is None or not devices:
+        return [], {"devices": 0, "rows": 0, "evaluations": 0, "wall_s": 0.0}
+    start = _ts(start) if start is not None else _ts(lo)
+    end = _ts(end) if end is not None else _ts(hi) + pd.Timedelta(microseconds=1)
+    parts = [devices[i::workers] for i in range(max(1, min(workers, len(devices))))]
+    t0 = time.perf_counter()
+    wall_start = time.time()
+    if len(parts) == 1:
+        results = [replay_devices(sources, parts[0], cfg, start, end, wall_start)]
+    else:
+        # spawn, as fleet.py: workers open the sources themselves
+        with ProcessPoolExecutor(max_workers=len(parts), mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(replay_devices, [sources] * len(parts), parts, [cfg] * len(parts),
+                                    [start] * len(parts), [end] * len(parts), [wall_start] * len(parts)))
+    wall_s = time.perf_counter() - t0
+    alerts = sorted((a for r in results for a in r[0]), key=lambda a: (a["at"], a["device_id"]))
+    data_s = (end - start).total_seconds()
+    return alerts, {"devices": len(devices), "rows": sum(r[1]["rows"] for r in results),
+                    "evaluations": sum(r[1]["evaluations"] for r in results), "workers": len(parts),
+                    "data_s": data_s, "wall_s": wall_s, "speedup": data_s / wall_s if wall_s else None}
+
+def load_labels(path):
+    """Fault windows from a JSON list or JSON lines of {device_id, fault, start, end (null = open)}."""
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def _quantiles(v):
+    return {"p50": float(np.percentile(v, 50)), "p90": float(np.percentile(v, 90)), "mean": float(np.mean(v))} if v else None
+
+def score(alerts, labels, grace_s=60.0, open_s=600.0, expected_cause=EXPECTED_CAUSE):
+    """Precision / recall / detection delay / RCA top-1 of alerts against fault windows."""
+    grace, open_ = pd.Timedelta(seconds=grace_s), pd.Timedelta(seconds=open_s)
+    windows = {}
+    for f in labels:
+        s = _ts(f["start"])
+        e = _ts(f["end"]) if f.get("end") else s + open_
+        windows.setdefault(f["device_id"], []).append((s, e + grace, f))
+    by_device = {}
+    for a in alerts:
+        by_device.setdefault(a["device_id"], []).append((_ts(a["at"]), a))
+    true_alerts = sum(1 for d, items in by_device.items() for t, _ in items
+                      if any(s <= t <= e for s, e, _ in windows.get(d, ())))
+    kinds, delays = {}, []
+    for d, wins in windows.items():
+        items = by_device.get(d, [])
+        for s, e, f in wins:
+            k = kinds.setdefault(f.get("fault", "fault"), {"faults": 0, "detected": 0, "delays": [], "rca_hits": 0})
+            k["faults"] += 1
+            hit = next(((t, a) for t, a in items if s <= t <= e), None)
+            if hit is None:
+                continue
+            k["detected"] += 1
+            delay = (hit[0] - s).total_seconds()
+            k["delays"].append(delay); delays.append(delay)
+            k["rca_hits"] += hit[1]["top_cause"] == expected_cause.get(f.get("fault"))
+    faults = sum(k["faults"] for k in kinds.values())
+    detected = sum(k["detected"] for k in kinds.values())
+    out = {"faults": faults, "detected": detected, "recall": detected / faults if faults else None,
+           "alerts": len(alerts), "true_alerts": true_alerts,
+           "precision": true_alerts / len(alerts) if alerts else None, "delay_s": _quantiles(delays),
+           "rca_top1": sum(k["rca_hits"] for k in kinds.values()) / detected if detected else None, "by_fault": {}}
+    for name, k in sorted(kinds.items()):
+        out["by_fault"][name] = {"faults": k["faults"], "detected": k["detected"],
+                                 "recall": k["detected"] / k["faults"], "delay_s": _quantiles(k["delays"]),
+                                 "rca_top1": k["rca_hits"] / k["detected"] if k["detected"] else None}
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--source", nargs="+", required=True, help="DuckDB files and/or Parquet files, globs or directories")
+    ap.add_argument("--labels", help="fault windows (JSON / JSON lines) to score against")
+    ap.add_argument("--devices", nargs="*", help="only these devices")
+    ap.add_argument("--start"); ap.add_argument("--end")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--speedup", type=float, default=0.0, help="x real time (0 = as fast as possible)")
+    ap.add_argument("--window-s", type=float, default=DEFAULTS["window_s"])
+    ap.add_argument("--step-s", type=float, default=DEFAULTS["step_s"])
+    ap.add_argument("--chunk-s", type=float, default=DEFAULTS["chunk_s"])
+    ap.add_argument("--z-threshold", type=float, default=DEFAULTS["z_threshold"])
+    ap.add_argument("--contamination", type=float, default=DEFAULTS["contamination"])
+    ap.add_argument("--iforest", choices=["registry", "window", "off"], default=DEFAULTS["iforest"])
+    ap.add_argument("--refit-s", type=float, default=DEFAULTS["refit_s"])
+    ap.add_argument("--baseline-rows", type=int, default=DEFAULTS["baseline_rows"])
+    ap.add_argument("--rca-weights", type=float, nargs=3, default=list(DEFAULTS["rca_weights"]))
+    ap.add_argument("--min-anomalies", type=int, default=DEFAULTS["min_anomalies"])
+    ap.add_argument("--grace-s", type=float, default=60.0, help="alerts this long after a fault's end still count")
+    ap.add_argument("--open-s", type=float, default=600.0, help="window of faults with no end")
+    ap.add_argument("--out", help="write the report (and alerts) as JSON to this path")
+    args = ap.parse_args()
+    cfg = {k: getattr(args, k) for k in DEFAULTS}
+    cfg["rca_weights"] = tuple(args.rca_weights)
+    alerts, run = replay(args.source, cfg, workers=args.workers, devices=args.devices or None,
+                         start=args.start, end=args.end)
+    print(f"{run['devices']} devices, {run['rows']:,} rows, {run['evaluations']:,} evaluations in "
+          f"{run['wall_s']:.1f} s on {run.get('workers', 0)} workers ({run.get('speedup') or 0:,.0f}x real time); "
+          f"{len(alerts)} alerts")
+    report = {"config": cfg, "run": run}
+    if args.labels:
+        report["score"] = s = score(alerts, load_labels(args.labels), args.grace_s, args.open_s)
+        print(f"recall {s['recall'] or 0:.3f}  precision {s['precision'] or 0:.3f}  "
+              f"delay p50 {(s['delay_s'] or {}).get('p50', float('nan')):.0f} s  rca top-1 {s['rca_top1'] or 0:.3f}")
+        for name, k in s["by_fault"].items():
+            print(f"  {name:<16} {k['detected']}/{k['faults']} detected, delay p50 "
+                  f"{(k['delay_s'] or {}).get('p50', float('nan')):.0f} s, rca top-1 {k['rca_top1'] or 0:.3f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(dict(report, alerts=alerts), f, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+# api/rollups.py
+"""
+Continuously maintained per-device downsampled aggregates (1m and 1h buckets; the 1 Hz raw
+table serves as the 1s level). Committed ingest batches are coalesced for up to flush_s and
+folded in as mergeable partials (min/max/sum/count/last per gauge, sums for disk_errors and
+nic_drops) upserted into each level. Partials merge commutatively, so buckets stay exact for
+late or out-of-order events. Rollups lag raw data by at most about flush_s; batches still
+pending when the process dies are not folded in.
+"""
+import threading, time, traceback
+from collections import deque
+import numpy as np
+import pandas as pd
+
+from schema import COLUMNS
+
+GAUGES = ["inlet_temp_c", "fan_rpm", "temp_c", "vcore_v", "cpu_pct", "mem_pct", "latency_ms"]
+COUNTERS = ["disk_errors", "nic_drops"]
+LEVELS = [("1s", 1), ("1m", 60), ("1h", 3600)]          # (name, bucket seconds), finest first
+STORED = {"1m": "minute", "1h": "hour"}                  # materialised levels -> date_trunc part
+# Each stored level is built from the one before it (1s rows -> 1m -> 1h)
+
+def _table(level):
+    return f"rollup_{level}"
+
+def _partials(source, part):
+    """SELECT of per-(device, bucket) partials over a raw telemetry-shaped relation."""
+    typed = ", ".join(["CAST(ts AS TIMESTAMP) AS ts", "CAST(device_id AS VARCHAR) AS device_id"]
+                      + [f"CAST({m} AS DOUBLE) AS {m}" for m in GAUGES]
+                      + [f"CAST({m} AS BIGINT) AS {m}" for m in COUNTERS])
+    cols = [f"date_trunc('{part}', ts) AS bucket", "device_id", "max(ts) AS last_ts", "count(*) AS rows"]
+    for m in GAUGES:
+        cols += [f"min({m}) AS {m}_min", f"max({m}) AS {m}_max", f"sum({m}) AS {m}_sum",
+                 f"count({m}) AS {m}_count", f"arg_max({m}, epoch_us(ts)) AS {m}_last",
+                 f"max(ts) FILTER (WHERE {m} IS NOT NULL) AS {m}_last_ts"]
+    cols += [f"sum({m})::BIGINT AS {m}_sum" for m in COUNTERS]
+    return (f"SELECT {', '.join(cols)} FROM (SELECT {typed} FROM {source}) "
+            f"WHERE ts IS NOT NULL AND device_id IS NOT NULL GROUP BY ALL")
+
+def _coarsen(source, part):
+    """Re-bucket finer partials (e.g. 1m -> 1h); same columns as _partials."""
+    cols = [f"date_trunc('{part}', bucket) AS bucket", "device_id", "max(last_ts) AS last_ts",
+            "sum(rows)::BIGINT AS rows"]
+    for m in GAUGES:
+        cols += [f"min({m}_min) AS {m}_min", f"max({m}_max) AS {m}_max", f"sum({m}_sum) AS {m}_sum",
+                 f"sum({m}_count)::BIGINT AS {m}_count", f"arg_max({m}_last, epoch_us({m}_last_ts)) AS {m}_last",
+                 f"max({m}_last_ts) AS {m}_last_ts"]
+    cols += [f"sum({m}_sum)::BIGINT AS {m}_sum" for m in COUNTERS]
+    return f"SELECT {', '.join(cols)} FROM {source} GROUP BY ALL"
+
+def _merge_set():
+    """ON CONFLICT assignments combining the stored bucket with an incoming partial."""
+    sets = ["last_ts = greatest(last_ts, EXCLUDED.last_ts)", "rows = rows + EXCLUDED.rows"]
+    for m in GAUGES:
+        sets += [f"{m}_min = least({m}_min, EXCLUDED.{m}_min)",
+                 f"{m}_max = greatest({m}_max, EXCLUDED.{m}_max)",
+                 f"{m}_sum = coalesce({m}_sum + EXCLUDED.{m}_sum, {m}_sum, EXCLUDED.{m}_sum)",
+                 f"{m}_count = {m}_count + EXCLUDED.{m}_count",
+                 # The value with the later timestamp wins, whichever batch brought it
+                 f"{m}_last = CASE WHEN EXCLUDED.{m}_last_ts >= coalesce({m}_last_ts, EXCLUDED.{m}_last_ts) "
+                 f"THEN EXCLUDED.{m}_last ELSE {m}_last END",
+                 f"{m}_last_ts = greatest({m}_last_ts, EXCLUDED.{m}_last_ts)"]
+    sets += [f"{m}_sum = coalesce({m}_sum + EXCLUDED.{m}_sum, {m}_sum, EXCLUDED.{m}_sum)" for m in COUNTERS]
+    return ", ".join(sets)
+
+def _output():
+    """Columns returned to clients: bucket start, counts, min/max/mean/last, counter sums."""
+    cols = ["bucket AS ts", "device_id", "rows"]
+    for m in GAUGES:
+        cols += [f"{m}_min", f"{m}_max", f"{m}_sum / nullif({m}_count, 0) AS {m}_mean",
+                 f"{m}_count", f"{m}_last"]
+    return cols + [f"{m}_sum" for m in COUNTERS]
+
+OUTPUT_COLUMNS = [c.rsplit(" AS ", 1)[-1] for c in _output()]
+
+def _utc(t):
+    """Naive UTC Timestamp from an ISO string / datetime (tz-aware values are converted)."""
+    t = pd.Timestamp(t)
+    return t.tz_convert("UTC").tz_localize(None) if t.tz is not None else t
+
+def pick_level(start, end, points):
+    """Finest level whose bucket count over [start, end] fits in `points` (else the coarsest)."""
+    span = (_utc(end) - _utc(start)).total_seconds()
+    for name, step in LEVELS:
+        if span / step <= points:
+            return name
+    return LEVELS[-1][0]
+
+class Rollups:
+    def __init__(self, con, flush_rows=200000, flush_s=1.0, read_only=False):
+        self.con = con
+        self.flush_rows = int(flush_rows)
+        self.flush_s = float(flush_s)
+        self._pending = []                   # committed frames not yet folded in
+        self._pending_rows = 0
+        self._oldest = None                  # monotonic time the oldest pending frame arrived
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self.folds = 0
+        self.folded_rows = 0
+        self._fold_ms = deque(maxlen=256)
+        if read_only:
+            return                           # query() only, on a snapshot (reader processes)
+        self._cur = con.cursor()             # own connection: folds run their own transactions
+        gauge_cols = "".join(f", {m}_min DOUBLE, {m}_max DOUBLE, {m}_sum DOUBLE, {m}_count BIGINT, "
+                             f"{m}_last DOUBLE, {m}_last_ts TIMESTAMP" for m in GAUGES)
+        counter_cols = "".join(f", {m}_sum BIGINT" for m in COUNTERS)
+        for level in STORED:
+            fresh = not con.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = ?",
+                                    [_table(level)]).fetchone()[0]
+            con.execute(f"CREATE TABLE IF NOT EXISTS {_table(level)} (bucket TIMESTAMP, device_id VARCHAR, "
+                        f"last_ts TIMESTAMP, rows BIGINT{gauge_cols}{counter_cols}, "
+                        f"PRIMARY KEY (device_id, bucket))")
+            if fresh:
+                # Backfill once from whatever raw history the hot table already holds
+                src = _partials("telemetry", "minute") if level == "1m" else _coarsen(_table("1m"), STORED[level])
+                con.execute(f"INSERT INTO {_table(level)} {src}")
+
+    # ---------- Ingest side ----------
+    def append(self, df):
+        """Ingest listener: queue a committed batch; folding happens on the rollup thread."""
+        df = df.reindex(columns=COLUMNS)
+        ts = pd.to_datetime(df["ts"], utc=True).dt.tz_localize(None)
+        df = df.assign(ts=ts)
+        with self._cond:
+            if not self._pending:
+                self._oldest = time.monotonic()
+                self._cond.notify()
+            self._pending.append(df)
+            self._pending_rows += len(df)
+            if self._pending_rows >= self.flush_rows:
+                self._cond.notify()
+
+    def fold(self, df):
+        """Merge a raw frame into every stored level in one transaction."""
+        t0 = time.perf_counter()
+        cur = self._cur
+        cur.register("rollup_raw", df)
+        cur.execute("BEGIN")
+        try:
+            # Raw rows are scanned once into 1m partials; coarser levels re-bucket those
+            cur.execute(f"CREATE OR REPLACE TEMP TABLE rollup_batch AS {_partials('rollup_raw', 'minute')}")
+            for level, part in STORED.items():
+                src = "SELECT * FROM rollup_batch" if level == "1m" else _coarsen("rollup_batch", part)
+                cur.execute(f"INSERT INTO {_table(level)} {src} "
+                            f"ON CONFLICT (device_id, bucket) DO UPDATE SET {_merge_set()}")
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        finally:
+            cur.unregister("rollup_raw")
+        self.folds += 1
+        self.folded_rows += len(df)
+        self._fold_ms.append((time.perf_counter() - t0) * 1000.0)
+
+    # ---------- Background folding ----------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rollups", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Fold whatever is pending and join the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Coalesce batches for up to flush_s so per-statement overhead is paid once
+                while not self._stopping and self._pending_rows < self.flush_rows:
+                    if self._pending:
+                        wait = self._oldest + self.flush_s - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                frames, self._pending, self._pending_rows = self._pending, [], 0
+                stopping = self._stopping
+            if frames:
+                try:
+                    self.fold(pd.concat(frames, ignore_index=True))
+                except Exception:
+                    traceback.print_exc()
+            if stopping:
+                return
+
+    def query(self, device_id, start, end, level, raw=None):
+        """
+        Buckets of one device in [start, end] at `level`. The 1s level is aggregated on the
+        fly from `raw`, a DataFrame of the device's raw rows in that range.
+        """
+        if level not in STORED:
+            if raw is None or raw.empty:
+                return pd.DataFrame(columns=OUTPUT_COLUMNS)
+            cur = self.con.cursor()
+            cur.register("raw", raw)
+            return cur.execute(f"SELECT {', '.join(_output())} FROM ({_partials('raw', 'second')}) ORDER BY bucket").df()
+        return self.con.cursor().execute(
+            f"""
+            SELECT {', '.join(_output())}
+            FROM {_table(level)}
+            WHERE device_id = ?
+              AND bucket BETWEEN date_trunc('{STORED[level]}', CAST(? AS TIMESTAMP)) AND CAST(? AS TIMESTAMP)
+            ORDER BY bucket ASC
+            """,
+            [device_id, start, end],
+        ).df()
+
+    def stats(self):
+        lat = np.array(self._fold_ms) if self._fold_ms else np.zeros(1)
+        with self._cond:
+            pending = self._pending_rows
+            lag = time.monotonic() - self._oldest if self._pending else 0.0
+        out = {"levels": [name for name, _ in LEVELS], "pending_rows": pending, "lag_s": lag,
+               "folds": self.folds, "folded_rows": self.folded_rows,
+               "fold_ms_p50": float(np.percentile(lat, 50)), "fold_ms_p99": float(np.percentile(lat, 99))}
+        for level in STORED:
+            out[f"{_table(level)}_rows"] = int(self.con.cursor().execute(f"SELECT count(*) FROM {_table(level)}").fetchone()[0])
+        return out
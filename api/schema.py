@@ -0,0 +1,76 @@
+# api/schema.py
+import pandas as pd
+
+# Canonical 11-column telemetry schema (same order as the telemetry table)
+COLUMNS = [
+    "ts","device_id","inlet_temp_c","fan_rpm","temp_c","vcore_v",
+    "cpu_pct","mem_pct","disk_errors","nic_drops","latency_ms"
+]
+
+_COLUMN_SET = frozenset(COLUMNS)
+NUMERIC_COLUMNS = COLUMNS[2:]
+
+def validate_event(event, device_id=None):
+    """
+    Check one event against the canonical schema: an object with only canonical fields,
+    a device_id (taken from `device_id`, e.g. the MQTT topic, when absent and required to
+    match it otherwise), numbers or null for the metrics and a string or null ts.
+    Returns the event; raises ValueError describing the first problem.
+    """
+    if not isinstance(event, dict):
+        raise ValueError("event must be a JSON object")
+    extra = event.keys() - _COLUMN_SET
+    if extra:
+        raise ValueError(f"unknown fields {sorted(extra)}")
+    dev = event.get("device_id", device_id)
+    if not isinstance(dev, str) or not dev:
+        raise ValueError("device_id missing")
+    if device_id is not None and dev != device_id:
+        raise ValueError(f"device_id {dev!r} does not match {device_id!r}")
+    for col in NUMERIC_COLUMNS:
+        v = event.get(col)
+        if v is not None and (isinstance(v, bool) or not isinstance(v, (int, float))):
+            raise ValueError(f"{col} must be a number")
+    if not isinstance(event.get("ts"), (str, type(None))):
+        raise ValueError("ts must be an ISO-8601 string")
+    event["device_id"] = dev
+    return event
+
+_OFFSET = r"(?:[zZ]|[+-]\d\d(?::?\d\d)?)\s*$"
+
+def _parse_ts(raw):
+    ts = pd.to_datetime(raw, errors="coerce", utc=True, format="ISO8601")
+    retry = ts.isna() & raw.notna()
+    if retry.any():
+        ts[retry] = pd.to_datetime(raw[retry], errors="coerce", utc=True, format="mixed")
+    return ts
+
+def normalize_events(events):
+    """
+    Build a telemetry DataFrame from a list of event dicts.
+    Invalid/missing timestamps become current UTC; missing columns are backfilled with None.
+    """
+    df = pd.DataFrame(events)
+
+    # Parse/normalize timestamp; coerce invalid to NaT. Batches mix events from many
+    # agents, so accept any ISO-8601 variant first and only then fall back to mixed parsing.
+    # Strings with and without a UTC offset are parsed apart: in one call pandas applies the
+    # last offset it saw to the naive strings after it instead of reading them as UTC.
+    if "ts" in df.columns:
+        raw = df["ts"]
+        ts = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns, UTC]")
+        aware = raw.astype(str).str.contains(_OFFSET, regex=True)
+        for part in (aware, ~aware):
+            if part.any():
+                ts[part] = _parse_ts(raw[part])
+        df["ts"] = ts
+    else:
+        df["ts"] = pd.NaT
+
+    # Fill NaT timestamps with current UTC
+    df["ts"] = df["ts"].fillna(pd.Timestamp.utcnow())
+
+    for col in COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    return df
@@ -0,0 +1,74 @@
+# api/serve.py
+"""
+Process launcher for the API.
+
+    READ_WORKERS=0 (default)   one process serving everything (ROLE=all), as app.py does
+    READ_WORKERS=N             one ROLE=writer process on 127.0.0.1:WRITER_PORT that owns the
+                               DuckDB file, ingest and every background job, and N ROLE=reader
+                               uvicorn workers on PORT serving reads from the writer's snapshots
+                               and forwarding writes / live routes to it (see snapshots.py)
+
+The launcher exits when the writer does (so the container restarts as a whole) and stops
+the writer when the readers are shut down.
+
+    READ_WORKERS=3 python api/serve.py
+"""
+import os, signal, subprocess, sys, threading, time
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+READ_WORKERS = int(os.getenv("READ_WORKERS", "0"))
+WRITER_PORT = int(os.getenv("WRITER_PORT", "8001"))
+WRITER_START_S = float(os.getenv("WRITER_START_S", "600"))
+
+def wait_healthy(proc, url, timeout_s):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"writer exited with {proc.returncode} during startup")
+        try:
+            if requests.get(url, timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit(f"writer not healthy after {timeout_s:.0f}s")
+
+def main():
+    import uvicorn
+    if READ_WORKERS <= 0:
+        uvicorn.run("app:app", host=HOST, port=PORT, app_dir=HERE)
+        return
+    writer_url = f"http://127.0.0.1:{WRITER_PORT}"
+    writer = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(WRITER_PORT),
+         "--app-dir", HERE],
+        env=dict(os.environ, ROLE="writer"))
+    wait_healthy(writer, writer_url + "/health", WRITER_START_S)
+    stopping, crashed = threading.Event(), threading.Event()
+
+    def watch():
+        writer.wait()
+        if not stopping.is_set():
+            crashed.set()
+            print(f"[serve] writer exited with {writer.returncode}; stopping readers", flush=True)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=watch, name="writer-watch", daemon=True).start()
+    os.environ.update(ROLE="reader", WRITER_URL=writer_url)
+    try:
+        uvicorn.run("app:app", host=HOST, port=PORT, workers=READ_WORKERS, app_dir=HERE)
+    finally:
+        stopping.set()
+        writer.terminate()
+        try:
+            writer.wait(60)
+        except subprocess.TimeoutExpired:
+            writer.kill()
+    sys.exit(1 if crashed.is_set() else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# api/snapshots.py
+"""
+Read snapshots for multi-process serving. DuckDB lets a single process open the database
+file (another process cannot even open it read-only), so the process that owns it
+(ROLE=writer) publishes a transactionally consistent copy every interval_s (stretched
+when copies are slow, see Cost below):
+
+    <snap_dir>/snap-<taken_at µs>.duckdb      <snap_dir>/CURRENT names the newest one
+
+Reader processes (ROLE=reader) open the newest snapshot read-only and switch to a newer
+one as soon as it appears; queries already running finish on the snapshot they started
+on (older files are unlinked, not truncated, so open ones stay readable).
+
+Cost: every snapshot copies the whole database, so copy time grows with the hot table, and
+the copy competes with ingest for the writer's CPU and IO. bench/bench_snapshot.py at the
+100M rows of bench_cluster (2000 devices, one core): 118 s and 4.2 GB per copy (253 s
+while ingest commits run alongside), ingest commit p50 5.5 -> 9.0 ms during the copy.
+That is about 1.2 s per million hot rows, so at max_duty 0.25 the default 5 s interval
+holds up to about a million. Instead of copying back to back, the next copy starts no
+sooner than copy time / max_duty after the last one started, which keeps the copy's share
+of the writer's time at or below max_duty: at 100M rows the interval stretches to ~470 s.
+/snapshot/stats reports the interval in effect and how often it was stretched.
+
+Freshness: a reader sees every row committed before its snapshot's taken_at, so data it
+serves is at most the interval in effect + copy time + poll_s old. Readers forward reads
+to the writer once their snapshot is older than SNAPSHOT_MAX_AGE_S, so that is a hard
+bound; past ~10M hot rows (a 12 s copy) the default 60 s bound is exceeded and readers
+forward everything, so keep the hot table small with TIER_HOT_HOURS or raise the bound.
+"""
+import glob, os, threading, time, traceback
+from contextlib import nullcontext
+import duckdb
+
+CURRENT = "CURRENT"
+
+def _sql_str(s):
+    return "'" + str(s).replace("'", "''") + "'"
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _taken_at(name):
+    """Epoch seconds a snapshot was taken at, from its file name."""
+    return int(os.path.basename(name)[5:-7]) / 1e6
+
+class Snapshotter:
+    """Writer side: COPY FROM DATABASE into a new file, then publish it atomically."""
+    def __init__(self, con, snap_dir, interval_s=5.0, keep=3, guard=None, max_duty=0.25):
+        self.con = con
+        self.snap_dir = os.path.abspath(snap_dir)
+        self.interval_s = float(interval_s)
+        self.max_duty = min(1.0, max(0.01, float(max_duty)))    # share of wall time spent copying
+        self.effective_interval_s = self.interval_s
+        self.stretched = 0
+        self.keep = max(2, int(keep))
+        self.guard = guard or nullcontext       # held while the copy's snapshot is taken
+        self._stop = threading.Event()
+        self._thread = None
+        self.snapshots = 0
+        self.failures = 0
+        self.last_taken_at = None
+        self.last_copy_ms = None
+        self.last_bytes = None
+        os.makedirs(self.snap_dir, exist_ok=True)
+        for tmp in glob.glob(os.path.join(glob.escape(self.snap_dir), ".snap-*")):
+            os.remove(tmp)                      # interrupted copy
+
+    def take(self):
+        """Copy the database into a new snapshot file and point CURRENT at it; returns its path."""
+        cur = self.con.cursor()
+        t0 = time.perf_counter()
+        tmp = os.path.join(self.snap_dir, f".snap-{os.getpid()}.tmp")
+        _remove(tmp, tmp + ".wal")              # left by a failed copy; ATTACH would reuse it
+        db = cur.execute("SELECT current_database()").fetchall()[0][0]
+        try:
+            cur.execute(f"ATTACH {_sql_str(tmp)} AS snapshot_out")
+            try:
+                with self.guard():
+                    # Rows committed before taken_at are in the copy
+                    us = time.time_ns() // 1000
+                    cur.execute(f"COPY FROM DATABASE {db} TO snapshot_out")
+            finally:
+                cur.execute("DETACH snapshot_out")
+        except BaseException:
+            _remove(tmp, tmp + ".wal")
+            raise
+        finally:
+            cur.close()
+        name = f"snap-{us}.duckdb"
+        path = os.path.join(self.snap_dir, name)
+        os.replace(tmp, path)
+        with open(os.path.join(self.snap_dir, f".{CURRENT}.tmp"), "w") as f:
+            f.write(name)
+        os.replace(os.path.join(self.snap_dir, f".{CURRENT}.tmp"), os.path.join(self.snap_dir, CURRENT))
+        for old in sorted(glob.glob(os.path.join(glob.escape(self.snap_dir), "snap-*.duckdb")))[:-self.keep]:
+            _remove(old)
+        self.snapshots += 1
+        self.last_taken_at = us / 1e6
+        self.last_copy_ms = (time.perf_counter() - t0) * 1000.0
+        self.last_bytes = os.path.getsize(path)
+        return path
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="snapshots", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=60)
+
+    def next_interval(self, copy_s):
+        """Seconds from the start of a copy that took copy_s to the start of the next one."""
+        interval = max(self.interval_s, copy_s / self.max_duty)
+        if interval > self.interval_s:
+            self.stretched += 1
+        self.effective_interval_s = interval
+        return interval
+
+    def _loop(self):
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            try:
+                self.take()
+            except Exception:
+                self.failures += 1
+                traceback.print_exc()
+            elapsed = time.monotonic() - t0
+            self._stop.wait(max(0.0, self.next_interval(elapsed) - elapsed))
+
+    def stats(self):
+        return {"role": "writer", "dir": self.snap_dir, "interval_s": self.interval_s,
+                "effective_interval_s": self.effective_interval_s, "max_duty": self.max_duty,
+                "stretched": self.stretched,
+                "snapshots": self.snapshots, "failures": self.failures,
+                "age_s": time.time() - self.last_taken_at if self.last_taken_at else None,
+                "last_copy_ms": self.last_copy_ms, "last_bytes": self.last_bytes}
+
+class SnapshotReader:
+    """
+    Reader side, standing in for the duckdb connection: cursor() and execute() run on the
+    newest snapshot. on_refresh(fn) callbacks run after every switch.
+    """
+    def __init__(self, snap_dir, poll_s=1.0, config=None):
+        self.snap_dir = os.path.abspath(snap_dir)
+        self.poll_s = float(poll_s)
+        self.config = config or {}              # duckdb settings per snapshot, e.g. memory_limit
+        self._con = None
+        self._name = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+
+    def wait(self, timeout_s=120.0):
+        """Block until a first snapshot is open (raises TimeoutError)."""
+        deadline = time.monotonic() + timeout_s
+        while not self.refresh() and self._con is None:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"no snapshot in {self.snap_dir} after {timeout_s:.0f}s")
+            time.sleep(min(self.poll_s, 0.5))
+
+    def refresh(self):
+        """Switch to the newest snapshot if CURRENT names a newer one; True when switched."""
+        try:
+            with open(os.path.join(self.snap_dir, CURRENT)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return False
+        if not name or name == self._name:
+            return False
+        try:
+            con = duckdb.connect(os.path.join(self.snap_dir, name), read_only=True, config=self.config)
+        except duckdb.Error:
+            return False                        # replaced meanwhile; the next poll picks the new one
+        with self._lock:
+            # The old connection is dropped, not closed: cursors still streaming from it keep it open
+            self._con, self._name = con, name
+        self.refreshes += 1
+        for fn in self._listeners:
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc()
+        return True
+
+    def on_refresh(self, fn):
+        self._listeners.append(fn)
+
+    def cursor(self):
+        with self._lock:
+            con = self._con
+        if con is None:
+            raise RuntimeError("no snapshot opened yet")
+        return con.cursor()
+
+    def execute(self, sql, params=None):
+        return self.cursor().execute(sql, params)
+
+    def age_s(self):
+        """Seconds since the open snapshot was taken (None before the first one)."""
+        name = self._name
+        return time.time() - _taken_at(name) if name else None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="snapshot-poll", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_s):
+            try:
+                self.refresh()
+            except Exception:
+                traceback.print_exc()
+
+    def stats(self):
+        return {"role": "reader", "dir": self.snap_dir, "snapshot": self._name,
+                "age_s": self.age_s(), "refreshes": self.refreshes, "poll_s": self.poll_s}
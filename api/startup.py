@@ -0,0 +1,66 @@
+# api/startup.py
+"""
+Startup tracking: how long the process took to reach each phase, and the background warm-up
+that runs once the server is accepting connections.
+
+    phases   seconds since the process started (from /proc on Linux, else since this import):
+             imported -> db_open (WAL replay) -> components -> serving -> warm
+    warm-up  named steps run in order on one thread; a failing step is recorded and skipped,
+             since everything it preloads is also loaded lazily on first use
+
+Liveness is "the process answers"; readiness is "serving and warmed up" (see /health/ready).
+"""
+import os, threading, time, traceback
+
+def process_age_s():
+    """Seconds since this process was started (0.0 where /proc is unavailable)."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime_s = float(f.read().split()[0])
+        return max(0.0, uptime_s - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+class Startup:
+    def __init__(self):
+        self.t0 = time.monotonic() - process_age_s()
+        self.phases = {}
+        self.steps = {}
+        self._warm = threading.Event()
+        self._thread = None
+
+    def mark(self, phase):
+        """Record that `phase` was reached now."""
+        self.phases[phase] = time.monotonic() - self.t0
+
+    def warm_up(self, steps):
+        """Run [(name, fn), ...] on a background thread; marks "warm" when all are done."""
+        if self._thread is None:
+            for name, _ in steps:
+                self.steps[name] = {"state": "pending"}
+            self._thread = threading.Thread(target=self._run, args=(steps,), name="warm-up", daemon=True)
+            self._thread.start()
+
+    def _run(self, steps):
+        for name, fn in steps:
+            self.steps[name] = {"state": "running"}
+            t0 = time.perf_counter()
+            try:
+                fn()
+                self.steps[name] = {"state": "done", "seconds": time.perf_counter() - t0}
+            except Exception as e:
+                traceback.print_exc()
+                self.steps[name] = {"state": "failed", "seconds": time.perf_counter() - t0, "error": str(e)}
+        self.mark("warm")
+        self._warm.set()
+
+    def wait(self, timeout_s=None):
+        return self._warm.wait(timeout_s)
+
+    def warm(self):
+        return self._warm.is_set()
+
+    def stats(self):
+        return {"phases": dict(self.phases), "warm": self.warm(), "steps": dict(self.steps)}
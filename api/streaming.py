@@ -0,0 +1,195 @@
+# api/streaming.py
+"""
+Incremental z-score detection maintained at ingest time.
+
+For every (device, metric) the detector keeps the last W-1 samples and scores each new
+sample against the rolling window that ends at it, using windowed sums (O(1) per sample,
+vectorised over a committed batch). Flagged samples go into a bounded per-device buffer
+that /anomaly/window and /detect_latest read instead of recomputing.
+
+Semantics match anomaly._rolling_z for windows of at least 5*W rows (where the batch
+detector also uses w=W): window of W samples including the current one, min_periods=10,
+sample std (ddof=1), zero std -> z=0, |z| > 2.5 flags. Scores agree with the pandas
+rolling result to ~1e-9 relative (different summation order); a sample sitting exactly
+on the threshold can therefore flip. The first W-1 rows of a queried window have no full
+in-window history, so those are always recomputed with _rolling_z to stay identical.
+
+Listeners (subscribe) get the samples each batch flagged, e.g. the policy engine's trigger.
+"""
+import threading, traceback
+from collections import deque
+import numpy as np
+
+from anomaly import METRICS, _rolling_z
+from hotcache import _ts_ns
+
+W = 60
+MIN_PERIODS = 10
+THRESHOLD = 2.5
+
+class _DeviceState:
+    def __init__(self):
+        self.hist = np.empty((0, len(METRICS)))   # last W-1 samples, oldest first
+        self.first_ts = None                      # first ts this process scored
+        self.last_ts = None
+        self.dirty_until = np.iinfo(np.int64).min # late rows scored out of order up to here
+        self.anomalies = deque()                  # (ts_ns, metric_idx, score)
+        self.floor = np.iinfo(np.int64).min       # anomalies at or below this were evicted
+
+def rolling_z(hist, new, w=W):
+    """
+    z-scores of the rows of `new` (k x m) given the previous samples `hist` (h x m, h < w),
+    computed with windowed sums. NaN samples are skipped like pandas rolling does.
+    """
+    data = np.vstack([hist, new])
+    valid = ~np.isnan(data)
+    # Shift by a per-metric reference value so sums of squares do not lose precision
+    ref = np.nanmin(np.where(valid, data, np.inf), axis=0)
+    ref[~np.isfinite(ref)] = 0.0
+    x = np.where(valid, data - ref, 0.0)
+    zero = np.zeros((1, data.shape[1]))
+    s = np.vstack([zero, np.cumsum(x, axis=0)])
+    q = np.vstack([zero, np.cumsum(x * x, axis=0)])
+    c = np.vstack([zero, np.cumsum(valid, axis=0)])
+    h = len(hist); k = len(new)
+    hi = np.arange(h + 1, h + k + 1)
+    lo = np.maximum(hi - w, 0)
+    n = c[hi] - c[lo]; sm = s[hi] - s[lo]; sq = q[hi] - q[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sm / n
+        var = (sq - sm * mean) / (n - 1)
+        # Cancellation leaves tiny residues where pandas reports an exact zero
+        var[var <= 1e-12 * (1.0 + np.abs(mean + ref) ** 2)] = 0.0
+        sd = np.sqrt(var)
+        z = (x[h:] - mean) / sd
+    ok = (n >= MIN_PERIODS) & (sd > 0) & valid[h:]
+    return np.where(ok, z, 0.0)
+
+class StreamingDetector:
+    def __init__(self, window=W, max_anomalies=4096):
+        self.window = int(window)
+        self.max_anomalies = int(max_anomalies)
+        self._devices = {}
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.flagged = 0
+        self.served = 0
+        self.fallbacks = 0
+        self._listeners = []
+
+    # ---------- Write side ----------
+    def append(self, df):
+        """Ingest listener: score a committed batch and keep the flagged samples."""
+        if df.empty:
+            return
+        ts_all = _ts_ns(df["ts"])
+        vals_all = df.reindex(columns=METRICS).to_numpy(dtype=float, na_value=np.nan)
+        groups = df.groupby("device_id", sort=False).indices
+        flags = {}
+        with self._lock:
+            for device_id, idx in groups.items():
+                ts = ts_all[idx]; vals = vals_all[idx]
+                order = np.argsort(ts, kind="stable")
+                hits = self._score(device_id, ts[order], vals[order])
+                if hits:
+                    flags[device_id] = hits
+        if flags:
+            for fn in self._listeners:
+                try:
+                    fn(flags)
+                except Exception:
+                    traceback.print_exc()
+
+    def subscribe(self, fn):
+        """Register fn({device_id: [(ts_ns, metric, score), ...]}) for the samples each batch flags."""
+        self._listeners.append(fn)
+
+    def _score(self, device_id, ts, vals):
+        st = self._devices.get(device_id)
+        if st is None:
+            st = self._devices[device_id] = _DeviceState()
+            st.first_ts = int(ts[0])
+        elif ts[0] < st.last_ts:
+            # Late rows: scores from here up to the newest seen are not batch-identical
+            st.dirty_until = max(st.dirty_until, int(st.last_ts))
+        z = rolling_z(st.hist, vals, self.window)
+        st.hist = np.vstack([st.hist, vals])[-(self.window - 1):]
+        st.last_ts = int(max(st.last_ts or ts[-1], ts[-1]))
+        self.samples += len(ts)
+        rows, cols = np.nonzero(np.abs(z) > THRESHOLD)
+        hits = [(int(ts[r]), m, float(abs(z[r, m]))) for r, m in zip(rows.tolist(), cols.tolist())]
+        st.anomalies.extend(hits)
+        self.flagged += len(rows)
+        while len(st.anomalies) > self.max_anomalies:
+            st.floor = max(st.floor, st.anomalies.popleft()[0])
+        return [(t, METRICS[m], score) for t, m, score in hits]
+
+    # ---------- Read side ----------
+    def zscore_anomalies(self, device_id, df):
+        """
+        z-score anomalies for the rows of `df` (one device, sorted by ts) in the exact form
+        anomaly.zscore_anomalies returns, or None when the precomputed results cannot
+        answer (window too short, not fully observed, out-of-order data, evicted).
+        """
+        w = min(60, max(10, len(df) // 5))
+        if df.empty or w != self.window:
+            return self._fallback()
+        ts = _ts_ns(df["ts"])
+        with self._lock:
+            st = self._devices.get(device_id)
+            if (st is None or ts[0] < st.first_ts or ts[-1] > st.last_ts
+                    or ts[0] <= st.dirty_until or ts[0] <= st.floor):
+                return self._fallback()
+            stored = [a for a in st.anomalies if ts[0] <= a[0] <= ts[-1]]
+            self.served += 1
+
+        hits = []
+        # Head rows: their batch window starts at the first row, so recompute them exactly
+        head = df.iloc[:w - 1]
+        for mi, m in enumerate(METRICS):
+            z = _rolling_z(head[m].values, w=w)
+            for i in np.where(np.abs(z) > THRESHOLD)[0]:
+                hits.append((mi, int(i), float(abs(z[i]))))
+        for a_ts, mi, score in stored:
+            i = int(np.searchsorted(ts, a_ts, side="left"))
+            if i >= w - 1:
+                hits.append((mi, i, score))
+        hits.sort(key=lambda h: (h[0], h[1]))
+        ts_col = df["ts"]
+        return [{"idx": i, "ts": ts_col.iloc[i].isoformat(), "metric": METRICS[mi], "score": score,
+                 "type": "zscore"} for mi, i, score in hits]
+
+    def flagged_at(self, device_id, ts):
+        """Stored anomalies of samples whose ts (ns) is in `ts`, as (ts_ns, metric, score)."""
+        want = set(np.asarray(ts, dtype=np.int64).tolist())
+        with self._lock:
+            st = self._devices.get(device_id)
+            found = [a for a in st.anomalies if a[0] in want] if st is not None else []
+        return [(t, METRICS[m], score) for t, m, score in found]
+
+    def flagged_counts(self, since_ns):
+        """Flagged samples per device with ts at or after since_ns (a sample counts once)."""
+        out = {}
+        with self._lock:
+            for device_id, st in self._devices.items():
+                n, prev = 0, None
+                for t, _, _ in reversed(st.anomalies):
+                    if t < since_ns:
+                        break
+                    if t != prev:
+                        n += 1; prev = t
+                if n:
+                    out[device_id] = n
+        return out
+
+    def _fallback(self):
+        self.fallbacks += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            devices = len(self._devices)
+            stored = sum(len(s.anomalies) for s in self._devices.values())
+        return {"window": self.window, "devices": devices, "samples": self.samples,
+                "flagged": self.flagged, "stored": stored, "served": self.served,
+                "fallbacks": self.fallbacks}
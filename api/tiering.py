@@ -0,0 +1,485 @@
+# api/tiering.py
+"""
+Hot/cold storage tiering. Rows older than the hot horizon are moved out of the DuckDB
+telemetry table into Parquet files laid out as
+
+    <cold_dir>/date=YYYY-MM-DD/device=<url-quoted device_id>/part-*.parquet
+
+and window reads union the hot table with only the partitions matching the device and
+date range, so the hot table (and every recent-data query) stays bounded by the horizon.
+
+- Moves are exactly-once: a batch is written to a staging directory and its hot rows are
+  deleted in the transaction that records it in tier_moves. On startup, committed staged
+  batches are published and uncommitted ones are discarded.
+- Compaction: a partition with compact_files or more files is rewritten as one file.
+- Retention: hot rows live for hot_hours; cold partitions are dropped after cold_days
+  (0 keeps them forever).
+- Multi-process (serve.py): reader processes open a read_only TierManager on a snapshot
+  of the database and read the same cold tree. Cold rows are read below the snapshot's
+  cutoff only, so rows moved after it are not seen twice; queries of every process hold
+  a shared flock on <cold_dir>/.lock, and compaction/retention swap files only when they
+  get it exclusively (otherwise they retry on the next run).
+"""
+import fcntl, glob, os, shutil, threading, time, traceback, uuid
+from contextlib import contextmanager
+from datetime import datetime as dt
+from urllib.parse import quote, unquote
+import pandas as pd
+
+from schema import COLUMNS
+
+_SELECT = ", ".join(COLUMNS)
+_STAGING = "_staging"
+
+def _utc(t):
+    """Naive UTC Timestamp from an ISO string / datetime (tz-aware values are converted)."""
+    t = pd.Timestamp(t)
+    return t.tz_convert("UTC").tz_localize(None) if t.tz is not None else t
+
+def _device_dir(device_id):
+    return "device=" + quote(str(device_id), safe="")
+
+def _sql_str(s):
+    return "'" + str(s).replace("'", "''") + "'"
+
+class _SharedLock:
+    """Readers share it; publishing, compaction and retention swap files under it exclusively."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writers = 0            # waiting or active; new readers queue behind them
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            while self._writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._writers += 1
+            while self._readers:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writers -= 1
+                self._cond.notify_all()
+
+class TierManager:
+    def __init__(self, con, cold_dir, hot_hours=24.0, cold_days=0.0, compact_files=8,
+                 read_only=False, multiprocess=False):
+        self.con = con
+        self.read_only = read_only
+        self.multiprocess = multiprocess or read_only
+        self.cold_dir = os.path.abspath(cold_dir)
+        self.hot_hours = float(hot_hours)
+        self.cold_days = float(cold_days)
+        self.compact_files = max(2, int(compact_files))
+        self._rw = _SharedLock()
+        self._lock = threading.Lock()        # guards _index and counters
+        self._index = {}                     # "YYYY-MM-DD" -> set of device ids with cold files
+        self._pins = {}                      # file -> running queries reading it
+        self._doomed = set()                 # pinned files to delete once unpinned
+        self._stop = threading.Event()
+        self._thread = None
+        self.moves = 0
+        self.moved_rows = 0
+        self.compactions = 0
+        self.dropped_partitions = 0
+        self.last_run_ms = None
+        self.skipped_swaps = 0
+        if not read_only:
+            con.execute("""
+            CREATE TABLE IF NOT EXISTS tier_moves (
+                batch_id VARCHAR,
+                cutoff TIMESTAMP,
+                rows BIGINT,
+                moved_at TIMESTAMP
+            )
+            """)
+        # Every row with ts >= cutoff is still in the hot table; cold rows all have ts < cutoff
+        self.cutoff = self._read_cutoff()
+        os.makedirs(self.cold_dir, exist_ok=True)
+        if not read_only:
+            self._recover()
+        self._scan()
+
+    def _read_cutoff(self):
+        cutoff = self.con.execute("SELECT max(cutoff) FROM tier_moves").fetchall()[0][0]
+        return pd.Timestamp(cutoff) if cutoff is not None else None
+
+    def reload(self):
+        """Read side of a reader process: pick up the cutoff of a newer snapshot."""
+        cutoff = self._read_cutoff()
+        if cutoff != self.cutoff:
+            self.cutoff = cutoff
+            self._scan()           # new partitions only appear with moves
+
+    # ---------- Read side ----------
+    def hot_floor(self):
+        """Lower bound of complete hot data (None if nothing was ever moved)."""
+        return self.cutoff
+
+    def files(self, device_id, start=None, end=None):
+        """Cold Parquet files of one device whose date partition overlaps [start, end]."""
+        if self.cutoff is None or (start is not None and _utc(start) >= self.cutoff):
+            return []
+        lo = None if start is None else _utc(start).strftime("%Y-%m-%d")
+        hi = None if end is None else _utc(end).strftime("%Y-%m-%d")
+        with self._lock:
+            dates = [d for d, devs in self._index.items()
+                     if device_id in devs and (lo is None or d >= lo) and (hi is None or d <= hi)]
+        base = glob.escape(self.cold_dir)
+        return sorted(f for d in dates
+                      for f in glob.glob(os.path.join(base, f"date={d}", _device_dir(device_id), "*.parquet")))
+
+    def execute(self, cur, device_id, start, end):
+        """
+        Start the two-tier window query (ascending by ts) on cursor `cur` and return a
+        release() to call once its result is consumed. The query's snapshot of the hot
+        table and its pinned file list stay consistent however long the result is
+        streamed; files compacted or expired meanwhile are deleted only on release.
+        """
+        where = "device_id = ? AND ts BETWEEN CAST(? AS TIMESTAMP) AND CAST(? AS TIMESTAMP)"
+        sql = f"SELECT {_SELECT} FROM telemetry WHERE {where}"
+        params = [device_id, start, end]
+        with self._rw.shared():
+            files = self.files(device_id, start, end)
+            if files:
+                sql += f" UNION ALL SELECT {_SELECT} FROM read_parquet(?) WHERE {where} AND ts < ?"
+                params += [files, device_id, start, end, self.cutoff.to_pydatetime()]
+            self._pin(files)
+            lock = self._flock(fcntl.LOCK_SH) if files and self.multiprocess else None
+            try:
+                cur.execute(sql + " ORDER BY ts ASC", params)
+            except Exception:
+                self._release(files, lock)
+                raise
+        return lambda: self._release(files, lock)
+
+    def _release(self, files, lock):
+        if lock is not None:
+            os.close(lock)
+        self._unpin(files)
+
+    def _flock(self, mode):
+        """An fd holding the cross-process cold-tree lock in `mode`, or None if non-blocking and taken."""
+        fd = os.open(os.path.join(self.cold_dir, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, mode)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @contextmanager
+    def _swapping(self):
+        """
+        Exclusive over file swaps: in-process queries via _rw, other processes' via the
+        flock (taken without waiting). Yields False when another process is reading.
+        """
+        with self._rw.exclusive():
+            lock = self._flock(fcntl.LOCK_EX | fcntl.LOCK_NB) if self.multiprocess else None
+            if self.multiprocess and lock is None:
+                self.skipped_swaps += 1
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                if lock is not None:
+                    os.close(lock)
+
+    def stable(self):
+        """Context in which no move commits: a database snapshot taken in it matches the cold tree."""
+        return self._rw.shared()
+
+    def window(self, device_id, start, end):
+        """Rows of one device with start <= ts <= end from both tiers, ascending by ts."""
+        cur = self.con.cursor()
+        release = self.execute(cur, device_id, start, end)
+        try:
+            return cur.df()
+        finally:
+            release()
+            cur.close()
+
+    def last(self, device_id, n):
+        """
+        The device's newest n rows from both tiers, ascending by ts. Cold days are read
+        newest first, only as far back as it takes to be sure of the newest n.
+        """
+        n = int(n)
+        cur = self.con.cursor()
+        try:
+            with self._rw.shared():
+                lock = self._flock(fcntl.LOCK_SH) if self.multiprocess else None
+                try:
+                    parts = [cur.execute(f"SELECT {_SELECT} FROM telemetry WHERE device_id = ? "
+                                         "ORDER BY ts DESC LIMIT ?", [device_id, n]).df()]
+                    hot_ts, cold = parts[0]["ts"], 0
+                    dates = []
+                    # Hot rows at or past the cutoff are newer than any cold row; late ones may not be
+                    if self.cutoff is not None and int((hot_ts >= self.cutoff).sum()) < n:
+                        with self._lock:
+                            dates = sorted((d for d, devs in self._index.items() if device_id in devs), reverse=True)
+                    base = glob.escape(self.cold_dir)
+                    for d in dates:
+                        files = glob.glob(os.path.join(base, f"date={d}", _device_dir(device_id), "*.parquet"))
+                        if not files:
+                            continue
+                        parts.append(cur.execute(
+                            f"SELECT {_SELECT} FROM read_parquet(?) WHERE device_id = ? AND ts < ? "
+                            "ORDER BY ts DESC LIMIT ?", [files, device_id, self.cutoff.to_pydatetime(), n]).df())
+                        cold += len(parts[-1])
+                        # Every cold row not read yet is older than this day
+                        if cold + int((hot_ts >= pd.Timestamp(d)).sum()) >= n:
+                            break
+                finally:
+                    if lock is not None:
+                        os.close(lock)
+        finally:
+            cur.close()
+        parts = [p for p in parts if not p.empty] or parts[:1]
+        df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        return df.sort_values("ts", ascending=False, kind="stable").head(n).iloc[::-1].reset_index(drop=True)
+
+    def _pin(self, files):
+        with self._lock:
+            for f in files:
+                self._pins[f] = self._pins.get(f, 0) + 1
+
+    def _unpin(self, files):
+        with self._lock:
+            for f in files:
+                self._pins[f] -= 1
+                if not self._pins[f]:
+                    del self._pins[f]
+                    if f in self._doomed:
+                        self._doomed.discard(f)
+                        self._remove(f)
+
+    def _discard(self, files):
+        """Delete replaced/expired files now, or when the last query reading them is done."""
+        with self._lock:
+            for f in files:
+                if f in self._pins:
+                    self._doomed.add(f)
+                else:
+                    self._remove(f)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def devices(self):
+        with self._lock:
+            return set().union(*self._index.values())
+
+    # ---------- Move ----------
+    def move(self, now=None):
+        """Move hot rows older than the horizon to Parquet, one day per transaction."""
+        horizon = _utc(now if now is not None else dt.utcnow()) - pd.Timedelta(hours=self.hot_hours)
+        cur = self.con.cursor()
+        moved = 0
+        while not self._stop.is_set():
+            oldest = cur.execute("SELECT min(ts) FROM telemetry WHERE ts < ?",
+                                 [horizon.to_pydatetime()]).fetchone()[0]
+            if oldest is None:
+                break
+            upto = min(horizon, pd.Timestamp(oldest).normalize() + pd.Timedelta(days=1))
+            moved += self._move_batch(cur, upto)
+        return moved
+
+    def _move_batch(self, cur, upto):
+        batch = uuid.uuid4().hex
+        stage = os.path.join(self.cold_dir, _STAGING, batch)
+        bound = [upto.to_pydatetime()]
+        committed = False
+        os.makedirs(os.path.dirname(stage), exist_ok=True)
+        cur.execute("BEGIN")
+        try:
+            cur.execute(
+                f"""
+                COPY (SELECT {_SELECT}, strftime(ts, '%Y-%m-%d') AS date, device_id AS device
+                      FROM telemetry WHERE ts < ?)
+                TO {_sql_str(stage)} (FORMAT PARQUET, PARTITION_BY (date, device),
+                                      FILENAME_PATTERN 'part-{{uuid}}')
+                """, bound)
+            rows = cur.execute("DELETE FROM telemetry WHERE ts < ?", bound).fetchone()[0]
+            cur.execute("INSERT INTO tier_moves VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+                        [batch, bound[0], rows])
+            # Raise the floor before the delete is visible so a concurrent hot-cache seed
+            # never claims rows that are already gone
+            if self.cutoff is None or upto > self.cutoff:
+                self.cutoff = upto
+            with self._rw.exclusive():
+                cur.execute("COMMIT")
+                committed = True
+                self._publish(stage)
+        except Exception:
+            # A committed batch that failed to publish stays staged; _recover retries it
+            if not committed:
+                try:
+                    cur.execute("ROLLBACK")
+                except Exception:
+                    pass
+                shutil.rmtree(stage, ignore_errors=True)
+            raise
+        with self._lock:
+            self.moves += 1
+            self.moved_rows += int(rows)
+        return int(rows)
+
+    def _publish(self, stage):
+        """Move a committed staging batch's files into the partition tree."""
+        if os.path.isdir(stage):
+            for date_dir in os.listdir(stage):
+                date = date_dir.split("=", 1)[1]
+                for dev_dir in os.listdir(os.path.join(stage, date_dir)):
+                    device_id = unquote(dev_dir.split("=", 1)[1])
+                    dest = os.path.join(self.cold_dir, date_dir, _device_dir(device_id))
+                    os.makedirs(dest, exist_ok=True)
+                    src = os.path.join(stage, date_dir, dev_dir)
+                    for name in os.listdir(src):
+                        os.replace(os.path.join(src, name), os.path.join(dest, name))
+                    with self._lock:
+                        self._index.setdefault(date, set()).add(device_id)
+        shutil.rmtree(stage, ignore_errors=True)
+
+    def _recover(self):
+        root = os.path.join(self.cold_dir, _STAGING)
+        if not os.path.isdir(root):
+            return
+        for batch in os.listdir(root):
+            stage = os.path.join(root, batch)
+            committed = self.con.execute("SELECT count(*) FROM tier_moves WHERE batch_id = ?",
+                                         [batch]).fetchone()[0]
+            if committed:
+                self._publish(stage)
+            else:
+                shutil.rmtree(stage, ignore_errors=True)
+
+    def _scan(self):
+        index = {}
+        for date_dir in os.listdir(self.cold_dir):
+            if not date_dir.startswith("date="):
+                continue
+            try:
+                dev_dirs = os.listdir(os.path.join(self.cold_dir, date_dir))
+            except FileNotFoundError:
+                continue                 # dropped by retention (in the writer process) meanwhile
+            for dev_dir in dev_dirs:
+                part = os.path.join(self.cold_dir, date_dir, dev_dir)
+                if not self.read_only:
+                    for tmp in glob.glob(os.path.join(glob.escape(part), ".compact-*")):
+                        os.remove(tmp)   # interrupted compaction; its inputs are intact
+                if dev_dir.startswith("device="):
+                    index.setdefault(date_dir[5:], set()).add(unquote(dev_dir[7:]))
+        with self._lock:
+            self._index = index
+
+    # ---------- Compaction / retention ----------
+    def compact(self):
+        """Rewrite every partition holding compact_files or more files as one ts-sorted file."""
+        with self._lock:
+            parts = [(d, dev) for d, devs in self._index.items() for dev in devs]
+        cur = self.con.cursor()
+        done = 0
+        for date, device_id in parts:
+            if self._stop.is_set():
+                break
+            part = os.path.join(self.cold_dir, f"date={date}", _device_dir(device_id))
+            files = sorted(glob.glob(os.path.join(glob.escape(part), "*.parquet")))
+            if len(files) < self.compact_files:
+                continue
+            tmp = os.path.join(part, f".compact-{uuid.uuid4()}.tmp")
+            cur.execute(f"COPY (SELECT {_SELECT} FROM read_parquet(?) ORDER BY ts) "
+                        f"TO {_sql_str(tmp)} (FORMAT PARQUET)", [files])
+            with self._swapping() as ok:
+                if not ok:
+                    os.remove(tmp)
+                    continue
+                os.replace(tmp, os.path.join(part, f"part-{uuid.uuid4()}.parquet"))
+                self._discard(files)
+            done += 1
+        with self._lock:
+            self.compactions += done
+        return done
+
+    def enforce_retention(self, now=None):
+        """Drop cold date partitions older than cold_days."""
+        if self.cold_days <= 0:
+            return 0
+        keep_from = (_utc(now if now is not None else dt.utcnow())
+                     - pd.Timedelta(days=self.cold_days)).strftime("%Y-%m-%d")
+        with self._lock:
+            expired = [d for d in self._index if d < keep_from]
+        with self._swapping() as ok:
+            if not ok:
+                return 0
+            for d in expired:
+                date_dir = os.path.join(self.cold_dir, f"date={d}")
+                self._discard(glob.glob(os.path.join(glob.escape(date_dir), "*", "*.parquet")))
+                for root, _, _ in sorted(os.walk(date_dir), reverse=True):
+                    try:
+                        os.rmdir(root)       # directories still holding pinned files stay
+                    except OSError:
+                        pass
+                with self._lock:
+                    self._index.pop(d, None)
+                    self.dropped_partitions += 1
+        return len(expired)
+
+    # ---------- Background loop ----------
+    def run_once(self, now=None):
+        t0 = time.perf_counter()
+        with self._rw.exclusive():
+            self._recover()
+        self.move(now)
+        self.compact()
+        self.enforce_retention(now)
+        self.last_run_ms = (time.perf_counter() - t0) * 1000.0
+
+    def start(self, interval_s=300.0):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, args=(interval_s,),
+                                            name="tiering", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+
+    def _loop(self, interval_s):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(interval_s)
+
+    def stats(self):
+        with self._lock:
+            return {"cold_dir": self.cold_dir, "hot_hours": self.hot_hours,
+                    "cold_days": self.cold_days,
+                    "cutoff": self.cutoff.isoformat() if self.cutoff is not None else None,
+                    "partitions": sum(len(v) for v in self._index.values()),
+                    "dates": len(self._index), "moves": self.moves,
+                    "moved_rows": self.moved_rows, "compactions": self.compactions,
+                    "dropped_partitions": self.dropped_partitions,
+                    "skipped_swaps": self.skipped_swaps, "last_run_ms": self.last_run_ms}
@@ -0,0 +1,78 @@
+# bench/bench_anomaly.py
+"""
+find_anomalies latency across window sizes and metric counts, against the original
+per-metric/per-row implementation.
+
+    python bench/bench_anomaly.py --rows 1000 10000 100000 --repeat 5 --out anomaly.json
+"""
+import argparse, json, os, sys, time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+from anomaly import METRICS, _rolling_z, zscore_anomalies, find_anomalies
+from models import fit_model
+
+def legacy_zscore(df):
+    """The z-score loop find_anomalies used before vectorisation (reference only)."""
+    out = []
+    for m in METRICS:
+        if m in df.columns:
+            z = _rolling_z(df[m].values, w=min(60, max(10, len(df) // 5)))
+            for i in np.where(np.abs(z) > 2.5)[0]:
+                out.append({"idx": int(i), "ts": df.iloc[i]["ts"].isoformat(), "metric": m,
+                            "score": float(abs(z[i])), "type": "zscore"})
+    keyed = {}
+    for a in out:
+        k = (a["idx"], a["metric"])
+        if k not in keyed or a["score"] > keyed[k]["score"]: keyed[k] = a
+    return list(keyed.values())
+
+def make_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"ts": pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(n), unit="s")})
+    for m in METRICS:
+        df[m] = rng.normal(50, 5, n)
+    # A noisy metric: heavy tails produce many hits
+    df["latency_ms"] = rng.standard_t(2, n) * 3 + 11
+    return df
+
+def timed(fn, repeat):
+    best = []
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); best.append(time.perf_counter() - t)
+    return float(np.median(best)) * 1000.0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--metrics", type=int, nargs="+", default=[1, 3, 7])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", help="write results as JSON to this path")
+    args = ap.parse_args()
+
+    results = []
+    print(f"{'rows':>8}{'metrics':>9}{'hits':>7}{'legacy z ms':>13}{'z ms':>9}"
+          f"{'find+fit ms':>13}{'find+model ms':>15}")
+    for n in args.rows:
+        full = make_frame(n)
+        model = fit_model(full.iloc[: min(n, 3600)])
+        for k in args.metrics:
+            df = full[["ts"] + METRICS[-k:]]
+            hits = len(zscore_anomalies(df))
+            row = {"rows": n, "metrics": k, "hits": hits,
+                   "legacy_zscore_ms": timed(lambda: legacy_zscore(df), args.repeat),
+                   "zscore_ms": timed(lambda: zscore_anomalies(df), args.repeat)}
+            if k == len(METRICS):
+                row["find_fit_ms"] = timed(lambda: find_anomalies(full), 1)
+                row["find_model_ms"] = timed(lambda: find_anomalies(full, model=model), args.repeat)
+            results.append(row)
+            print(f"{n:>8}{k:>9}{hits:>7}{row['legacy_zscore_ms']:>13.1f}{row['zscore_ms']:>9.1f}"
+                  f"{row.get('find_fit_ms', float('nan')):>13.1f}{row.get('find_model_ms', float('nan')):>15.1f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# bench/bench_cluster.py
+"""
+Per-device query latency on an arrival-ordered telemetry table before and after the
+(device_id, ts) clustering rewrite, plus /devices from the registry vs SELECT DISTINCT.
+Rows are generated the way ingest lays them out: 1 Hz, all devices interleaved by ts.
+
+    python bench/bench_cluster.py --rows 100000000 --devices 2000 --out cluster.json
+"""
+import argparse, json, os, sys, tempfile, time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+
+QUERIES = {
+    "devices_distinct": ("SELECT DISTINCT device_id FROM telemetry ORDER BY device_id", False),
+    "devices_registry": ("SELECT device_id FROM devices ORDER BY device_id", False),
+    "latest_recent_1000": ("SELECT * FROM (SELECT * FROM telemetry WHERE device_id = ? ORDER BY ts DESC LIMIT 1000) "
+                           "ORDER BY ts", True),
+    "window_1h": ("SELECT * FROM telemetry WHERE device_id = ? AND ts BETWEEN CAST(? AS TIMESTAMP) - INTERVAL 1 HOUR "
+                  "AND CAST(? AS TIMESTAMP) ORDER BY ts", True),
+    "window_all": ("SELECT * FROM telemetry WHERE device_id = ? ORDER BY ts", True),
+    "stats_60m": ("SELECT device_id, count(*) FROM telemetry WHERE ts >= CAST(? AS TIMESTAMP) - INTERVAL 1 HOUR "
+                  "GROUP BY 1", False),
+}
+
+def build(con, rows, devices):
+    con.execute(f"""
+    CREATE TABLE telemetry AS
+    SELECT TIMESTAMP '2024-01-01' + to_seconds((i // {devices})::BIGINT) AS ts,
+           'dev-' || lpad((i % {devices})::VARCHAR, 5, '0') AS device_id,
+           22 + random() AS inlet_temp_c, (4700 + i % 200)::INTEGER AS fan_rpm, 56 + random() AS temp_c,
+           1.0 + random() / 100 AS vcore_v, 30 + 5 * random() AS cpu_pct, 55 + random() AS mem_pct,
+           0::INTEGER AS disk_errors, 0::INTEGER AS nic_drops, 11 + random() AS latency_ms
+    FROM range({rows}) r(i)
+    """)
+    con.execute("CHECKPOINT")
+
+def params(name, dev, end):
+    if name == "window_1h":
+        return [dev, end, end]
+    if name == "stats_60m":
+        return [end]
+    return [dev] if QUERIES[name][1] else []
+
+def measure(con, devices, end, repeat, rng):
+    out = {}
+    for name, (sql, per_device) in QUERIES.items():
+        if name == "devices_registry" and not con.execute(
+                "SELECT count(*) FROM information_schema.tables WHERE table_name = 'devices'").fetchall()[0][0]:
+            continue
+        lat = []
+        for _ in range(repeat):
+            dev = f"dev-{rng.integers(devices):05d}"
+            t = time.perf_counter()
+            con.execute(sql, params(name, dev, end)).fetchall()
+            lat.append((time.perf_counter() - t) * 1000.0)
+        out[name] = {"p50_ms": float(np.percentile(lat, 50)), "p99_ms": float(np.percentile(lat, 99))}
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000_000)
+    ap.add_argument("--devices", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--slice-s", type=float, default=3600)
+    ap.add_argument("--db", help="keep the database here instead of a temporary directory")
+    ap.add_argument("--out", help="write results as JSON to this path")
+    args = ap.parse_args()
+
+    import duckdb
+    from clustering import Clusterer
+    from device_registry import DeviceRegistry
+
+    tmp = tempfile.TemporaryDirectory(prefix="eta-bench-")
+    path = args.db or os.path.join(tmp.name, "bench.duckdb")
+    con = duckdb.connect(path)
+    t = time.perf_counter()
+    if not con.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = 'telemetry'").fetchall()[0][0]:
+        build(con, args.rows, args.devices)
+    build_s = time.perf_counter() - t
+    end = str(con.execute("SELECT max(ts) FROM telemetry").fetchall()[0][0])
+    rng = np.random.default_rng(0)
+    results = {"rows": args.rows, "devices": args.devices, "build_s": build_s,
+               "before": measure(con, args.devices, end, args.repeat, rng)}
+
+    t = time.perf_counter()
+    DeviceRegistry(con)
+    results["registry_backfill_s"] = time.perf_counter() - t
+    t = time.perf_counter()
+    c = Clusterer(con, slice_s=args.slice_s, settle_s=0)
+    rewritten = c.run_once(now=np.datetime64(end) + np.timedelta64(int(args.slice_s), "s"))
+    con.execute("CHECKPOINT")
+    results.update(cluster_s=time.perf_counter() - t, rewritten_rows=rewritten, slices=c.slices)
+    results["after"] = measure(con, args.devices, end, args.repeat, np.random.default_rng(0))
+
+    print(f"{args.rows:,} rows, {args.devices} devices; clustered {rewritten:,} rows in {results['cluster_s']:.0f} s")
+    print(f"{'query':<22}{'before p50 ms':>15}{'after p50 ms':>15}{'speed-up':>10}")
+    for name, a in results["after"].items():
+        b = results["before"].get(name) or results["before"]["devices_distinct"]
+        print(f"{name:<22}{b['p50_ms']:>15.1f}{a['p50_ms']:>15.1f}{b['p50_ms'] / a['p50_ms']:>9.1f}x")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    con.close()
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
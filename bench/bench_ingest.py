@@ -0,0 +1,87 @@
+# bench/bench_ingest.py
+"""
+Ingest throughput: JSON /ingest vs columnar /ingest/bulk (Arrow IPC, NDJSON, Parquet).
+Runs the API in-process against a throwaway database.
+
+    python bench/bench_ingest.py --rows 200000
+"""
+import argparse, io, json, os, sys, tempfile, time
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def make_rows(n, devices=50):
+    rng = np.random.default_rng(7)
+    ticks = (np.arange(n) // devices).astype("timedelta64[s]")
+    return {
+        "ts": np.char.add(np.datetime_as_string(np.datetime64("2024-01-01T00:00:00", "ms") + ticks), "Z"),
+        "device_id": np.array([f"bench-{i % devices}" for i in range(n)]),
+        "inlet_temp_c": rng.normal(22, 0.5, n).round(1),
+        "fan_rpm": rng.integers(4700, 4900, n),
+        "temp_c": rng.normal(56, 1, n).round(1),
+        "vcore_v": rng.normal(1.0, 0.01, n).round(3),
+        "cpu_pct": rng.normal(32, 3, n).round(1),
+        "mem_pct": rng.normal(55, 5, n).round(1),
+        "disk_errors": (rng.random(n) < 0.001).astype(int),
+        "nic_drops": (rng.random(n) < 0.001).astype(int),
+        "latency_ms": rng.normal(11, 1, n).round(1),
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200000)
+    ap.add_argument("--json-batch", type=int, default=1000, help="events per /ingest request")
+    ap.add_argument("--out", help="write results as JSON to this path")
+    args = ap.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="eta-bench-")
+    os.environ["RCA_DB"] = os.path.join(tmpdir, "bench.duckdb")
+    sys.path.insert(0, os.path.join(ROOT, "api"))
+    from fastapi.testclient import TestClient
+    import app as api
+
+    cols = make_rows(args.rows)
+    table = pa.table(cols)
+    events = table.to_pylist()
+    bodies = {}
+    sink = io.BytesIO()
+    with ipc.new_stream(sink, table.schema) as w:
+        w.write_table(table, max_chunksize=65536)
+    bodies["arrow"] = sink.getvalue()
+    bodies["ndjson"] = "\n".join(json.dumps(e) for e in events).encode()
+    sink = io.BytesIO(); pq.write_table(table, sink); bodies["parquet"] = sink.getvalue()
+
+    results = []
+    with TestClient(api.app) as c:
+        t = time.perf_counter()
+        # Fire-and-forget like the agents do; the last request waits for its commit,
+        # which (single FIFO writer) implies every earlier batch is committed too
+        starts = range(0, len(events), args.json_batch)
+        for i in starts:
+            wait = "true" if i == starts[-1] else "false"
+            while True:
+                r = c.post(f"/ingest?wait={wait}", json=events[i:i + args.json_batch])
+                if r.status_code != 429:
+                    break
+                time.sleep(0.01)  # backpressure: retry like a well-behaved agent
+            r.raise_for_status()
+        results.append(("json /ingest", args.rows, time.perf_counter() - t))
+        for fmt, body in bodies.items():
+            t = time.perf_counter()
+            r = c.post(f"/ingest/bulk?format={fmt}", content=body)
+            r.raise_for_status()
+            assert r.json()["ingested"] == args.rows
+            results.append((f"{fmt} /ingest/bulk", args.rows, time.perf_counter() - t))
+
+    print(f"{'path':<22}{'rows':>10}{'seconds':>10}{'rows/s':>14}")
+    for name, n, s in results:
+        print(f"{name:<22}{n:>10}{s:>10.2f}{n / s:>14,.0f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump([{"path": p, "rows": n, "seconds": s, "rows_per_s": n / s} for p, n, s in results], f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# bench/bench_load.py
+"""
+End-to-end load benchmark: a fresh API (uvicorn, throwaway database) is driven by the
+fleet load generator (simulator/loadgen.py) at a ramp of offered rates while query
+workers hit /window, /detect_latest and /rca for random devices. Per step it reports
+the sustained ingest rate (rows committed per second, measured until /rowcount has
+every accepted row), ingest p50/p99 latency, 429s and errors, and query p50/p99 per
+endpoint; a step is marked saturated when the API commits less than 95% of the offered
+rate. Results are written as JSON with the git revision, so runs can be compared:
+
+    python bench/bench_load.py --devices 50000 --rates 2000 5000 10000 20000 --duration 30 --out load.json
+    python bench/bench_load.py ... --baseline load.json       # exit 1 on a regression past --tolerance
+    python bench/bench_load.py --api http://host:8000 ...     # against a running API instead
+"""
+import argparse, json, os, platform, random, subprocess, sys, tempfile, threading, time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from simulator.loadgen import Fleet, LoadGen
+
+ENDPOINTS = ["window", "detect_latest", "rca"]
+# (metric, direction): higher is better (+1) or lower is better (-1)
+COMPARE = [("committed_rows_s", 1), ("ingest_ms_p99", -1), ("window_ms_p99", -1),
+           ("detect_latest_ms_p99", -1), ("rca_ms_p99", -1)]
+
+def start_api(db, port, env):
+    env = dict(os.environ, RCA_DB=db, TIERING="0", ROLLUPS="0", MODEL_REGISTRY="0", **env)
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+                             "--log-level", "warning"], cwd=os.path.join(ROOT, "api"), env=env,
+                            stdout=subprocess.DEVNULL, stderr=open(os.path.join(os.path.dirname(db), "api.log"), "w"))
+    for _ in range(600):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1).raise_for_status()
+            return proc
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("API did not start")
+
+def rowcount(base):
+    return requests.get(base + "/rowcount", timeout=60).json()["rows"]
+
+class QueryLoad:
+    """Closed-loop query workers cycling through ENDPOINTS for random devices."""
+    def __init__(self, base, device_ids, workers=4, minutes=2, seed=0):
+        self.base = base
+        self.device_ids = device_ids
+        self.workers = workers
+        self.minutes = minutes
+        self.seed = seed
+        self.latency_ms = {e: [] for e in ENDPOINTS}
+        self.errors = {e: 0 for e in ENDPOINTS}
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _worker(self, i):
+        rng = random.Random(self.seed * 1000 + i)
+        s = requests.Session()
+        k = i
+        while not self._stop.is_set():
+            ep = ENDPOINTS[k % len(ENDPOINTS)]; k += 1
+            dev = str(rng.choice(self.device_ids))
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            body = {"device_id": dev, "start": (now - timedelta(minutes=self.minutes)).isoformat() + "Z",
+                    "end": now.isoformat() + "Z"}
+            t = time.perf_counter()
+            try:
+                if ep == "detect_latest":
+                    r = s.get(self.base + "/detect_latest", params={"device_id": dev, "minutes": self.minutes}, timeout=60)
+                else:
+                    r = s.post(f"{self.base}/{ep}", json=body, timeout=60)
+                ok = r.ok; r.content
+            except requests.RequestException:
+                ok = False
+            if ok:
+                self.latency_ms[ep].append((time.perf_counter() - t) * 1000.0)
+            else:
+                self.errors[ep] += 1
+
+    def __enter__(self):
+        self._threads = [threading.Thread(target=self._worker, args=(i,), daemon=True) for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+
+    def summary(self, elapsed):
+        out = {}
+        for ep, lat in self.latency_ms.items():
+            a = np.array(lat) if lat else np.zeros(1)
+            out.update({f"{ep}_n": len(lat), f"{ep}_qps": len(lat) / elapsed, f"{ep}_errors": self.errors[ep],
+                        f"{ep}_ms_p50": float(np.percentile(a, 50)), f"{ep}_ms_p99": float(np.percentile(a, 99))})
+        return out
+
+def run_step(base, fleet, rate, args):
+    before = rowcount(base)
+    gen = LoadGen(fleet, base, rate, args.batch, args.format, wait=True, senders=args.senders)
+    with QueryLoad(base, fleet.device_ids, args.query_workers, seed=args.seed) as q:
+        t0 = time.monotonic()
+        step = gen.run(args.duration)
+        # Sustained rate: everything accepted must be committed, however long that takes
+        deadline = time.monotonic() + args.drain_s
+        while rowcount(base) - before < gen.sent_rows and time.monotonic() < deadline:
+            time.sleep(0.1)
+        elapsed = time.monotonic() - t0
+    committed = rowcount(base) - before
+    step.update(committed_rows=committed, committed_rows_s=committed / elapsed,
+                saturated=committed / elapsed < 0.95 * rate, **q.summary(elapsed))
+    return step
+
+def compare(results, baseline, tolerance):
+    """Regressions of this run's steps against the baseline steps with the same offered rate."""
+    old = {s["offered_rows_s"]: s for s in baseline["steps"]}
+    out = []
+    for s in results["steps"]:
+        b = old.get(s["offered_rows_s"])
+        for metric, sign in COMPARE if b else []:
+            if b.get(metric) and sign * (s[metric] - b[metric]) / b[metric] < -tolerance:
+                out.append({"offered_rows_s": s["offered_rows_s"], "metric": metric, "baseline": b[metric], "now": s[metric]})
+    return out
+
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=5000)
+    ap.add_argument("--rates", type=float, nargs="+", default=[1000, 2500, 5000, 10000], help="offered rows/s per step")
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds per step")
+    ap.add_argument("--batch", type=int, default=1000)
+    ap.add_argument("--format", choices=["json", "arrow"], default="json")
+    ap.add_argument("--senders", type=int, default=4)
+    ap.add_argument("--query-workers", type=int, default=2)
+    ap.add_argument("--drain-s", type=float, default=60.0, help="max wait for the backlog to commit after a step")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--fault-rate", type=float, default=0.001)
+    ap.add_argument("--api", help="benchmark a running API instead of starting one")
+    ap.add_argument("--api-env", nargs="*", default=[], metavar="KEY=VALUE", help="extra env for the started API")
+    ap.add_argument("--port", type=int, default=8767)
+    ap.add_argument("--out", help="write results as JSON to this path")
+    ap.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory(prefix="eta-bench-")
+    proc = None
+    if args.api:
+        base = args.api.rstrip("/")
+    else:
+        proc = start_api(os.path.join(tmp.name, "bench.duckdb"), args.port, dict(kv.split("=", 1) for kv in args.api_env))
+        base = f"http://127.0.0.1:{args.port}"
+    fleet = Fleet(args.devices, seed=args.seed, fault_rate=args.fault_rate)
+    results = {"meta": {"git": git_rev(), "at": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+                        "cpus": os.cpu_count(), **{k: v for k, v in vars(args).items() if k not in ("out", "baseline")}},
+               "steps": []}
+    print(f"{'offered':>9}{'committed/s':>13}{'ingest p50':>12}{'p99 ms':>9}{'429s':>7}{'errors':>8}"
+          + "".join(f"{e + ' p99':>19}" for e in ENDPOINTS))
+    try:
+        for rate in args.rates:
+            s = run_step(base, fleet, rate, args)
+            results["steps"].append(s)
+            print(f"{rate:>9.0f}{s['committed_rows_s']:>13.0f}{s['ingest_ms_p50']:>12.1f}{s['ingest_ms_p99']:>9.1f}"
+                  f"{s['rejected']:>7}{s['errors']:>8}" + "".join(f"{s[e + '_ms_p99']:>19.1f}" for e in ENDPOINTS)
+                  + ("  saturated" if s["saturated"] else ""), flush=True)
+    finally:
+        if proc is not None:
+            proc.terminate(); proc.wait()
+        tmp.cleanup()
+    sat = [s["offered_rows_s"] for s in results["steps"] if s["saturated"]]
+    results["max_sustained_rows_s"] = max((s["committed_rows_s"] for s in results["steps"]), default=0.0)
+    results["first_saturated_rate"] = sat[0] if sat else None
+    code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = compare(results, json.load(f), args.tolerance)
+        for r in results["regressions"]:
+            print(f"REGRESSION at {r['offered_rows_s']:.0f} rows/s: {r['metric']} {r['baseline']:.1f} -> {r['now']:.1f}")
+        code = 1 if results["regressions"] else 0
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(code)
+
+if __name__ == "__main__":
+    main()
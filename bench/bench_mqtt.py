@@ -0,0 +1,116 @@
+# bench/bench_mqtt.py
+"""
+End-to-end ingest throughput: MQTT (through the API's bridge, via the in-process fake
+broker) against HTTP POST /ingest on one keep-alive session, at 1 and `--per` events per
+message / request. Each case gets a fresh uvicorn process on a throwaway database and is
+timed until /rowcount reports every row committed.
+
+    python bench/bench_mqtt.py --events 20000 --per 1 100 --out mqtt.json
+"""
+import argparse, json, os, subprocess, sys, tempfile, time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench.fake_broker import FakeBroker
+
+def events(n, devices=100):
+    base = np.datetime64("2024-01-01T00:00:00", "ms")
+    return [{"ts": str(base + np.timedelta64(i, "ms")) + "Z", "device_id": f"bench-{i % devices}",
+             "temp_c": 50.0 + (i % 17), "fan_rpm": 4000 + i % 300, "cpu_pct": 30.0} for i in range(n)]
+
+def start_api(db, port, broker_port):
+    env = dict(os.environ, RCA_DB=db, TIERING="0", ROLLUPS="0", MODEL_REGISTRY="0",
+               MQTT_HOST="127.0.0.1" if broker_port else "", MQTT_PORT=str(broker_port or 1883))
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+                             "--log-level", "warning"], cwd=os.path.join(ROOT, "api"), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import requests
+    for _ in range(600):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1).raise_for_status(); break
+        except requests.RequestException:
+            time.sleep(0.1)
+    if broker_port:
+        for _ in range(100):
+            if requests.get(f"http://127.0.0.1:{port}/ingest/mqtt").json().get("connected"):
+                break
+            time.sleep(0.1)
+    return proc
+
+def wait_rows(base, n, session, timeout=300):
+    end = time.time() + timeout
+    while time.time() < end:
+        if session.get(base + "/rowcount").json().get("rows", 0) >= n:
+            return True
+        time.sleep(0.02)
+    return False
+
+def chunked(evs, per):
+    """Messages of up to `per` events, each from a single device (one MQTT topic)."""
+    by_dev = {}
+    for e in evs:
+        by_dev.setdefault(e["device_id"], []).append(e)
+    return [g[i:i + per] for g in by_dev.values() for i in range(0, len(g), per)]
+
+def run_case(transport, chunks, port, broker):
+    import requests
+    with tempfile.TemporaryDirectory(prefix="eta-bench-") as tmp:
+        proc = start_api(os.path.join(tmp, "bench.duckdb"), port, broker.port if transport == "mqtt" else None)
+        base = f"http://127.0.0.1:{port}"
+        session = requests.Session()
+        per = max(len(c) for c in chunks)
+        expected = sum(len(c) for c in chunks)
+        try:
+            t0 = time.perf_counter()
+            if transport == "mqtt":
+                import paho.mqtt.client as paho
+                client = paho.Client(paho.CallbackAPIVersion.VERSION2)
+                client.max_inflight_messages_set(1000)
+                client.connect("127.0.0.1", broker.port); client.loop_start()
+                infos = [client.publish(f"telemetry/{c[0]['device_id']}", json.dumps(c if per > 1 else c[0]), qos=1)
+                         for c in chunks]
+                for info in infos:
+                    info.wait_for_publish()
+                sent = time.perf_counter()
+                client.loop_stop(); client.disconnect()
+            else:
+                for c in chunks:
+                    session.post(base + "/ingest", json=c if per > 1 else c[0]).raise_for_status()
+                sent = time.perf_counter()
+            ok = wait_rows(base, expected, session)
+            done = time.perf_counter()
+        finally:
+            proc.terminate(); proc.wait()
+    return {"transport": transport, "per_message": per, "events": expected, "complete": ok,
+            "send_s": sent - t0, "total_s": done - t0, "events_per_s": expected / (done - t0)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=20000)
+    ap.add_argument("--per", type=int, nargs="+", default=[1, 100])
+    ap.add_argument("--transports", nargs="+", default=["mqtt", "http"], choices=["mqtt", "http"])
+    ap.add_argument("--out", help="write results as JSON to this path")
+    ap.add_argument("--port", type=int, default=8766)
+    args = ap.parse_args()
+
+    broker = FakeBroker().start()
+    results = []
+    print(f"{'transport':<10}{'per msg':>8}{'events':>9}{'send s':>9}{'total s':>9}{'events/s':>11}")
+    try:
+        evs = events(args.events)
+        for per in args.per:
+            chunks = chunked(evs, per)
+            for transport in args.transports:
+                r = run_case(transport, chunks, args.port, broker)
+                results.append(r)
+                print(f"{transport:<10}{per:>8}{r['events']:>9}{r['send_s']:>9.2f}{r['total_s']:>9.2f}"
+                      f"{r['events_per_s']:>11.0f}{'' if r['complete'] else '  (incomplete)'}")
+    finally:
+        broker.stop()
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# bench/bench_replay.py
+"""
+Backtest benchmark: generates --hours of telemetry for --devices simulated devices with
+seeded faults (simulator/loadgen.py's Fleet, one row per device per --period s) into a
+DuckDB file (and, with --parquet, the same rows as Parquet), then replays it through
+api/replay.py once per detector config and prints recall / precision / detection delay /
+RCA top-1 next to the replay speed.
+
+    python bench/bench_replay.py --devices 200 --hours 6 --workers 4 --out replay.json
+    python bench/bench_replay.py ... --configs '{"z3": {"z_threshold": 3}}'
+"""
+import argparse, json, os, sys, tempfile, time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+sys.path.insert(0, os.path.join(ROOT, "simulator"))
+from loadgen import Fleet
+from replay import replay, score
+from schema import COLUMNS
+
+CONFIGS = {
+    "default": {},
+    "z3": {"z_threshold": 3.0},
+    "z3-no-iforest": {"z_threshold": 3.0, "iforest": "off"},
+    "z3-min3": {"z_threshold": 3.0, "min_anomalies": 3},
+}
+
+def generate(path, devices, hours, period, fault_rate, fault_s, seed, parquet=None):
+    """Write the fleet's rows to a DuckDB telemetry table; returns the fault windows."""
+    import duckdb
+    fleet = Fleet(devices, seed=seed, fault_rate=fault_rate, fault_s=fault_s)
+    con = duckdb.connect(path)
+    con.execute(f"CREATE TABLE telemetry ({', '.join(c + ' ' + t for c, t in zip(COLUMNS, ['TIMESTAMP', 'VARCHAR'] + ['DOUBLE'] * 9))})")
+    t0 = pd.Timestamp("2026-01-01")
+    ticks, per_batch = int(hours * 3600 / period), max(1, 200_000 // devices)
+    for lo in range(0, ticks, per_batch):
+        frames = []
+        for k in range(lo, min(ticks, lo + per_batch)):
+            ts = t0 + pd.Timedelta(seconds=k * period)
+            cols = fleet.tick(ts.isoformat() + "Z", period)
+            cols["ts"] = np.full(devices, ts.to_datetime64())
+            cols["vcore_v"] = np.full(devices, np.nan)
+            frames.append(pd.DataFrame(cols)[COLUMNS])
+        batch = pd.concat(frames, ignore_index=True)
+        con.execute("INSERT INTO telemetry SELECT * FROM batch")
+    if parquet:
+        con.execute(f"COPY telemetry TO '{parquet}' (FORMAT PARQUET)")
+    con.close()
+    return fleet.faults
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=100)
+    ap.add_argument("--hours", type=float, default=4.0)
+    ap.add_argument("--period", type=float, default=1.0, help="seconds between a device's rows")
+    ap.add_argument("--fault-rate", type=float, default=1 / 3600, help="faults per device-second")
+    ap.add_argument("--fault-s", type=float, default=300.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--parquet", action="store_true", help="replay from Parquet instead of DuckDB")
+    ap.add_argument("--configs", help="JSON object of name -> replay config (default: built-in set)")
+    ap.add_argument("--out", help="write results as JSON to this path")
+    args = ap.parse_args()
+    configs = json.loads(args.configs) if args.configs else CONFIGS
+
+    with tempfile.TemporaryDirectory(prefix="eta-replay-") as tmp:
+        db = os.path.join(tmp, "replay.duckdb")
+        pq = os.path.join(tmp, "replay.parquet") if args.parquet else None
+        t = time.perf_counter()
+        labels = generate(db, args.devices, args.hours, args.period, args.fault_rate, args.fault_s, args.seed, pq)
+        print(f"generated {args.devices} devices x {args.hours:g} h, {len(labels)} faults in {time.perf_counter() - t:.1f} s")
+        results = {"args": vars(args), "configs": {}}
+        print(f"{'config':<16}{'recall':>8}{'prec':>7}{'alerts':>8}{'delay p50':>11}{'p90':>6}{'rca@1':>7}{'x real':>8}")
+        for name, cfg in configs.items():
+            alerts, run = replay([pq or db], cfg, workers=args.workers)
+            s = score(alerts, labels)
+            results["configs"][name] = {"config": cfg, "run": run, "score": s}
+            d = s["delay_s"] or {}
+            print(f"{name:<16}{s['recall'] or 0:>8.3f}{s['precision'] or 0:>7.3f}{s['alerts']:>8}"
+                  f"{d.get('p50', float('nan')):>11.0f}{d.get('p90', float('nan')):>6.0f}{s['rca_top1'] or 0:>7.3f}"
+                  f"{run['speedup'] or 0:>8.0f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
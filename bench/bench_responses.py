@@ -0,0 +1,107 @@
+# bench/bench_responses.py
+"""
+/window response latency and server peak RSS: the old to_json -> json.loads -> JSONResponse
+path against the streamed encoder in each format. Every (rows, path) case gets a fresh
+uvicorn process on one throwaway database, so peak RSS (VmHWM) is not shared between cases.
+
+    python bench/bench_responses.py --rows 10000 100000 1000000 --repeat 5 --out responses.json
+"""
+import argparse, json, os, subprocess, sys, tempfile, time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ["legacy", "json", "columnar", "arrow", "csv"]
+
+def build_db(path, rows):
+    import duckdb
+    con = duckdb.connect(path)
+    con.execute("""
+    CREATE TABLE telemetry AS
+    SELECT TIMESTAMP '2024-01-01' + INTERVAL (i) SECOND AS ts, 'bench-0' AS device_id,
+           22 + random() AS inlet_temp_c, (4700 + i % 200)::INTEGER AS fan_rpm, 56 + random() AS temp_c,
+           1.0 + random() / 100 AS vcore_v, 30 + 5 * random() AS cpu_pct, 55 + random() AS mem_pct,
+           0::INTEGER AS disk_errors, 0::INTEGER AS nic_drops, 11 + random() AS latency_ms
+    FROM range(?) r(i)
+    """, [rows])
+    con.close()
+
+def serve(db, port):
+    """Child process: the API plus the old /window implementation, on uvicorn."""
+    os.environ.update(RCA_DB=db, TIERING="0", ROLLUPS="0", MODEL_REGISTRY="0")
+    sys.path.insert(0, os.path.join(ROOT, "api"))
+    import uvicorn
+    import app as api
+
+    @api.app.post("/bench/window_legacy")
+    def window_legacy(req: api.WindowReq):
+        df = api.con.execute(api.WINDOW_SQL, [req.device_id, req.start, req.end]).df()
+        return {"rows": json.loads(df.to_json(orient="records", date_format="iso"))}
+
+    uvicorn.run(api.app, host="127.0.0.1", port=port, log_level="warning")
+
+def rss_kb(pid, field):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+
+def run_case(db, rows, path, repeat, port):
+    """Fresh server per case; stream `repeat` responses and read the server's peak RSS."""
+    import requests
+    proc = subprocess.Popen([sys.executable, __file__, "--serve", db, str(port)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        for _ in range(600):
+            try:
+                requests.get(base + "/health", timeout=1); break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        end = (np.datetime64("2024-01-01T00:00:00") + np.timedelta64(rows - 1, "s")).astype(str)
+        body = {"device_id": "bench-0", "start": "2024-01-01T00:00:00", "end": end}
+        url = base + ("/bench/window_legacy" if path == "legacy" else f"/window?format={path}")
+        base_kb = rss_kb(proc.pid, "VmRSS")
+        lat, size = [], 0
+        for _ in range(repeat):
+            t = time.perf_counter(); size = 0
+            with requests.post(url, json=body, stream=True) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(1 << 20):
+                    size += len(chunk)
+            lat.append((time.perf_counter() - t) * 1000.0)
+        peak_kb = rss_kb(proc.pid, "VmHWM")
+    finally:
+        proc.terminate(); proc.wait()
+    return {"rows": rows, "path": path, "bytes": size,
+            "p50_ms": float(np.percentile(lat, 50)), "p99_ms": float(np.percentile(lat, 99)),
+            "peak_rss_mb": peak_kb / 1024.0, "rss_growth_mb": (peak_kb - base_kb) / 1024.0}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    ap.add_argument("--paths", nargs="+", default=PATHS, choices=PATHS)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", help="write results as JSON to this path")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--serve", nargs=2, help=argparse.SUPPRESS)    # db port (server child)
+    args = ap.parse_args()
+    if args.serve:
+        return serve(args.serve[0], int(args.serve[1]))
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="eta-bench-") as tmp:
+        db = os.path.join(tmp, "bench.duckdb")
+        build_db(db, max(args.rows))
+        print(f"{'rows':>9}  {'path':<9}{'MB out':>9}{'p50 ms':>10}{'p99 ms':>10}{'peak RSS MB':>13}{'RSS growth MB':>15}")
+        for n in args.rows:
+            for path in args.paths:
+                r = run_case(db, n, path, args.repeat, args.port)
+                results.append(r)
+                print(f"{n:>9}  {path:<9}{r['bytes'] / 1e6:>9.1f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+                      f"{r['peak_rss_mb']:>13.1f}{r['rss_growth_mb']:>15.1f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# bench/bench_snapshot.py
+"""
+Cost of the writer's read snapshots (ROLE=writer): seconds and bytes per full COPY FROM
+DATABASE of a hot table with --rows rows (laid out like bench_cluster), and what a copy
+running alongside does to the latency of ingest commits, which share the writer's CPU and IO.
+
+    python bench/bench_snapshot.py --rows 100000000 --devices 2000 --out snapshot.json
+"""
+import argparse, json, os, sys, tempfile, threading, time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+
+from bench_cluster import build
+from schema import COLUMNS
+
+def commit_latency(q, seconds, rows=100, stop=None):
+    """Commit `rows`-row batches back to back for `seconds` (or until stop is set); latencies in ms."""
+    batch = pd.DataFrame({"ts": pd.Timestamp("2030-01-01"), "device_id": "bench-ingest",
+                          "cpu_pct": np.arange(rows, dtype=float)}).reindex(columns=COLUMNS)
+    lat, end = [], time.perf_counter() + seconds
+    while time.perf_counter() < end and not (stop is not None and stop.is_set()):
+        t = time.perf_counter()
+        q.commit(batch)
+        lat.append((time.perf_counter() - t) * 1000.0)
+    return lat
+
+def pct(lat):
+    return {"commits": len(lat), "p50_ms": float(np.percentile(lat, 50)), "p99_ms": float(np.percentile(lat, 99))}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000_000)
+    ap.add_argument("--devices", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--idle-s", type=float, default=5.0, help="seconds of ingest commits measured without a copy")
+    ap.add_argument("--db", help="keep the database here instead of a temporary directory")
+    ap.add_argument("--out", help="write results as JSON to this path")
+    args = ap.parse_args()
+
+    import duckdb
+    from ingest_queue import IngestQueue
+    from snapshots import Snapshotter
+
+    tmp = tempfile.TemporaryDirectory(prefix="eta-bench-")
+    path = args.db or os.path.join(tmp.name, "bench.duckdb")
+    con = duckdb.connect(path)
+    t = time.perf_counter()
+    if not con.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = 'telemetry'").fetchall()[0][0]:
+        build(con, args.rows, args.devices)
+    build_s = time.perf_counter() - t
+    rows = con.execute("SELECT count(*) FROM telemetry").fetchall()[0][0]
+    snaps = Snapshotter(con, os.path.join(tmp.name, "snapshots"), keep=2)
+    q = IngestQueue(con)
+
+    copies = []
+    for _ in range(args.repeat):
+        snaps.take()
+        copies.append(snaps.last_copy_ms / 1000.0)
+    idle = commit_latency(q, args.idle_s)
+    stop = threading.Event()
+    during = []
+    worker = threading.Thread(target=lambda: during.extend(commit_latency(q, float("inf"), stop=stop)))
+    worker.start()
+    snaps.take()
+    stop.set(); worker.join()
+    copy_s = float(np.median(copies))
+
+    results = {"rows": rows, "devices": args.devices, "build_s": build_s, "db_bytes": os.path.getsize(path),
+               "snapshot_bytes": snaps.last_bytes, "copy_s": copies, "copy_s_p50": copy_s,
+               "copy_s_with_ingest": snaps.last_copy_ms / 1000.0,
+               "ingest_idle": pct(idle), "ingest_during_copy": pct(during) if during else None,
+               "effective_interval_s": snaps.next_interval(copy_s)}
+    print(f"{rows:,} rows: copy {copy_s:.1f} s p50 ({snaps.last_bytes / 1e9:.2f} GB); the default 5 s "
+          f"interval stretches to {results['effective_interval_s']:.0f} s")
+    print(f"ingest commit p50/p99 ms: idle {results['ingest_idle']['p50_ms']:.1f}/{results['ingest_idle']['p99_ms']:.1f}", end="")
+    if during:
+        print(f", during copy {results['ingest_during_copy']['p50_ms']:.1f}/{results['ingest_during_copy']['p99_ms']:.1f}")
+    else:
+        print(", no commit finished during the copy")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    con.close()
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
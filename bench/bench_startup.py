@@ -0,0 +1,185 @@
+# bench/bench_startup.py
+"""
+Cold-start benchmark: wall-clock seconds from spawning the API (uvicorn, throwaway copy of
+a database with --rows rows) until it answers /health (listening) and /health/ready
+(warmed up), the first /rca after that, and the graceful shutdown. Two scenarios:
+
+    clean   the previous process shut down gracefully
+    crash   the previous process was SIGKILLed after ingesting --crash-rows rows over HTTP,
+            so the start replays whatever WAL it left behind (wal_bytes)
+
+The API's own /startup/stats phases (imported, db_open, components, serving, warm) are
+recorded alongside. Results carry the git revision; --app-dir runs another checkout's api/
+(e.g. a git worktree of an older commit) for before/after numbers.
+
+    python bench/bench_startup.py --rows 10000000 --repeat 3 --out startup.json
+    python bench/bench_startup.py ... --baseline startup.json    # exit 1 on a regression past --tolerance
+"""
+import argparse, json, os, platform, shutil, signal, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# (metric, direction): higher is better (+1) or lower is better (-1)
+COMPARE = [("listen_s", -1), ("ready_s", -1), ("first_rca_ms", -1)]
+
+def build(path, rows, devices):
+    import duckdb
+    con = duckdb.connect(path)
+    con.execute(f"""
+    CREATE TABLE telemetry AS
+    SELECT now()::TIMESTAMP - to_seconds(({rows} - i) // {devices}) AS ts,
+           'dev-' || lpad((i % {devices})::VARCHAR, 5, '0') AS device_id,
+           22 + random() AS inlet_temp_c, (4700 + i % 200)::INTEGER AS fan_rpm, 56 + random() AS temp_c,
+           1.0 + random() / 100 AS vcore_v, 30 + 5 * random() AS cpu_pct, 55 + random() AS mem_pct,
+           0::INTEGER AS disk_errors, 0::INTEGER AS nic_drops, 11 + random() AS latency_ms
+    FROM range({rows}) r(i)
+    """)
+    con.close()
+
+def wait_for(base, path, proc, timeout_s):
+    """Seconds until GET path answers 200 (None if it never does; 404 = route missing)."""
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout_s:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API exited with {proc.returncode}")
+        try:
+            r = requests.get(base + path, timeout=1)
+            if r.status_code in (200, 404):
+                return r.status_code
+        except requests.RequestException:
+            pass
+        time.sleep(0.02)
+    return None
+
+def start(app_dir, db, port, env):
+    log = open(os.path.join(os.path.dirname(db), "api.log"), "a")
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+                             "--log-level", "warning"], cwd=app_dir, env=dict(os.environ, RCA_DB=db, **env),
+                            stdout=log, stderr=log)
+
+def measure(app_dir, db, port, env, timeout_s):
+    base = f"http://127.0.0.1:{port}"
+    wal = os.path.getsize(db + ".wal") if os.path.exists(db + ".wal") else 0
+    t0 = time.perf_counter()
+    proc = start(app_dir, db, port, env)
+    out = {"wal_bytes": wal}
+    if wait_for(base, "/health", proc, timeout_s) is None:
+        proc.kill()
+        raise RuntimeError("API did not start")
+    out["listen_s"] = time.perf_counter() - t0
+    ready = wait_for(base, "/health/ready", proc, timeout_s)
+    out["ready_s"] = time.perf_counter() - t0 if ready == 200 else out["listen_s"]
+    dev = requests.get(base + "/devices", timeout=60).json()["devices"][0]
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    t = time.perf_counter()
+    requests.post(base + "/rca", json={"device_id": dev, "start": (now - timedelta(minutes=10)).isoformat(),
+                                       "end": now.isoformat()}, timeout=120).raise_for_status()
+    out["first_rca_ms"] = (time.perf_counter() - t) * 1000.0
+    r = requests.get(base + "/startup/stats", timeout=10)
+    out["phases"] = r.json()["phases"] if r.ok else None
+    return proc, out
+
+def stop(proc, db):
+    t = time.perf_counter()
+    proc.send_signal(signal.SIGTERM)
+    proc.wait(120)
+    return {"shutdown_s": time.perf_counter() - t,
+            "wal_left_bytes": os.path.getsize(db + ".wal") if os.path.exists(db + ".wal") else 0}
+
+def crash(app_dir, db, port, env, rows, devices, timeout_s):
+    """Ingest `rows` rows over HTTP and SIGKILL the API: leaves the WAL a crash would."""
+    base = f"http://127.0.0.1:{port}"
+    proc = start(app_dir, db, port, env)
+    if wait_for(base, "/health", proc, timeout_s) is None:
+        proc.kill()
+        raise RuntimeError("API did not start")
+    batch, sent = 5000, 0
+    while sent < rows:
+        n = min(batch, rows - sent)
+        events = [{"device_id": f"dev-{(sent + i) % devices:05d}", "cpu_pct": 50.0, "temp_c": 60.0} for i in range(n)]
+        requests.post(base + "/ingest?wait=true", json=events, timeout=120).raise_for_status()
+        sent += n
+    proc.kill()
+    proc.wait()
+
+def summarize(runs):
+    keys = [k for k, v in runs[0].items() if isinstance(v, (int, float))]
+    out = {k: float(np.median([r[k] for r in runs])) for k in keys}
+    if runs[0].get("phases"):
+        out["phases"] = {p: float(np.median([r["phases"].get(p, np.nan) for r in runs])) for p in runs[0]["phases"]}
+    return out
+
+def compare(results, baseline, tolerance):
+    out = []
+    for scenario, s in results["scenarios"].items():
+        b = baseline["scenarios"].get(scenario, {})
+        for metric, sign in COMPARE:
+            if b.get(metric) and sign * (s[metric] - b[metric]) / b[metric] < -tolerance:
+                out.append({"scenario": scenario, "metric": metric, "baseline": b[metric], "now": s[metric]})
+    return out
+
+def git_rev(path):
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=path, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--devices", type=int, default=500)
+    ap.add_argument("--crash-rows", type=int, default=200_000, help="rows ingested before the SIGKILL")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--port", type=int, default=8197)
+    ap.add_argument("--timeout-s", type=float, default=300)
+    ap.add_argument("--app-dir", default=os.path.join(ROOT, "api"), help="api/ directory to start")
+    ap.add_argument("--env", nargs="*", default=[], help="extra KEY=VALUE settings for the API")
+    ap.add_argument("--out", help="write results as JSON to this path")
+    ap.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+    env = dict(kv.split("=", 1) for kv in args.env)
+
+    tmp = tempfile.TemporaryDirectory(prefix="eta-bench-")
+    seed = os.path.join(tmp.name, "seed.duckdb")
+    build(seed, args.rows, args.devices)
+    results = {"meta": {"git": git_rev(args.app_dir), "at": datetime.now(timezone.utc).isoformat(),
+                        "python": platform.python_version(), "cpus": os.cpu_count(),
+                        **{k: v for k, v in vars(args).items() if k not in ("out", "baseline")}},
+               "scenarios": {}}
+    print(f"{'scenario':<9}{'wal MB':>8}{'listen s':>10}{'ready s':>9}{'1st rca ms':>12}{'shutdown s':>12}{'WAL left MB':>13}")
+    for scenario in ("clean", "crash"):
+        runs = []
+        for i in range(args.repeat):
+            work = os.path.join(tmp.name, f"{scenario}-{i}")
+            os.makedirs(work)
+            db = os.path.join(work, "rca.duckdb")
+            shutil.copy(seed, db)
+            if scenario == "crash":
+                crash(args.app_dir, db, args.port, env, args.crash_rows, args.devices, args.timeout_s)
+            proc, run = measure(args.app_dir, db, args.port, env, args.timeout_s)
+            run.update(stop(proc, db))
+            runs.append(run)
+            shutil.rmtree(work)
+        s = results["scenarios"][scenario] = summarize(runs)
+        print(f"{scenario:<9}{s['wal_bytes'] / 1e6:>8.1f}{s['listen_s']:>10.2f}{s['ready_s']:>9.2f}"
+              f"{s['first_rca_ms']:>12.0f}{s['shutdown_s']:>12.2f}{s['wal_left_bytes'] / 1e6:>13.1f}")
+        if s.get("phases"):
+            print("         phases: " + "  ".join(f"{p} {v:.2f}s" for p, v in s["phases"].items()))
+    code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = compare(results, json.load(f), args.tolerance)
+        for r in results["regressions"]:
+            print(f"REGRESSION {r['scenario']}: {r['metric']} {r['baseline']:.2f} -> {r['now']:.2f}")
+        code = 1 if results["regressions"] else 0
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    tmp.cleanup()
+    sys.exit(code)
+
+if __name__ == "__main__":
+    main()
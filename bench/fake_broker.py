@@ -0,0 +1,151 @@
+# bench/fake_broker.py
+"""
+Minimal in-process MQTT 3.1.1 broker for tests and benchmarks: CONNECT, SUBSCRIBE /
+UNSUBSCRIBE with + and # wildcards, PUBLISH at QoS 0/1 (PUBACK to the publisher,
+fan-out at min(publish, subscription) QoS), PINGREQ, DISCONNECT. No retained messages,
+sessions or redelivery. Runs on its own event loop thread:
+
+    broker = FakeBroker().start()      # broker.port
+    ...
+    broker.stop()
+
+    python bench/fake_broker.py --port 1883     # standalone, as a local broker stand-in
+"""
+import argparse, asyncio, struct, threading
+
+def matches(filt, topic):
+    f, t = filt.split("/"), topic.split("/")
+    for i, part in enumerate(f):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(f) == len(t)
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        b = n % 128; n //= 128
+        out.append(b | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+def _str(s):
+    b = s.encode()
+    return struct.pack("!H", len(b)) + b
+
+class _Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.subs = {}             # topic filter -> granted qos
+        self.next_id = 0
+
+    def packet_id(self):
+        self.next_id = self.next_id % 65535 + 1
+        return self.next_id
+
+class FakeBroker:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.clients = set()
+        self.published = 0
+        self.delivered = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        ready = threading.Event()
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+        self._thread = threading.Thread(target=run, name="fake-mqtt-broker", daemon=True)
+        self._thread.start()
+        ready.wait(10)
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        async def shutdown():
+            self._server.close()
+            for c in list(self.clients):
+                c.writer.close()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop = None
+
+    # ---------- Protocol ----------
+    async def _serve(self, reader, writer):
+        client = _Client(writer)
+        self.clients.add(client)
+        try:
+            while True:
+                head = await reader.readexactly(1)
+                length, mult = 0, 1
+                while True:
+                    b = (await reader.readexactly(1))[0]
+                    length += (b & 0x7F) * mult; mult *= 128
+                    if not b & 0x80:
+                        break
+                body = await reader.readexactly(length) if length else b""
+                kind, flags = head[0] >> 4, head[0] & 0x0F
+                if kind == 1:                                     # CONNECT
+                    writer.write(b"\x20\x02\x00\x00")
+                elif kind == 3:                                   # PUBLISH
+                    qos = (flags >> 1) & 3
+                    n = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + n].decode(); pos = 2 + n
+                    if qos:
+                        writer.write(b"\x40\x02" + body[pos:pos + 2]); pos += 2
+                    self.published += 1
+                    self._fan_out(topic, body[pos:], qos)
+                elif kind == 8:                                   # SUBSCRIBE
+                    pid, pos, granted = body[:2], 2, bytearray()
+                    while pos < len(body):
+                        n = struct.unpack("!H", body[pos:pos + 2])[0]
+                        filt = body[pos + 2:pos + 2 + n].decode(); qos = min(body[pos + 2 + n], 1)
+                        client.subs[filt] = qos; granted.append(qos); pos += 3 + n
+                    writer.write(b"\x90" + _varint(2 + len(granted)) + pid + bytes(granted))
+                elif kind == 10:                                  # UNSUBSCRIBE
+                    pos = 2
+                    while pos < len(body):
+                        n = struct.unpack("!H", body[pos:pos + 2])[0]
+                        client.subs.pop(body[pos + 2:pos + 2 + n].decode(), None); pos += 2 + n
+                    writer.write(b"\xb0\x02" + body[:2])
+                elif kind == 12:                                  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif kind == 14:                                  # DISCONNECT
+                    break
+                # PUBACK (4) from subscribers needs no answer
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    def _fan_out(self, topic, payload, qos):
+        for c in list(self.clients):
+            granted = [q for f, q in c.subs.items() if matches(f, topic)]
+            if not granted:
+                continue
+            q = min(qos, max(granted))
+            var = _str(topic) + (struct.pack("!H", c.packet_id()) if q else b"")
+            c.writer.write(bytes([0x30 | (q << 1)]) + _varint(len(var) + len(payload)) + var + payload)
+            self.delivered += 1
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=1883)
+    args = ap.parse_args()
+    broker = FakeBroker(args.host, args.port).start()
+    print(f"fake MQTT broker on {broker.host}:{broker.port}", flush=True)
+    threading.Event().wait()
@@ -1,7 +1,47 @@
+import numpy as np
 class PID:
     def __init__(self,kp=0.6,ki=0.04,kd=0.1,setpoint=55.0,out_min=-300,out_max=300):
-        self.kp,self.ki,self.kd=kp,ki,kd; self.setpoint=setpoint; self.out_min,out_max=out_min,out_max; self.out_max=out_max; self.integral=0.0; self.prev_error=None
+        self.kp,self.ki,self.kd=kp,ki,kd; self.setpoint=setpoint; self.out_min,self.out_max=out_min,out_max; self.integral=0.0; self.prev_error=None
     def update(self,measurement,dt=1.0):
         error=self.setpoint-measurement; self.integral+=error*dt; deriv=0.0 if self.prev_error is None else (error-self.prev_error)/max(dt,1e-6); self.prev_error=error
         out=self.kp*error + self.ki*self.integral + self.kd*deriv
         return max(self.out_min, min(self.out_max, out))
+class PIDBank:
+    """
+    N PID loops held in NumPy arrays and updated together: one update() per tick for a whole fleet.
+    Every parameter is a scalar or a length-N array, and stays writable per loop (bank.kp[i]=...).
+    - reverse: output rises when the measurement rises above the setpoint (fans cooling a node).
+    - Output clamped to [out_min, out_max] per loop; the integral stops accumulating while the
+      output is saturated in the error's direction (anti-windup), so loops recover without overshoot.
+    - Derivative on the measurement, not the error: a setpoint change causes no derivative kick.
+      d_tau > 0 low-passes it (seconds), for noisy sensors.
+    - A NaN measurement (no reading this tick) holds that loop's output and state.
+    """
+    def __init__(self,n,kp=0.6,ki=0.04,kd=0.1,setpoint=55.0,out_min=-300.0,out_max=300.0,reverse=False,d_tau=0.0):
+        self.n=int(n)
+        self.kp,self.ki,self.kd=self._arr(kp),self._arr(ki),self._arr(kd)
+        self.setpoint=self._arr(setpoint); self.out_min,self.out_max=self._arr(out_min),self._arr(out_max)
+        self.sign=np.where(self._arr(reverse,bool),-1.0,1.0); self.d_tau=self._arr(d_tau)
+        self.integral=np.zeros(self.n); self.deriv=np.zeros(self.n); self.prev_meas=np.full(self.n,np.nan); self.out=np.zeros(self.n)
+    def _arr(self,v,dtype=float):
+        return np.array(np.broadcast_to(np.asarray(v,dtype=dtype),(self.n,)))
+    def __len__(self): return self.n
+    def reset(self,idx=None):
+        """Clear integral and derivative state (all loops, or the loops in idx)."""
+        idx=slice(None) if idx is None else idx
+        self.integral[idx]=0.0; self.deriv[idx]=0.0; self.prev_meas[idx]=np.nan; self.out[idx]=0.0
+    def update(self,measurement,dt=1.0):
+        """Advance every loop by dt (scalar or per loop) and return the N clamped outputs."""
+        m=np.asarray(measurement,dtype=float); dt=np.maximum(np.asarray(dt,dtype=float),1e-6); ok=np.isfinite(m)
+        error=self.sign*(self.setpoint-m)
+        with np.errstate(invalid="ignore"):
+            raw=np.where(np.isfinite(self.prev_meas),-self.sign*(m-self.prev_meas)/dt,0.0)
+        deriv=self.deriv+(dt/(self.d_tau+dt))*(raw-self.deriv)
+        p,d=self.kp*error,self.kd*deriv
+        integral=self.integral+error*dt
+        u=p+self.ki*integral+d
+        integral=np.where(((u>self.out_max)&(error>0))|((u<self.out_min)&(error<0)),self.integral,integral)
+        u=np.clip(p+self.ki*integral+d,self.out_min,self.out_max)
+        self.integral=np.where(ok,integral,self.integral); self.deriv=np.where(ok,deriv,self.deriv)
+        self.prev_meas=np.where(ok,m,self.prev_meas); self.out=np.where(ok,u,self.out)
+        return self.out.copy()
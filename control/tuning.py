@@ -0,0 +1,146 @@
+# control/tuning.py
+"""
+Offline PID tuning for fan control. A ThermalPlant of N nodes is driven by a PIDBank of N
+loops, each tick a handful of NumPy operations, so an hour of a few thousand loops simulates
+in seconds. sweep() runs every gain candidate of a grid side by side in one bank, each
+against the same disturbances and sensor noise, and ranks them.
+
+Plant: MockRedfishAdapter.steady_temp_c (die temperature vs fan rpm and inlet), reached with
+a first-order lag of tau_s; the fan follows its command with a lag of fan_tau_s within
+[fan_min, fan_max]; readings carry the adapter's inlet spread and +0..1 °C sensor noise.
+Disturbances follow simulator/loadgen.py's fault kinds: a fan_drop (100-300 rpm lost) or a
+workload_spike (extra heat), each for a while, once per loop.
+
+    python -m control.tuning --loops 200 --seconds 1800 --kp 50 100 200 400 --ki 2 5 10 20 --kd 0 100 300
+"""
+import argparse, itertools, json, time
+import numpy as np
+
+from control.pid import PIDBank
+from hardware.adapters import MockRedfishAdapter
+
+NOMINAL_FAN_RPM = MockRedfishAdapter.NOMINAL_FAN_RPM
+
+class ThermalPlant:
+    def __init__(self, n, tau_s=30.0, fan_tau_s=5.0, fan_min=2500.0, fan_max=8000.0, seed=0):
+        self.n = int(n)
+        self.tau_s = float(tau_s)
+        self.fan_tau_s = float(fan_tau_s)
+        self.fan_min, self.fan_max = float(fan_min), float(fan_max)
+        self.rng = np.random.default_rng(seed)
+        self.fan = np.full(self.n, float(NOMINAL_FAN_RPM))
+        self.fan_loss = np.zeros(self.n)           # rpm lost to a fan_drop fault
+        self.heat_c = np.zeros(self.n)             # extra °C from a workload_spike
+        self.temp = MockRedfishAdapter.steady_temp_c(self.fan, 22.15)
+
+    def step(self, fan_cmd, dt=1.0, noise=None):
+        """Advance dt seconds with the fans commanded to fan_cmd; returns the temp_c readings."""
+        self.fan += (np.clip(fan_cmd, self.fan_min, self.fan_max) - self.fan) * (1.0 - np.exp(-dt / self.fan_tau_s))
+        inlet, sensor = noise if noise is not None else (22.0 + self.rng.random(self.n) * 1.3 - 0.5,
+                                                         self.rng.random(self.n))
+        target = MockRedfishAdapter.steady_temp_c(self.fan - self.fan_loss, inlet) + self.heat_c
+        self.temp += (target - self.temp) * (1.0 - np.exp(-dt / self.tau_s))
+        return np.round(self.temp + sensor, 1)
+
+def disturbances(n, seconds, rng):
+    """One fault per loop: (kind 0 fan_drop / 1 workload_spike, magnitude, start s, end s)."""
+    kind = rng.integers(0, 2, n)
+    mag = np.where(kind == 0, rng.choice([100.0, 200.0, 300.0], n), rng.uniform(0.5, 2.5, n))
+    start = rng.uniform(0.2, 0.5, n) * seconds
+    return kind, mag, start, start + rng.uniform(0.2, 0.4, n) * seconds
+
+def simulate(bank, plant, seconds, dt=1.0, faults=None, noise=None, warmup_s=300.0):
+    """
+    Run bank against plant for `seconds`; per loop, over the ticks after warmup_s and on the
+    readings the controller sees: iae_c (mean |temp_c - setpoint|), peak_c (highest reading
+    above setpoint), over_s (seconds more than 1 °C above it), effort_rpm_s (mean |fan command
+    change| per second) and saturated (fraction of ticks clamped).
+    noise(tick) -> (inlet, sensor) arrays, to replay the same noise across candidates.
+    """
+    n, ticks = plant.n, int(round(seconds / dt))
+    first = min(ticks, int(round(warmup_s / dt))) + 1
+    scored = ticks - first + 1
+    kind, mag, start, end = faults if faults is not None else disturbances(n, seconds, plant.rng)
+    iae, peak, over = np.zeros(n), np.full(n, -np.inf), np.zeros(n)
+    effort, saturated = np.zeros(n), np.zeros(n)
+    cmd = np.full(n, float(NOMINAL_FAN_RPM))
+    reading = plant.step(cmd, dt, noise(0) if noise else None)
+    for k in range(1, ticks + 1):
+        t = k * dt
+        active = (start <= t) & (t < end)
+        plant.fan_loss = np.where(active & (kind == 0), mag, 0.0)
+        plant.heat_c = np.where(active & (kind == 1), mag, 0.0)
+        u = bank.update(reading, dt)
+        new = NOMINAL_FAN_RPM + u
+        if k >= first:
+            effort += np.abs(new - cmd)
+            saturated += (u <= bank.out_min) | (u >= bank.out_max)
+        cmd = new
+        reading = plant.step(cmd, dt, noise(k) if noise else None)
+        if k >= first:
+            err = reading - bank.setpoint
+            iae += np.abs(err); peak = np.maximum(peak, err); over += err > 1.0
+    return {"iae_c": iae / scored, "peak_c": peak, "over_s": over * dt,
+            "effort_rpm_s": effort / (scored * dt), "saturated": saturated / scored}
+
+def sweep(grid, loops=100, seconds=1800.0, dt=1.0, setpoint=57.0, d_tau=5.0, effort_weight=0.01, seed=0):
+    """
+    Simulate every (kp, ki, kd) in grid on `loops` nodes each, all in one bank; the nodes
+    of every candidate see the same faults and noise. Returns per-candidate means, best
+    (lowest cost = iae_c + effort_weight * effort_rpm_s) first, and the simulation rate.
+    """
+    grid = [tuple(map(float, g)) for g in grid]
+    c, n = len(grid), len(grid) * loops
+    gains = np.repeat(np.array(grid), loops, axis=0)
+    rng = np.random.default_rng(seed)
+    faults = tuple(np.tile(a, c) for a in disturbances(loops, seconds, rng))
+    ticks = int(round(seconds / dt))
+    inlet = 22.0 + rng.random((ticks + 1, loops)) * 1.3 - 0.5
+    sensor = rng.random((ticks + 1, loops))
+    bank = PIDBank(n, kp=gains[:, 0], ki=gains[:, 1], kd=gains[:, 2], setpoint=setpoint,
+                   out_min=2500.0 - NOMINAL_FAN_RPM, out_max=8000.0 - NOMINAL_FAN_RPM, reverse=True, d_tau=d_tau)
+    plant = ThermalPlant(n, seed=seed)
+    t0 = time.perf_counter()
+    res = simulate(bank, plant, seconds, dt, faults=faults, noise=lambda k: (np.tile(inlet[k], c), np.tile(sensor[k], c)))
+    wall_s = time.perf_counter() - t0
+    out = []
+    for i, (kp, ki, kd) in enumerate(grid):
+        row = {"kp": kp, "ki": ki, "kd": kd}
+        row.update({k: float(v[i * loops:(i + 1) * loops].mean()) for k, v in res.items()})
+        row["cost"] = row["iae_c"] + effort_weight * row["effort_rpm_s"]
+        out.append(row)
+    out.sort(key=lambda r: r["cost"])
+    return out, {"loops": n, "simulated_s": seconds, "wall_s": wall_s, "speedup": seconds / wall_s,
+                 "loop_seconds_per_s": n * seconds / wall_s}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--loops", type=int, default=200, help="nodes simulated per gain candidate")
+    ap.add_argument("--seconds", type=float, default=1800.0)
+    ap.add_argument("--dt", type=float, default=1.0)
+    ap.add_argument("--setpoint", type=float, default=57.0)
+    ap.add_argument("--kp", type=float, nargs="+", default=[50, 100, 200, 400])
+    ap.add_argument("--ki", type=float, nargs="+", default=[2, 5, 10, 20])
+    ap.add_argument("--kd", type=float, nargs="+", default=[0, 100, 300])
+    ap.add_argument("--d-tau", type=float, default=5.0)
+    ap.add_argument("--effort-weight", type=float, default=0.01)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--out", help="write every candidate's results as JSON to this path")
+    args = ap.parse_args()
+    ranked, run = sweep(itertools.product(args.kp, args.ki, args.kd), loops=args.loops, seconds=args.seconds,
+                        dt=args.dt, setpoint=args.setpoint, d_tau=args.d_tau, effort_weight=args.effort_weight,
+                        seed=args.seed)
+    print(f"{len(ranked)} candidates x {args.loops} loops x {args.seconds:.0f} s in {run['wall_s']:.1f} s: "
+          f"{run['speedup']:,.0f}x real time for {run['loops']} loops at once, "
+          f"{run['loop_seconds_per_s']:,.0f} loop-seconds/s")
+    print(f"{'kp':>7}{'ki':>7}{'kd':>7}{'iae °C':>9}{'peak °C':>9}{'over s':>8}{'rpm/s':>8}{'sat':>6}{'cost':>8}")
+    for r in ranked[:args.top]:
+        print(f"{r['kp']:>7g}{r['ki']:>7g}{r['kd']:>7g}{r['iae_c']:>9.2f}{r['peak_c']:>9.2f}{r['over_s']:>8.0f}"
+              f"{r['effort_rpm_s']:>8.1f}{r['saturated']:>6.2f}{r['cost']:>8.2f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "run": run, "candidates": ranked}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
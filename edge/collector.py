@@ -0,0 +1,196 @@
+# edge/collector.py
+"""
+Multi-device edge collector: one asyncio process polls every device of an inventory
+through the async adapter interface and feeds the samples into one store-and-forward
+spool (edge/spool.py), instead of one edge_agent process per device.
+
+Scheduling: each device samples on its own period grid, offset by a stable per-device
+phase (from a hash of its id) plus a small random jitter per tick, so a rack of devices
+with the same period does not read, and post, in lock-step. At most max_concurrency
+reads are in flight; a read that does not finish within read_timeout_s is abandoned.
+A tick that finishes after the next one was due is an overrun: the missed ticks are
+skipped instead of being read back-to-back.
+
+Inventory (YAML or JSON), a list or {"devices": [...]}:
+    - {device_id: rack-7-node-1, adapter: redfish, period_s: 1.0}
+    - {device_id: rack-7-node-2, adapter: ipmi, period_s: 5.0, options: {latency_s: 0.2, hang_p: 0.01}}
+options are passed to the adapter (the mocks take latency_s, latency_jitter_s, hang_p, hang_s).
+
+    INVENTORY=inventory.yaml python -m edge.collector
+    SIM_DEVICES=2000 python -m edge.collector          # synthetic inventory of mocks
+"""
+import asyncio, json, os, random, zlib
+from collections import deque
+import numpy as np
+
+from hardware.adapters import ADAPTERS
+
+def phase(device_id, period):
+    """Stable offset in [0, period) for a device, the same on every restart."""
+    return (zlib.crc32(str(device_id).encode()) / 2**32) * period
+
+def load_inventory(path):
+    with open(path) as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    return data["devices"] if isinstance(data, dict) else data
+
+def simulated_inventory(n, period_s=1.0, slow_frac=0.02, hung_frac=0.005, seed=0):
+    """n mock devices, mixed adapters; a few slow and a few hanging BMCs."""
+    rng = random.Random(seed)
+    kinds = sorted(ADAPTERS)
+    out = []
+    for i in range(n):
+        options = {}
+        r = rng.random()
+        if r < hung_frac:
+            options = {"hang_p": 0.2}
+        elif r < hung_frac + slow_frac:
+            options = {"latency_s": 0.3 * period_s, "latency_jitter_s": 0.9 * period_s}
+        out.append({"device_id": f"sim-{i:05d}", "adapter": kinds[i % len(kinds)], "period_s": period_s, "options": options})
+    return out
+
+class DeviceStats:
+    def __init__(self, window=256):
+        self.samples = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.latency_ms = deque(maxlen=window)     # adapter read time
+        self.wait_ms = deque(maxlen=window)        # time spent waiting for a concurrency slot
+        self.last_error = None
+
+    def summary(self):
+        lat = np.array(self.latency_ms) if self.latency_ms else np.zeros(1)
+        return {"samples": self.samples, "timeouts": self.timeouts, "errors": self.errors,
+                "overruns": self.overruns, "skipped": self.skipped,
+                "read_ms_p50": float(np.percentile(lat, 50)), "read_ms_p99": float(np.percentile(lat, 99)),
+                "last_error": self.last_error}
+
+class Collector:
+    def __init__(self, inventory, sink, max_concurrency=256, read_timeout_s=None, jitter=0.1):
+        self.sink = sink
+        self.max_concurrency = int(max_concurrency)
+        self.read_timeout_s = read_timeout_s
+        self.jitter = float(jitter)
+        self.devices = []
+        for d in inventory:
+            cls = ADAPTERS[d.get("adapter", "redfish")]
+            self.devices.append((cls(d["device_id"], **(d.get("options") or {})), float(d.get("period_s", 1.0))))
+        self.stats = {a.device_id: DeviceStats() for a, _ in self.devices}
+        self._sem = None
+        self._tasks = []
+        self._started = None
+        self._stopping = False
+        self.in_flight = 0
+
+    async def run(self, duration_s=None):
+        """Poll every device until cancelled (or for duration_s)."""
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self._stopping = False
+        loop = asyncio.get_running_loop()
+        self._started = t0 = loop.time()
+        self._tasks = [asyncio.create_task(self._poll(adapter, period, t0)) for adapter, period in self.devices]
+        try:
+            if duration_s is None:
+                await asyncio.gather(*self._tasks)
+            else:
+                await asyncio.sleep(duration_s)
+        finally:
+            # wait_for can swallow a cancel that races a finishing read, so pollers also check the flag
+            self._stopping = True
+            for t in self._tasks:
+                t.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _poll(self, adapter, period, t0):
+        loop = asyncio.get_running_loop()
+        st = self.stats[adapter.device_id]
+        timeout = self.read_timeout_s if self.read_timeout_s is not None else period
+        due = t0 + phase(adapter.device_id, period)
+        while not self._stopping:
+            delay = due + random.uniform(-self.jitter, self.jitter) * period - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            queued = loop.time()
+            async with self._sem:
+                started = loop.time()
+                self.in_flight += 1
+                try:
+                    reading = await asyncio.wait_for(adapter.aread(), timeout)
+                except asyncio.TimeoutError:
+                    reading = None; st.timeouts += 1
+                except Exception as e:
+                    reading = None; st.errors += 1; st.last_error = str(e)
+                finally:
+                    self.in_flight -= 1
+            done = loop.time()
+            st.wait_ms.append((started - queued) * 1000.0)
+            st.latency_ms.append((done - started) * 1000.0)
+            if reading is not None:
+                st.samples += 1
+                self.sink(reading.to_event())
+            due += period
+            if done > due:
+                # Overrun: skip the ticks that are already late rather than bursting to catch up
+                missed = int((done - due) // period) + 1
+                st.overruns += 1; st.skipped += missed
+                due += missed * period
+
+    def summary(self, top=10):
+        """Fleet totals plus the devices with the slowest reads."""
+        per = {d: s.summary() for d, s in self.stats.items()}
+        lat = np.concatenate([np.array(s.latency_ms) for s in self.stats.values() if s.latency_ms] or [np.zeros(1)])
+        wait = np.concatenate([np.array(s.wait_ms) for s in self.stats.values() if s.wait_ms] or [np.zeros(1)])
+        elapsed = (asyncio.get_running_loop().time() - self._started) if self._started is not None else 0.0
+        samples = sum(p["samples"] for p in per.values())
+        return {"devices": len(per), "in_flight": self.in_flight, "samples": samples,
+                "samples_per_s": samples / elapsed if elapsed else 0.0,
+                "timeouts": sum(p["timeouts"] for p in per.values()), "errors": sum(p["errors"] for p in per.values()),
+                "overruns": sum(p["overruns"] for p in per.values()), "skipped": sum(p["skipped"] for p in per.values()),
+                "read_ms_p50": float(np.percentile(lat, 50)), "read_ms_p99": float(np.percentile(lat, 99)),
+                "slot_wait_ms_p99": float(np.percentile(wait, 99)),
+                "slowest": dict(sorted(per.items(), key=lambda kv: -kv[1]["read_ms_p99"])[:top])}
+
+async def main():
+    from edge.spool import Spool, Uploader
+    api = os.getenv("RCA_API", "http://localhost:8000")
+    collector_id = os.getenv("COLLECTOR_ID", "collector-" + os.uname().nodename)
+    period = float(os.getenv("SAMPLE_PERIOD", "1.0"))
+    inventory = (load_inventory(os.environ["INVENTORY"]) if os.getenv("INVENTORY")
+                 else simulated_inventory(int(os.getenv("SIM_DEVICES", "100")), period_s=period))
+    spool = Spool(os.getenv("SPOOL_DIR", f".edge-spool-{collector_id}"),
+                  segment_bytes=int(os.getenv("SPOOL_SEGMENT_BYTES", str(4 << 20))),
+                  segment_age_s=float(os.getenv("SPOOL_SEGMENT_AGE_S", "300")),
+                  max_bytes=int(os.getenv("SPOOL_MAX_BYTES", str(1 << 30))))
+    uploader = Uploader(spool, api, source=collector_id, batch_rows=int(os.getenv("UPLOAD_BATCH_ROWS", "5000")),
+                        linger_s=float(os.getenv("UPLOAD_LINGER_S", "1.0")))
+    timeout = os.getenv("READ_TIMEOUT_S")
+    collector = Collector(inventory, spool.append, max_concurrency=int(os.getenv("MAX_CONCURRENCY", "256")),
+                          read_timeout_s=float(timeout) if timeout else None,
+                          jitter=float(os.getenv("SCHED_JITTER", "0.1")))
+    uploader.start()
+    stats_s = float(os.getenv("STATS_S", "30"))
+
+    async def report():
+        while True:
+            await asyncio.sleep(stats_s)
+            print("[collector]", json.dumps(collector.summary(top=5)), flush=True)
+            print("[spool]", json.dumps(uploader.stats()), flush=True)
+
+    reporter = asyncio.create_task(report()) if stats_s > 0 else None
+    print(f"[collector] {len(inventory)} devices -> {api} as {collector_id}", flush=True)
+    try:
+        await collector.run()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        uploader.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,36 +1,72 @@
-import os, time, requests, threading
+import os, time, json, requests, threading
 from hardware.adapters import MockRedfishAdapter  # or MockSNMPAdapter, MockIPMIAdapter, MockModbusAdapter
 from control.pid import PID
+from edge.spool import Spool, Uploader
 API=os.getenv("RCA_API","http://localhost:8000")
 DEVICE_ID=os.getenv("DEVICE_ID","rack-7-node-3")
 SAMPLE_PERIOD=float(os.getenv("SAMPLE_PERIOD","1.0"))
+ACTION_STATE=os.getenv("ACTION_STATE",f".edge-actions-{DEVICE_ID}.json")  # last applied action id + its effect
+ACTION_POLL_S=float(os.getenv("ACTION_POLL_S","25"))
+SPOOL_DIR=os.getenv("SPOOL_DIR",f".edge-spool-{DEVICE_ID}")
+SPOOL_SEGMENT_BYTES=int(os.getenv("SPOOL_SEGMENT_BYTES",str(1<<20)))
+SPOOL_SEGMENT_AGE_S=float(os.getenv("SPOOL_SEGMENT_AGE_S","300"))
+SPOOL_MAX_BYTES=int(os.getenv("SPOOL_MAX_BYTES",str(256<<20)))
+UPLOAD_BATCH_ROWS=int(os.getenv("UPLOAD_BATCH_ROWS","500"))
+UPLOAD_LINGER_S=float(os.getenv("UPLOAD_LINGER_S","2.0"))
+SPOOL_STATS_S=float(os.getenv("SPOOL_STATS_S","60"))  # how often spool depth/upload lag are logged (0 = never)
 adapter=MockRedfishAdapter(device_id=DEVICE_ID)
 pid=PID(setpoint=55.0)
 fan_target_delta=0.0
-def post_events(batch):
-    try: requests.post(f"{API}/ingest", json=batch, timeout=5)
-    except Exception: pass
+spool=Spool(SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES, segment_age_s=SPOOL_SEGMENT_AGE_S, max_bytes=SPOOL_MAX_BYTES)
+uploader=Uploader(spool, API, source=DEVICE_ID, batch_rows=UPLOAD_BATCH_ROWS, linger_s=UPLOAD_LINGER_S)
+def stats_logger():
+    while True:
+        time.sleep(SPOOL_STATS_S); print("[spool]", json.dumps(uploader.stats()), flush=True)
+def load_action_state():
+    try:
+        with open(ACTION_STATE) as f: st=json.load(f)
+        return int(st.get("last_action_id",0)), float(st.get("fan_target_delta",0.0))
+    except (OSError, ValueError): return 0, 0.0
+def save_action_state(last_id, delta):
+    # The effect and the id it includes are written together (atomic rename), so a crash
+    # between applying and acking can neither lose nor repeat an action
+    tmp=ACTION_STATE+".tmp"
+    with open(tmp,"w") as f: json.dump({"last_action_id":last_id,"fan_target_delta":delta}, f)
+    os.replace(tmp, ACTION_STATE)
+def apply_action(delta, act, params):
+    if act=="Increase fan target": return delta+int(params.get("fan_delta",100))
+    if act=="Reduce node workload": return delta-20
+    if act=="Migrate traffic": return delta-50
+    if act=="Restart service": return delta-30
+    return delta
 def actions_poller():
+    """Long-poll this device's action queue; apply each action id exactly once, then ack."""
     global fan_target_delta
+    last_id, fan_target_delta = load_action_state()
+    acked=0   # re-acked after a restart in case the last ack never reached the API
     while True:
         try:
-            r=requests.get(f"{API}/actions", timeout=5).json()
-            for a in r.get("actions", []):
-                if a.get("device_id")!=DEVICE_ID: continue
-                act=a.get("action"); params=a.get("params",{})
-                if act=="Increase fan target": fan_target_delta+=int(params.get("fan_delta",100))
-                elif act=="Reduce node workload": fan_target_delta-=20
-                elif act=="Migrate traffic": fan_target_delta-=50
-                elif act=="Restart service": fan_target_delta-=30
-        except Exception: pass
-        time.sleep(5)
+            r=requests.get(f"{API}/actions/poll", params={"device_id":DEVICE_ID,"after":last_id,"timeout":ACTION_POLL_S},
+                           timeout=ACTION_POLL_S+10).json()
+            actions=[a for a in r.get("actions", []) if a["id"]>last_id]
+            if actions:
+                delta=fan_target_delta
+                for a in actions: delta=apply_action(delta, a.get("action"), a.get("params",{}))
+                save_action_state(actions[-1]["id"], delta)
+                last_id, fan_target_delta = actions[-1]["id"], delta
+            if last_id>acked:
+                requests.post(f"{API}/actions/ack", json={"device_id":DEVICE_ID,"upto":last_id}, timeout=5).raise_for_status()
+                acked=last_id
+        except Exception: time.sleep(1)
 def main():
     threading.Thread(target=actions_poller, daemon=True).start()
+    uploader.start()
+    if SPOOL_STATS_S>0: threading.Thread(target=stats_logger, daemon=True).start()
     while True:
         reading=adapter.read()
         temp=reading.metrics.get("temp_c",55.0)
         correction=pid.update(temp, dt=SAMPLE_PERIOD)
         reading.metrics["fan_rpm"]=max(2500, int(reading.metrics["fan_rpm"] + fan_target_delta + correction))
-        post_events([reading.to_event()])
+        spool.append(reading.to_event())
         time.sleep(SAMPLE_PERIOD)
 if __name__=="__main__": main()
@@ -0,0 +1,262 @@
+# edge/spool.py
+"""
+Store-and-forward spool for the edge agent. Samples are appended as JSON lines to
+append-only segment files (a new segment after segment_bytes or segment_age_s); an
+uploader thread ships them in gzip batches over one keep-alive session and only then
+advances its persisted read position.
+
+Every batch is numbered and its exact byte range is written to the state file before the
+first send, so after a crash or an outage the same rows are resent under the same number;
+the API acknowledges a number it has already committed without inserting it again, so
+replay neither loses nor duplicates rows. When the spool grows past max_bytes the oldest
+segments are dropped (counted in dropped_rows).
+"""
+import calendar, gzip, json, os, random, threading, time
+import requests
+from requests.adapters import HTTPAdapter
+
+def _ts_age(ts):
+    """Seconds since an ISO-8601 UTC timestamp (0 when unparseable)."""
+    try:
+        return max(0.0, time.time() - calendar.timegm(time.strptime(ts[:19], "%Y-%m-%dT%H:%M:%S")))
+    except (TypeError, ValueError):
+        return 0.0
+
+class Spool:
+    def __init__(self, path, segment_bytes=1 << 20, segment_age_s=60.0, max_bytes=256 << 20):
+        self.path = path
+        self.segment_bytes = int(segment_bytes)
+        self.segment_age_s = float(segment_age_s)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        os.makedirs(path, exist_ok=True)
+        self.state = {"segment": None, "offset": 0, "next_batch": 1, "pending": None}
+        try:
+            with open(self._state_path()) as f:
+                self.state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        self.segments = sorted(int(n[4:-6]) for n in os.listdir(path) if n.startswith("seg-") and n.endswith(".jsonl"))
+        self.bytes = sum(os.path.getsize(self._seg_path(s)) for s in self.segments)
+        # Rows not uploaded yet, counted once at startup and then tracked incrementally
+        self.depth_rows = sum(self._count_lines(s, self.state["offset"] if s == self.state["segment"] else 0)
+                              for s in self.segments if self.state["segment"] is None or s >= self.state["segment"])
+        self.appended_rows = 0
+        self.dropped_rows = 0
+        self._active = None; self._active_id = None; self._active_opened = 0.0
+        if self.state["segment"] is None and self.segments:
+            self.state["segment"] = self.segments[0]
+
+    def _seg_path(self, seg):
+        return os.path.join(self.path, f"seg-{seg:09d}.jsonl")
+
+    def _state_path(self):
+        return os.path.join(self.path, "state.json")
+
+    def _count_lines(self, seg, offset):
+        try:
+            with open(self._seg_path(seg), "rb") as f:
+                f.seek(offset)
+                return sum(1 for line in f if line.endswith(b"\n"))
+        except OSError:
+            return 0
+
+    def save_state(self):
+        tmp = self._state_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, self._state_path())
+
+    # ---------- Write side ----------
+    def append(self, event):
+        line = (json.dumps(event, separators=(",", ":")) + "\n").encode()
+        with self._lock:
+            now = time.monotonic()
+            if (self._active is None or self._active.tell() >= self.segment_bytes
+                    or now - self._active_opened >= self.segment_age_s):
+                self._roll(now)
+            self._active.write(line); self._active.flush()
+            self.bytes += len(line); self.appended_rows += 1; self.depth_rows += 1
+            self._enforce_cap()
+            self._wake.notify_all()
+
+    def _roll(self, now):
+        if self._active is not None:
+            self._active.close()
+        seg = (self.segments[-1] + 1) if self.segments else 1
+        self.segments.append(seg)
+        if self.state["segment"] is None:
+            self.state["segment"] = seg; self.state["offset"] = 0
+        self._active = open(self._seg_path(seg), "ab"); self._active_id = seg; self._active_opened = now
+
+    def _enforce_cap(self):
+        while self.bytes > self.max_bytes and len(self.segments) > 1:
+            seg = self.segments.pop(0)
+            size = os.path.getsize(self._seg_path(seg))
+            lost = self._count_lines(seg, self.state["offset"] if seg == self.state["segment"] else 0)
+            os.remove(self._seg_path(seg))
+            self.bytes -= size; self.dropped_rows += lost; self.depth_rows -= lost
+            if self.state["segment"] == seg:
+                # The reader was inside the dropped segment; its unsent batch went with it.
+                # Its number may already be committed by an in-flight send, so never reuse it.
+                pending = self.state["pending"]
+                if pending is not None:
+                    self.state["next_batch"] = max(self.state["next_batch"], pending["batch"] + 1)
+                self.state.update(segment=self.segments[0], offset=0, pending=None)
+                self.save_state()
+
+    # ---------- Read side (uploader thread) ----------
+    def next_batch(self, max_rows, linger_s, timeout):
+        """
+        The batch to send next: the pending one if a send is outstanding, otherwise up to
+        max_rows complete lines from the read position once max_rows are there or the
+        oldest waited linger_s. None when nothing is ready within `timeout`.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                if self.state["pending"] is not None:
+                    return self.state["pending"]
+                batch = self._cut(max_rows, linger_s)
+                if batch is not None:
+                    self.state["pending"] = batch
+                    self.save_state()
+                    return batch
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return None
+                self._wake.wait(min(left, max(0.05, linger_s / 4)))
+
+    def _cut(self, max_rows, linger_s):
+        seg = self.state["segment"]
+        while seg is not None:
+            start = self.state["offset"]
+            lines, end = [], start
+            with open(self._seg_path(seg), "rb") as f:
+                f.seek(start)
+                for line in f:
+                    if not line.endswith(b"\n") or len(lines) >= max_rows:
+                        break
+                    lines.append(line); end += len(line)
+            if lines:
+                ready = len(lines) >= max_rows or seg != self._active_id or _ts_age(json.loads(lines[0]).get("ts")) >= linger_s
+                if not ready:
+                    return None
+                return {"batch": self.state["next_batch"], "segment": seg, "start": start, "end": end, "rows": len(lines)}
+            if seg == self._active_id or seg == self.segments[-1]:
+                return None
+            # A sealed segment fully sent: delete it and move on
+            self.bytes -= os.path.getsize(self._seg_path(seg))
+            os.remove(self._seg_path(seg))
+            self.segments.remove(seg)
+            seg = self.segments[0] if self.segments else None
+            self.state.update(segment=seg, offset=0)
+            self.save_state()
+        return None
+
+    def read(self, batch):
+        with open(self._seg_path(batch["segment"]), "rb") as f:
+            f.seek(batch["start"])
+            return f.read(batch["end"] - batch["start"])
+
+    def done(self, batch):
+        """The API has the batch: advance past it for good."""
+        with self._lock:
+            if self.state["pending"] != batch:
+                return      # dropped by the size cap meanwhile
+            self.state.update(segment=batch["segment"], offset=batch["end"],
+                              next_batch=batch["batch"] + 1, pending=None)
+            self.save_state()
+            self.depth_rows -= batch["rows"]
+
+    def oldest_age(self):
+        """Seconds the oldest unsent sample has been waiting (by its ts)."""
+        with self._lock:
+            seg = self.state["segment"]
+            if seg is None or not self.depth_rows:
+                return 0.0
+            try:
+                with open(self._seg_path(seg), "rb") as f:
+                    f.seek(self.state["offset"])
+                    line = f.readline()
+            except OSError:
+                return 0.0
+        return _ts_age(json.loads(line).get("ts")) if line.endswith(b"\n") else 0.0
+
+class Uploader:
+    def __init__(self, spool, api, source, batch_rows=500, linger_s=2.0,
+                 backoff_s=0.5, backoff_max_s=60.0, timeout_s=15.0):
+        self.spool = spool
+        self.url = f"{api}/ingest"
+        self.source = source
+        self.batch_rows = int(batch_rows)
+        self.linger_s = float(linger_s)
+        self.backoff_s = float(backoff_s)
+        self.backoff_max_s = float(backoff_max_s)
+        self.timeout_s = float(timeout_s)
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.uploaded_rows = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_lag_s = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="spool-uploader", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def send(self, batch):
+        """POST one batch (gzip JSON array); True once the API has accepted or already had it."""
+        body = b"[" + self.spool.read(batch).rstrip(b"\n").replace(b"\n", b",") + b"]"
+        lag = self.spool.oldest_age()
+        r = self.session.post(self.url, params={"source": self.source, "batch": batch["batch"], "wait": "true"},
+                              data=gzip.compress(body, 5), timeout=self.timeout_s,
+                              headers={"Content-Type": "application/json", "Content-Encoding": "gzip",
+                                       "X-Spool-Depth": str(self.spool.depth_rows), "X-Upload-Lag": f"{lag:.3f}"})
+        if r.status_code == 400:
+            # Rejected as malformed: resending cannot help, so skip it rather than block the spool
+            self.last_error = f"batch {batch['batch']} rejected: {r.text[:200]}"
+            return True
+        # 409 (still queued from an earlier attempt), 429, 5xx (a failed commit) and timeouts
+        # raise: run() backs off and resends the batch until it is committed or a duplicate
+        r.raise_for_status()
+        self.last_lag_s = lag
+        return True
+
+    def run(self):
+        attempt = 0
+        while not self._stop.is_set():
+            batch = self.spool.next_batch(self.batch_rows, self.linger_s, timeout=1.0)
+            if batch is None:
+                continue
+            try:
+                self.send(batch)
+            except requests.RequestException as e:
+                # Exponential backoff with full jitter; the same batch is retried as-is
+                self.failures += 1; self.last_error = str(e); attempt += 1
+                self._stop.wait(random.uniform(0, min(self.backoff_max_s, self.backoff_s * 2 ** attempt)))
+                continue
+            attempt = 0
+            self.spool.done(batch)
+            self.uploaded_rows += batch["rows"]; self.batches += 1
+
+    def stats(self):
+        return {"spool_rows": self.spool.depth_rows, "spool_bytes": self.spool.bytes,
+                "spool_segments": len(self.spool.segments),
+                "upload_lag_s": self.spool.oldest_age(), "last_upload_lag_s": self.last_lag_s,
+                "appended_rows": self.spool.appended_rows, "uploaded_rows": self.uploaded_rows,
+                "batches": self.batches, "failures": self.failures, "dropped_rows": self.spool.dropped_rows,
+                "last_error": self.last_error}
@@ -1,4 +1,5 @@
-import random, datetime
+import random, datetime, asyncio
+import numpy as np
 class CanonicalReading:
     def __init__(self, device_id, metrics, provenance):
         self.ts = datetime.datetime.utcnow().isoformat()+"Z"
@@ -11,11 +12,27 @@ class CanonicalReading:
 class BaseAdapter:
     def __init__(self, device_id:str): self.device_id=device_id
     def read(self): raise NotImplementedError
-class MockRedfishAdapter(BaseAdapter):
+    async def aread(self):
+        """Async read for the collector; blocking drivers run in a worker thread unless they override this."""
+        return await asyncio.to_thread(self.read)
+class MockBMC(BaseAdapter):
+    """Mock base: aread() can simulate a slow BMC (latency_s + up to latency_jitter_s) or a hung one (hang_p per read)."""
+    def __init__(self, device_id:str, latency_s=0.0, latency_jitter_s=0.0, hang_p=0.0, hang_s=3600.0):
+        super().__init__(device_id); self.latency_s=latency_s; self.latency_jitter_s=latency_jitter_s; self.hang_p=hang_p; self.hang_s=hang_s
+    async def aread(self):
+        if self.hang_p and random.random()<self.hang_p: await asyncio.sleep(self.hang_s)
+        elif self.latency_s or self.latency_jitter_s: await asyncio.sleep(self.latency_s+random.uniform(0,self.latency_jitter_s))
+        return self.read()
+class MockRedfishAdapter(MockBMC):
+    NOMINAL_FAN_RPM=4800
+    @staticmethod
+    def steady_temp_c(fan_rpm, inlet_c):
+        """Die temperature the node settles at for a fan speed and inlet temperature, before sensor noise (scalars or arrays)."""
+        return 55+np.maximum(0,(5000-np.asarray(fan_rpm,dtype=float))/50)+(np.asarray(inlet_c,dtype=float)-22)*0.6
     def read(self):
         import random
-        inlet=22.0+random.uniform(-0.5,0.8); fan=4800+random.uniform(-80,80)
-        temp=55+max(0,(5000-fan)/50)+(inlet-22)*0.6+random.uniform(0,1.0)
+        inlet=22.0+random.uniform(-0.5,0.8); fan=self.NOMINAL_FAN_RPM+random.uniform(-80,80)
+        temp=float(self.steady_temp_c(fan,inlet))+random.uniform(0,1.0)
         vcore=1.0+random.uniform(-0.02,0.02); cpu=min(100,30+(temp-55)*0.9+random.uniform(0,3))
         mem=45+random.uniform(0,20); latency=8+(cpu/12)+random.uniform(0,2)
         disk_err=1 if random.random()<0.001 else 0; nic_drop=1 if random.random()<0.0015 else 0
@@ -23,7 +40,7 @@ class MockRedfishAdapter(BaseAdapter):
                  "cpu_pct":round(cpu,1),"mem_pct":round(mem,1),"disk_errors":disk_err,"nic_drops":nic_drop,"latency_ms":round(latency,1)}
         provenance={"adapter":"redfish","fw_version":"1.2.3","sampling_ms":1000,"notes":"mock"}
         return CanonicalReading(self.device_id, metrics, provenance)
-class MockSNMPAdapter(BaseAdapter):
+class MockSNMPAdapter(MockBMC):
     def read(self):
         import random
         temp=56+random.uniform(-1.0,1.0); fan=5000+random.uniform(-120,120); cpu=35+(temp-55)*0.8+random.uniform(0,2)
@@ -31,7 +48,7 @@ class MockSNMPAdapter(BaseAdapter):
                  "cpu_pct":round(cpu,1),"mem_pct":50+random.uniform(-5,5),"disk_errors":0,"nic_drops":0,"latency_ms":8+(cpu/12)+random.uniform(0,2)}
         provenance={"adapter":"snmp","fw_version":"n/a","sampling_ms":1000,"notes":"mock"}
         return CanonicalReading(self.device_id, metrics, provenance)
-class MockIPMIAdapter(BaseAdapter):
+class MockIPMIAdapter(MockBMC):
     def read(self):
         import random
         inlet=23.0+random.uniform(-0.5,0.5); fan=5200+random.uniform(-100,100)
@@ -40,7 +57,7 @@ class MockIPMIAdapter(BaseAdapter):
                  "cpu_pct":round(cpu,1),"mem_pct":48+random.uniform(-6,6),"disk_errors":0,"nic_drops":0,"latency_ms":8+(cpu/12)+random.uniform(0,2)}
         provenance={"adapter":"ipmi","fw_version":"BMC-4.9.0","sampling_ms":1000,"notes":"mock"}
         return CanonicalReading(self.device_id, metrics, provenance)
-class MockModbusAdapter(BaseAdapter):
+class MockModbusAdapter(MockBMC):
     def read(self):
         import random
         inlet=21.5+random.uniform(-0.7,0.7); fan=4900+random.uniform(-150,150)
@@ -49,3 +66,4 @@ class MockModbusAdapter(BaseAdapter):
                  "cpu_pct":round(cpu,1),"mem_pct":47+random.uniform(-4,8),"disk_errors":0,"nic_drops":0,"latency_ms":8+(cpu/12)+random.uniform(0,2)}
         provenance={"adapter":"modbus","fw_version":"mb-0.9","sampling_ms":1000,"notes":"mock"}
         return CanonicalReading(self.device_id, metrics, provenance)
+ADAPTERS={"redfish":MockRedfishAdapter,"snmp":MockSNMPAdapter,"ipmi":MockIPMIAdapter,"modbus":MockModbusAdapter}
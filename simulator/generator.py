@@ -3,7 +3,13 @@ import os, time, json, random, datetime, threading
 import requests
 API=os.getenv("RCA_API","http://localhost:8000")
 DEVICE_IDS=["rack-7-node-1","rack-7-node-2"]
-STATE={d:{"fan_delta":0,"workload":1.0} for d in DEVICE_IDS}
+STATE={d:{"fan_delta":0,"workload":1.0,"last_action_id":0} for d in DEVICE_IDS}
+FAULT_LOG=os.getenv("FAULT_LOG")   # append injected faults as JSON lines (labels for api/replay.py; end=null: never reverted)
+def log_fault(device_id, fault, magnitude):
+    if not FAULT_LOG: return
+    with open(FAULT_LOG,"a") as f:
+        f.write(json.dumps({"device_id":device_id,"fault":fault,"magnitude":magnitude,
+                            "start":datetime.datetime.utcnow().isoformat()+"Z","end":None})+"\n")
 def tick(device_id, drift):
     inlet=22.0+random.uniform(-0.5,0.8); base_fan=5000+drift["fan_delta"]
     fan=max(2500, base_fan+random.uniform(-50,50))
@@ -25,25 +31,35 @@ def inject_faults_loop():
         # Simulate a cooling or workload fault
         fault_type = random.choice(["fan_drop", "workload_spike"])
         if fault_type == "fan_drop":
-            STATE[target]["fan_delta"] -= random.choice([100, 200, 300])
+            drop = random.choice([100, 200, 300])
+            STATE[target]["fan_delta"] -= drop
+            log_fault(target, fault_type, -drop)
             print(f"[FAULT] {target}: fan drop injected")
         else:
-            STATE[target]["workload"] = min(2.0, STATE[target]["workload"] + 0.2)
+            before = STATE[target]["workload"]
+            STATE[target]["workload"] = min(2.0, before + 0.2)
+            log_fault(target, fault_type, round(STATE[target]["workload"] - before, 3))
             print(f"[FAULT] {target}: workload spike injected")
 
-def poll_actions_loop():
+def apply_action(dev, action, params):
+    if action=="Increase fan target": STATE[dev]["fan_delta"]+=int(params.get("fan_delta",100))
+    elif action=="Reduce node workload": STATE[dev]["workload"]=max(0.7, STATE[dev]["workload"]*float(params.get("workload_factor",0.9)))
+    elif action=="Migrate traffic": STATE[dev]["workload"]=max(0.8, STATE[dev]["workload"]-0.1)
+    elif action=="Restart service": STATE[dev]["workload"]=max(0.85, STATE[dev]["workload"]-0.05)
+def poll_actions_loop(dev):
+    """Long-poll one device's action queue; each action id is applied once, then acked."""
+    acked=0
     while True:
         try:
-            res=requests.get(f"{API}/actions", timeout=3).json()
+            res=requests.get(f"{API}/actions/poll", params={"device_id":dev,"after":STATE[dev]["last_action_id"],"timeout":25}, timeout=35).json()
             for a in res.get("actions", []):
-                dev=a["device_id"]
-                if dev in STATE:
-                    if a["action"]=="Increase fan target": STATE[dev]["fan_delta"]+=int(a.get("params",{}).get("fan_delta",100))
-                    elif a["action"]=="Reduce node workload": STATE[dev]["workload"]=max(0.7, STATE[dev]["workload"]*float(a.get("params",{}).get("workload_factor",0.9)))
-                    elif a["action"]=="Migrate traffic": STATE[dev]["workload"]=max(0.8, STATE[dev]["workload"]-0.1)
-                    elif a["action"]=="Restart service": STATE[dev]["workload"]=max(0.85, STATE[dev]["workload"]-0.05)
-        except Exception: pass
-        time.sleep(5)
+                if a["id"]<=STATE[dev]["last_action_id"]: continue
+                apply_action(dev, a["action"], a.get("params",{}))
+                STATE[dev]["last_action_id"]=a["id"]
+            if STATE[dev]["last_action_id"]>acked:
+                requests.post(f"{API}/actions/ack", json={"device_id":dev,"upto":STATE[dev]["last_action_id"]}, timeout=3).raise_for_status()
+                acked=STATE[dev]["last_action_id"]
+        except Exception: time.sleep(1)
 def emit_loop():
     while True:
         batch=[tick(d, STATE[d]) for d in DEVICE_IDS]
@@ -52,6 +68,7 @@ def emit_loop():
         time.sleep(1)
 def main():
     threading.Thread(target=inject_faults_loop, daemon=True).start()
-    threading.Thread(target=poll_actions_loop, daemon=True).start()
+    for d in DEVICE_IDS:
+        threading.Thread(target=poll_actions_loop, args=(d,), daemon=True).start()
     emit_loop()
 if __name__=="__main__": main()
@@ -0,0 +1,220 @@
+# simulator/loadgen.py
+"""
+Fleet-scale load generator: N simulated devices (tens of thousands) ticked with NumPy,
+using the same physical model as generator.tick(), with seeded fault injection and an
+open-loop sender at a fixed ingest rate.
+
+A tick produces one row per device, all stamped with the tick's wall-clock time; the
+tick period is devices / rate, so `rate` is the offered rows/s. Rows are posted in
+batches of batch_rows (JSON to /ingest, or Arrow IPC to /ingest/bulk) by a pool of
+sender threads on keep-alive sessions. Batches are scheduled, not chained: when the API
+is slower than the offered rate, the backlog shows up as latency and 429s instead of
+silently lowering the rate.
+
+Faults start on a device with probability fault_rate per device-second and last an
+exponential fault_s: a fan drop (fan_delta -100/-200/-300) or a workload spike (+0.2,
+capped at 2.0), reverted when the fault ends. The same seed gives the same rows and the
+same faults; every fault is recorded in `faults` (device, kind, start/end tick and ts).
+
+    python simulator/loadgen.py --devices 50000 --rate 20000 --batch 2000 --duration 60 --seed 1
+"""
+import argparse, io, json, os, queue, threading, time
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+API = os.getenv("RCA_API", "http://localhost:8000")
+FAULT_KINDS = ("fan_drop", "workload_spike")
+
+class Fleet:
+    def __init__(self, n, seed=0, fault_rate=0.0, fault_s=60.0, prefix="load"):
+        self.n = int(n)
+        self.device_ids = np.array([f"{prefix}-{i:05d}" for i in range(self.n)], dtype=object)
+        self.rng = np.random.default_rng(seed)
+        self.fan_delta = np.zeros(self.n)
+        self.workload = np.ones(self.n)
+        self.fault_rate = float(fault_rate)
+        self.fault_s = float(fault_s)
+        self.ticks = 0
+        self._until = np.full(self.n, -1)         # tick a device's active fault ends at, -1 when none
+        self._undo = np.zeros(self.n)             # fan_delta / workload change to revert
+        self._kind = np.zeros(self.n, dtype=np.int8)
+        self._open = {}                           # device index -> its open entry in faults
+        self.faults = []
+
+    def _inject(self, ts, period):
+        k = self.ticks
+        ending = np.flatnonzero(self._until == k)
+        fan = ending[self._kind[ending] == 0]
+        self.fan_delta[fan] -= self._undo[fan]
+        spike = ending[self._kind[ending] == 1]
+        self.workload[spike] -= self._undo[spike]
+        for i in ending:
+            f = self._open.pop(int(i)); f["end_tick"] = k; f["end"] = ts
+        self._until[ending] = -1
+        if not self.fault_rate:
+            return
+        start = np.flatnonzero((self.rng.random(self.n) < self.fault_rate * period) & (self._until < 0))
+        kind = self.rng.integers(0, 2, start.size).astype(np.int8)
+        mag = np.where(kind == 0, -self.rng.choice([100, 200, 300], start.size),
+                       np.minimum(2.0, self.workload[start] + 0.2) - self.workload[start])
+        dur = np.maximum(1, np.ceil(self.rng.exponential(self.fault_s, start.size) / period)).astype(int)
+        self.fan_delta[start[kind == 0]] += mag[kind == 0]
+        self.workload[start[kind == 1]] += mag[kind == 1]
+        self._until[start] = k + dur; self._undo[start] = mag; self._kind[start] = kind
+        for i, kd, m in zip(start.tolist(), kind.tolist(), mag.tolist()):
+            self._open[i] = f = {"device_id": str(self.device_ids[i]), "fault": FAULT_KINDS[kd],
+                                 "magnitude": round(m, 3), "start_tick": k, "start": ts, "end_tick": None, "end": None}
+            self.faults.append(f)
+
+    def tick(self, ts, period=1.0):
+        """One row per device at `ts` (ISO string), as a dict of columns; advances faults first."""
+        self._inject(ts, period)
+        n, u = self.n, self.rng.random
+        inlet = 22.0 + (u(n) * 1.3 - 0.5)
+        fan = np.maximum(2500, 5000 + self.fan_delta + (u(n) * 100 - 50))
+        temp = 55 + np.maximum(0, (5000 - fan) / 45) + (inlet - 22) * 0.6 + u(n) * 1.2
+        cpu = np.minimum(100, 30 + (temp - 55) * 0.9 * self.workload + u(n) * 3)
+        mem = np.minimum(100, 45 + u(n) * 20)
+        latency = 8 + cpu / 12 + u(n) * 2
+        self.ticks += 1
+        return {"ts": np.full(n, ts, dtype=object), "device_id": self.device_ids,
+                "inlet_temp_c": inlet.round(1), "cpu_pct": cpu.round(1), "mem_pct": mem.round(1),
+                "temp_c": temp.round(1), "fan_rpm": fan.astype(np.int64),
+                "disk_errors": (u(n) < 0.0015).astype(np.int64), "nic_drops": (u(n) < 0.002).astype(np.int64),
+                "latency_ms": latency.round(1)}
+
+def iso(t):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(t)) + f".{int(t % 1 * 1e6):06d}Z"
+
+def encode(cols, lo, hi, fmt):
+    """Rows [lo, hi) of a tick as a request body."""
+    if fmt == "arrow":
+        import pyarrow as pa, pyarrow.ipc as ipc
+        table = pa.table({k: v[lo:hi] for k, v in cols.items()})
+        sink = io.BytesIO()
+        with ipc.new_stream(sink, table.schema) as w:
+            w.write_table(table)
+        return sink.getvalue()
+    keys = list(cols)
+    lists = [cols[k][lo:hi].tolist() for k in keys]
+    return json.dumps([dict(zip(keys, row)) for row in zip(*lists)]).encode()
+
+class LoadGen:
+    def __init__(self, fleet, api=API, rate=1000.0, batch_rows=1000, fmt="json", wait=True, senders=4):
+        self.fleet = fleet
+        self.api = api
+        self.rate = float(rate)
+        self.batch_rows = int(batch_rows)
+        self.fmt = fmt
+        self.wait = wait
+        self.senders = int(senders)
+        self.period = fleet.n / self.rate
+        self.sent_rows = 0
+        self.rejected = 0          # 429 responses (retried)
+        self.errors = 0
+        self.last_error = None
+        self.latency_ms = []       # per accepted request, from its scheduled send time
+        self.max_lag_s = 0.0       # how far behind schedule ticks were generated
+        self._q = queue.Queue(maxsize=self.senders * 4)
+        self._lock = threading.Lock()
+
+    def _session(self):
+        s = requests.Session()
+        s.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        return s
+
+    def _send_loop(self):
+        s = self._session()
+        if self.fmt == "arrow":
+            url, params, headers = f"{self.api}/ingest/bulk", {"format": "arrow"}, {"Content-Type": "application/vnd.apache.arrow.stream"}
+        else:
+            url, params, headers = f"{self.api}/ingest", {"wait": str(self.wait).lower()}, {"Content-Type": "application/json"}
+        while True:
+            item = self._q.get()
+            if item is None:
+                return
+            due, rows, body = item
+            while True:
+                try:
+                    r = s.post(url, params=params, data=body, headers=headers, timeout=60)
+                except requests.RequestException as e:
+                    with self._lock:
+                        self.errors += 1; self.last_error = str(e)
+                    break
+                if r.status_code == 429:
+                    with self._lock:
+                        self.rejected += 1
+                    time.sleep(0.05)
+                    continue
+                with self._lock:
+                    if r.ok:
+                        self.sent_rows += rows
+                        self.latency_ms.append((time.monotonic() - due) * 1000.0)
+                    else:
+                        self.errors += 1; self.last_error = f"{r.status_code} {r.text[:200]}"
+                break
+
+    def run(self, duration_s):
+        """Offer `rate` rows/s for duration_s; returns once every batch is answered."""
+        threads = [threading.Thread(target=self._send_loop, daemon=True) for _ in range(self.senders)]
+        for t in threads:
+            t.start()
+        t0 = time.monotonic(); wall0 = time.time()
+        step = self.batch_rows / self.rate
+        k = 0
+        while k * self.period < duration_s:
+            due = t0 + k * self.period
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.max_lag_s = max(self.max_lag_s, -delay)
+            cols = self.fleet.tick(iso(wall0 + k * self.period), self.period)
+            for j, lo in enumerate(range(0, self.fleet.n, self.batch_rows)):
+                # Spread a tick's batches over its period instead of sending them in one burst
+                bdue = due + j * step
+                delay = bdue - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                hi = min(lo + self.batch_rows, self.fleet.n)
+                self._q.put((bdue, hi - lo, encode(cols, lo, hi, self.fmt)))
+            k += 1
+        for _ in threads:
+            self._q.put(None)
+        for t in threads:
+            t.join()
+        return self.summary(time.monotonic() - t0)
+
+    def summary(self, elapsed):
+        lat = np.array(self.latency_ms) if self.latency_ms else np.zeros(1)
+        return {"devices": self.fleet.n, "offered_rows_s": self.rate, "batch_rows": self.batch_rows,
+                "format": self.fmt, "elapsed_s": elapsed, "sent_rows": self.sent_rows,
+                "sent_rows_s": self.sent_rows / elapsed if elapsed else 0.0, "requests": len(self.latency_ms),
+                "ingest_ms_p50": float(np.percentile(lat, 50)), "ingest_ms_p99": float(np.percentile(lat, 99)),
+                "rejected": self.rejected, "errors": self.errors, "last_error": self.last_error,
+                "max_schedule_lag_s": self.max_lag_s, "faults": len(self.fleet.faults)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=1000)
+    ap.add_argument("--rate", type=float, default=1000.0, help="offered rows/s (tick period = devices / rate)")
+    ap.add_argument("--batch", type=int, default=1000, help="rows per request")
+    ap.add_argument("--format", choices=["json", "arrow"], default="json")
+    ap.add_argument("--no-wait", action="store_true", help="do not wait for the commit (JSON /ingest)")
+    ap.add_argument("--senders", type=int, default=4)
+    ap.add_argument("--duration", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--fault-rate", type=float, default=0.0, help="faults per device-second")
+    ap.add_argument("--fault-s", type=float, default=60.0, help="mean fault duration")
+    ap.add_argument("--fault-log", help="write the injected faults as JSON lines to this path")
+    args = ap.parse_args()
+    fleet = Fleet(args.devices, seed=args.seed, fault_rate=args.fault_rate, fault_s=args.fault_s)
+    gen = LoadGen(fleet, API, args.rate, args.batch, args.format, not args.no_wait, args.senders)
+    print(json.dumps(gen.run(args.duration)), flush=True)
+    if args.fault_log:
+        with open(args.fault_log, "w") as f:
+            for fault in fleet.faults:
+                f.write(json.dumps(fault) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os, sys
+
+# api/ modules import each other as top-level modules (the API runs from inside api/)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "api")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
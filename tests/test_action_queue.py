@@ -0,0 +1,38 @@
+import duckdb, pytest
+
+from action_queue import ActionQueue
+
+def test_pending_ack_and_ids_survive_restart(tmp_path):
+    con = duckdb.connect(str(tmp_path / "q.duckdb"))
+    q = ActionQueue(con)
+    a = q.enqueue("d1", "Increase fan target", {"fan_delta": 100})
+    b = q.enqueue("d2", "Restart service")
+    c = q.enqueue("d1", "Migrate traffic")
+    assert a["id"] < b["id"] < c["id"]
+    assert [x["id"] for x in q.pending("d1")] == [a["id"], c["id"]]
+    assert [x["id"] for x in q.pending("d1", after=a["id"])] == [c["id"]]
+    assert q.pending("d1")[0]["params"] == {"fan_delta": 100}
+    assert q.ack("d1", a["id"]) == 1 and q.ack("d1", a["id"]) == 0
+    assert [x["id"] for x in q.pending("d1")] == [c["id"]]
+    con.close()
+
+    q = ActionQueue(duckdb.connect(str(tmp_path / "q.duckdb")))
+    assert q.enqueue("d1", "Restart service")["id"] > c["id"]
+    assert q.stats()["pending"] == 3
+
+def test_record_runs_in_the_enqueue_transaction():
+    con = duckdb.connect(":memory:")
+    con.execute("CREATE TABLE actions (id BIGINT, action VARCHAR)")
+    q = ActionQueue(con)
+    log = lambda cur, a: cur.execute("INSERT INTO actions VALUES (?, ?)", [a["id"], a["action"]])
+    a = q.enqueue("d1", "Restart service", record=log)
+
+    def broken(cur, a):
+        log(cur, a)
+        raise RuntimeError("log failed")
+    with pytest.raises(RuntimeError):
+        q.enqueue("d1", "Migrate traffic", record=broken)
+    # Neither the failed action nor its log row is kept, and its id is not skipped
+    assert con.execute("SELECT id, action FROM actions").fetchall() == [(a["id"], "Restart service")]
+    assert [x["id"] for x in q.pending("d1")] == [a["id"]]
+    assert q.enqueue("d1", "Migrate traffic", record=log)["id"] == a["id"] + 1
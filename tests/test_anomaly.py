@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from anomaly import METRICS, _rolling_z, find_anomalies
+
+def legacy_find_anomalies(df):
+    """find_anomalies before vectorisation: per-metric, per-row, dict dedupe."""
+    if df.empty: return []
+    out = []
+    for m in METRICS:
+        if m in df.columns:
+            z = _rolling_z(df[m].values, w=min(60, max(10, len(df) // 5)))
+            for i in np.where(np.abs(z) > 2.5)[0]:
+                out.append({"idx": int(i), "ts": df.iloc[i]["ts"].isoformat(), "metric": m,
+                            "score": float(abs(z[i])), "type": "zscore"})
+    X = df[METRICS].astype(float).fillna(0.0)
+    if len(X) >= 40:
+        iso = IsolationForest(n_estimators=100, contamination=0.05, random_state=42)
+        pred = iso.fit_predict(X); scores = -iso.score_samples(X)
+        for i, p in enumerate(pred):
+            if p == -1:
+                out.append({"idx": int(i), "ts": df.iloc[i]["ts"].isoformat(), "metric": "multivariate",
+                            "score": float(scores[i]), "type": "iforest"})
+    keyed = {}
+    for a in out:
+        k = (a["idx"], a["metric"])
+        if k not in keyed or a["score"] > keyed[k]["score"]: keyed[k] = a
+    return list(keyed.values())
+
+def frame(n, seed, ts_offset_us=0):
+    rng = np.random.default_rng(seed)
+    ts = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(n), unit="s")
+    df = pd.DataFrame({"ts": ts + pd.to_timedelta(np.arange(n) * ts_offset_us, unit="us")})
+    for m in METRICS:
+        df[m] = rng.normal(50, 5, n).round(1)
+    df["latency_ms"] = rng.standard_t(2, n) * 3 + 11
+    df["disk_errors"] = (rng.random(n) < 0.02).astype(float)
+    df.loc[df.index[::17], "fan_rpm"] = np.nan
+    return df
+
+def test_vectorised_output_is_identical():
+    for n, seed, off in [(0, 0, 0), (25, 1, 0), (45, 2, 0), (400, 3, 1234), (3000, 4, 0)]:
+        df = frame(n, seed, off)
+        assert find_anomalies(df) == legacy_find_anomalies(df)
+    df = frame(300, 5)
+    df["ts"] = df["ts"].dt.tz_localize("UTC")
+    assert find_anomalies(df) == legacy_find_anomalies(df)
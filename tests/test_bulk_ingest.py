@@ -0,0 +1,87 @@
+import json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import pytest
+
+import bulk_ingest
+from ingest_queue import Duplicate
+from schema import COLUMNS, normalize_events
+from test_ingest_queue import make_queue
+
+EVENTS = [
+    {"ts": "2024-01-01T00:00:00Z", "device_id": "d1", "cpu_pct": 1.0, "fan_rpm": 4000},
+    {"ts": "2024-01-01T02:30:00+02:00", "device_id": "d1", "cpu_pct": 2.0},
+    {"ts": "2024-01-01 00:45:00.250", "device_id": "d2", "temp_c": 55.5},
+    {"ts": "not a time", "device_id": "d2", "nic_drops": 3},
+    {"device_id": "d3", "latency_ms": 12.5},
+]
+
+def write(path, fmt, events=EVENTS):
+    if fmt == "ndjson":
+        path.write_text("\n".join(json.dumps(e) for e in events) + "\n")
+        return str(path)
+    names = dict.fromkeys(k for e in events for k in e)
+    table = pa.table({k: [e.get(k) for e in events] for k in names})
+    if fmt == "parquet":
+        pq.write_table(table, str(path))
+    else:
+        with ipc.new_stream(str(path), table.schema) as w:
+            w.write_table(table)
+    return str(path)
+
+def rows(con):
+    return con.execute(f"SELECT {', '.join(COLUMNS)} FROM telemetry ORDER BY device_id, ts").df()
+
+def test_detect_format():
+    assert bulk_ingest.detect_format("application/vnd.apache.arrow.stream") == "arrow"
+    assert bulk_ingest.detect_format("application/vnd.apache.arrow.file") == "arrow"
+    assert bulk_ingest.detect_format("application/x-ndjson; charset=utf-8") == "ndjson"
+    assert bulk_ingest.detect_format("application/vnd.apache.parquet") == "parquet"
+    assert bulk_ingest.detect_format("application/json", "Parquet") == "parquet"
+    with pytest.raises(ValueError):
+        bulk_ingest.detect_format("application/json")
+    with pytest.raises(ValueError):
+        bulk_ingest.detect_format(None, "csv")
+
+@pytest.mark.parametrize("fmt", ["arrow", "ndjson", "parquet"])
+def test_timestamps_and_missing_columns_match_ingest(tmp_path, fmt):
+    con, q = make_queue()
+    before = pd.Timestamp.now("UTC").tz_localize(None)
+    assert bulk_ingest.load(con, q, write(tmp_path / f"up.{fmt}", fmt), fmt) == len(EVENTS)
+    got = rows(con)
+
+    expected = normalize_events([dict(e) for e in EVENTS])[COLUMNS]
+    expected["ts"] = expected["ts"].dt.tz_convert(None)
+    expected = expected.sort_values(["device_id", "ts"]).reset_index(drop=True)
+    stamped = [3, 4]                     # invalid or missing ts: stamped with the time of ingest
+    assert (got["ts"][stamped] >= before).all()
+    assert got.drop(index=stamped)["ts"].tolist() == expected.drop(index=stamped)["ts"].tolist()
+    for col in COLUMNS[1:]:
+        assert got[col].astype(object).where(got[col].notna(), None).tolist() == \
+            expected[col].astype(object).where(expected[col].notna(), None).tolist(), col
+
+def test_missing_columns_are_backfilled(tmp_path):
+    con, q = make_queue()
+    path = write(tmp_path / "up.arrow", "arrow", [{"device_id": "d1", "cpu_pct": 5.0}] * 3)
+    assert bulk_ingest.load(con, q, path, "arrow", chunk_rows=2) == 3
+    got = rows(con)
+    assert got["cpu_pct"].tolist() == [5.0] * 3 and got["ts"].notna().all()
+    assert got[[c for c in COLUMNS[2:] if c != "cpu_pct"]].isna().all().all()
+
+def test_marked_upload_commits_once_and_a_failed_one_can_be_resent(tmp_path):
+    con, q = make_queue()
+    path = write(tmp_path / "up.parquet", "parquet")
+    assert bulk_ingest.load(con, q, path, "parquet", chunk_rows=2, mark=("backfill", 1)) == len(EVENTS)
+    with pytest.raises(Duplicate):
+        bulk_ingest.load(con, q, path, "parquet", mark=("backfill", 1))
+    assert con.execute("SELECT batch FROM ingest_marks WHERE source = 'backfill'").fetchall() == [(1,)]
+    assert len(rows(con)) == len(EVENTS)
+
+    bad = write(tmp_path / "bad.ndjson", "ndjson", [{"device_id": "d1", "fan_rpm": 1}, {"device_id": "d1", "fan_rpm": 2.5e12}])
+    with pytest.raises(Exception) as err:
+        bulk_ingest.load(con, q, bad, "ndjson", mark=("backfill", 2))
+    assert err.value.committed == 0
+    assert bulk_ingest.load(con, q, path, "parquet", mark=("backfill", 2)) == len(EVENTS)
+    assert con.execute("SELECT batch FROM ingest_marks WHERE source = 'backfill'").fetchall() == [(2,)]
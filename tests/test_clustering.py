@@ -0,0 +1,43 @@
+import duckdb
+import pandas as pd
+
+from clustering import Clusterer
+from device_registry import DeviceRegistry
+from ingest_queue import IngestQueue
+from schema import normalize_events
+from test_ingest_queue import DDL
+
+def test_registry_is_maintained_in_the_ingest_transaction():
+    con = duckdb.connect(":memory:"); con.execute(DDL)
+    con.execute("INSERT INTO telemetry (ts, device_id) VALUES ('2024-01-01 00:00:00', 'old')")
+    reg = DeviceRegistry(con)
+    q = IngestQueue(con, batch_rows=100, max_age_s=0.05)
+    q.in_transaction(reg.fold)
+    q.start()
+    q.submit([{"device_id": "d1", "ts": "2024-01-02T00:00:00Z"}, {"device_id": "d2", "ts": "2024-01-02T00:00:05Z"}],
+             durable=True, mark=("edge-7", 1)).result(timeout=5)
+    q.submit([{"device_id": "d1", "ts": "2024-01-02T00:01:00Z"}], durable=True).result(timeout=5)
+    q.stop()
+    q.commit(normalize_events([{"device_id": "d2", "ts": "2024-01-01T23:00:00Z"}]), source="mqtt")
+    got = {r[0]: r[1:] for r in con.execute(
+        "SELECT device_id, first_seen, last_seen, rows, source FROM devices").fetchall()}
+    assert got["old"][2:] == (1, "backfill")
+    assert got["d1"][2:] == (2, "http") and str(got["d1"][1]) == "2024-01-02 00:01:00"
+    assert got["d2"][2:] == (2, "mqtt") and str(got["d2"][0]) == "2024-01-01 23:00:00"
+    assert reg.list(active_since="2024-01-02").device_id.tolist() == ["d1", "d2"]
+
+def test_settled_slices_are_rewritten_sorted_by_device():
+    con = duckdb.connect(":memory:"); con.execute(DDL)
+    ts = pd.date_range("2024-01-01", periods=3 * 3600, freq="s")
+    df = pd.DataFrame({"ts": ts.repeat(3), "device_id": ["c", "a", "b"] * len(ts)})
+    df["cpu_pct"] = range(len(df))
+    con.execute("INSERT INTO telemetry (ts, device_id, cpu_pct) SELECT ts, device_id, cpu_pct FROM df")
+    before = con.execute("SELECT sum(cpu_pct), count(*) FROM telemetry").fetchone()
+
+    c = Clusterer(con, slice_s=3600, settle_s=600)
+    assert c.run_once(now=pd.Timestamp("2024-01-01 02:30")) == 2 * 3 * 3600      # third slice not settled yet
+    assert con.execute("SELECT sum(cpu_pct), count(*) FROM telemetry").fetchone() == before
+    order = con.execute("SELECT device_id FROM telemetry WHERE ts < '2024-01-01 01:00' ORDER BY rowid").fetchall()
+    assert [d for (d,) in order] == ["a"] * 3600 + ["b"] * 3600 + ["c"] * 3600
+    assert Clusterer(con, slice_s=3600).upto == pd.Timestamp("2024-01-01 02:00")   # persisted watermark
+    assert c.run_once(now=pd.Timestamp("2024-01-01 02:30")) == 0
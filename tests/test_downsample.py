@@ -0,0 +1,107 @@
+import threading, time
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsample import downsample, lttb, minmax, window_bounds
+from overview import FleetOverview
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=np.int64) * 1_000_000_000
+    y = np.sin(np.arange(n) / 300) + rng.normal(0, 0.05, n)
+    y[n // 3], y[2 * n // 3] = 9.0, -9.0
+    return x, y
+
+def test_lttb_and_minmax_keep_endpoints_and_extremes_within_budget():
+    x, y = series(50000)
+    for pick in (lttb, minmax):
+        idx = pick(x, y, 500)
+        assert len(idx) <= 500 and np.all(np.diff(idx) > 0)
+        assert {0, len(x) - 1, int(np.argmax(y)), int(np.argmin(y))} <= set(idx.tolist())
+    # minmax keeps each bucket's min and max
+    idx = minmax(x, y, 100)
+    bid = x * 49 // (int(x[-1]) + 1)
+    for b in (0, 17, 48):
+        picked = idx[bid[idx] == b]
+        assert y[picked].min() == y[bid == b].min() and y[picked].max() == y[bid == b].max()
+    assert lttb(x[:10], y[:10], 50).tolist() == list(range(10))
+
+def test_downsample_returns_real_rows_per_metric():
+    x, y = series(20000)
+    df = pd.DataFrame({"ts": pd.to_datetime(x), "device_id": "d", "temp_c": y, "fan_rpm": -y, "cpu_pct": np.nan})
+    out, rows_in = downsample(df, 300, "lttb", ["temp_c", "fan_rpm", "cpu_pct"])
+    assert rows_in == 20000 and len(out) <= 600
+    assert list(out.columns) == ["ts", "device_id", "temp_c", "fan_rpm", "cpu_pct"]
+    merged = out.merge(df, on="ts", suffixes=("", "_src"))
+    assert len(merged) == len(out) and (merged["temp_c"] == merged["temp_c_src"]).all()
+    assert out["temp_c"].max() == 9.0 and out["temp_c"].min() == -9.0
+
+def test_window_bounds_are_naive_utc():
+    now = "2024-01-01T12:00:00Z"
+    assert window_bounds(now=now) == ("2024-01-01T11:50:00", "2024-01-01T12:00:00")
+    # start only (naive): runs to the server's now, which is tz-aware
+    assert window_bounds("2024-01-01T11:00:00", now=now) == ("2024-01-01T11:00:00", "2024-01-01T12:00:00")
+    assert window_bounds("2024-01-01T13:00:00+02:00", "2024-01-01T11:30:00", now=now) == \
+        ("2024-01-01T11:00:00", "2024-01-01T11:30:00")
+    assert window_bounds("2024-01-01T11:00:00Z", "2024-01-01T07:30:00-04:00") == \
+        ("2024-01-01T11:00:00", "2024-01-01T11:30:00")
+    with pytest.raises(ValueError):
+        window_bounds("yesterday-ish", now=now)
+
+def test_fleet_overview_one_query_sparklines_and_cache():
+    con = duckdb.connect(":memory:")
+    con.execute("""CREATE TABLE telemetry AS
+        SELECT now()::TIMESTAMP - INTERVAL (s) SECOND AS ts, 'd' || d AS device_id,
+               d * 10.0 AS temp_c, CASE WHEN s % 2 = 0 THEN NULL ELSE 3000 + d END AS fan_rpm
+        FROM range(3) t(d), range(300) r(s)""")
+    calls = []
+    def query(site, sql, params):
+        calls.append(site)
+        return con.cursor().execute(sql, params)
+    now_ns = time.time_ns()
+    ov = FleetOverview(query, lambda since: {"d1": 4} if since < now_ns else {}, ttl_s=60)
+    out, cached = ov.summary(5, 30, ["temp_c", "fan_rpm"])
+    assert not cached and out["step_s"] == 10 and out["source"] == "raw"
+    assert [d["device_id"] for d in out["devices"]] == ["d1", "d0", "d2"]    # anomalous first
+    d2 = out["devices"][2]
+    assert d2["latest"] == {"temp_c": 20.0, "fan_rpm": 3002.0} and d2["anomalies"] == 0
+    assert len(d2["spark"]["temp_c"]) == 30 and set(d2["spark"]["temp_c"]) <= {20.0, None}
+    assert ov.summary(5, 30, ["temp_c", "fan_rpm"])[1] and calls == ["fleet_summary"]
+
+def test_fleet_overview_latest_reaches_back_past_an_all_null_bucket():
+    con = duckdb.connect(":memory:")
+    con.execute("""CREATE TABLE telemetry AS
+        SELECT now()::TIMESTAMP - INTERVAL (s) SECOND AS ts, 'd0' AS device_id, 50.0 + s AS temp_c,
+               CASE WHEN s >= 60 THEN 4000 + s END AS fan_rpm
+        FROM range(200) r(s)""")
+    ov = FleetOverview(lambda site, sql, params: con.cursor().execute(sql, params), lambda since: {})
+    d0 = ov.summary(5, 30, ["temp_c", "fan_rpm"])[0]["devices"][0]
+    assert d0["latest"] == {"temp_c": 50.0, "fan_rpm": 4060.0}
+    assert d0["spark"]["fan_rpm"][-1] is None
+
+def test_fleet_overview_builds_block_only_their_own_key():
+    con = duckdb.connect(":memory:")
+    con.execute("CREATE TABLE telemetry AS SELECT now()::TIMESTAMP AS ts, 'd0' AS device_id, "
+                "1.0 AS temp_c, 2 AS fan_rpm")
+    gate, builds = threading.Event(), []
+    def query(site, sql, params):
+        builds.append("fan_rpm" in sql)
+        if "fan_rpm" in sql:
+            gate.wait(10)                      # hold the fan_rpm build in flight
+        return con.cursor().execute(sql, params)
+    ov = FleetOverview(query, lambda since: {}, ttl_s=60)
+    ov.summary(5, 30, ["temp_c"])
+    slow = [threading.Thread(target=ov.summary, args=(5, 30, ["fan_rpm"])) for _ in range(3)]
+    for t in slow:
+        t.start()
+    while not builds[1:]:
+        time.sleep(0.01)
+    t0 = time.monotonic()
+    assert ov.summary(5, 30, ["temp_c"])[1] and ov.summary(5, 60, ["temp_c"])[1] is False
+    assert time.monotonic() - t0 < 5          # neither waited for the fan_rpm build
+    gate.set()
+    for t in slow:
+        t.join()
+    assert builds == [False, True, False]    # the three fan_rpm callers shared one build
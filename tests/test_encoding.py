@@ -0,0 +1,65 @@
+import asyncio, io, json
+import duckdb
+import pyarrow.ipc as ipc
+import pytest
+
+import encoding
+
+@pytest.fixture
+def cur():
+    con = duckdb.connect(":memory:")
+    con.execute("CREATE TABLE t AS SELECT TIMESTAMP '2024-01-01' + INTERVAL (i) SECOND AS ts, 'd1' AS device_id, "
+                "CASE WHEN i % 3 = 0 THEN NULL ELSE i END::INTEGER AS fan_rpm, i / 7 AS cpu_pct FROM range(150000) r(i)")
+    return con
+
+def test_streamed_json_matches_the_old_to_json_loads_path(cur):
+    old = json.loads(cur.execute("SELECT * FROM t ORDER BY ts").df().to_json(orient="records", date_format="iso"))
+    cur.execute("SELECT * FROM t ORDER BY ts")
+    body = b"".join(encoding.encode(cur.fetch_record_batch(encoding.BATCH_ROWS), "json"))
+    assert json.loads(body) == {"rows": old}
+
+def test_arrow_csv_and_columnar(cur):
+    df = cur.execute("SELECT * FROM t LIMIT 10").df()
+    table = ipc.open_stream(io.BytesIO(b"".join(encoding.encode(df, "arrow")))).read_all()
+    assert table.num_rows == 10 and table.column_names == list(df.columns)
+    csv = b"".join(encoding.encode(df, "csv")).decode().splitlines()
+    assert csv[0] == '"ts","device_id","fan_rpm","cpu_pct"' and len(csv) == 11
+    cols = json.loads(b"".join(encoding.encode(df, "columnar")))
+    assert cols["rows"] == 10 and cols["columns"]["fan_rpm"][:2] == [None, 1.0]
+
+def test_negotiate():
+    assert encoding.negotiate("text/csv;q=0.9, application/json") == "csv"
+    assert encoding.negotiate("*/*") == "json"
+    assert encoding.negotiate("text/csv", "arrow") == "arrow"
+    with pytest.raises(ValueError):
+        encoding.negotiate(None, "xml")
+
+def test_stream_cleans_up_when_the_client_leaves_before_the_first_chunk(cur):
+    closed = []
+    cur.execute("SELECT * FROM t")
+    response = encoding.stream(cur, "json", on_close=lambda: closed.append(True))
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await asyncio.sleep(0.1)        # disconnect is noticed while the headers are on their way
+
+    asyncio.run(response({"type": "http", "method": "GET", "path": "/"}, receive, send))
+    assert closed == [True]
+    with pytest.raises(duckdb.ConnectionException):
+        cur.execute("SELECT 1")
+
+def test_stream_cleans_up_once_after_a_full_body(cur):
+    closed, sent = [], []
+    cur.execute("SELECT * FROM t LIMIT 5")
+    response = encoding.stream(cur, "csv", on_close=lambda: closed.append(True))
+
+    async def receive():
+        await asyncio.sleep(10)
+
+    async def send(message):
+        sent.append(message.get("body", b""))
+
+    asyncio.run(response({"type": "http", "method": "GET", "path": "/"}, receive, send))
+    assert closed == [True] and len(b"".join(sent).decode().splitlines()) == 6
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from feed import Feed, make_cursor, parse_cursor
+
+def batch(device_id, seconds, temp=50.0):
+    return pd.DataFrame({"ts": pd.to_datetime(seconds, unit="s"), "device_id": device_id, "temp_c": temp})
+
+def test_since_returns_only_rows_committed_after_the_cursor():
+    feed = Feed(capacity=100)
+    feed.append(batch("a", [1, 2, 3]))
+    start = feed.position()
+    feed.append(batch("b", [1, 2]))
+    feed.append(batch("a", [5, 4]))
+    feed.append(batch("a", [0], temp=1.0))      # late row: still delivered, by commit order
+    df, cursor = feed.since("a", start)
+    assert list(df["ts"].astype("int64") // 10**6) == [0, 4, 5]
+    assert parse_cursor(cursor)[1] == feed.seq and parse_cursor(cursor)[2] == 5 * 10**6
+    assert feed.since("a", cursor)[0].empty
+    # Newest `limit` rows when there are more
+    assert list(feed.since("a", start, limit=2)[0]["ts"].astype("int64") // 10**6) == [4, 5]
+
+def test_since_falls_back_when_the_feed_cannot_tell():
+    feed = Feed(capacity=4, max_devices=1)
+    feed.append(batch("a", [1, 2]))
+    old = feed.position()
+    feed.append(batch("a", [3, 4]))
+    assert len(feed.since("a", old)[0]) == 2
+    feed.append(batch("a", np.arange(5, 10)))   # evicts the rows right after `old`
+    assert feed.since("a", old) is None
+    assert feed.since("a", make_cursor("other-epoch", feed.seq, 0)) is None
+    feed.append(batch("b", [1]))                # "a" leaves the LRU
+    assert feed.since("a", make_cursor(feed.epoch, 1, 0)) is None
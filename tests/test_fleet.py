@@ -0,0 +1,79 @@
+import os, threading, time
+import numpy as np
+import pandas as pd
+
+from anomaly import METRICS
+from fleet import FleetSweeper
+
+class Stuck:
+    """Model stand-in whose scoring never returns in time (pickled into the workers)."""
+    offset_ = 0.0
+
+    def score_samples(self, X):
+        time.sleep(60)
+
+class Broken:
+    offset_ = 0.0
+
+    def score_samples(self, X):
+        raise RuntimeError("bad model")
+
+def window(spikes, rows=200, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({m: rng.normal(50, 0.5, rows) for m in METRICS})
+    df.insert(0, "ts", pd.date_range("2024-01-01", periods=rows, freq="s"))
+    for i in np.linspace(20, rows - 1, spikes).astype(int):
+        df.loc[i, "temp_c"] = 90.0
+    return df
+
+def alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] not in ("Z", "X")
+    except FileNotFoundError:
+        return False
+
+def test_sweep_ranks_by_severity_and_returns_partial_results():
+    sweeper = FleetSweeper(workers=2)
+    try:
+        jobs = [("calm", window(0), None, False), ("hot", window(15), None, False),
+                ("stuck", window(5), None, Stuck()), ("spiky", window(4), None, False),
+                ("broken", window(5), None, Broken())]
+        results, errors = sweeper.sweep(jobs, device_timeout_s=15, timeout_s=60)
+        assert [r["device_id"] for r in results] == ["hot", "spiky", "calm"]
+        assert results[0]["severity"] > results[1]["severity"] > results[2]["severity"]
+        assert results[0]["top_cause"]["metric"] == "temp_c"
+        assert errors["stuck"] == "timeout" and errors["broken"] == "error: bad model"
+    finally:
+        sweeper.shutdown()
+
+def test_a_timed_out_worker_is_killed_and_replaced_at_once():
+    sweeper = FleetSweeper(workers=1)
+    try:
+        t = time.monotonic()
+        results, errors = sweeper.sweep([("stuck", window(5), None, Stuck()), ("calm", window(0), None, False)],
+                                        device_timeout_s=3, timeout_s=45)
+        assert [r["device_id"] for r in results] == ["calm"] and errors == {"stuck": "timeout"}
+        assert time.monotonic() - t < 45
+        (pid,) = sweeper.worker_pids()   # the replacement that ran "calm"
+        assert alive(pid) and pid != os.getpid()
+        results, errors = sweeper.sweep([("calm", window(0), None, False)], device_timeout_s=30)
+        assert [r["device_id"] for r in results] == ["calm"] and not errors
+        assert sweeper.worker_pids() == {pid}
+    finally:
+        sweeper.shutdown()
+
+def test_concurrent_sweeps_use_their_own_workers():
+    sweeper = FleetSweeper(workers=1)
+    out = {}
+    def run(name, jobs, device_timeout_s):
+        out[name] = sweeper.sweep(jobs, device_timeout_s=device_timeout_s, timeout_s=60)
+    try:
+        stuck = threading.Thread(target=run, args=("stuck", [("stuck", window(5), None, Stuck())], 8))
+        calm = threading.Thread(target=run, args=("calm", [(f"d{i}", window(0, seed=i), None, False) for i in range(3)], 30))
+        stuck.start(); calm.start(); stuck.join(); calm.join()
+        assert out["stuck"] == ([], {"stuck": "timeout"})
+        results, errors = out["calm"]
+        assert sorted(r["device_id"] for r in results) == ["d0", "d1", "d2"] and not errors
+    finally:
+        sweeper.shutdown()
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from hotcache import HotCache
+
+def batch(device_id, seconds, base="2024-01-01"):
+    ts = pd.Timestamp(base) + pd.to_timedelta(seconds, unit="s")
+    return pd.DataFrame({"ts": ts, "device_id": device_id, "cpu_pct": np.arange(len(seconds), dtype=float),
+                         "fan_rpm": 4000})
+
+def test_seeded_ring_serves_until_eviction_reaches_request():
+    cache = HotCache(capacity=4)
+    cache.seed("d1", batch("d1", [])) # device with no history: complete
+    cache.append(batch("d1", [0, 1, 2]))
+    assert len(cache.last("d1", 10)) == 3          # complete history, fewer rows than asked
+    cache.append(batch("d1", [3, 4, 5]))           # evicts ts 0 and 1
+    assert list(cache.last("d1", 4)["ts"].dt.second) == [2, 3, 4, 5]
+    assert cache.last("d1", 5) is None             # reaches past the buffer
+    assert cache.window("d1", "2024-01-01T00:00:02") is not None
+    assert cache.window("d1", "2024-01-01T00:00:01") is None
+    assert cache.last("d1", 1)["fan_rpm"].dtype == np.int32
+
+def test_out_of_order_rows_and_unseeded_devices():
+    cache = HotCache(capacity=3)
+    cache.append(batch("d2", [0]))                 # unseeded: ignored
+    assert cache.last("d2", 1) is None
+    cache.seed("d2", batch("d2", [9, 8, 7]))       # DESC order like the seed query
+    cache.append(batch("d2", [10, 6.5]))           # late row below the floor
+    out = cache.last("d2", 2)
+    assert list(out["ts"].dt.second) == [9, 10]
+    assert cache.window("d2", "2024-01-01T00:00:07") is None
+    assert cache.stats()["hits"] == 1
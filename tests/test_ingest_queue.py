@@ -0,0 +1,76 @@
+import duckdb, pytest
+
+from ingest_queue import IngestQueue, QueueFull, Duplicate, Pending
+from schema import normalize_events
+
+DDL = """
+CREATE TABLE telemetry (
+    ts TIMESTAMP, device_id VARCHAR, inlet_temp_c DOUBLE, fan_rpm INTEGER, temp_c DOUBLE,
+    vcore_v DOUBLE, cpu_pct DOUBLE, mem_pct DOUBLE, disk_errors INTEGER, nic_drops INTEGER,
+    latency_ms DOUBLE
+)
+"""
+
+def make_queue(**kw):
+    con = duckdb.connect(":memory:")
+    con.execute(DDL)
+    return con, IngestQueue(con, **kw)
+
+def test_group_commit_and_durable_wait():
+    con, q = make_queue(batch_rows=100, max_age_s=0.05)
+    q.start()
+    q.submit([{"device_id": "d1", "cpu_pct": 1.0, "ts": "2024-01-01T00:00:00Z"}])
+    fut = q.submit([{"device_id": "d1", "cpu_pct": 2.0, "ts": "2024-01-01T00:00:01.25Z"},
+                    {"device_id": "d2", "fan_rpm": 4000}], durable=True)
+    assert fut.result(timeout=5) == 2
+    q.stop()
+    rows = con.execute("SELECT device_id, ts IS NULL FROM telemetry ORDER BY device_id").fetchall()
+    assert rows == [("d1", False), ("d1", False), ("d2", False)]
+    assert q.stats()["flushes"] == 1
+
+def test_backpressure_and_bad_request_isolation():
+    con, q = make_queue(max_rows=3, batch_rows=100, max_age_s=0.05)
+    bad = q.submit([{"device_id": "d1", "fan_rpm": "not-a-number"}], durable=True)
+    good = q.submit([{"device_id": "d1", "fan_rpm": 4000}], durable=True)
+    with pytest.raises(QueueFull):
+        q.submit([{"device_id": "d1"}, {"device_id": "d1"}])
+    q.start()
+    assert good.result(timeout=5) == 1
+    with pytest.raises(Exception):
+        bad.result(timeout=5)
+    q.stop()
+    assert con.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0] == 1
+
+def test_marked_batches_are_committed_once():
+    con, q = make_queue(batch_rows=100, max_age_s=0.05)
+    q.start()
+    assert q.submit([{"device_id": "d1", "cpu_pct": 1.0}], durable=True, mark=("edge-1", 1)).result(timeout=5) == 1
+    for batch in (1, 0):
+        with pytest.raises(Duplicate):
+            q.submit([{"device_id": "d1", "cpu_pct": 1.0}], mark=("edge-1", batch))
+    q.submit([{"device_id": "d1", "cpu_pct": 2.0}], durable=True, mark=("edge-1", 2)).result(timeout=5)
+    q.stop()
+    # The committed mark survives a restart
+    with pytest.raises(Duplicate):
+        IngestQueue(con).submit([{"device_id": "d1"}], mark=("edge-1", 2))
+    assert con.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0] == 2
+
+def test_a_queued_batch_is_not_acknowledged_until_committed():
+    con, q = make_queue(batch_rows=100, max_age_s=0.05)
+    failed = q.submit([{"device_id": "d1", "fan_rpm": 2.5e12}], durable=True, mark=("edge-1", 1))
+    with pytest.raises(Pending):                 # resent while the first attempt is queued
+        q.submit([{"device_id": "d1", "fan_rpm": 2.5e12}], mark=("edge-1", 1))
+    q.start()
+    with pytest.raises(Exception):
+        failed.result(timeout=5)
+    # Its commit failed, so the resend is taken rather than acknowledged as a duplicate
+    assert q.submit([{"device_id": "d1", "fan_rpm": 1}], durable=True, mark=("edge-1", 1)).result(timeout=5) == 1
+    q.stop()
+    assert con.execute("SELECT fan_rpm FROM telemetry").fetchall() == [(1,)]
+
+def test_naive_timestamps_stay_utc_next_to_offset_ones():
+    df = normalize_events([{"device_id": "d1", "ts": "2024-01-01T02:30:00+02:00"},
+                           {"device_id": "d2", "ts": "2024-01-01 00:45:00"},
+                           {"device_id": "d3", "ts": "2024-01-01T01:00:00-0100"}])
+    assert [t.isoformat() for t in df["ts"]] == [
+        "2024-01-01T00:30:00+00:00", "2024-01-01T00:45:00+00:00", "2024-01-01T02:00:00+00:00"]
@@ -0,0 +1,26 @@
+import numpy as np
+
+from simulator.loadgen import Fleet
+
+def run(fleet, ticks):
+    return [fleet.tick(f"2024-01-01T00:{k // 60:02d}:{k % 60:02d}Z") for k in range(ticks)]
+
+def test_seeded_rows_and_faults_are_reproducible():
+    a, b = Fleet(500, seed=3, fault_rate=0.01, fault_s=5), Fleet(500, seed=3, fault_rate=0.01, fault_s=5)
+    ra, rb = run(a, 30), run(b, 30)
+    assert all(np.array_equal(x[c], y[c]) for x, y in zip(ra, rb) for c in x)
+    assert a.faults == b.faults and len(a.faults) > 50
+    assert Fleet(500, seed=4, fault_rate=0.01, fault_s=5).tick("2024-01-01T00:00:00Z")["temp_c"].tolist() != ra[0]["temp_c"].tolist()
+
+def test_faults_shift_the_model_and_revert():
+    fleet = Fleet(2000, seed=1, fault_rate=0.02, fault_s=3)
+    rows = run(fleet, 200)
+    closed = [f for f in fleet.faults if f["end_tick"] is not None]
+    assert closed and all(f["end_tick"] > f["start_tick"] for f in closed)
+    # Once every fault has ended, the fleet is back at its nominal state
+    fleet.fault_rate = 0.0
+    run(fleet, 200)
+    assert np.allclose(fleet.fan_delta, 0) and np.allclose(fleet.workload, 1)
+    healthy = rows[0]
+    assert 2500 <= healthy["fan_rpm"].min() and healthy["cpu_pct"].max() <= 100
+    assert abs(healthy["temp_c"].mean() - 55.75) < 0.3 and abs(healthy["latency_ms"].mean() - 11.6) < 0.3
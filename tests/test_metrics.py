@@ -0,0 +1,37 @@
+import threading
+
+from metrics import Registry
+
+def test_histograms_merge_thread_shards_and_render():
+    reg = Registry("db,ingest")
+    reg.histogram("q_seconds", "query time", ("site",), buckets=(0.01, 0.1), subsystem="db")
+    reg.counter("rows_total", "rows", subsystem="ingest")
+    reg.collect("wal_bytes", "wal", lambda: 42, subsystem="storage")
+
+    def work():
+        for v in (0.005, 0.05, 0.5):
+            reg.observe("q_seconds", ("window",), v)
+        reg.inc("rows_total", (), 10)
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    text = reg.render()
+    assert 'q_seconds_bucket{site="window",le="0.01"} 4' in text
+    assert 'q_seconds_bucket{site="window",le="0.1"} 8' in text
+    assert 'q_seconds_bucket{site="window",le="+Inf"} 12' in text
+    assert 'q_seconds_count{site="window"} 12' in text
+    assert "rows_total 40" in text and "# TYPE q_seconds histogram" in text
+    assert "wal_bytes" not in text        # storage is switched off
+
+def test_disabled_subsystem_records_nothing():
+    reg = Registry("0")
+    reg.histogram("q_seconds", "query time", ("site",), subsystem="db")
+    with reg.timer("q_seconds", ("x",)):
+        pass
+    assert reg.snapshot() == {} and reg.render() == "\n"
+    reg.configure("db")
+    with reg.timer("q_seconds", ("x",)):
+        pass
+    assert reg.snapshot()["q_seconds"][("x",)][-1] == 1
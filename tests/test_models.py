@@ -0,0 +1,71 @@
+import threading, time
+import numpy as np
+import pandas as pd
+
+from anomaly import METRICS
+from models import ModelRegistry
+
+def baseline(key, rows=200):
+    rng = np.random.default_rng(sum(map(ord, key)))
+    return pd.DataFrame({m: rng.normal(50, 5, rows) for m in METRICS})
+
+def settle(reg, timeout=30):
+    """Wait until no background fit is in flight."""
+    deadline = time.monotonic() + timeout
+    while reg.stats()["inflight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not reg.stats()["inflight"]
+
+def fitted(reg, *keys):
+    for key in keys:
+        reg.get(key)
+        settle(reg)
+    return [reg.get(key) for key in keys]
+
+def test_lru_eviction_and_ttl_expiry():
+    reg = ModelRegistry(baseline, max_models=2, ttl_s=60, refresh_s=3600)
+    a, b = fitted(reg, "a", "b")
+    assert a is not None and b is not None and reg.stats()["fits"] == 2
+    assert reg.get("a") is a                   # a is now the most recently used
+    fitted(reg, "c")
+    assert list(reg._models) == ["a", "c"] and reg.stats()["evictions"] == 1
+
+    reg._models["a"].last_used -= 120          # idle past ttl_s
+    reg.expire()
+    assert list(reg._models) == ["c"] and reg.stats()["evictions"] == 2
+    reg.stop()
+
+def test_models_persist_and_reload_without_refitting(tmp_path):
+    reg = ModelRegistry(baseline, model_dir=str(tmp_path))
+    (entry,) = fitted(reg, "dev/1")
+    reg.stop()
+    X = baseline("other")[METRICS]
+
+    loads = []
+    again = ModelRegistry(lambda key: loads.append(key), model_dir=str(tmp_path))
+    reloaded = again.get("dev/1")
+    assert reloaded is not None and loads == []
+    assert again.stats()["loads"] == 1 and again.stats()["fits"] == 0
+    assert np.allclose(reloaded.score_samples(X), entry.score_samples(X))
+    assert reloaded.score_mean == entry.score_mean and reloaded.fitted_at == entry.fitted_at
+    again.stop()
+
+def test_drifted_scores_trigger_one_refit_at_a_time():
+    gate = threading.Event()
+    def loader(key):
+        if reg.stats()["fits"]:
+            gate.wait(30)                      # hold the refit in flight
+        return baseline(key)
+    reg = ModelRegistry(loader, min_refit_s=0)
+    (entry,) = fitted(reg, "d1")
+    entry.score_samples(baseline("d1")[METRICS])
+    assert reg.stats()["drift_refits"] == 0   # its own baseline does not drift
+
+    drifted = baseline("d1")[METRICS] * 5
+    entry.score_samples(drifted)
+    entry.score_samples(drifted)               # refit already in flight: not counted again
+    assert reg.stats()["drift_refits"] == 1 and reg.stats()["inflight"] == 1
+    gate.set()
+    settle(reg)
+    assert reg.stats()["fits"] == 2 and reg.get("d1") is not entry
+    reg.stop()
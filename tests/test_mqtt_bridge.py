@@ -0,0 +1,42 @@
+import json, time
+import duckdb
+import paho.mqtt.client as paho
+
+from bench.fake_broker import FakeBroker, matches
+from ingest_queue import IngestQueue
+from mqtt_bridge import MqttBridge
+from test_ingest_queue import DDL
+
+def wait_for(cond, timeout=10):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.02)
+    return cond()
+
+def test_bridge_batches_valid_events_and_publishes_actions():
+    assert matches("telemetry/#", "telemetry/a") and matches("actions/+", "actions/d1") and not matches("a/+", "a/b/c")
+    broker = FakeBroker().start()
+    con = duckdb.connect(":memory:"); con.execute(DDL)
+    bridge = MqttBridge(IngestQueue(con), "127.0.0.1", broker.port, batch_rows=500, flush_s=0.1)
+    bridge.start()
+    client = paho.Client(paho.CallbackAPIVersion.VERSION2)
+    got = []
+    client.on_message = lambda c, u, m: got.append((m.topic, json.loads(m.payload)))
+    client.connect("127.0.0.1", broker.port); client.loop_start()
+    client.subscribe("actions/#", qos=1)
+    try:
+        assert wait_for(lambda: bridge.connected)
+        for i in range(20):
+            batch = [{"ts": f"2024-01-01T00:00:{i:02d}Z", "temp_c": 50.0 + i, "fan_rpm": 4000}] * 50
+            client.publish("telemetry/d1", json.dumps(batch), qos=1)
+        client.publish("telemetry/d2", json.dumps({"temp_c": "hot"}), qos=1)               # wrong type
+        client.publish("telemetry/d2", json.dumps({"device_id": "d3", "temp_c": 1.0}), qos=1)  # topic mismatch
+        client.publish("telemetry/d2", b"not json", qos=1)
+        assert wait_for(lambda: bridge.committed_rows == 1000 and bridge.invalid_messages == 1)
+        assert bridge.invalid_events == 2
+        assert con.execute("SELECT count(*), count(DISTINCT device_id) FROM telemetry").fetchone() == (1000, 1)
+        bridge.publish_action({"id": 7, "device_id": "d1", "action": "Restart service", "params": {}})
+        assert wait_for(lambda: got) and got[0] == ("actions/d1", {"id": 7, "device_id": "d1",
+                                                                   "action": "Restart service", "params": {}})
+    finally:
+        client.loop_stop(); bridge.stop(); broker.stop()
@@ -0,0 +1,37 @@
+import numpy as np
+
+from control.pid import PID, PIDBank
+from control.tuning import sweep
+
+def test_bank_matches_scalar_pids_while_unsaturated():
+    rng = np.random.default_rng(0)
+    kp, ki, kd, sp = rng.uniform(0.1, 1, 5), rng.uniform(0.01, 0.1, 5), rng.uniform(0, 0.5, 5), rng.uniform(50, 60, 5)
+    pids = [PID(kp[i], ki[i], kd[i], sp[i], out_min=-1e9, out_max=1e9) for i in range(5)]
+    bank = PIDBank(5, kp=kp, ki=ki, kd=kd, setpoint=sp, out_min=-1e9, out_max=1e9)
+    for _ in range(50):
+        m = rng.uniform(45, 65, 5)
+        assert np.allclose(bank.update(m, dt=0.5), [p.update(x, dt=0.5) for p, x in zip(pids, m)])
+
+def test_clamp_anti_windup_reverse_and_missing_readings():
+    bank = PIDBank(3, kp=1.0, ki=1.0, kd=0.0, setpoint=50.0, out_min=[-10, -10, -5], out_max=[10, 10, 5],
+                   reverse=[False, True, False])
+    for _ in range(100):
+        out = bank.update([40.0, 40.0, 40.0])
+    assert out.tolist() == [10.0, -10.0, 5.0]
+    assert bank.integral[0] <= 10.0               # stopped growing once saturated
+    assert bank.update([50.0, 50.0, 50.0])[0] < 10.0   # so it comes off the clamp at once
+    held = bank.integral.copy()
+    out = bank.update([np.nan, 55.0, 55.0])
+    assert out[0] == bank.out[0] and bank.integral[0] == held[0]
+
+def test_derivative_on_measurement_has_no_setpoint_kick():
+    bank = PIDBank(1, kp=0.0, ki=0.0, kd=1.0, setpoint=50.0, out_min=-100, out_max=100)
+    bank.update([50.0]); bank.update([50.0])
+    bank.setpoint[:] = 60.0
+    assert bank.update([50.0])[0] == 0.0
+    assert bank.update([52.0])[0] == -2.0
+
+def test_sweep_ranks_a_working_loop_above_a_sluggish_one():
+    ranked, run = sweep([(100, 10, 0), (1, 0.01, 0)], loops=20, seconds=900)
+    assert (ranked[0]["kp"], ranked[-1]["kp"]) == (100, 1)
+    assert ranked[0]["iae_c"] < ranked[-1]["iae_c"] and run["speedup"] > 100
@@ -0,0 +1,73 @@
+import os
+import time
+import duckdb, pytest
+
+from action_queue import ActionQueue
+from policy import PolicyEngine, load_rules
+
+RULES = os.path.join(os.path.dirname(__file__), "..", "api", "policies.yaml")
+S = 1_000_000_000
+
+def _engine(con, cause, score=0.9):
+    q = ActionQueue(con)
+    rca = {"ranked": [{"metric": cause, "score": score}]}
+    engine = PolicyEngine(con, load_rules(RULES), lambda d: ([], rca), q.enqueue)
+    q.subscribe_acks(engine.on_ack)
+    return engine, q
+
+def _wait(engine, n):
+    deadline = time.time() + 5
+    while sum(engine.outcomes.values()) < n and time.time() < deadline:
+        time.sleep(0.01)
+
+def test_flags_trigger_dispatch_then_cooldown_and_ack_closes_the_loop(tmp_path):
+    con = duckdb.connect(str(tmp_path / "p.duckdb"))
+    engine, q = _engine(con, "fan_rpm")
+    engine.eval_interval_s = 0.0
+    engine.start()
+    now = int(time.time()) * S
+    engine.on_anomalies({"d1": [(now - 2 * S, "fan_rpm", 4.0), (now - 2 * S, "temp_c", 3.0)]})
+    engine.on_anomalies({"d1": [(now - S, "fan_rpm", 4.0)]})
+    assert engine.triggers == 0                      # 2 flagged samples, 3 needed
+    engine.on_anomalies({"d1": [(now, "fan_rpm", 5.0)]})
+    _wait(engine, 1)
+    assert engine.outcomes == {"dispatched": 1}
+    (action,) = q.pending("d1")
+    assert (action["action"], action["params"]) == ("Increase fan target", {"fan_delta": 200})
+
+    engine.on_anomalies({"d1": [(now + i * S, "fan_rpm", 5.0) for i in range(1, 4)]})
+    _wait(engine, 2)
+    assert engine.outcomes["cooldown"] == 1 and len(q.pending("d1")) == 1
+    q.ack("d1", action["id"])
+    engine.stop()
+
+    (d,) = engine.decisions("d1")
+    assert d["rule"] == "fan-boost" and d["action_id"] == action["id"] and not d["dry_run"]
+    assert all(d[k] for k in ("sample_ts", "detected_at", "decided_at", "dispatched_at", "delivered_at", "acked_at"))
+    assert d["latency_ms"]["total"] >= d["latency_ms"]["apply"] >= 0
+    assert engine.stats()["latency"]["total"]["n"] == 1
+
+    # Cooldowns come back after a restart
+    engine, q = _engine(con, "fan_rpm")
+    assert engine.step("d1", time.time(), time.time()) == "cooldown"
+
+def test_dry_run_rule_and_unmatched_causes_send_nothing(tmp_path):
+    con = duckdb.connect(str(tmp_path / "p.duckdb"))
+    engine, q = _engine(con, "disk_errors")
+    assert engine.step("d1", time.time(), time.time()) == "dry_run"
+    assert q.stats()["enqueued"] == 0 and engine.decisions()[0]["dispatched_at"] is None
+    assert _engine(con, "disk_errors", score=0.3)[0].step("d2", time.time(), time.time()) == "low_score"
+    assert _engine(con, "mem_pct")[0].step("d2", time.time(), time.time()) == "no_rule"
+
+def test_failed_dispatch_charges_no_cooldown_or_limits(tmp_path):
+    con = duckdb.connect(str(tmp_path / "p.duckdb"))
+    engine, q = _engine(con, "fan_rpm")
+    def down(device_id, action, params):
+        raise RuntimeError("queue down")
+    engine.dispatch = down
+    with pytest.raises(RuntimeError):
+        engine.step("d1", time.time(), time.time())
+    assert engine.decisions() == [] and not engine._fired and not engine._fleet_sent and not engine._device_sent.get("d1")
+    engine.dispatch = q.enqueue
+    assert engine.step("d1", time.time(), time.time()) == "dispatched"
+    assert engine.step("d1", time.time(), time.time()) == "cooldown"
@@ -0,0 +1,30 @@
+import os, time
+import numpy as np
+import pandas as pd
+
+import rca
+
+def test_dag_is_cached_and_reloaded_on_change(tmp_path, monkeypatch):
+    dag = tmp_path / "dag.yaml"
+    dag.write_text("nodes: [a, b, latency_ms]\nedges:\n  - [a, b]\n  - [b, latency_ms]\n")
+    monkeypatch.setattr(rca, "DAG_PATH", str(dag))
+    g = rca._get_graph()
+    assert rca._get_graph() is g
+    assert rca._is_upstream("a", "latency_ms", g) and not rca._is_upstream("latency_ms", "a", g)
+    dag.write_text("nodes: [a, b, latency_ms]\nedges:\n  - [b, latency_ms]\n")
+    os.utime(dag, ns=(time.time_ns(), time.time_ns() + 10**9))
+    g2 = rca._get_graph()
+    assert g2 is not g and not rca._is_upstream("a", "latency_ms", g2)
+
+def test_lagged_cross_correlation_marks_leading_metric():
+    rng = np.random.default_rng(0)
+    n = 800
+    cpu = rng.normal(40, 5, n)
+    df = pd.DataFrame({"cpu_pct": cpu, "mem_pct": rng.normal(50, 5, n),
+                       "latency_ms": 8 + np.roll(cpu, 4) / 12 + rng.normal(0, 0.2, n)})
+    anomalies = [{"idx": 500, "metric": "cpu_pct"}, {"idx": 100, "metric": "mem_pct"},
+                 {"idx": 50, "metric": "latency_ms"}]
+    ranked = {r["metric"]: r for r in rca.rank_root_causes(df, anomalies)["ranked"]}
+    assert any("leads latency_ms by 4 samples" in e for e in ranked["cpu_pct"]["explanation"])
+    assert not any("leads" in e for e in ranked["mem_pct"]["explanation"])
+    assert ranked["cpu_pct"]["score"] > ranked["mem_pct"]["score"]
@@ -0,0 +1,40 @@
+import duckdb
+import numpy as np
+import pandas as pd
+
+from replay import replay, score
+from test_ingest_queue import DDL
+
+def _fleet(path, minutes=40, fault_at=1530):
+    """Two devices at 1 Hz; d1's fan drops 1500 rpm (and temp rises) from fault_at s on."""
+    rng = np.random.default_rng(0)
+    n = minutes * 60
+    ts = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(n), unit="s")
+    con = duckdb.connect(str(path)); con.execute(DDL)
+    for dev in ("d1", "d2"):
+        drop = (np.arange(n) >= fault_at) * (dev == "d1")
+        df = pd.DataFrame({"ts": ts, "device_id": dev, "fan_rpm": 5000 + rng.normal(0, 20, n) - 1500 * drop,
+                           "temp_c": 55 + rng.normal(0, 0.3, n) + 8 * drop, "cpu_pct": 30 + rng.normal(0, 1, n),
+                           "latency_ms": 11 + rng.normal(0, 0.3, n)})
+        con.execute("INSERT INTO telemetry BY NAME SELECT * FROM df")
+    return con
+
+def test_replay_finds_the_fault_from_duckdb_and_parquet_alike(tmp_path):
+    con = _fleet(tmp_path / "t.duckdb")
+    for dev in ("d1", "d2"):      # cold-tier layout: the files keep device_id
+        (tmp_path / "cold" / f"device={dev}").mkdir(parents=True)
+        con.execute(f"COPY (SELECT * FROM telemetry WHERE device_id = '{dev}') TO "
+                    f"'{tmp_path / 'cold' / f'device={dev}' / 'part-0.parquet'}' (FORMAT PARQUET)")
+    con.close()
+    cfg = {"iforest": "off", "z_threshold": 6.0, "chunk_s": 700}
+    alerts, run = replay([str(tmp_path / "t.duckdb")], cfg)
+    assert run["devices"] == 2 and run["rows"] == 2 * 2400 and run["evaluations"] == 2 * 39
+    assert [a["device_id"] for a in alerts] == ["d1"] * len(alerts) and alerts
+    assert alerts[0]["at"] == "2024-01-01T00:26:00" and "fan_rpm" in alerts[0]["metrics"]
+    assert replay([str(tmp_path / "cold")], cfg, workers=2)[0] == alerts
+
+    labels = [{"device_id": "d1", "fault": "fan_drop", "start": "2024-01-01T00:25:30Z", "end": None},
+              {"device_id": "d2", "fault": "workload_spike", "start": "2024-01-01T00:10:00Z", "end": "2024-01-01T00:12:00Z"}]
+    s = score(alerts, labels, open_s=3600)
+    assert (s["faults"], s["detected"], s["recall"], s["precision"]) == (2, 1, 0.5, 1.0)
+    assert s["delay_s"]["p50"] == 30.0 and s["by_fault"]["workload_spike"]["detected"] == 0
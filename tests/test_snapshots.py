@@ -0,0 +1,109 @@
+import os
+from contextlib import contextmanager
+import duckdb
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from forward import Forwarder
+from snapshots import Snapshotter, SnapshotReader
+from tiering import TierManager
+from test_ingest_queue import DDL
+
+def test_readers_see_published_snapshots_and_switch_to_newer_ones(tmp_path):
+    con = duckdb.connect(str(tmp_path / "rca.duckdb")); con.execute(DDL)
+    con.execute("INSERT INTO telemetry (ts, device_id) VALUES ('2024-01-01 00:00:00', 'd1')")
+    snaps = Snapshotter(con, tmp_path / "snapshots", keep=2)
+    reader = SnapshotReader(tmp_path / "snapshots")
+    assert reader.age_s() is None and not reader.refresh()
+    snaps.take()
+    reader.wait(5)
+    assert 0 <= reader.age_s() < 5
+    streaming = reader.cursor().execute("SELECT device_id FROM telemetry")
+
+    con.execute("INSERT INTO telemetry (ts, device_id) VALUES ('2024-01-01 00:00:01', 'd2')")
+    snaps.take(); snaps.take()
+    assert reader.refresh() and not reader.refresh()
+    assert reader.execute("SELECT count(*) FROM telemetry").fetchall() == [(2,)]
+    assert streaming.fetchall() == [("d1",)]         # started on the old snapshot, which is gone by now
+    assert len([f for f in os.listdir(tmp_path / "snapshots") if f.endswith(".duckdb")]) == 2
+
+def test_reader_tiers_stop_at_the_snapshot_cutoff(tmp_path):
+    con = duckdb.connect(str(tmp_path / "rca.duckdb")); con.execute(DDL)
+    con.execute("INSERT INTO telemetry (ts, device_id, cpu_pct) SELECT TIMESTAMP '2024-01-01' + to_hours(i::BIGINT), "
+                "'d1', i FROM range(48) r(i)")
+    writer = TierManager(con, tmp_path / "cold", hot_hours=36, multiprocess=True)
+    writer.move(now="2024-01-02 18:00")
+    snaps = Snapshotter(con, tmp_path / "snapshots", guard=writer.stable)
+    snaps.take()
+    reader_con = SnapshotReader(tmp_path / "snapshots"); reader_con.wait(5)
+    reader = TierManager(reader_con, tmp_path / "cold", read_only=True)
+    reader_con.on_refresh(reader.reload)
+    assert reader.cutoff == writer.cutoff
+
+    writer.move(now="2024-01-03 00:00")               # moved after the reader's snapshot
+    assert reader.cutoff < writer.cutoff
+    assert len(reader.window("d1", "2024-01-01", "2024-01-03")) == 48   # no row twice
+    snaps.take(); reader_con.refresh()
+    assert reader.cutoff == writer.cutoff
+    assert len(reader.window("d1", "2024-01-01", "2024-01-03")) == 48
+
+    # A reader streaming cold files holds compaction off until it is done
+    cur = reader_con.cursor()
+    release = reader.execute(cur, "d1", "2024-01-01", "2024-01-03")
+    with writer._swapping() as ok:
+        assert not ok
+    release()
+    with writer._swapping() as ok:
+        assert ok
+
+def test_forwarder_proxies_matching_requests_and_streams_back():
+    async def ingest(request):
+        return JSONResponse({"got": (await request.body()).decode(), "q": request.url.query})
+
+    async def stream(request):
+        async def chunks():
+            for i in range(3):
+                yield f"data: {i}\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    writer = Starlette(routes=[Route("/ingest", ingest, methods=["POST"]), Route("/stream", stream)])
+    reader = Starlette(routes=[Route("/window", lambda request: JSONResponse({"local": True}))])
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=writer), base_url="http://writer")
+    app = Forwarder(reader, "http://writer", match=lambda scope: scope["path"] != "/window",
+                    headers=lambda: [(b"x-snapshot-age", b"1.000")], client=client)
+    with TestClient(app) as tc:
+        r = tc.post("/ingest?wait=true", content=b'{"device_id": "d1"}')
+        assert r.json() == {"got": '{"device_id": "d1"}', "q": "wait=true"}
+        assert tc.get("/stream").text == "data: 0\n\ndata: 1\n\ndata: 2\n\n"
+        r = tc.get("/window")
+        assert r.json() == {"local": True} and r.headers["x-snapshot-age"] == "1.000"
+
+def test_a_failed_copy_does_not_break_later_snapshots(tmp_path):
+    con = duckdb.connect(str(tmp_path / "rca.duckdb")); con.execute(DDL)
+    fail = []
+    @contextmanager
+    def guard():
+        if fail:
+            raise OSError("disk full")
+        yield
+    snaps = Snapshotter(con, tmp_path / "snapshots", guard=guard)
+    tmp = tmp_path / "snapshots" / f".snap-{os.getpid()}.tmp"
+    fail.append(True)
+    with pytest.raises(OSError):
+        snaps.take()
+    assert not tmp.exists()
+    fail.clear()
+    duckdb.connect(str(tmp)).execute(DDL).close()      # a partial copy some crash left behind
+    assert os.path.exists(snaps.take()) and not tmp.exists()
+
+def test_slow_copies_stretch_the_interval(tmp_path):
+    snaps = Snapshotter(duckdb.connect(), tmp_path / "snapshots", interval_s=5, max_duty=0.25)
+    assert snaps.next_interval(0.5) == 5 and snaps.stretched == 0
+    assert snaps.next_interval(10) == 40 and snaps.stretched == 1
+    stats = snaps.stats()
+    assert stats["effective_interval_s"] == 40 and stats["stretched"] == 1
+    assert snaps.next_interval(1) == 5
@@ -0,0 +1,45 @@
+import threading, time
+import duckdb
+
+from checkpoints import Checkpointer
+from startup import Startup
+from test_ingest_queue import DDL
+
+def test_checkpoints_fold_the_wal_and_skip_while_results_stream(tmp_path):
+    path = str(tmp_path / "rca.duckdb")
+    con = duckdb.connect(path); con.execute(DDL); con.execute("CHECKPOINT")
+    con.execute("INSERT INTO telemetry (ts, device_id) SELECT TIMESTAMP '2024-01-01' + to_seconds(i), 'd1' "
+                "FROM range(10000) r(i)")
+    ck = Checkpointer(con, path + ".wal")
+    assert ck.wal_bytes() > 0
+
+    unpin = ck.pin()
+    streaming = con.cursor().execute("SELECT * FROM telemetry"); streaming.fetchone()
+    assert not ck.checkpoint() and ck.skipped == 1          # would block every query until drained
+    streaming.fetchall(); unpin(); unpin()                  # release is idempotent
+    writer = con.cursor(); writer.execute("BEGIN"); writer.execute("INSERT INTO telemetry (device_id) VALUES ('d2')")
+    assert not ck.checkpoint() and ck.skipped == 2          # an open write transaction
+    writer.execute("COMMIT")
+    assert ck.checkpoint()
+    assert ck.wal_bytes() == 0 and ck.checkpoints == 1
+
+    # The shutdown checkpoint waits for streams still open
+    unpin = ck.pin()
+    threading.Timer(0.2, unpin).start()
+    t0 = time.monotonic(); ck.stop(wait_s=5)
+    assert ck.checkpoints == 2 and time.monotonic() - t0 >= 0.2
+
+def test_warm_up_runs_steps_in_the_background_and_records_failures():
+    startup = Startup()
+    startup.mark("serving")
+    gate = threading.Event()
+
+    def boom():
+        raise RuntimeError("no dag")
+    startup.warm_up([("slow", gate.wait), ("dag", boom), ("ok", lambda: None)])
+    assert not startup.warm() and startup.steps["ok"] == {"state": "pending"}
+    gate.set()
+    assert startup.wait(5)
+    assert [s["state"] for s in startup.steps.values()] == ["done", "failed", "done"]
+    assert startup.steps["dag"]["error"] == "no dag"
+    assert 0 <= startup.phases["serving"] <= startup.phases["warm"]
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomaly import zscore_anomalies
+from streaming import StreamingDetector
+
+def telemetry(n, seed=3):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "ts": pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(n), unit="s"),
+        "device_id": "d1",
+        "cpu_pct": rng.normal(35, 3, n).round(1),
+        "mem_pct": rng.normal(55, 5, n).round(1),
+        "temp_c": rng.normal(56, 1, n).round(1),
+        "fan_rpm": rng.integers(4700, 4900, n),
+        "disk_errors": (rng.random(n) < 0.01).astype(int),
+        "nic_drops": np.zeros(n, dtype=int),
+        "latency_ms": rng.normal(11, 1, n).round(1),
+    })
+    df.loc[rng.choice(n, 15, replace=False), "latency_ms"] += 25
+    df.loc[rng.choice(n, 5, replace=False), "cpu_pct"] = np.nan
+    return df
+
+def test_matches_batch_rolling_z():
+    df = telemetry(1500)
+    det = StreamingDetector()
+    rng = np.random.default_rng(0)
+    i = 0
+    while i < len(df):
+        k = int(rng.integers(1, 40))
+        det.append(df.iloc[i:i + k])
+        i += k
+    for start, length in [(0, 300), (137, 600), (700, 800), (1200, 300)]:
+        win = df.iloc[start:start + length].reset_index(drop=True)
+        expected = zscore_anomalies(win)
+        got = det.zscore_anomalies("d1", win)
+        assert [(a["idx"], a["metric"], a["ts"]) for a in got] == \
+               [(a["idx"], a["metric"], a["ts"]) for a in expected]
+        assert [a["score"] for a in got] == pytest.approx([a["score"] for a in expected], rel=1e-9)
+
+def test_falls_back_when_results_cannot_answer():
+    df = telemetry(600)
+    det = StreamingDetector()
+    det.append(df.iloc[100:])
+    assert det.zscore_anomalies("d1", df.iloc[:400].reset_index(drop=True)) is None   # before coverage
+    assert det.zscore_anomalies("d1", df.iloc[300:400].reset_index(drop=True)) is None # short window
+    det.append(df.iloc[50:60])                                                          # late rows
+    assert det.zscore_anomalies("d1", df.iloc[200:600].reset_index(drop=True)) is None
@@ -0,0 +1,85 @@
+import os
+import duckdb
+import numpy as np
+import pandas as pd
+
+from schema import COLUMNS
+from tiering import TierManager
+
+def make_db(path):
+    con = duckdb.connect(str(path))
+    con.execute("CREATE TABLE telemetry (ts TIMESTAMP, device_id VARCHAR, inlet_temp_c DOUBLE, fan_rpm INTEGER, "
+                "temp_c DOUBLE, vcore_v DOUBLE, cpu_pct DOUBLE, mem_pct DOUBLE, disk_errors INTEGER, "
+                "nic_drops INTEGER, latency_ms DOUBLE)")
+    return con
+
+def insert(con, device_id, start, hours):
+    ts = pd.Timestamp(start) + pd.to_timedelta(np.arange(hours * 6) * 600, unit="s")
+    df = pd.DataFrame({"ts": ts, "device_id": device_id}).reindex(columns=COLUMNS)
+    df["cpu_pct"] = np.arange(len(df), dtype=float)
+    con.register("batch", df)
+    con.execute("INSERT INTO telemetry SELECT * FROM batch")
+    con.unregister("batch")
+
+def test_move_query_compact_and_retention(tmp_path):
+    con = make_db(tmp_path / "t.duckdb")
+    for dev in ("rack1/node 01", "rack2"):
+        insert(con, dev, "2024-01-01", 72)
+    full = con.execute("SELECT * FROM telemetry WHERE device_id = 'rack1/node 01' ORDER BY ts").df()
+    tiers = TierManager(con, tmp_path / "cold", hot_hours=24, cold_days=2, compact_files=2)
+    now = pd.Timestamp("2024-01-04")
+
+    assert tiers.move(now) == 2 * 48 * 6
+    assert con.execute("SELECT min(ts) FROM telemetry").fetchone()[0] == pd.Timestamp("2024-01-03")
+    assert tiers.devices() == {"rack1/node 01", "rack2"}
+    got = tiers.window("rack1/node 01", "2024-01-01T00:00:00Z", "2024-01-04T00:00:00Z")
+    pd.testing.assert_frame_equal(got, full)
+    # Partition pruning: one date, one device; recent windows skip the cold tier entirely
+    assert len(tiers.files("rack2", "2024-01-02T01:00:00", "2024-01-02T02:00:00")) == 1
+    assert tiers.files("rack2", "2024-01-03T01:00:00", "2024-01-03T02:00:00") == []
+
+    insert(con, "rack2", "2024-01-02T12:05:00", 1)  # late rows behind the cutoff
+    tiers.move(now)
+    assert len(tiers.files("rack2", "2024-01-02", "2024-01-02T23:59:59")) == 2
+    assert tiers.compact() == 1
+    assert len(tiers.files("rack2", "2024-01-02", "2024-01-02T23:59:59")) == 1
+    assert len(tiers.window("rack2", "2024-01-02", "2024-01-02T23:59:59")) == 24 * 6 + 6
+
+    assert tiers.enforce_retention(now) == 1             # drops 2024-01-01
+    assert tiers.window("rack2", "2024-01-01", "2024-01-01T23:59:59").empty
+
+def test_restart_publishes_committed_and_discards_uncommitted_batches(tmp_path):
+    con = make_db(tmp_path / "t.duckdb")
+    insert(con, "d1", "2024-01-01", 24)
+    tiers = TierManager(con, tmp_path / "cold", hot_hours=1)
+    orphan = tmp_path / "cold" / "_staging" / "deadbeef" / "date=2024-01-01" / "device=d1"
+    orphan.mkdir(parents=True)
+    (orphan / "part-x.parquet").write_bytes(b"")
+    tiers.move(pd.Timestamp("2024-01-03"))
+    reopened = TierManager(con, tmp_path / "cold", hot_hours=1)
+    assert not os.path.exists(tmp_path / "cold" / "_staging" / "deadbeef")
+    assert reopened.cutoff == pd.Timestamp("2024-01-02")
+    assert len(reopened.window("d1", "2024-01-01", "2024-01-02")) == 24 * 6
+
+def test_last_reaches_into_cold_days_for_silent_devices(tmp_path):
+    con = make_db(tmp_path / "t.duckdb")
+    insert(con, "quiet", "2024-01-01", 48)              # silent since 2024-01-03
+    insert(con, "busy", "2024-01-01", 72)
+    tiers = TierManager(con, tmp_path / "cold", hot_hours=24)
+    tiers.move(pd.Timestamp("2024-01-04"))
+    full = tiers.window("quiet", "2024-01-01", "2024-01-04")
+
+    assert con.execute("SELECT count(*) FROM telemetry WHERE device_id = 'quiet'").fetchone()[0] == 0
+    pd.testing.assert_frame_equal(tiers.last("quiet", 10), full.tail(10).reset_index(drop=True))
+    # Spans both cold days; more than the device has returns all of it
+    pd.testing.assert_frame_equal(tiers.last("quiet", 200), full.tail(200).reset_index(drop=True))
+    pd.testing.assert_frame_equal(tiers.last("quiet", 1000), full)
+    busy = tiers.last("busy", 200)
+    assert len(busy) == 200 and busy["ts"].is_monotonic_increasing
+    assert busy["ts"].iloc[-1] == pd.Timestamp("2024-01-03T23:50:00")
+    assert busy["ts"].iloc[0] == pd.Timestamp("2024-01-03T23:50:00") - pd.Timedelta(minutes=10 * 199)
+
+    insert(con, "quiet", "2024-01-01T05:05:00", 1)      # late hot rows, older than the cold tail
+    assert tiers.last("quiet", 3)["ts"].tolist() == full["ts"].tail(3).tolist()
+    assert tiers.last("quiet", 1000)["ts"].is_monotonic_increasing and len(tiers.last("quiet", 1000)) == len(full) + 6
+    assert tiers.last("nobody", 5).empty
@@ -25,6 +25,30 @@ def call_json(method, url, **kwargs):
         st.error(f"Request error calling {url}: {e}")
         return None
 
+@st.cache_data(ttl=2, show_spinner=False)
+def _get_fresh(url, params):
+    resp = requests.get(url, params=dict(params), timeout=8)
+    resp.raise_for_status()
+    return resp.json()
+
+@st.cache_data(ttl=15, show_spinner=False)
+def _get_slow(url, params):
+    resp = requests.get(url, params=dict(params), timeout=8)
+    resp.raise_for_status()
+    return resp.json()
+
+def cached_json(path, params=None, slow=False):
+    """
+    GET through Streamlit's cache, so reruns (every widget change and refresh tick) within the
+    TTL reuse the response: 2 s for live data, 15 s (slow=True) for health and the device list.
+    Failures are not cached.
+    """
+    try:
+        return (_get_slow if slow else _get_fresh)(f"{API}{path}", tuple(sorted((params or {}).items())))
+    except requests.exceptions.RequestException as e:
+        st.error(f"GET {path} failed: {e}")
+        return None
+
 def now_utc():
     return datetime.datetime.now(datetime.timezone.utc)
 
@@ -33,20 +57,62 @@ def iso(dt: datetime.datetime) -> str:
         dt = dt.replace(tzinfo=datetime.timezone.utc)
     return dt.isoformat()
 
-def fetch_latest_recent(device, limit=2000):
-    return call_json("GET", f"{API}/latest_recent", params={"device_id": device, "limit": int(limit)})
+def fetch_latest_recent(device, limit=2000, since=None):
+    params = {"device_id": device, "limit": int(limit)}
+    if since:
+        params["since"] = since
+    return cached_json("/latest_recent", params)
+
+BUFFER_ROWS = 100    # newest rows for the table; the chart uses /downsample
+CHART_POINTS = 800   # points per metric the server reduces a chart window to
+CHART_METRICS = ["inlet_temp_c", "fan_rpm", "temp_c", "cpu_pct", "latency_ms"]
+FLEET_METRICS = ["temp_c", "fan_rpm", "cpu_pct"]
+FLEET_PAGE_ROWS = 100
+
+def recent_rows(device):
+    """
+    The device's newest BUFFER_ROWS rows, kept in the session: after the first full fetch each
+    tick only asks for the rows committed since the last cursor and merges them in.
+    """
+    buf = st.session_state.setdefault("buffers", {}).get(device)
+    data_json = fetch_latest_recent(device, limit=BUFFER_ROWS, since=buf["cursor"] if buf else None)
+    if data_json is None:
+        return buf["df"] if buf else None
+    delta = pd.DataFrame(data_json.get("rows", []))
+    if not delta.empty:
+        delta["ts"] = pd.to_datetime(delta["ts"], errors="coerce", utc=True)
+    if buf is not None and not buf["df"].empty:
+        # Deltas may repeat rows already held (e.g. after a server restart); the newest copy wins
+        df = pd.concat([buf["df"], delta], ignore_index=True) if not delta.empty else buf["df"]
+        df = df.drop_duplicates(subset="ts", keep="last").sort_values("ts").tail(BUFFER_ROWS)
+    else:
+        df = delta.sort_values("ts") if not delta.empty else delta
+    st.session_state["buffers"][device] = {"df": df, "cursor": data_json.get("cursor")}
+    return df
+
+def chart_series(device, minutes, method):
+    """The device's last `minutes`, downsampled server-side to CHART_POINTS per metric."""
+    out = cached_json("/downsample", {"device_id": device, "minutes": int(minutes), "points": CHART_POINTS,
+                                      "method": method, "metrics": ",".join(CHART_METRICS)})
+    if out is None:
+        return None
+    df = pd.DataFrame(out.get("rows", []))
+    if not df.empty:
+        df["ts"] = pd.to_datetime(df["ts"], errors="coerce", utc=True)
+    return df
 
 def detect_latest(device, minutes):
-    return call_json("GET", f"{API}/detect_latest", params={"device_id": device, "minutes": int(minutes)})
+    return cached_json("/detect_latest", {"device_id": device, "minutes": int(minutes)})
 
 # ---------- Health ----------
-health = call_json("GET", f"{API}/health")
+health = cached_json("/health", slow=True)
 if not health or health.get("status") != "ok":
     st.warning(f"API not reachable at {API}. Start it with `python api/app.py`.")
     st.stop()
 
 # ---------- Sidebar ----------
 with st.sidebar:
+    view = st.radio("View", ["Fleet overview", "Device"], key="view")
     st.header("Time Window")
     preset = st.selectbox(
         "Window preset",
@@ -57,6 +123,8 @@ with st.sidebar:
     auto_on = st.checkbox("Enable Auto-Refresh", value=True)
     interval = st.selectbox("Every (seconds)", [2, 5, 10], index=1)
     auto_detect = st.checkbox("Also run Anomaly + RCA each tick", value=False)
+    chart_method = st.selectbox("Chart downsampling", ["lttb", "minmax"],
+                                help="lttb keeps the line's shape; minmax keeps every bucket's extremes")
 
     preset_to_min = {"Last 2 min": 2, "Last 5 min": 5, "Last 10 min": 10, "Last 15 min": 15, "Last 30 min": 30}
     delta_min = preset_to_min[preset]
@@ -67,8 +135,59 @@ with st.sidebar:
     st.caption("Label window (server derives real window):")
     st.code(f"Start: {iso(start_dt)}\nEnd:   {iso(end_dt)}", language="text")
 
+def auto_refresh():
+    if auto_on:
+        st.caption(f"Auto-refresh is ON — next update in {interval}s")
+        time.sleep(interval)
+        st.rerun()
+
+# ---------- Fleet overview ----------
+def open_device():
+    st.session_state["view"] = "Device"
+    st.session_state["device"] = st.session_state["fleet_pick"]
+
+def fleet_page():
+    st.subheader("Fleet overview")
+    c1, c2, c3 = st.columns([1, 2, 1])
+    metric = c1.selectbox("Sparkline", FLEET_METRICS)
+    match = c2.text_input("Filter devices (substring)")
+    page = c3.number_input("Page", min_value=1, value=1, step=1)
+    summary = cached_json("/fleet/summary", {
+        "minutes": delta_min, "points": 60, "metrics": ",".join(FLEET_METRICS),
+        "limit": FLEET_PAGE_ROWS, "offset": (int(page) - 1) * FLEET_PAGE_ROWS, "match": match,
+    })
+    if summary is None:
+        return
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Devices", summary.get("total", 0))
+    m2.metric("With anomalies", summary.get("anomalous", 0))
+    m3.metric("Sparkline step", f"{summary.get('step_s', 0)} s")
+    rows = summary.get("devices", [])
+    if not rows:
+        st.info("No telemetry in this window.")
+        return
+    table = pd.DataFrame({
+        "device": [d["device_id"] for d in rows],
+        "anomalies": [d["anomalies"] for d in rows],
+        "last seen": pd.to_datetime([d["last_ts"] for d in rows], errors="coerce"),
+        **{m: [d["latest"][m] for d in rows] for m in FLEET_METRICS},
+        "trend": [[v for v in d["spark"][metric] if v is not None] for d in rows],
+    })
+    st.dataframe(table, hide_index=True, use_container_width=True, column_config={
+        "anomalies": st.column_config.NumberColumn("anomalies", help="Samples flagged in the window"),
+        "trend": st.column_config.LineChartColumn(f"{metric}, last {delta_min} min"),
+    })
+    c1, c2 = st.columns([3, 1])
+    c1.selectbox("Open device", [d["device_id"] for d in rows], key="fleet_pick", label_visibility="collapsed")
+    c2.button("Open device", on_click=open_device)
+
+if view == "Fleet overview":
+    fleet_page()
+    auto_refresh()
+    st.stop()
+
 # ---------- Device selector (from API only) ----------
-devices_json = call_json("GET", f"{API}/devices")
+devices_json = cached_json("/devices", slow=True)
 if not devices_json:
     st.error("Could not fetch devices from API.")
     st.stop()
@@ -76,7 +195,9 @@ devices = devices_json.get("devices", [])
 if not devices:
     st.info("No devices observed yet. Start the simulator or edge agent so the API sees telemetry.")
     st.stop()
-device = st.selectbox("Device (from API)", devices, index=0)
+if st.session_state.get("device") not in devices:
+    st.session_state["device"] = devices[0]
+device = st.selectbox("Device (from API)", devices, key="device")
 
 # ---------- Actions ----------
 cols = st.columns([1,1,1])
@@ -97,22 +218,19 @@ telemetry_container = st.container()
 anomaly_container = st.container()
 
 def render_once():
-    # Telemetry: time-agnostic recent rows (always returns data if ingest works)
-    data_json = fetch_latest_recent(device, limit=2000)
+    # Telemetry: chart from the downsampled window, table from the time-agnostic recent rows
+    series = chart_series(device, delta_min, chart_method)
+    df = recent_rows(device)
     with telemetry_container:
         st.subheader("Telemetry")
-        if data_json and data_json.get("rows"):
-            df = pd.DataFrame(data_json["rows"])
-            if not df.empty:
-                if df["ts"].dtype == object:
-                    df["ts"] = pd.to_datetime(df["ts"], errors="coerce", utc=True)
-                df = df.sort_values("ts")
-                cols_order = [c for c in ["inlet_temp_c","fan_rpm","temp_c","cpu_pct","latency_ms"] if c in df.columns]
-                if cols_order:
-                    st.line_chart(df.set_index("ts")[cols_order])
-                st.dataframe(df.tail(30), use_container_width=True)
-            else:
-                st.info("No rows yet.")
+        if series is not None and not series.empty:
+            cols_order = [c for c in CHART_METRICS if c in series.columns]
+            if cols_order:
+                st.line_chart(series.set_index("ts")[cols_order])
+        if df is not None and not df.empty:
+            st.dataframe(df.tail(30), use_container_width=True)
+        elif df is not None:
+            st.info("No rows yet.")
         else:
             st.info("No data returned. Ensure simulator/edge agent is posting to this API.")
 
@@ -131,30 +249,49 @@ def render_once():
             else:
                 st.info("No root-cause signals in this window.")
 
-# Manual single run
-if refresh_clicked or detect_clicked or not auto_on:
-    render_once()
-
-# Auto-Refresh loop
-if auto_on:
-    render_once()
-    st.caption(f"Auto-refresh is ON — next update in {interval}s")
-    time.sleep(interval)
-    st.rerun()
-
-# ---------- Manual remediation ----------
-st.subheader("Remediation")
-action = st.selectbox(
-    "Action",
-    ["Increase fan target", "Reduce node workload", "Migrate traffic", "Restart service"],
-)
-params = {}
-if action == "Increase fan target":
-    params["fan_delta"] = 100
-elif action == "Reduce node workload":
-    params["workload_factor"] = 0.9
-
-if st.button("Apply Remediation"):
-    ok = call_json("POST", f"{API}/remediate", json={"device_id": device, "action": action, "params": params})
-    if ok and ok.get("ok"):
-        st.success(f"Remediation submitted at {ok.get('ts')}. Effects will appear in new telemetry shortly.")
+def render_remediation():
+    # ---------- Manual remediation ----------
+    st.subheader("Remediation")
+    action = st.selectbox(
+        "Action",
+        ["Increase fan target", "Reduce node workload", "Migrate traffic", "Restart service"],
+    )
+    params = {}
+    if action == "Increase fan target":
+        params["fan_delta"] = 100
+    elif action == "Reduce node workload":
+        params["workload_factor"] = 0.9
+
+    if st.button("Apply Remediation"):
+        ok = call_json("POST", f"{API}/remediate", json={"device_id": device, "action": action, "params": params})
+        if ok and ok.get("ok"):
+            st.success(f"Remediation submitted at {ok.get('ts')}. Effects will appear in new telemetry shortly.")
+
+    # ---------- Auto-remediation (policy engine) ----------
+    st.subheader("Auto-remediation")
+    pstats = cached_json("/policy/stats")
+    if pstats and pstats.get("enabled", True):
+        outcomes = pstats.get("outcomes", {})
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Mode", pstats.get("mode", "?"))
+        c2.metric("Dispatched", outcomes.get("dispatched", 0))
+        c3.metric("Dry-run", outcomes.get("dry_run", 0))
+        c4.metric("Rate-limited", sum(outcomes.get(k, 0) for k in ("cooldown", "device_limit", "fleet_limit")))
+        dec = cached_json("/policy/decisions", {"limit": 200})
+        rows = (dec or {}).get("decisions", [])
+        if rows:
+            lat = pd.DataFrame([dict(d["latency_ms"], decided_at=d["decided_at"]) for d in rows])
+            lat["decided_at"] = pd.to_datetime(lat["decided_at"], errors="coerce", utc=True)
+            st.caption("Closed-loop latency per decision (ms): sample → detected → decided → dispatched → applied")
+            st.line_chart(lat.set_index("decided_at").sort_index()[["detect", "decide", "dispatch", "apply", "total"]])
+            st.dataframe(pd.DataFrame(rows)[["decided_at", "device_id", "rule", "cause", "score", "action",
+                                             "dry_run", "acked_at"]], use_container_width=True)
+        else:
+            st.info("No policy decisions yet.")
+    else:
+        st.info("Policy engine is off (POLICY=off).")
+
+# Render everything before auto_refresh(): its st.rerun() ends this run, so nothing after it shows
+render_once()
+render_remediation()
+auto_refresh()